@@ -2,25 +2,20 @@ import imaplib
 import email
 import time
 import threading
-import logging
-import sys
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
 from email.utils import parsedate_to_datetime
 
-# Uproszczona konfiguracja logowania
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', filename='autoresponder.log', filemode='a')
-logger = logging.getLogger('autoresponder')
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+from log_pipeline import setup_logging, EventAdapter
+
+# Logowanie przez kolejkę (zapis w osobnym wątku), rotacja autoresponder.log,
+# komunikat "Brak nowych wiadomości" najwyżej raz na minutę dla danego konta
+logger = setup_logging('autoresponder', filename='autoresponder.log', sampled_events=('poll_empty',), sample_interval=60.0)
 
 class Autoresponder:
 	"""Obsługuje automatyczne odpowiadanie na nowe wiadomości."""
-	def __init__(self, imap_server, imap_port, smtp_server, smtp_port, username, password, response_message, check_interval=60):
+	def __init__(self, imap_server, imap_port, smtp_server, smtp_port, username, password, response_message, check_interval=60, use_ssl=True):
 		# Inicjalizacja podstawowych parametrów
 		self.imap_server = imap_server
 		self.imap_port = imap_port
@@ -30,95 +25,67 @@ class Autoresponder:
 		self.password = password
 		self.response_message = response_message
 		self.check_interval = check_interval
+		self.use_ssl = use_ssl
 		self.is_running = False
 		self.processed_ids = set()
 		self.thread = None
 		self.start_time = None
-		logger.info(f"Autoresponder zainicjalizowany dla {username}")
+		self.log = EventAdapter(logger, {'account': username})
+		self.log.info("Autoresponder zainicjalizowany", extra={'event': 'init'})
 
 	def start(self):
 		if not self.is_running:
-			logger.info("Uruchamianie autorespondera")
 			self.is_running = True
 			self.start_time = datetime.now()
-			logger.info(f"Start time: {self.start_time}")
-			print(f"[Autoresponder] Uruchomiono {self.start_time.strftime('%Y-%m-%d %H:%M:%S')}")
 			self.thread = threading.Thread(target=self._run)
 			self.thread.daemon = True
 			self.thread.start()
-			logger.info(f"Wątek autorespondera: {self.thread.name}")
-			print(f"Autoresponder uruchomiony! Sprawdzanie co {self.check_interval} sekund.")
+			self.log.info("Autoresponder uruchomiony, sprawdzanie co %s s", self.check_interval,
+						  extra={'event': 'start', 'worker': self.thread.name})
 			return True
-		logger.warning("Autoresponder już działa")
+		self.log.warning("Autoresponder już działa", extra={'event': 'start'})
 		return False
 
 	def stop(self):
 		if self.is_running:
-			logger.info("Zatrzymywanie autorespondera")
 			self.is_running = False
-			if self.thread:
-				logger.info(f"Oczekiwanie na zakończenie wątku {self.thread.name}")
-			logger.info("Autoresponder zatrzymany")
-			print("Autoresponder zatrzymany.")
+			self.log.info("Autoresponder zatrzymany", extra={'event': 'stop'})
 			return True
-		logger.warning("Autoresponder już zatrzymany")
+		self.log.warning("Autoresponder już zatrzymany", extra={'event': 'stop'})
 		return False
 
 	def _run(self):
 		# Główna pętla sprawdzania nowych wiadomości
-		logger.info("Główna pętla autorespondera")
-		print(f"[Autoresponder] Sprawdzanie co {self.check_interval} sekund")
 		while self.is_running:
 			try:
-				logger.info("Sprawdzanie wiadomości")
-				print(f"[Autoresponder] Sprawdzanie wiadomości... {datetime.now().strftime('%H:%M:%S')}")
-				new_messages = self._fetch_new_messages()
+				self.log.debug("Sprawdzanie wiadomości", extra={'event': 'poll_start'})
+				new_messages = [(msg_id, msg_data) for msg_id, msg_data in self._fetch_new_messages() if msg_id not in self.processed_ids]
 				if new_messages:
-					logger.info(f"{len(new_messages)} nowych wiadomości")
-					print(f"[Autoresponder] {len(new_messages)} nowych wiadomości")
+					self.log.info("%d nowych wiadomości", len(new_messages), extra={'event': 'poll_found', 'count': len(new_messages)})
 					for msg_id, msg_data in new_messages:
-						if msg_id not in self.processed_ids:
-							logger.info(f"Przetwarzanie {msg_id}")
-							print(f"[Autoresponder] Przetwarzanie {msg_id}")
-							self._process_message(msg_id, msg_data)
-							self.processed_ids.add(msg_id)
-							logger.info(f"{msg_id} przetworzona")
-						else:
-							logger.info(f"{msg_id} już przetworzona")
+						self._process_message(msg_id, msg_data)
+						self.processed_ids.add(msg_id)
 				else:
-					logger.info("Brak nowych wiadomości")
-					print("[Autoresponder] Brak nowych wiadomości")
+					self.log.info("Brak nowych wiadomości", extra={'event': 'poll_empty'})
 			except Exception as e:
-				logger.error(f"Błąd: {e}")
-				print(f"[Autoresponder] BŁĄD: {e}")
-				import traceback
-				logger.error(traceback.format_exc())
-				print("[Autoresponder] Szczegóły błędu w logu")
-			logger.debug(f"Oczekiwanie {self.check_interval} sekund")
-			print(f"[Autoresponder] Oczekiwanie {self.check_interval} sekund")
+				self.log.exception("Błąd: %s", e, extra={'event': 'poll_error'})
 			time.sleep(self.check_interval)
 
 	def _fetch_new_messages(self):
 		# Logika pobierania wiadomości: obsługa UID/fetch z fallbackem
 		try:
-			logger.info(f"Łączenie z {self.imap_server}:{self.imap_port}")
-			print(f"[Autoresponder] Łączenie z {self.imap_server}:{self.imap_port}")
-			mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
+			self.log.debug("Łączenie z %s:%s", self.imap_server, self.imap_port, extra={'event': 'imap_connect'})
+			mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port) if self.use_ssl else imaplib.IMAP4(self.imap_server, self.imap_port)
 			try:
-				logger.info("Logowanie IMAP")
 				mail.login(self.username, self.password)
-				logger.info("Wybór skrzynki odbiorczej")
 				mail.select('inbox', readonly=True)
 				search_criteria = f'(UNSEEN SINCE "{self.start_time.strftime("%d-%b-%Y")}")' if self.start_time else 'UNSEEN'
-				logger.info(f"Wyszukiwanie: {search_criteria}")
 				typ, data = mail.search(None, search_criteria)
 				if typ != 'OK':
-					logger.warning(f"Błąd wyszukiwania: {typ}")
-					print(f"[Autoresponder] Błąd wyszukiwania: {typ}")
+					self.log.warning("Błąd wyszukiwania: %s", typ, extra={'event': 'imap_search_error'})
 					return []
 				msg_ids = data[0].split()[-10:]
-				logger.info(f"{len(msg_ids)} wiadomości (limit 10)")
-				print(f"[Autoresponder] {len(msg_ids)} wiadomości (10 ostatnich)")
+				self.log.debug("%d wiadomości (limit 10)", len(msg_ids), extra={'event': 'imap_search', 'criteria': search_criteria})
 				messages = []
 				for msg_id in msg_ids:
 					try:
@@ -126,139 +93,112 @@ class Autoresponder:
 						try:
 							typ, header_data = mail.uid('fetch', uid, '(BODY[HEADER.FIELDS (Date)])')
 						except Exception as e_uid:
-							logger.warning(f"UID fetch nieudany dla {uid}, próba fetch")
+							self.log.warning("UID fetch nieudany dla %s, próba fetch", uid, extra={'event': 'imap_fallback'})
 							typ, header_data = mail.fetch(uid, '(BODY[HEADER.FIELDS (Date)])')
 						date_header = ""
 						if typ == 'OK' and header_data and header_data[0]:
 							date_header_bytes = header_data[0][1]
 							date_header = date_header_bytes.decode(errors="replace").replace("Date:", "").strip() if date_header_bytes else ""
 						if not date_header:
-							logger.warning(f"Brak nagłówka daty dla {uid}, pobieranie pełnej wiadomości")
+							self.log.warning("Brak nagłówka daty dla %s, pobieranie pełnej wiadomości", uid, extra={'event': 'imap_fallback'})
 							try:
 								typ_full, full_msg_data = mail.uid('fetch', uid, '(RFC822.PEEK)')
 							except Exception as e_uid_full:
-								logger.warning(f"UID fetch pełnej wiadomości nieudany dla {uid}, próba fetch")
+								self.log.warning("UID fetch pełnej wiadomości nieudany dla %s, próba fetch", uid, extra={'event': 'imap_fallback'})
 								typ_full, full_msg_data = mail.fetch(uid, '(RFC822.PEEK)')
 							if typ_full == 'OK' and full_msg_data and full_msg_data[0]:
 								full_msg = email.message_from_bytes(full_msg_data[0][1])
 								date_header = full_msg.get("Date", "").strip()
 							else:
-								logger.warning(f"Nie pobrano pełnej wiadomości {uid}")
+								self.log.warning("Nie pobrano pełnej wiadomości %s", uid, extra={'event': 'imap_fetch_error'})
 								continue
 						message_date = None
 						if date_header:
 							try:
 								message_date = email.utils.parsedate_to_datetime(date_header)
 							except Exception as dt_err:
-								logger.warning(f"Parsowanie daty nieudane dla {uid}: {dt_err}")
+								self.log.warning("Parsowanie daty nieudane dla %s: %s", uid, dt_err, extra={'event': 'imap_fetch_error'})
 								continue
-						logger.info(f"Pobieranie wiadomości {uid}")
 						try:
 							typ, msg_data = mail.uid('fetch', uid, '(RFC822.PEEK)')
 						except Exception as e_fetch:
-							logger.warning(f"UID fetch wiadomości nieudany dla {uid}, próba fetch")
+							self.log.warning("UID fetch wiadomości nieudany dla %s, próba fetch", uid, extra={'event': 'imap_fallback'})
 							typ, msg_data = mail.fetch(uid, '(RFC822.PEEK)')
 						if typ == 'OK':
 							messages.append((uid, msg_data[0][1]))
-							logger.info(f"{uid} pobrana")
 						else:
-							logger.warning(f"Błąd pobierania {uid}: {typ}")
+							self.log.warning("Błąd pobierania %s: %s", uid, typ, extra={'event': 'imap_fetch_error'})
 					except Exception as e:
-						logger.error(f"Błąd pobierania wiadomości {msg_id}: {e}")
-						print(f"[Autoresponder] Błąd pobierania {msg_id}: {e}")
-				logger.info(f"Pobrano {len(messages)} wiadomości")
+						self.log.error("Błąd pobierania wiadomości %s: %s", msg_id, e, extra={'event': 'imap_fetch_error'})
+				self.log.debug("Pobrano %d wiadomości", len(messages), extra={'event': 'imap_fetched'})
 				return messages
 			finally:
-				try: 
-					mail.close() 
-				except: 
+				try:
+					mail.close()
+				except:
 					pass
-				try: 
-					mail.logout() 
-				except: 
+				try:
+					mail.logout()
+				except:
 					pass
 		except Exception as e:
-			logger.error(f"Błąd połączenia IMAP: {e}")
-			print(f"[Autoresponder] BŁĄD połączenia: {e}")
-			import traceback
-			logger.error(traceback.format_exc())
+			self.log.exception("Błąd połączenia IMAP: %s", e, extra={'event': 'imap_error'})
 			return []
 
 	def _process_message(self, msg_id, msg_data):
 		# Przetwarzanie wiadomości: parsowanie, weryfikacja kryteriów i wysyłka odpowiedzi
 		try:
-			logger.info(f"Parsowanie {msg_id}")
 			msg = email.message_from_bytes(msg_data)
 			from_header = msg['From']
 			date_header = msg['Date']
-			logger.info(f"From: {from_header}, Date: {date_header}")
 			message_date = None
 			if date_header:
 				try:
 					message_date = parsedate_to_datetime(date_header)
-					logger.info(f"Data: {message_date} vs start: {self.start_time}")
-					print(f"[Autoresponder] Data: {message_date.strftime('%Y-%m-%d %H:%M:%S')}")
 					if message_date < self.start_time:
-						logger.info(f"Pominięto {msg_id} (stara wiadomość)")
-						print("[Autoresponder] Pominięto starą wiadomość")
+						self._skip(msg_id, 'old')
 						return
 				except Exception as e:
-					logger.warning(f"Nieudane parsowanie daty: {e}")
+					self.log.warning("Nieudane parsowanie daty: %s", e, extra={'event': 'message_date_error', 'msg_id': msg_id})
 			from_addr = email.utils.parseaddr(from_header)[1]
 			subject = msg['Subject'] or "(Brak tematu)"
-			logger.info(f"{from_addr}, Temat: {subject}")
-			print(f"[Autoresponder] Od: {from_addr}, Temat: {subject}")
+			self.log.debug("Od: %s, Temat: %s", from_addr, subject, extra={'event': 'message_parsed', 'msg_id': msg_id})
 			if from_addr.lower() == self.username.lower():
-				logger.info("Pominięto własną wiadomość")
-				print("[Autoresponder] Pominięto własną wiadomość")
+				self._skip(msg_id, 'own')
 				return
 			auto_submitted = msg.get('Auto-Submitted', 'no').lower()
-			logger.info(f"Auto-Submitted: {auto_submitted}")
 			if auto_submitted and auto_submitted != 'no':
-				logger.info("Pominięto automatyczną odpowiedź")
-				print("[Autoresponder] Pominięto automatyczną odpowiedź")
+				self._skip(msg_id, 'auto_submitted')
 				return
 			for header in ['X-Autoreply', 'X-Autorespond', 'Precedence', 'X-Precedence']:
 				value = msg.get(header)
 				if value:
-					logger.info(f"Pominięto wiadomość z nagłówkiem {header}")
-					print(f"[Autoresponder] Pominięto {header}")
+					self._skip(msg_id, header)
 					return
 			if subject.lower().startswith('re:') or subject.lower().startswith('fwd:'):
-				logger.info("Pominięto wiadomość z Re:/Fwd:")
-				print("[Autoresponder] Pominięto wiadomość z Re:/Fwd:")
+				self._skip(msg_id, 'reply_or_forward')
 				return
-			logger.info(f"Wysyłanie odpowiedzi: Re: {subject}")
-			print(f"[Autoresponder] Wysyłanie odpowiedzi: Re: {subject}")
 			self._send_response(from_addr, subject, msg.get('Message-ID', ''))
-			logger.info("Odpowiedź wysłana")
 			self.processed_ids.add(msg_id)
 		except Exception as e:
-			logger.error(f"Błąd przetwarzania {msg_id}: {e}")
-			print(f"[Autoresponder] BŁĄD przetwarzania {msg_id}: {e}")
-			import traceback
-			logger.error(traceback.format_exc())
+			self.log.exception("Błąd przetwarzania %s: %s", msg_id, e, extra={'event': 'message_error', 'msg_id': msg_id})
+
+	def _skip(self, msg_id, reason):
+		self.log.info("Pominięto %s", msg_id, extra={'event': 'message_skipped', 'msg_id': msg_id, 'reason': reason})
 
 	def _send_response(self, recipient, original_subject, message_id):
 		# Wysyłka odpowiedzi przez SMTP
 		try:
-			logger.info(f"Przygotowywanie odpowiedzi do {recipient}")
 			from main import send_email
 			subject = "Re: " + original_subject if original_subject else "Automatyczna odpowiedź"
-			logger.info(f"Temat odpowiedzi: {subject}")
 			response_text = f"{self.response_message}\n\n---\nAutomatyczna odpowiedź: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-			logger.info(f"Łączenie SMTP {self.smtp_server}:{self.smtp_port}")
-			print(f"[Autoresponder] SMTP: {self.smtp_server}:{self.smtp_port}")
-			send_email(self.smtp_server, self.smtp_port, self.username, self.password, recipient, subject, response_text)
-			logger.info(f"Odpowiedź do {recipient} wysłana")
-			print(f"[Autoresponder] Odpowiedź do {recipient} wysłana")
+			start = time.perf_counter()
+			send_email(self.smtp_server, self.smtp_port, self.username, self.password, recipient, subject, response_text, use_ssl=self.use_ssl)
+			self.log.info("Odpowiedź do %s wysłana", recipient,
+						  extra={'event': 'reply_sent', 'recipient': recipient, 'smtp_ms': round((time.perf_counter() - start) * 1000, 1)})
 		except Exception as e:
-			logger.error(f"Błąd wysyłania do {recipient}: {e}")
-			print(f"[Autoresponder] BŁĄD wysyłania do {recipient}: {e}")
-			import traceback
-			logger.error(traceback.format_exc())
+			self.log.exception("Błąd wysyłania do %s: %s", recipient, e, extra={'event': 'reply_failed', 'recipient': recipient})
 
 	def set_response_message(self, message):
 		self.response_message = message
-		logger.info("Treść odpowiedzi zaktualizowana")
-		print("[Autoresponder] Treść odpowiedzi zaktualizowana")
+		self.log.info("Treść odpowiedzi zaktualizowana", extra={'event': 'config'})
@@ -0,0 +1,131 @@
+import argparse
+import contextlib
+import io
+import logging
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from fake_mail_server import FakeMailServer, make_synthetic_message
+from mail_index import MailIndex
+from main import fetch_imap, fetch_pop3, get_email_body_imap, get_email_body_pop3, send_email
+
+# Benchmark stosu pocztowego (main.py, autoresponder.py) na lokalnym serwerze fake_mail_server.py.
+# Dla każdej operacji: mediana i p95 czasu, liczba komend protokołu i bajtów wysłanych przez serwer.
+
+USER = "user@localhost"
+PASSWORD = "haslo"
+
+
+def _measure(srv, protocol, func, repeats):
+    """Uruchamia func `repeats` razy (z wyciszonym stdout) i zwraca statystyki jednej operacji."""
+    timings = []
+    srv.stats.reset()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        timings.append(time.perf_counter() - start)
+    stats = srv.stats.as_dict()
+    timings.sort()
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        "commands": stats["commands"][protocol] / repeats,
+        "kb_sent": stats["bytes_sent"][protocol] / repeats / 1024,
+    }
+
+
+def _measure_autoreply(srv, repeats, poll_interval):
+    """Mierzy czas od dostarczenia wiadomości do wysłania automatycznej odpowiedzi."""
+    from autoresponder import Autoresponder
+    logging.disable(logging.CRITICAL)
+    responder = Autoresponder("127.0.0.1", srv.imap_port, "127.0.0.1", srv.smtp_port, USER, PASSWORD,
+                              "Jestem niedostępny", check_interval=poll_interval, use_ssl=False)
+    timings = []
+    srv.stats.reset()
+    with contextlib.redirect_stdout(io.StringIO()):
+        responder.start()
+        try:
+            for i in range(repeats):
+                replies = len(srv.mailbox.outbox)
+                start = time.perf_counter()
+                srv.mailbox.add(make_synthetic_message(10_000 + i, sender=f"klient{i}@example.com",
+                                                       date=datetime.now(timezone.utc)))
+                while len(srv.mailbox.outbox) == replies and time.perf_counter() - start < 30:
+                    time.sleep(0.002)
+                timings.append(time.perf_counter() - start)
+        finally:
+            responder.stop()
+    logging.disable(logging.NOTSET)
+    stats = srv.stats.as_dict()
+    timings.sort()
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        "commands": (stats["commands"]["imap"] + stats["commands"]["smtp"]) / repeats,
+        "kb_sent": (stats["bytes_sent"]["imap"] + stats["bytes_sent"]["smtp"]) / repeats / 1024,
+    }
+
+
+def run_benchmark(messages=1000, page_size=50, repeats=20, attachment_kb=0, poll_interval=0.2, large_attachment_mb=20):
+    """Uruchamia serwer z `messages` wiadomościami i zwraca słownik {operacja: statystyki}."""
+    results = {}
+    with FakeMailServer(messages=messages, attachment_size=attachment_kb * 1024, deliver=False) as srv:
+        host = "127.0.0.1"
+        last = len(srv.mailbox.messages)
+        results["imap_list"] = _measure(srv, "imap", lambda: fetch_imap(
+            host, srv.imap_port, USER, PASSWORD, page_size, use_ssl=False), repeats)
+        results["pop3_list"] = _measure(srv, "pop3", lambda: fetch_pop3(
+            host, srv.pop3_port, USER, PASSWORD, page_size, use_ssl=False), repeats)
+        results["imap_open"] = _measure(srv, "imap", lambda: get_email_body_imap(
+            host, srv.imap_port, USER, PASSWORD, str(last), use_ssl=False), repeats)
+        results["pop3_open"] = _measure(srv, "pop3", lambda: get_email_body_pop3(
+            host, srv.pop3_port, USER, PASSWORD, last, use_ssl=False), repeats)
+        results["smtp_send"] = _measure(srv, "smtp", lambda: send_email(
+            host, srv.smtp_port, USER, PASSWORD, "odbiorca@example.com", "Test", "Treść testowa",
+            use_ssl=False), repeats)
+        if large_attachment_mb:
+            # Otwarcie wiadomości z dużym załącznikiem – powinna zostać przesłana tylko część tekstowa
+            large = srv.mailbox.add(make_synthetic_message(len(srv.mailbox.messages) + 1,
+                                                           attachment_size=large_attachment_mb * 1024 * 1024),
+                                    flags={"\\Seen"})
+            results["imap_open_large"] = _measure(srv, "imap", lambda: get_email_body_imap(
+                host, srv.imap_port, USER, PASSWORD, str(large.uid), use_ssl=False), max(3, repeats // 4))
+        with tempfile.TemporaryDirectory() as tmp:
+            # Indeks FTS5: pełna synchronizacja (jednorazowo) i wyszukiwanie w pamięci podręcznej
+            index = MailIndex(os.path.join(tmp, "index.db"))
+            results["index_sync"] = _measure(srv, "imap", lambda: index.sync(
+                host, srv.imap_port, USER, PASSWORD, use_ssl=False), 1)
+            results["index_search"] = _measure(srv, "imap", lambda: index.search("raport termin"), repeats)
+            index.close()
+        results["autoreply"] = _measure_autoreply(srv, max(3, repeats // 4), poll_interval)
+    return results
+
+
+def print_results(results):
+    print(f"{'operacja':<16} {'mediana ms':>11} {'p95 ms':>9} {'komendy':>9} {'KB z serwera':>13}")
+    for name, r in results.items():
+        print(f"{name:<16} {r['median_ms']:>11.2f} {r['p95_ms']:>9.2f} {r['commands']:>9.1f} {r['kb_sent']:>13.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark klienta poczty na lokalnym serwerze testowym")
+    parser.add_argument("--messages", type=int, default=1000, help="liczba wiadomości w skrzynce")
+    parser.add_argument("--page-size", type=int, default=50, help="liczba pobieranych tematów")
+    parser.add_argument("--repeats", type=int, default=20, help="liczba powtórzeń każdej operacji")
+    parser.add_argument("--attachment-kb", type=int, default=0, help="rozmiar załącznika w każdej wiadomości (KB)")
+    parser.add_argument("--large-attachment-mb", type=int, default=20,
+                        help="rozmiar załącznika wiadomości do testu imap_open_large (0 – pomiń)")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="check_interval autorespondera (s)")
+    args = parser.parse_args()
+    print(f"Wiadomości: {args.messages}, strona: {args.page_size}, powtórzenia: {args.repeats}, "
+          f"załącznik: {args.attachment_kb} KB")
+    print_results(run_benchmark(args.messages, args.page_size, args.repeats, args.attachment_kb, args.poll_interval,
+                                args.large_attachment_mb))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,766 @@
+import argparse
+import base64
+import email
+import os
+import re
+import socket
+import socketserver
+import ssl
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+# Lokalny, uproszczony serwer IMAP / POP3 / SMTP do testów i benchmarków klienta poczty.
+# Obsługuje tylko podzbiór protokołów używany przez main.py i autoresponder.py.
+
+SYNTHETIC_WORDS = [
+    "spotkanie", "raport", "faktura", "projekt", "termin", "zadanie", "oferta", "umowa",
+    "prezentacja", "budżet", "kolokwium", "laboratorium", "wyniki", "harmonogram", "serwer",
+    "poczta", "kopia", "wniosek", "zamówienie", "przypomnienie", "great", "thanks", "problem",
+]
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def make_synthetic_message(index, sender=None, recipient="user@localhost", date=None, attachment_size=0, body_lines=5):
+    """Buduje syntetyczną wiadomość (bajty RFC 822) z opcjonalnym załącznikiem o zadanym rozmiarze."""
+    sender = sender or f"nadawca{index % 50}@example.com"
+    date = date or datetime.now(timezone.utc)
+    words = [SYNTHETIC_WORDS[(index * 7 + k) % len(SYNTHETIC_WORDS)] for k in range(4)]
+    subject = f"Wiadomość {index}: {' '.join(words[:2])}"
+    body = "\r\n".join(
+        f"Linia {line} wiadomości {index}: {' '.join(words)}" for line in range(body_lines)
+    )
+    encoded_subject = "=?utf-8?b?" + base64.b64encode(subject.encode("utf-8")).decode("ascii") + "?="
+    headers = (
+        f"From: {sender}\r\n"
+        f"To: {recipient}\r\n"
+        f"Subject: {encoded_subject}\r\n"
+        f"Date: {format_datetime(date)}\r\n"
+        f"Message-ID: <synthetic-{index}@localhost>\r\n"
+        "MIME-Version: 1.0\r\n"
+    )
+    if not attachment_size:
+        return (headers +
+                "Content-Type: text/plain; charset=\"utf-8\"\r\n"
+                "Content-Transfer-Encoding: 8bit\r\n\r\n" + body + "\r\n").encode("utf-8")
+    boundary = f"==synthetic-{index}=="
+    payload = base64.encodebytes(os.urandom(attachment_size)).decode("ascii").replace("\n", "\r\n")
+    return (headers +
+            f"Content-Type: multipart/mixed; boundary=\"{boundary}\"\r\n\r\n"
+            f"--{boundary}\r\n"
+            "Content-Type: text/plain; charset=\"utf-8\"\r\n"
+            "Content-Transfer-Encoding: 8bit\r\n\r\n" + body + "\r\n"
+            f"--{boundary}\r\n"
+            "Content-Type: application/octet-stream; name=\"dane.bin\"\r\n"
+            "Content-Transfer-Encoding: base64\r\n"
+            "Content-Disposition: attachment; filename=\"dane.bin\"\r\n\r\n" + payload +
+            f"--{boundary}--\r\n").encode("utf-8")
+
+
+class StoredMessage:
+    """Wiadomość w skrzynce serwera wraz z flagami i leniwie parsowaną strukturą."""
+    def __init__(self, uid, raw, flags=None, internaldate=None):
+        self.uid = uid
+        self.raw = raw
+        self.flags = set(flags or [])
+        self._parsed = None
+        self._search_text = None
+        if internaldate is None:
+            try:
+                internaldate = parsedate_to_datetime(self.header_value("Date"))
+            except Exception:
+                internaldate = None
+        self.internaldate = internaldate or datetime.now(timezone.utc)
+
+    @property
+    def parsed(self):
+        if self._parsed is None:
+            self._parsed = email.message_from_bytes(self.raw)
+        return self._parsed
+
+    def header_block(self):
+        end = self.raw.find(b"\r\n\r\n")
+        return self.raw if end < 0 else self.raw[:end + 2]
+
+    def text_block(self):
+        end = self.raw.find(b"\r\n\r\n")
+        return b"" if end < 0 else self.raw[end + 4:]
+
+    def header_value(self, name):
+        for header_name, value in _split_headers(self.header_block()):
+            if header_name.lower() == name.lower():
+                return value.decode("utf-8", errors="replace").strip()
+        return ""
+
+    def search_text(self):
+        """Zdekodowane nagłówki i części tekstowe (małe litery) do wyszukiwania SEARCH TEXT/BODY."""
+        if self._search_text is None:
+            from email.header import decode_header, make_header
+            parts = []
+            for name in ("Subject", "From", "To"):
+                try:
+                    parts.append(str(make_header(decode_header(self.header_value(name)))))
+                except Exception:
+                    parts.append(self.header_value(name))
+            for part in self.parsed.walk():
+                if part.get_content_maintype() == "text":
+                    payload = part.get_payload(decode=True) or b""
+                    parts.append(payload.decode(part.get_content_charset() or "utf-8", errors="replace"))
+            self._search_text = "\n".join(parts).lower()
+        return self._search_text
+
+
+class Mailbox:
+    """Skrzynka INBOX współdzielona przez serwery IMAP, POP3 i SMTP."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = []
+        self.outbox = []
+        self.next_uid = 1
+
+    def add(self, raw, flags=None, internaldate=None):
+        with self.lock:
+            message = StoredMessage(self.next_uid, raw, flags, internaldate)
+            self.next_uid += 1
+            self.messages.append(message)
+            return message
+
+    def seed(self, count, attachment_size=0, start_date=None):
+        """Dodaje `count` syntetycznych wiadomości (najstarsze pierwsze)."""
+        start_date = start_date or datetime.now(timezone.utc) - timedelta(minutes=count)
+        for i in range(count):
+            self.add(make_synthetic_message(len(self.messages) + 1, date=start_date + timedelta(minutes=i),
+                                            attachment_size=attachment_size), flags={"\\Seen"})
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.messages)
+
+
+class ServerStats:
+    """Liczniki rund protokołu (komend) i przesłanych bajtów dla benchmarków."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.commands = {"imap": 0, "pop3": 0, "smtp": 0}
+            self.bytes_sent = {"imap": 0, "pop3": 0, "smtp": 0}
+            self.connections = {"imap": 0, "pop3": 0, "smtp": 0}
+
+    def count(self, protocol, commands=0, sent=0, connections=0):
+        with self.lock:
+            self.commands[protocol] += commands
+            self.bytes_sent[protocol] += sent
+            self.connections[protocol] += connections
+
+    def as_dict(self):
+        with self.lock:
+            return {"commands": dict(self.commands), "bytes_sent": dict(self.bytes_sent),
+                    "connections": dict(self.connections)}
+
+
+def _split_headers(header_bytes):
+    """Dzieli blok nagłówków na pary (nazwa, wartość) z obsługą linii kontynuacji."""
+    headers = []
+    for line in header_bytes.split(b"\r\n"):
+        if not line:
+            continue
+        if line[:1] in (b" ", b"\t") and headers:
+            name, value = headers[-1]
+            headers[-1] = (name, value + b"\r\n" + line)
+        elif b":" in line:
+            name, value = line.split(b":", 1)
+            headers.append((name.decode("ascii", errors="replace"), value))
+    return headers
+
+
+def _header_fields(message, names, negate=False):
+    wanted = {n.lower() for n in names}
+    lines = []
+    for name, value in _split_headers(message.header_block()):
+        if (name.lower() in wanted) != negate:
+            lines.append(name.encode("ascii") + b":" + value + b"\r\n")
+    return b"".join(lines) + b"\r\n"
+
+
+def _part_by_path(msg, path):
+    """Zwraca część MIME dla ścieżki sekcji IMAP (np. [1, 2])."""
+    part = msg
+    for number in path:
+        if part.is_multipart():
+            children = part.get_payload()
+            if not 1 <= number <= len(children):
+                return None
+            part = children[number - 1]
+        elif number != 1:
+            return None
+    return part
+
+
+def _raw_part_body(part):
+    payload = part.get_payload()
+    if isinstance(payload, list):
+        return part.as_bytes().split(b"\n\n", 1)[-1]
+    try:
+        return payload.encode("ascii", errors="surrogateescape")
+    except UnicodeEncodeError:
+        return payload.encode("utf-8", errors="surrogateescape")
+
+
+def _imap_string(value):
+    if value is None or value == "":
+        return "NIL"
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _bodystructure(part):
+    """Buduje odpowiedź BODYSTRUCTURE (RFC 3501) dla części MIME."""
+    if part.is_multipart():
+        children = "".join(_bodystructure(child) for child in part.get_payload())
+        boundary = part.get_param("boundary")
+        params = f"({_imap_string('boundary')} {_imap_string(boundary)})" if boundary else "NIL"
+        return f"({children} {_imap_string(part.get_content_subtype().upper())} {params} NIL NIL)"
+    maintype, subtype = part.get_content_maintype(), part.get_content_subtype()
+    params = [(k, v) for k, v in (part.get_params() or [])[1:]]
+    params_str = "(" + " ".join(f"{_imap_string(k.upper())} {_imap_string(v)}" for k, v in params) + ")" if params else "NIL"
+    encoding = (part.get("Content-Transfer-Encoding") or "7bit").upper()
+    body = _raw_part_body(part)
+    fields = (f"{_imap_string(maintype.upper())} {_imap_string(subtype.upper())} {params_str} "
+              f"{_imap_string(part.get('Content-ID'))} {_imap_string(part.get('Content-Description'))} "
+              f"{_imap_string(encoding)} {len(body)}")
+    if maintype == "text":
+        fields += " " + str(body.count(b"\n"))
+    disposition = part.get("Content-Disposition")
+    if disposition:
+        dsp_type = disposition.split(";")[0].strip()
+        dsp_params = part.get_params(header="Content-Disposition")[1:] if part.get_params(header="Content-Disposition") else []
+        dsp_params_str = "(" + " ".join(f"{_imap_string(k.upper())} {_imap_string(v)}" for k, v in dsp_params) + ")" if dsp_params else "NIL"
+        fields += f" NIL ({_imap_string(dsp_type.upper())} {dsp_params_str})"
+    return f"({fields})"
+
+
+def _parse_sequence_set(spec, maximum):
+    """Rozwija zbiór sekwencji IMAP (np. '1:5,7,10:*') do zbioru liczb."""
+    result = set()
+    for chunk in spec.split(","):
+        if ":" in chunk:
+            start, end = chunk.split(":", 1)
+            start = maximum if start == "*" else int(start)
+            end = maximum if end == "*" else int(end)
+            if start > end:
+                start, end = end, start
+            result.update(range(start, end + 1))
+        elif chunk:
+            result.add(maximum if chunk == "*" else int(chunk))
+    return result
+
+
+def _tokenize(text):
+    """Dzieli argumenty komendy IMAP na atomy, napisy w cudzysłowach i listy w nawiasach."""
+    tokens = []
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch.isspace():
+            i += 1
+        elif ch in "()":
+            tokens.append(ch)
+            i += 1
+        elif ch == '"':
+            j = i + 1
+            value = []
+            while j < len(text) and text[j] != '"':
+                if text[j] == "\\" and j + 1 < len(text):
+                    j += 1
+                value.append(text[j])
+                j += 1
+            tokens.append(("str", "".join(value)))
+            i = j + 1
+        else:
+            j = i
+            while j < len(text) and not text[j].isspace() and text[j] not in '()"':
+                j += 1
+            tokens.append(text[i:j])
+            i = j
+    return tokens
+
+
+def _token_value(token):
+    return token[1] if isinstance(token, tuple) else token
+
+
+def _parse_imap_date(value):
+    day, month, year = value.split("-")
+    return datetime(int(year), MONTHS.index(month.capitalize()) + 1, int(day), tzinfo=timezone.utc).date()
+
+
+def _build_search_predicate(tokens, maximum):
+    """Zamienia kryteria SEARCH na funkcję predykatu (message, seq) -> bool."""
+    def parse_key(pos):
+        token = tokens[pos]
+        if token == "(":
+            preds = []
+            pos += 1
+            while tokens[pos] != ")":
+                pred, pos = parse_key(pos)
+                preds.append(pred)
+            return (lambda m, s, preds=preds: all(p(m, s) for p in preds)), pos + 1
+        key = _token_value(token).upper()
+        if key == "ALL":
+            return (lambda m, s: True), pos + 1
+        if key == "SEEN":
+            return (lambda m, s: "\\Seen" in m.flags), pos + 1
+        if key == "UNSEEN":
+            return (lambda m, s: "\\Seen" not in m.flags), pos + 1
+        if key in ("SINCE", "BEFORE", "ON"):
+            day = _parse_imap_date(_token_value(tokens[pos + 1]))
+            if key == "SINCE":
+                return (lambda m, s: m.internaldate.date() >= day), pos + 2
+            if key == "BEFORE":
+                return (lambda m, s: m.internaldate.date() < day), pos + 2
+            return (lambda m, s: m.internaldate.date() == day), pos + 2
+        if key in ("SUBJECT", "FROM", "TO"):
+            needle = _token_value(tokens[pos + 1]).lower()
+            header = key.capitalize()
+            def match_header(m, s, needle=needle, header=header):
+                from email.header import decode_header, make_header
+                try:
+                    value = str(make_header(decode_header(m.header_value(header))))
+                except Exception:
+                    value = m.header_value(header)
+                return needle in value.lower()
+            return match_header, pos + 2
+        if key in ("TEXT", "BODY"):
+            needle = _token_value(tokens[pos + 1]).lower()
+            return (lambda m, s: needle in m.search_text()), pos + 2
+        if key == "UID":
+            uids = _parse_sequence_set(_token_value(tokens[pos + 1]), maximum["uid"])
+            return (lambda m, s: m.uid in uids), pos + 2
+        if key == "NOT":
+            inner, pos = parse_key(pos + 1)
+            return (lambda m, s: not inner(m, s)), pos
+        if key == "OR":
+            left, pos = parse_key(pos + 1)
+            right, pos = parse_key(pos)
+            return (lambda m, s: left(m, s) or right(m, s)), pos
+        if key == "CHARSET":
+            return (lambda m, s: True), pos + 2
+        if re.match(r"^[\d*:,]+$", key):
+            seqs = _parse_sequence_set(key, maximum["seq"])
+            return (lambda m, s: s in seqs), pos + 1
+        raise ValueError(f"nieobsługiwane kryterium {key}")
+
+    preds = []
+    pos = 0
+    while pos < len(tokens):
+        pred, pos = parse_key(pos)
+        preds.append(pred)
+    return lambda m, s: all(p(m, s) for p in preds)
+
+
+FETCH_ITEM_RE = re.compile(r"(BODY(?:\.PEEK)?)\[([^\]]*)\](?:<(\d+)\.(\d+)>)?|[A-Z0-9.]+")
+
+
+class _CountingHandler(socketserver.StreamRequestHandler):
+    protocol = None
+
+    def setup(self):
+        context = getattr(self.server, "ssl_context", None)
+        if context is not None and self.protocol in ("imap", "pop3"):
+            self.request = context.wrap_socket(self.request, server_side=True)
+            self.connection = self.request
+        super().setup()
+        # Bez algorytmu Nagle'a: odpowiedzi wysyłane w kilku zapisach nie czekają na opóźnione ACK klienta
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.stats.count(self.protocol, connections=1)
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.wfile.write(data)
+        self.server.stats.count(self.protocol, sent=len(data))
+
+    def readline(self):
+        line = self.rfile.readline(65536 + 2)
+        if not line:
+            return None
+        return line.rstrip(b"\r\n")
+
+
+class IMAPHandler(_CountingHandler):
+    """Obsługa sesji IMAP4rev1 (CAPABILITY, LOGIN, SELECT/EXAMINE, SEARCH, FETCH, UID, LOGOUT)."""
+    protocol = "imap"
+
+    def handle(self):
+        self.selected = False
+        self.readonly = False
+        self.send("* OK [CAPABILITY IMAP4rev1 LITERAL+] Fake IMAP gotowy\r\n")
+        while True:
+            command = self._read_command()
+            if command is None:
+                break
+            self.server.stats.count("imap", commands=1)
+            parts = command.split(" ", 2)
+            if len(parts) < 2:
+                self.send("* BAD pusta komenda\r\n")
+                continue
+            tag, name = parts[0], parts[1].upper()
+            args = parts[2] if len(parts) > 2 else ""
+            try:
+                if not self.dispatch(tag, name, args):
+                    break
+            except Exception as e:
+                self.send(f"{tag} BAD {e}\r\n")
+
+    def _read_command(self):
+        """Czyta komendę wraz z literałami {n}, zamieniając je na napisy w cudzysłowach."""
+        line = self.readline()
+        if line is None:
+            return None
+        text = ""
+        while True:
+            m = re.search(rb"\{(\d+)(\+?)\}$", line)
+            if not m:
+                return text + line.decode("utf-8", errors="replace")
+            text += line[:m.start()].decode("utf-8", errors="replace")
+            if not m.group(2):
+                self.send("+ gotowy\r\n")
+            literal = self.rfile.read(int(m.group(1))).decode("utf-8", errors="replace")
+            text += _imap_string(literal)
+            line = self.readline() or b""
+
+    def dispatch(self, tag, name, args):
+        if name == "CAPABILITY":
+            self.send("* CAPABILITY IMAP4rev1 LITERAL+\r\n" f"{tag} OK CAPABILITY zakończone\r\n")
+        elif name == "NOOP":
+            self.send(f"{tag} OK NOOP\r\n")
+        elif name == "LOGIN":
+            self.send(f"{tag} OK LOGIN zakończone\r\n")
+        elif name in ("SELECT", "EXAMINE"):
+            self.selected = True
+            self.readonly = name == "EXAMINE"
+            messages = self.server.mailbox.snapshot()
+            unseen = sum(1 for m in messages if "\\Seen" not in m.flags)
+            mode = "READ-ONLY" if self.readonly else "READ-WRITE"
+            self.send(f"* {len(messages)} EXISTS\r\n* 0 RECENT\r\n* OK [UNSEEN {unseen}]\r\n"
+                      f"* OK [UIDVALIDITY 1]\r\n* OK [UIDNEXT {self.server.mailbox.next_uid}]\r\n"
+                      "* FLAGS (\\Seen \\Answered \\Flagged \\Deleted \\Draft)\r\n"
+                      f"{tag} OK [{mode}] {name} zakończone\r\n")
+        elif name == "SEARCH":
+            self.search(tag, args, use_uid=False)
+        elif name == "FETCH":
+            seq_spec, items = args.split(" ", 1)
+            self.fetch(tag, seq_spec, items, use_uid=False)
+        elif name == "UID":
+            sub, rest = args.split(" ", 1)
+            sub = sub.upper()
+            if sub == "FETCH":
+                seq_spec, items = rest.split(" ", 1)
+                self.fetch(tag, seq_spec, items, use_uid=True)
+            elif sub == "SEARCH":
+                self.search(tag, rest, use_uid=True)
+            else:
+                self.send(f"{tag} BAD UID {sub} nieobsługiwane\r\n")
+        elif name == "CLOSE":
+            self.selected = False
+            self.send(f"{tag} OK CLOSE zakończone\r\n")
+        elif name == "LOGOUT":
+            self.send("* BYE Fake IMAP kończy\r\n" f"{tag} OK LOGOUT zakończone\r\n")
+            return False
+        else:
+            self.send(f"{tag} BAD {name} nieobsługiwane\r\n")
+        return True
+
+    def search(self, tag, args, use_uid):
+        messages = self.server.mailbox.snapshot()
+        maximum = {"seq": len(messages), "uid": messages[-1].uid if messages else 0}
+        predicate = _build_search_predicate(_tokenize(args), maximum)
+        hits = [str(m.uid if use_uid else seq) for seq, m in enumerate(messages, 1) if predicate(m, seq)]
+        self.send("* SEARCH" + "".join(" " + hit for hit in hits) + f"\r\n{tag} OK SEARCH zakończone\r\n")
+
+    def fetch(self, tag, seq_spec, items, use_uid):
+        messages = self.server.mailbox.snapshot()
+        if use_uid:
+            wanted = _parse_sequence_set(seq_spec, messages[-1].uid if messages else 0)
+            selected = [(seq, m) for seq, m in enumerate(messages, 1) if m.uid in wanted]
+        else:
+            wanted = _parse_sequence_set(seq_spec, len(messages))
+            selected = [(seq, messages[seq - 1]) for seq in sorted(wanted) if 1 <= seq <= len(messages)]
+        items = items.strip()
+        if items.startswith("(") and items.endswith(")"):
+            items = items[1:-1]
+        requested = [m for m in FETCH_ITEM_RE.finditer(items.upper())]
+        for seq, message in selected:
+            chunks = []
+            if use_uid and not any(r.group(0) == "UID" for r in requested):
+                chunks.append(f"UID {message.uid}".encode())
+            for item in requested:
+                chunks.append(self._fetch_item(message, item))
+            self.send(f"* {seq} FETCH (".encode() + b" ".join(chunks) + b")\r\n")
+        self.send(f"{tag} OK FETCH zakończone\r\n")
+
+    def _fetch_item(self, message, item):
+        name = item.group(0)
+        if item.group(1):
+            section = item.group(2)
+            data = self._section(message, section)
+            if item.group(3) is not None:
+                origin, octets = int(item.group(3)), int(item.group(4))
+                data = data[origin:origin + octets]
+                label = f"BODY[{section}]<{origin}>"
+            else:
+                label = f"BODY[{section}]"
+            if item.group(1) == "BODY":
+                self._mark_seen(message)
+            return label.encode() + f" {{{len(data)}}}\r\n".encode() + data
+        if name == "UID":
+            return f"UID {message.uid}".encode()
+        if name == "FLAGS":
+            return f"FLAGS ({' '.join(sorted(message.flags))})".encode()
+        if name in ("RFC822", "RFC822.PEEK"):
+            if name == "RFC822":
+                self._mark_seen(message)
+            return f"RFC822 {{{len(message.raw)}}}\r\n".encode() + message.raw
+        if name == "RFC822.HEADER":
+            header = message.header_block() + b"\r\n"
+            return f"RFC822.HEADER {{{len(header)}}}\r\n".encode() + header
+        if name == "RFC822.SIZE":
+            return f"RFC822.SIZE {len(message.raw)}".encode()
+        if name == "INTERNALDATE":
+            stamp = message.internaldate.strftime("%d-") + MONTHS[message.internaldate.month - 1] + message.internaldate.strftime("-%Y %H:%M:%S +0000")
+            return f'INTERNALDATE "{stamp}"'.encode()
+        if name in ("BODYSTRUCTURE", "BODY"):
+            return f"{name} {_bodystructure(message.parsed)}".encode()
+        raise ValueError(f"nieobsługiwany element FETCH {name}")
+
+    def _section(self, message, section):
+        if section == "":
+            return message.raw
+        if section == "HEADER":
+            return message.header_block() + b"\r\n"
+        if section == "TEXT":
+            return message.text_block()
+        m = re.match(r"HEADER\.FIELDS(\.NOT)?\s*\(([^)]*)\)", section)
+        if m:
+            return _header_fields(message, m.group(2).split(), negate=bool(m.group(1)))
+        m = re.match(r"^([\d.]+?)(?:\.(MIME|HEADER|TEXT))?$", section)
+        if m:
+            part = _part_by_path(message.parsed, [int(n) for n in m.group(1).split(".")])
+            if part is None:
+                return b""
+            if m.group(2) in ("MIME", "HEADER"):
+                return "".join(f"{k}: {v}\r\n" for k, v in part.items()).encode("utf-8") + b"\r\n"
+            return _raw_part_body(part)
+        raise ValueError(f"nieobsługiwana sekcja {section}")
+
+    def _mark_seen(self, message):
+        if self.selected and not self.readonly:
+            message.flags.add("\\Seen")
+
+
+class POP3Handler(_CountingHandler):
+    """Obsługa sesji POP3 (USER, PASS, STAT, LIST, UIDL, RETR, TOP, NOOP, QUIT)."""
+    protocol = "pop3"
+
+    def handle(self):
+        self.send("+OK Fake POP3 gotowy\r\n")
+        messages = self.server.mailbox.snapshot()
+        while True:
+            line = self.readline()
+            if line is None:
+                break
+            self.server.stats.count("pop3", commands=1)
+            parts = line.decode("utf-8", errors="replace").split()
+            if not parts:
+                continue
+            name, args = parts[0].upper(), parts[1:]
+            if name in ("USER", "PASS", "NOOP", "RSET"):
+                self.send("+OK\r\n")
+            elif name == "STAT":
+                self.send(f"+OK {len(messages)} {sum(len(m.raw) for m in messages)}\r\n")
+            elif name in ("LIST", "UIDL"):
+                if args:
+                    index = int(args[0])
+                    value = len(messages[index - 1].raw) if name == "LIST" else messages[index - 1].uid
+                    self.send(f"+OK {index} {value}\r\n")
+                else:
+                    lines = [f"{i} {len(m.raw) if name == 'LIST' else m.uid}" for i, m in enumerate(messages, 1)]
+                    self.send(f"+OK {len(messages)} wiadomości\r\n" + "".join(l + "\r\n" for l in lines) + ".\r\n")
+            elif name in ("RETR", "TOP"):
+                index = int(args[0])
+                if not 1 <= index <= len(messages):
+                    self.send("-ERR brak wiadomości\r\n")
+                    continue
+                raw = messages[index - 1].raw
+                if name == "TOP":
+                    header, _, body = raw.partition(b"\r\n\r\n")
+                    body_lines = body.split(b"\r\n")[:int(args[1]) if len(args) > 1 else 0]
+                    raw = header + b"\r\n\r\n" + b"\r\n".join(body_lines)
+                stuffed = b"\r\n".join(b"." + l if l.startswith(b".") else l for l in raw.split(b"\r\n"))
+                self.send(f"+OK {len(raw)} octets\r\n".encode() + stuffed + b"\r\n.\r\n")
+            elif name == "QUIT":
+                self.send("+OK do widzenia\r\n")
+                break
+            else:
+                self.send("-ERR nieobsługiwana komenda\r\n")
+
+
+class SMTPHandler(_CountingHandler):
+    """Obsługa sesji SMTP/ESMTP (EHLO, STARTTLS, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, QUIT)."""
+    protocol = "smtp"
+
+    def handle(self):
+        self.send("220 localhost Fake SMTP gotowy\r\n")
+        mail_from, recipients = None, []
+        while True:
+            line = self.readline()
+            if line is None:
+                break
+            self.server.stats.count("smtp", commands=1)
+            text = line.decode("utf-8", errors="replace")
+            name = text.split(" ", 1)[0].upper()
+            if name in ("EHLO", "HELO"):
+                extensions = ["localhost", "AUTH PLAIN LOGIN", "8BITMIME", "SIZE 52428800"]
+                if getattr(self.server, "ssl_context", None) is not None and not isinstance(self.connection, ssl.SSLSocket):
+                    extensions.append("STARTTLS")
+                self.send("".join(f"250-{e}\r\n" for e in extensions[:-1]) + f"250 {extensions[-1]}\r\n")
+            elif name == "STARTTLS":
+                self.send("220 Rozpocznij TLS\r\n")
+                self.wfile.flush()
+                self.request = self.server.ssl_context.wrap_socket(self.request, server_side=True)
+                self.connection = self.request
+                self.rfile = self.connection.makefile("rb", self.rbufsize)
+                self.wfile = socketserver._SocketWriter(self.connection)
+            elif name == "AUTH":
+                mechanism = text.split()[1].upper()
+                if mechanism == "LOGIN":
+                    self.send("334 VXNlcm5hbWU6\r\n")
+                    self.readline()
+                    self.send("334 UGFzc3dvcmQ6\r\n")
+                    self.readline()
+                elif len(text.split()) < 3:
+                    self.send("334 \r\n")
+                    self.readline()
+                self.send("235 2.7.0 Uwierzytelniono\r\n")
+            elif name == "MAIL":
+                mail_from, recipients = text.split(":", 1)[1].strip(), []
+                self.send("250 OK\r\n")
+            elif name == "RCPT":
+                recipients.append(text.split(":", 1)[1].strip())
+                self.send("250 OK\r\n")
+            elif name == "DATA":
+                self.send("354 Zakończ kropką w osobnej linii\r\n")
+                lines = []
+                while True:
+                    data_line = self.readline()
+                    if data_line is None or data_line == b".":
+                        break
+                    lines.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                raw = b"\r\n".join(lines) + b"\r\n"
+                self.server.mailbox.outbox.append({"from": mail_from, "to": recipients, "raw": raw, "time": time.time()})
+                if self.server.deliver:
+                    self.server.mailbox.add(raw)
+                self.send("250 OK przyjęto\r\n")
+            elif name in ("RSET", "NOOP"):
+                self.send("250 OK\r\n")
+            elif name == "QUIT":
+                self.send("221 Do widzenia\r\n")
+                break
+            else:
+                self.send("502 Nieobsługiwana komenda\r\n")
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeMailServer:
+    """Trzy serwery (IMAP, POP3, SMTP) na localhost współdzielące jedną skrzynkę.
+
+    Użycie:
+        with FakeMailServer(messages=1000) as srv:
+            fetch_imap("127.0.0.1", srv.imap_port, "user", "pass", use_ssl=False)
+    """
+    def __init__(self, messages=0, attachment_size=0, host="127.0.0.1", imap_port=0, pop3_port=0, smtp_port=0,
+                 certfile=None, keyfile=None, deliver=True):
+        self.host = host
+        self.mailbox = Mailbox()
+        self.stats = ServerStats()
+        self.ssl_context = None
+        if certfile:
+            self.ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.ssl_context.load_cert_chain(certfile, keyfile)
+        self._servers = {}
+        self._threads = []
+        for protocol, handler, port in (("imap", IMAPHandler, imap_port), ("pop3", POP3Handler, pop3_port),
+                                        ("smtp", SMTPHandler, smtp_port)):
+            server = _ThreadingServer((host, port), handler)
+            server.mailbox = self.mailbox
+            server.stats = self.stats
+            server.ssl_context = self.ssl_context
+            server.deliver = deliver
+            self._servers[protocol] = server
+        if messages:
+            self.mailbox.seed(messages, attachment_size=attachment_size)
+
+    @property
+    def imap_port(self):
+        return self._servers["imap"].server_address[1]
+
+    @property
+    def pop3_port(self):
+        return self._servers["pop3"].server_address[1]
+
+    @property
+    def smtp_port(self):
+        return self._servers["smtp"].server_address[1]
+
+    def start(self):
+        for server in self._servers.values():
+            thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in self._servers.values():
+            server.shutdown()
+            server.server_close()
+        self._threads = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokalny serwer IMAP/POP3/SMTP do testów klienta poczty")
+    parser.add_argument("--messages", type=int, default=100, help="liczba syntetycznych wiadomości w skrzynce")
+    parser.add_argument("--attachment-kb", type=int, default=0, help="rozmiar załącznika każdej wiadomości (KB)")
+    parser.add_argument("--imap-port", type=int, default=1143)
+    parser.add_argument("--pop3-port", type=int, default=1110)
+    parser.add_argument("--smtp-port", type=int, default=1025)
+    parser.add_argument("--certfile", help="certyfikat PEM – włącza IMAPS/POP3S i STARTTLS")
+    parser.add_argument("--keyfile", help="klucz prywatny PEM dla --certfile")
+    args = parser.parse_args()
+    srv = FakeMailServer(args.messages, args.attachment_kb * 1024, imap_port=args.imap_port, pop3_port=args.pop3_port,
+                         smtp_port=args.smtp_port, certfile=args.certfile, keyfile=args.keyfile)
+    srv.start()
+    print(f"IMAP: {srv.host}:{srv.imap_port}, POP3: {srv.host}:{srv.pop3_port}, SMTP: {srv.host}:{srv.smtp_port}"
+          f" ({'TLS' if srv.ssl_context else 'bez szyfrowania'}), wiadomości: {len(srv.mailbox.messages)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        srv.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,57 @@
 import sys
 import os
+from PyQt5.QtCore import QThread, pyqtSignal
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QFormLayout, QComboBox, QLineEdit, QTextEdit, QPushButton, QMessageBox, QListWidget, QListWidgetItem, QDialog, QDialogButtonBox, QLabel, QScrollArea, QFileDialog, QHBoxLayout, QTabWidget, QCheckBox, QTableWidget, QTableWidgetItem, QSplitter
 from main import send_email, fetch_pop3, fetch_imap, get_email_body_pop3, get_email_body_imap
 from autoresponder import Autoresponder
+from mail_index import MailIndex, default_index_path
 from textblob import TextBlob
 
+
+class SearchWorker(QThread):
+    # Wyszukiwanie poza wątkiem GUI: najpierw wyniki z pamięci podręcznej, potem synchronizacja indeksu
+    # (pierwsza dla dużej skrzynki trwa długo) i odświeżenie wyników, gdy doszły nowe wiadomości
+    progress = pyqtSignal(int, int)
+    found = pyqtSignal(list, int)
+    failed = pyqtSignal(str)
+    sync_failed = pyqtSignal(str)
+
+    def __init__(self, mail_index, text, settings, remote):
+        super().__init__()
+        self.mail_index = mail_index
+        self.text = text
+        self.settings = settings
+        self.remote = remote
+
+    def run(self):
+        s = self.settings
+        try:
+            hits = self.mail_index.search(self.text)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.found.emit(hits, 0)
+        added, remote_hits = 0, []
+        try:
+            # Dociągnięcie do indeksu tylko wiadomości nowszych niż ostatnio zindeksowana; brak sieci lub
+            # błędne logowanie nie ukrywają wyników z pamięci podręcznej
+            added = self.mail_index.sync(s["server"], s["port"], s["username"], s["password"],
+                                         progress=self.progress.emit)
+            if self.remote:
+                remote_hits = self.mail_index.search_remote(self.text, s["server"], s["port"], s["username"],
+                                                            s["password"])
+        except Exception as e:
+            self.sync_failed.emit(str(e))
+        if not added and not remote_hits:
+            return
+        try:
+            if added:
+                hits = self.mail_index.search(self.text)
+            self.found.emit(hits + remote_hits, added)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -13,6 +60,8 @@ class MainWindow(QMainWindow):
         self.current_settings = {}
         self.attachments = []
         self.autoresponder = None
+        self.mail_index = None
+        self.search_worker = None
 
     def _init_ui(self):
         # Podstawowa konfiguracja GUI
@@ -81,6 +130,18 @@ class MainWindow(QMainWindow):
         self.submit_btn = QPushButton("Wykonaj")
         self.submit_btn.clicked.connect(self.process_mail)
         mail_layout.addWidget(self.submit_btn)
+        # Wyszukiwanie pełnotekstowe w lokalnym indeksie (IMAP)
+        search_layout = QHBoxLayout()
+        self.search_le = QLineEdit()
+        self.search_le.setPlaceholderText("Szukaj w temacie, nadawcy i treści...")
+        self.search_le.returnPressed.connect(self.search_mail)
+        self.search_remote_cb = QCheckBox("Także na serwerze")
+        self.search_btn = QPushButton("Szukaj")
+        self.search_btn.clicked.connect(self.search_mail)
+        search_layout.addWidget(self.search_le)
+        search_layout.addWidget(self.search_remote_cb)
+        search_layout.addWidget(self.search_btn)
+        mail_layout.addLayout(search_layout)
         self.mail_list = QTableWidget()
         self.mail_list.setColumnCount(2)
         self.mail_list.setHorizontalHeaderLabels(["Temat", "Sentyment"])
@@ -229,13 +290,18 @@ class MainWindow(QMainWindow):
         if not item:
             return
         msg_id = item.data(256)
+        search_source = item.data(257)
         protocol = self.current_settings.get("protocol")
         server = self.current_settings.get("server")
         port = self.current_settings.get("port")
         username = self.current_settings.get("username")
         password = self.current_settings.get("password")
         try:
-            if protocol == "pop3":
+            if search_source == "cache":
+                full_message = self.mail_index.get_body(msg_id) or ""
+            elif search_source == "imap":
+                full_message = get_email_body_imap(server, port, username, password, str(msg_id), by_uid=True)
+            elif protocol == "pop3":
                 full_message = get_email_body_pop3(server, port, username, password, int(msg_id))
             elif protocol == "imap":
                 full_message = get_email_body_imap(server, port, username, password, msg_id)
@@ -258,6 +324,71 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "Błąd", f"Nie można pobrać treści: {e}")
 
+    def search_mail(self):
+        text = self.search_le.text().strip()
+        if not text:
+            return
+        username = self.username_le.text().strip()
+        password = self.password_le.text().strip()
+        server = self.server_le.text().strip()
+        if self.protocol_cb.currentText() != 'imap':
+            QMessageBox.warning(self, "Błąd", "Wyszukiwanie wymaga protokołu IMAP.")
+            return
+        try:
+            port = int(self.port_le.text().strip())
+        except ValueError:
+            QMessageBox.warning(self, "Błąd", "Port musi być liczbą.")
+            return
+        if self.search_worker is not None and self.search_worker.isRunning():
+            return
+        self.current_settings = {"protocol": "imap", "server": server, "port": port, "username": username, "password": password}
+        try:
+            path = default_index_path(username, server)
+            if self.mail_index is None or self.mail_index.path != path:
+                if self.mail_index is not None:
+                    self.mail_index.close()
+                self.mail_index = MailIndex(path)
+        except Exception as e:
+            QMessageBox.critical(self, "Błąd", f"Błąd wyszukiwania: {e}")
+            return
+        self.search_btn.setEnabled(False)
+        self.output_te.append(f"Wyszukiwanie „{text}”...")
+        self.search_worker = SearchWorker(self.mail_index, text, self.current_settings, self.search_remote_cb.isChecked())
+        self.search_worker.progress.connect(self.on_index_progress)
+        self.search_worker.found.connect(lambda hits, added: self.show_search_results(text, hits, added))
+        self.search_worker.failed.connect(self.on_search_failed)
+        self.search_worker.sync_failed.connect(self.on_index_sync_failed)
+        self.search_worker.finished.connect(lambda: self.search_btn.setEnabled(True))
+        self.search_worker.start()
+
+    def on_index_progress(self, done, total):
+        self.output_te.append(f"Indeksowanie: {done}/{total}")
+
+    def on_search_failed(self, error):
+        QMessageBox.critical(self, "Błąd", f"Błąd wyszukiwania: {error}")
+
+    def on_index_sync_failed(self, error):
+        self.output_te.append(f"Nie udało się zsynchronizować indeksu ({error}) – pokazano wyniki z pamięci podręcznej.")
+
+    def show_search_results(self, text, hits, added):
+        if added:
+            self.output_te.append(f"Zindeksowano {added} nowych wiadomości.")
+        self.mail_list.setRowCount(0)
+        for hit in hits:
+            blob = TextBlob(hit["subject"])
+            polarity = blob.sentiment.polarity
+            sentiment = "Pozytywny" if polarity > 0.1 else "Negatywny" if polarity < -0.1 else "Neutralny"
+            row_position = self.mail_list.rowCount()
+            self.mail_list.insertRow(row_position)
+            subject_item = QTableWidgetItem(f"{hit['uid']}: {hit['subject']}")
+            subject_item.setData(256, hit["uid"])
+            subject_item.setData(257, hit["source"])
+            subject_item.setToolTip(f"{hit['sender']}\n{hit['snippet']}")
+            sentiment_item = QTableWidgetItem(sentiment)
+            self.mail_list.setItem(row_position, 0, subject_item)
+            self.mail_list.setItem(row_position, 1, sentiment_item)
+        self.output_te.append(f"Znaleziono {len(hits)} wiadomości dla „{text}”.")
+
     def copy_to_clipboard(self, text):
         clipboard = QApplication.clipboard()
         clipboard.setText(text)
@@ -0,0 +1,115 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+# Asynchroniczne logowanie: wątki robocze tylko wkładają rekordy do kolejki (QueueHandler),
+# a zapis do pliku z rotacją i na konsolę wykonuje osobny wątek QueueListener.
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Atrybuty, które LogRecord ma zawsze – wszystko poza nimi traktujemy jako pola zdarzenia
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listeners = {}
+_setup_lock = threading.Lock()
+
+
+class StructuredFormatter(logging.Formatter):
+    """Dopisuje do komunikatu pola zdarzenia przekazane w `extra` w postaci klucz=wartość."""
+    def format(self, record):
+        text = super().format(record)
+        fields = [(k, v) for k, v in record.__dict__.items() if k not in _RECORD_ATTRS and not k.startswith('_')]
+        if fields:
+            text += ' | ' + ' '.join(f'{k}={v}' for k, v in fields)
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """Przepuszcza powtarzalne zdarzenia (np. "poll_empty") najwyżej raz na `interval` sekund
+    dla danego konta; liczbę pominiętych rekordów dopisuje do następnego przepuszczonego."""
+    def __init__(self, events, interval=60.0):
+        super().__init__()
+        self.events = set(events)
+        self.interval = interval
+        self._last = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        if event not in self.events:
+            return True
+        key = (event, getattr(record, 'account', None))
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now - last < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            self._last[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class EventAdapter(logging.LoggerAdapter):
+    """LoggerAdapter łączący stałe pola (np. konto) z polami `extra` pojedynczego wywołania."""
+    def process(self, msg, kwargs):
+        kwargs['extra'] = {**self.extra, **kwargs.get('extra', {})}
+        return msg, kwargs
+
+
+def setup_logging(name, filename=None, level=logging.INFO, console=True, max_bytes=1_000_000, backup_count=5,
+                  sampled_events=(), sample_interval=60.0, queue_size=10000):
+    """Konfiguruje (jednokrotnie) logger `name` z kolejką i wątkiem zapisującym. Zwraca logger."""
+    logger = logging.getLogger(name)
+    with _setup_lock:
+        if name in _listeners:
+            return logger
+        handlers = []
+        formatter = StructuredFormatter(DEFAULT_FORMAT)
+        if filename:
+            file_handler = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                                                encoding='utf-8', delay=True)
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        if console:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(formatter)
+            handlers.append(console_handler)
+        log_queue = queue.Queue(queue_size)
+        queue_handler = _DroppingQueueHandler(log_queue)
+        if sampled_events:
+            queue_handler.addFilter(SamplingFilter(sampled_events, sample_interval))
+        logger.addHandler(queue_handler)
+        logger.setLevel(level)
+        logger.propagate = False
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners[name] = listener
+    return logger
+
+
+def shutdown_logging():
+    """Zatrzymuje wątki zapisujące, opróżniając kolejki (wywoływane też przy wyjściu z programu)."""
+    with _setup_lock:
+        for listener in _listeners.values():
+            listener.stop()
+        _listeners.clear()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, który przy przepełnionej kolejce odrzuca rekord zamiast blokować wątek roboczy."""
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+atexit.register(shutdown_logging)
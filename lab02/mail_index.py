@@ -0,0 +1,236 @@
+import re
+import sqlite3
+import threading
+import email.utils
+from main import connect_imap, decode_subject, decode_section, parse_bodystructure, find_text_part
+
+# Lokalny indeks pełnotekstowy (SQLite FTS5) nad pamięcią podręczną wiadomości IMAP.
+# Synchronizacja przyrostowa po UID (tylko nowe wiadomości, pobierane paczkami),
+# wyszukiwanie w temacie, nadawcy i treści z rankingiem bm25, a dla zakresów spoza
+# pamięci podręcznej – zapasowe UID SEARCH po stronie serwera.
+
+INDEXED_BODY_BYTES = 65536  # z dużych treści indeksujemy tylko początek
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    uid INTEGER PRIMARY KEY,
+    subject TEXT,
+    sender TEXT,
+    date TEXT,
+    body TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    subject, sender, body, content='messages', content_rowid='uid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, subject, sender, body) VALUES (new.uid, new.subject, new.sender, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, subject, sender, body) VALUES ('delete', old.uid, old.subject, old.sender, old.body);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, subject, sender, body) VALUES ('delete', old.uid, old.subject, old.sender, old.body);
+    INSERT INTO messages_fts(rowid, subject, sender, body) VALUES (new.uid, new.subject, new.sender, new.body);
+END;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def default_index_path(username, server):
+    # Jeden plik indeksu na konto i serwer
+    safe = re.sub(r'[^\w.@-]', '_', f"{username}_{server}")
+    return f"mail_index_{safe}.db"
+
+
+def fts_query(text):
+    # Zamiana tekstu z pola wyszukiwania na zapytanie FTS5: każde słowo jako prefiks, wszystkie wymagane
+    words = re.findall(r'\w+', text, re.UNICODE)
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def _group_fetch_response(data):
+    # Podział odpowiedzi UID FETCH dla wielu wiadomości na (uid, elementy jednej wiadomości)
+    groups = []
+    for item in data:
+        head = item[0] if isinstance(item, tuple) else item
+        if not head:
+            continue
+        if re.match(rb'^\d+ \(', head):
+            groups.append([item])
+        elif groups:
+            groups[-1].append(item)
+    result = []
+    for items in groups:
+        text = b" ".join(i[0] if isinstance(i, tuple) else i for i in items)
+        m = re.search(rb'UID (\d+)', text)
+        if m:
+            result.append((int(m.group(1)), items))
+    return result
+
+
+def _literal(items, marker):
+    # Literał (treść {n}) z elementu odpowiedzi, którego nagłówek zawiera `marker`
+    for item in items:
+        if isinstance(item, tuple) and marker in item[0]:
+            return item[1]
+    return b""
+
+
+class MailIndex:
+    """Pamięć podręczna wiadomości i indeks FTS5 dla jednej skrzynki IMAP."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _meta(self, key, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, str(value)))
+
+    def cached_range(self):
+        # Zakres UID obecnych w pamięci podręcznej: (najmniejszy, największy) lub None
+        row = self.db.execute("SELECT MIN(uid), MAX(uid), COUNT(*) FROM messages").fetchone()
+        return (row[0], row[1]) if row[2] else None
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def sync(self, imap_server, imap_port, username, password, use_ssl=True, batch_size=200, max_messages=None,
+             progress=None):
+        """Dopisuje do indeksu wiadomości o UID większym niż ostatnio zindeksowany.
+        `max_messages` ogranicza pierwszą synchronizację do najnowszych wiadomości. Zwraca liczbę dodanych."""
+        with connect_imap(imap_server, imap_port, use_ssl) as mail:
+            mail.login(username, password)
+            mail.select('inbox', readonly=True)
+            uidvalidity = (mail.response('UIDVALIDITY')[1] or [b''])[0]
+            uidvalidity = uidvalidity.decode() if isinstance(uidvalidity, bytes) else str(uidvalidity or '')
+            with self.lock:
+                if self._meta('uidvalidity') not in (None, uidvalidity):
+                    # Zmiana UIDVALIDITY unieważnia wszystkie UID – budujemy indeks od nowa
+                    self.db.execute("DELETE FROM messages")
+                    self.db.execute("DELETE FROM meta")
+                self._set_meta('uidvalidity', uidvalidity)
+                self.db.commit()
+                last_uid = int(self._meta('last_uid', 0))
+            typ, data = mail.uid('search', None, f'UID {last_uid + 1}:*')
+            uids = [int(u) for u in data[0].split() if int(u) > last_uid]
+            if max_messages is not None:
+                uids = uids[-max_messages:]
+            added = 0
+            for start in range(0, len(uids), batch_size):
+                batch = uids[start:start + batch_size]
+                rows = self._fetch_batch(mail, batch)
+                with self.lock:
+                    # Upsert zamiast INSERT OR REPLACE: REPLACE nie uruchamia wyzwalacza usuwania (recursive_triggers
+                    # jest wyłączone) i w FTS zostawałyby stare wiersze; aktualizację obsługuje messages_au
+                    self.db.executemany("INSERT INTO messages(uid, subject, sender, date, body) VALUES (?, ?, ?, ?, ?) "
+                                        "ON CONFLICT(uid) DO UPDATE SET subject = excluded.subject, sender = excluded.sender, "
+                                        "date = excluded.date, body = excluded.body", rows)
+                    self._set_meta('last_uid', max(batch))
+                    self.db.commit()
+                added += len(rows)
+                if progress:
+                    progress(added, len(uids))
+            return added
+
+    def _fetch_batch(self, mail, uids):
+        # Jedna komenda na nagłówki + BODYSTRUCTURE całej paczki, potem jedna na każdą występującą sekcję tekstu
+        uid_set = ",".join(str(u) for u in uids)
+        typ, data = mail.uid('fetch', uid_set, '(BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)])')
+        messages = {}
+        sections = {}
+        for uid, items in _group_fetch_response(data):
+            header = email.message_from_bytes(_literal(items, b'HEADER.FIELDS'))
+            subject = decode_subject(header.get('Subject'))
+            sender = decode_subject(header.get('From'))
+            try:
+                date = email.utils.parsedate_to_datetime(header.get('Date')).isoformat()
+            except Exception:
+                date = header.get('Date') or ''
+            messages[uid] = [subject, sender, date, ""]
+            try:
+                text_part = find_text_part(parse_bodystructure(items))
+            except Exception:
+                text_part = None
+            if text_part:
+                sections.setdefault(text_part[0], []).append((uid, text_part[1], text_part[2]))
+        for section, parts in sections.items():
+            encodings = {uid: (charset, encoding) for uid, charset, encoding in parts}
+            typ, data = mail.uid('fetch', ",".join(str(uid) for uid, _, _ in parts),
+                                 f'(BODY.PEEK[{section}]<0.{INDEXED_BODY_BYTES}>)')
+            for uid, items in _group_fetch_response(data):
+                if uid in encodings:
+                    charset, encoding = encodings[uid]
+                    messages[uid][3] = decode_section(_literal(items, b'BODY['), charset, encoding)
+        return [(uid, *fields) for uid, fields in messages.items()]
+
+    def search(self, text, limit=50):
+        """Wyszukiwanie w pamięci podręcznej. Zwraca listę słowników (uid, subject, sender, date, snippet)."""
+        query = fts_query(text)
+        if not query:
+            return []
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT m.uid, m.subject, m.sender, m.date, "
+                "snippet(messages_fts, 2, '[', ']', '…', 12) "
+                "FROM messages_fts JOIN messages m ON m.uid = messages_fts.rowid "
+                "WHERE messages_fts MATCH ? ORDER BY bm25(messages_fts, 5.0, 3.0, 1.0) LIMIT ?",
+                (query, limit)).fetchall()
+        return [{"uid": r[0], "subject": r[1], "sender": r[2], "date": r[3], "snippet": r[4], "source": "cache"}
+                for r in rows]
+
+    def search_remote(self, text, imap_server, imap_port, username, password, use_ssl=True, limit=50):
+        """Zapasowe UID SEARCH na serwerze, ograniczone do UID spoza pamięci podręcznej."""
+        cached = self.cached_range()
+        words = re.findall(r'\w+', text, re.UNICODE)
+        if not words:
+            return []
+        # Słowa ASCII w cudzysłowach; pierwsze słowo z polskimi znakami wysyłamy jako literał UTF-8 (imaplib: jeden literał na komendę)
+        ascii_words = [w for w in words if w.isascii()]
+        utf8_word = next((w for w in words if not w.isascii()), None)
+        criteria = " ".join(f'TEXT "{w}"' for w in ascii_words)
+        if cached is None:
+            ranges = ['1:*']
+        else:
+            ranges = [f'{cached[1] + 1}:*'] + ([f'1:{cached[0] - 1}'] if cached[0] > 1 else [])
+        with connect_imap(imap_server, imap_port, use_ssl) as mail:
+            mail.login(username, password)
+            mail.select('inbox', readonly=True)
+            uids = []
+            for uid_range in ranges:
+                if utf8_word:
+                    mail.literal = utf8_word.encode('utf-8')
+                    typ, data = mail.uid('search', 'CHARSET', 'UTF-8', f'UID {uid_range} {criteria} TEXT'.replace('  ', ' '))
+                else:
+                    typ, data = mail.uid('search', None, f'UID {uid_range} {criteria}')
+                if typ == 'OK' and data and data[0]:
+                    uids.extend(int(u) for u in data[0].split())
+            uids = sorted((u for u in set(uids) if cached is None or not cached[0] <= u <= cached[1]), reverse=True)[:limit]
+            if not uids:
+                return []
+            typ, data = mail.uid('fetch', ",".join(map(str, uids)), '(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)])')
+            hits = []
+            for uid, items in _group_fetch_response(data):
+                header = email.message_from_bytes(_literal(items, b'HEADER.FIELDS'))
+                hits.append({"uid": uid, "subject": decode_subject(header.get('Subject')),
+                             "sender": decode_subject(header.get('From')), "date": header.get('Date') or '',
+                             "snippet": "", "source": "imap"})
+            return sorted(hits, key=lambda h: h["uid"], reverse=True)
+
+    def get_body(self, uid):
+        with self.lock:
+            row = self.db.execute("SELECT body FROM messages WHERE uid = ?", (uid,)).fetchone()
+        return row[0] if row else None
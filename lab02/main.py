@@ -2,7 +2,10 @@ import smtplib
 import poplib
 import imaplib
 import email
+import email.message
+import itertools
 import os
+import re
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
@@ -10,7 +13,7 @@ from email.header import decode_header
 import sys
 sys.stdout.reconfigure(encoding='utf-8')
 
-def send_email(smtp_server, smtp_port, username, password, recipient, subject, body, attachments=None, read_receipt=True):
+def send_email(smtp_server, smtp_port, username, password, recipient, subject, body, attachments=None, read_receipt=True, use_ssl=True):
     # Przygotowanie wiadomości email z opcjonalnymi załącznikami
     msg = MIMEMultipart()
     msg['From'] = username
@@ -32,11 +35,24 @@ def send_email(smtp_server, smtp_port, username, password, recipient, subject, b
                 except Exception as e:
                     print(f"Nie udało się dołączyć załącznika {attachment_path}: {e}")
     with smtplib.SMTP(smtp_server, smtp_port) as server:
-        server.starttls()
+        if use_ssl:
+            server.starttls()
         server.login(username, password)
         server.send_message(msg)
     print("Email wysłany.")
 
+def connect_imap(imap_server, imap_port, use_ssl=True):
+    # Połączenie IMAP; bez SSL tylko dla lokalnego serwera testowego (fake_mail_server.py)
+    if use_ssl:
+        return imaplib.IMAP4_SSL(imap_server, imap_port)
+    return imaplib.IMAP4(imap_server, imap_port)
+
+def connect_pop3(pop3_server, pop3_port, use_ssl=True):
+    # Połączenie POP3; bez SSL tylko dla lokalnego serwera testowego (fake_mail_server.py)
+    if use_ssl:
+        return poplib.POP3_SSL(pop3_server, pop3_port)
+    return poplib.POP3(pop3_server, pop3_port)
+
 def decode_subject(subject):
     if not subject:
         return ""
@@ -52,9 +68,9 @@ def decode_subject(subject):
             subject_parts.append(part)
     return "".join(subject_parts)
 
-def fetch_pop3(pop3_server, pop3_port, username, password, page_size=10):
+def fetch_pop3(pop3_server, pop3_port, username, password, page_size=10, use_ssl=True):
     # Pobranie wiadomości poprzez POP3, iterując od najnowszych
-    server = poplib.POP3_SSL(pop3_server, pop3_port)
+    server = connect_pop3(pop3_server, pop3_port, use_ssl)
     try:
         server.user(username)
         server.pass_(password)
@@ -78,9 +94,9 @@ def fetch_pop3(pop3_server, pop3_port, username, password, page_size=10):
         server.quit()
     return results
 
-def fetch_imap(imap_server, imap_port, username, password, page_size=10):
+def fetch_imap(imap_server, imap_port, username, password, page_size=10, use_ssl=True):
     # Pobieranie wiadomości przez IMAP (od najnowszych)
-    with imaplib.IMAP4_SSL(imap_server, imap_port) as mail:
+    with connect_imap(imap_server, imap_port, use_ssl) as mail:
         mail.login(username, password)
         mail.select('inbox')
         typ, data = mail.search(None, 'ALL')
@@ -123,9 +139,9 @@ def decode_payload(part):
             continue
     return payload.decode("utf-8", errors="replace")
 
-def get_email_body_pop3(pop3_server, pop3_port, username, password, msg_index):
+def get_email_body_pop3(pop3_server, pop3_port, username, password, msg_index, use_ssl=True):
     # Pobranie treści wiadomości POP3
-    server = poplib.POP3_SSL(pop3_server, pop3_port)
+    server = connect_pop3(pop3_server, pop3_port, use_ssl)
     try:
         server.user(username)
         server.pass_(password)
@@ -143,24 +159,105 @@ def get_email_body_pop3(pop3_server, pop3_port, username, password, msg_index):
         server.quit()
     return body
 
-def get_email_body_imap(imap_server, imap_port, username, password, msg_id):
-    # Pobranie treści wiadomości IMAP
-    with imaplib.IMAP4_SSL(imap_server, imap_port) as mail:
+def get_email_body_imap(imap_server, imap_port, username, password, msg_id, use_ssl=True, by_uid=False):
+    # Pobranie treści wiadomości IMAP: najpierw BODYSTRUCTURE, potem tylko sekcja text/plain (bez załączników)
+    with connect_imap(imap_server, imap_port, use_ssl) as mail:
         mail.login(username, password)
         mail.select('inbox')
-        typ, data = mail.fetch(msg_id, '(RFC822)')
-        raw_email = data[0][1]
-        msg_content = email.message_from_bytes(raw_email)
-        body = ""
-        if msg_content.is_multipart():
-            for part in msg_content.walk():
-                if part.get_content_type() == "text/plain" and not part.get("Content-Disposition"):
-                    body = decode_payload(part)
-                    break
-        else:
-            body = decode_payload(msg_content)
+        # by_uid: msg_id to UID (np. z wyników wyszukiwania), a nie numer kolejny
+        fetch = (lambda *args: mail.uid('fetch', *args)) if by_uid else mail.fetch
+        typ, data = fetch(msg_id, '(BODYSTRUCTURE)')
+        try:
+            structure = parse_bodystructure(data)
+        except Exception:
+            structure = None
+        if structure is None:
+            return get_email_body_rfc822(fetch, msg_id)
+        text_part = find_text_part(structure)
+        if text_part is None:
+            return ""
+        section, charset, encoding = text_part
+        typ, data = fetch(msg_id, f'(BODY.PEEK[{section}])')
+        raw_section = next((item[1] for item in data if isinstance(item, tuple)), b"")
+        return decode_section(raw_section, charset, encoding)
+
+def decode_section(raw_section, charset, encoding):
+    # Dekodowanie samej sekcji BODY[n] – nagłówki części odtwarzamy z BODYSTRUCTURE
+    part = email.message.Message()
+    part['Content-Type'] = f'text/plain; charset="{charset}"' if charset else 'text/plain'
+    part['Content-Transfer-Encoding'] = encoding
+    part.set_payload(raw_section.decode('ascii', errors='surrogateescape'))
+    return decode_payload(part)
+
+def get_email_body_rfc822(fetch, msg_id):
+    # Pobranie całej wiadomości (RFC822) – gdy serwer zwróci nieczytelne BODYSTRUCTURE
+    typ, data = fetch(msg_id, '(RFC822)')
+    raw_email = data[0][1]
+    msg_content = email.message_from_bytes(raw_email)
+    body = ""
+    if msg_content.is_multipart():
+        for part in msg_content.walk():
+            if part.get_content_type() == "text/plain" and not part.get("Content-Disposition"):
+                body = decode_payload(part)
+                break
+    else:
+        body = decode_payload(msg_content)
     return body
 
+def parse_bodystructure(fetch_data):
+    # Zamiana odpowiedzi FETCH (BODYSTRUCTURE) na zagnieżdżone listy; literały {n} traktujemy jak napisy
+    raw = b""
+    for item in fetch_data:
+        if isinstance(item, tuple):
+            raw += re.sub(rb'\{\d+\}$', b'', item[0]) + b'"' + item[1].replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+        elif item:
+            raw += item
+    text = raw.decode('utf-8', errors='replace')
+    start = text.upper().find('BODYSTRUCTURE')
+    if start < 0:
+        return None
+    tokens = re.findall(r'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+', text[start + len('BODYSTRUCTURE'):])
+    stack = [[]]
+    for token in tokens:
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) < 2:
+                break
+            closed = stack.pop()
+            stack[-1].append(closed)
+            if len(stack) == 1:
+                break
+        elif token.startswith('"'):
+            stack[-1].append(re.sub(r'\\(.)', r'\1', token[1:-1]))
+        else:
+            stack[-1].append(None if token.upper() == 'NIL' else token)
+    return stack[0][0] if stack[0] and isinstance(stack[0][0], list) else None
+
+def find_text_part(structure, section=""):
+    # Szukanie pierwszej części text/plain bez Content-Disposition; zwraca (sekcja, charset, kodowanie)
+    if structure and isinstance(structure[0], list):
+        # Części to listy na początku; po nich podtyp i (jako lista) parametry multipart
+        children = list(itertools.takewhile(lambda item: isinstance(item, list), structure))
+        for number, child in enumerate(children, 1):
+            found = find_text_part(child, f"{section}.{number}" if section else str(number))
+            if found:
+                return found
+        return None
+    if len(structure) < 7 or not isinstance(structure[0], str):
+        return None
+    maintype, subtype = structure[0].lower(), (structure[1] or "").lower()
+    params = structure[2] if isinstance(structure[2], list) else []
+    charset = next((params[i + 1] for i in range(0, len(params) - 1, 2) if str(params[i]).lower() == 'charset'), None)
+    encoding = structure[5] or '7bit'
+    if not section:
+        # Wiadomość jednoczęściowa – treść to sekcja 1, niezależnie od typu (jak decode_payload całości)
+        return "1", charset, encoding
+    disposition = structure[9] if maintype == 'text' and len(structure) > 9 else None
+    if maintype == 'text' and subtype == 'plain' and not disposition:
+        return section, charset, encoding
+    return None
+
 def main():
     # Funkcja główna: wybór protokołu i wykonanie akcji
     protocol = input("Wybierz protokół (smtp, pop3, imap): ").strip().lower()
@@ -0,0 +1,75 @@
+import itertools
+import queue
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class AIWorker(QThread):
+    """Wątek roboczy AI: z zamrożonej planszy (BoardSnapshot) buduje stan symulacji i listę ruchów,
+       wykonuje wyszukiwanie MCTS i odsyła ruch sygnałem, dzięki czemu pętla klatek (update_game co 16 ms)
+       nie jest blokowana."""
+
+    # id żądania, cel ('enemy' / 'hint'), ruch w indeksach komórek lub None
+    move_ready = pyqtSignal(int, str, object)
+
+    def __init__(self, game_ai, parent=None):
+        super().__init__(parent)
+        self.game_ai = game_ai
+        self.requests = queue.Queue()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        # cel -> id aktualnego żądania; żądanie spoza tego słownika jest anulowane
+        self.active = {}
+
+    def request(self, purpose, cell_type, board):
+        """Zleca wyszukiwanie; nowe żądanie o tym samym celu zastępuje (anuluje) poprzednie"""
+        request_id = next(self.ids)
+        with self.lock:
+            self.active[purpose] = request_id
+        self.requests.put((request_id, purpose, cell_type, board))
+        return request_id
+
+    def cancel(self, purpose=None):
+        """Anuluje żądanie o danym celu (lub wszystkie) – trwające wyszukiwanie kończy się przy następnej symulacji"""
+        with self.lock:
+            if purpose is None:
+                self.active.clear()
+            else:
+                self.active.pop(purpose, None)
+
+    def is_active(self, request_id, purpose):
+        with self.lock:
+            return self.active.get(purpose) == request_id
+
+    def finish(self, request_id, purpose):
+        """Zdejmuje żądanie z aktywnych po odebraniu wyniku; zwraca False, jeśli wynik jest nieaktualny"""
+        with self.lock:
+            if self.active.get(purpose) != request_id:
+                return False
+            del self.active[purpose]
+            return True
+
+    def stop(self):
+        self.cancel()
+        self.requests.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                break
+            request_id, purpose, cell_type, board = item
+            if not self.is_active(request_id, purpose):
+                continue
+            try:
+                move = self.game_ai.search_board(board, cell_type,
+                                                 stop_check=lambda: not self.is_active(request_id, purpose))
+            except Exception as e:
+                logger = self.game_ai.game_scene.logger
+                if logger:
+                    logger.log(f"AIWorker: Błąd obliczeń AI ({purpose}): {e}")
+                move = None
+            if self.is_active(request_id, purpose):
+                self.move_ready.emit(request_id, purpose, move)
@@ -1,13 +1,15 @@
 from PyQt5.QtGui import QColor
 from PyQt5.QtCore import Qt
 
+# Reguły gry (bez Qt) są w game_rules.py – tu tylko reeksport dla reszty kodu
+from game_rules import (POINTS_PER_STRENGTH, MAX_CELL_POINTS, FRAME_INTERVAL_MS, POINTS_INTERVAL_MS,
+                        FREEZE_DURATION_SECONDS, BRIDGE_COST_DIVISOR)
+
 WINDOW_WIDTH = 1280
 WINDOW_HEIGHT = 720
 
 # Ustawienia komórek
 DEFAULT_CELL_RADIUS = 30
-POINTS_PER_STRENGTH = 10
-MAX_CELL_POINTS = 50 
 
 # Kolory komórek
 COLOR_PLAYER = QColor(0, 200, 100)
@@ -44,11 +46,44 @@ MENU_TITLE_Y_POSITION = 100
 MENU_LEVEL_BUTTON_WIDTH = 300
 
 # Ustawienia sceny gry
-FRAME_INTERVAL_MS = 16
-POINTS_INTERVAL_MS = 2000
 TURN_TIMER_INTERVAL_MS = 1000
 TURN_DURATION_SECONDS = 10
 
+# Ustawienia AI (MCTS)
+AI_SIMULATION_TIME = 0.5     # limit czasu jednego wyszukiwania (s)
+AI_WORKERS = 0               # > 1 – równoległe wyszukiwanie w puli procesów
+AI_ROLLOUT_BUDGET = 100      # łączny limit symulacji; None – tylko limit czasu
+AI_ENGINE_CANDIDATES = 3     # ile ruchów z korzenia sprawdzić na silniku gry (0 – wyłączone)
+AI_ENGINE_LOOKAHEAD = 4.0    # horyzont tej symulacji (s czasu gry)
+AI_ENGINE_SHARE = 0.4        # część AI_SIMULATION_TIME na to sprawdzenie (reszta dla MCTS)
+
+# MongoDB (game_history.py) i zapis w tle (persistence.py)
+MONGODB_URI = "mongodb://localhost:27017"
+MONGODB_DATABASE = "wno2lab"
+MONGODB_COLLECTION = "replays"
+MONGODB_TIMEOUT_MS = 3000        # limit oczekiwania na serwer (ms); domyślne 30 s pymongo blokowało zapis
+PERSISTENCE_WORKERS = 4          # wątki zapisu równoległego (XML, JSON, binarny, MongoDB)
+
+# Gra sieciowa – port nasłuchu; None – ten sam numer co port partnera z menu (inny pozwala uruchomić
+# dwie instancje na jednym komputerze, np. przez net_proxy.py)
+NETWORK_LISTEN_PORT = None
+
+# Gra sieciowa – synchronizacja stanu przyrostami (state_sync.py)
+STATE_SYNC_INTERVAL = 5.0        # co ile sekund heartbeat wysyła zmiany stanu zamiast samego heartbeat
+STATE_SYNC_COMPRESSION = True    # kompresja zlib paczek (tylko gdy zmniejsza rozmiar)
+
+# Gra sieciowa w trybie lockstep (lockstep.py): przez UDP (ten sam numer portu) idą tylko komendy graczy
+LOCKSTEP = False                 # True – gra sieciowa w czasie rzeczywistym w trybie lockstep zamiast synchronizacji stanu
+LOCKSTEP_INPUT_DELAY = 6         # ticki (po FRAME_INTERVAL_MS) między wydaniem komendy a jej wykonaniem u obu stron
+LOCKSTEP_HASH_INTERVAL = 30      # co ile ticków strony porównują skrót stanu (wykrywanie rozjechania)
+
+# Powtórki binarne (replay_format.py)
+REPLAY_COMPRESSION = "zstd"      # "zstd" (gdy zainstalowany pakiet zstandard, inaczej zlib), "zlib" lub "none"
+REPLAY_KEYFRAME_INTERVAL = 10.0  # co ile sekund pełny stan komórek; pomiędzy zapisywane są tylko zmiany
+REPLAY_SEEK_KEYFRAME_INTERVAL = 5.0  # odstęp klatek kluczowych indeksu przewijania w PlaybackScene (s)
+REPLAY_CATALOG_PATH = "replays/catalog.db"  # katalog metadanych powtórek (replay_catalog.py, SQLite)
+REPLAY_STREAM_WINDOW = 256       # ile zdarzeń powtórki czytać naraz (i pamiętać do cofania)
+
 # Ustawienia edytora
 EDITOR_GRID_SIZE = 50
 
@@ -61,9 +96,6 @@ EDITOR_INSTRUCTION_FONT_SIZE = 12
 GAME_TURN_FONT_SIZE = 16
 GAME_OVER_FONT_SIZE = 36
 
-# Czas trwania zamrożenia w sekundach
-FREEZE_DURATION_SECONDS = 10  
-
 # Nazwy powerupów wyświetlane w komunikacie o aktywowanym powerupie
 POWERUP_FREEZE = "mrożący"
 POWERUP_TAKEOVER = "przejmujący"
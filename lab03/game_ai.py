@@ -1,8 +1,18 @@
 import math
 import random
 import time
-from collections import defaultdict
-
+import atexit
+import threading
+import multiprocessing
+from bisect import bisect_right
+from array import array
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+from game_engine import Simulation
 from game_objects import CellUnit, CellConnection
 
 class GameAI:
@@ -10,109 +20,246 @@ class GameAI:
 
     def __init__(self, game_scene):
         self.game_scene = game_scene
-        self.simulation_time = 0.5
+        self.simulation_time = config.AI_SIMULATION_TIME
         self.exploration_weight = 1.41
+        # workers > 1 włącza równoległe MCTS (zrównoleglenie korzenia) w puli procesów;
+        # rollout_budget ogranicza łączną liczbę symulacji (None – tylko limit czasu)
+        self.workers = config.AI_WORKERS
+        self.rollout_budget = config.AI_ROLLOUT_BUDGET
+        # Najczęściej odwiedzane ruchy z korzenia są sprawdzane na silniku z pełnymi regułami
+        # (kropki, konflikty, przejęcia) – MCTS operuje na uproszczonym modelu GameState
+        self.engine_candidates = config.AI_ENGINE_CANDIDATES
+        self.engine_lookahead = config.AI_ENGINE_LOOKAHEAD
+        # Drzewa MCTS zachowywane między kolejnymi wywołaniami (osobno dla każdej strony)
+        self.trees = {}
 
     def analyze_best_move(self, cell_type="player"):
         """Analiza obecnego stanu gry i sugestia najlepszego ruchu używając MCTS.
            Parametr cell_type określa, dla których komórek obliczyć ruch (domyślnie 'player')."""
-        controlled_cells = [cell for cell in self.game_scene.cells if cell.cell_type == cell_type]
-
-        if not controlled_cells:
+        board = self.prepare_search(cell_type)
+        if board is None:
             return None
+        return self.resolve_move(board, self.search_board(board, cell_type))
 
-        mcts = MCTS(self.game_scene, self.exploration_weight)
-
-        possible_moves = self._get_possible_moves(controlled_cells)
-
-        if not possible_moves:
+    def prepare_search(self, cell_type="player"):
+        """Zamraża stan sceny (wątek GUI): tylko odczyt komórek i mostów do BoardSnapshot, O(komórki + mosty).
+           Układ planszy, stan symulacji i lista ruchów powstają w search_board. None, gdy strona nie ma komórek."""
+        if not any(cell.cell_type == cell_type for cell in self.game_scene.cells):
             return None
-
-        best_move = mcts.search(possible_moves, self.simulation_time)
-
+        return BoardSnapshot.from_scene(self.game_scene, self.engine_candidates > 0)
+
+    def search_board(self, board, cell_type="player", stop_check=None):
+        """Wyszukiwanie na zamrożonej planszy – nie odwołuje się do sceny, działa w wątku AI.
+           Zwraca ruch w indeksach komórek lub None, gdy brak ruchów."""
+        game_state = GameState.from_board(board, OWNER_CODES[cell_type])
+        index_moves = game_state.get_possible_moves()
+        if not index_moves:
+            return None
+        return self.search_snapshot(game_state, index_moves, cell_type, stop_check, board.simulation)
+
+    def search_snapshot(self, game_state, index_moves, cell_type="player", stop_check=None, simulation=None):
+        """Wyszukiwanie na zamrożonym stanie – nie odwołuje się do sceny, może działać w wątku roboczym.
+           Sprawdzenie ruchów na silniku mieści się w tym samym limicie simulation_time co MCTS."""
+        deadline = time.time() + self.simulation_time
+        search_time = self.simulation_time
+        if simulation is not None:
+            search_time *= 1 - config.AI_ENGINE_SHARE
+        if self.workers > 1:
+            stats = self._parallel_statistics(game_state, index_moves, search_time)
+            best_move = choose_move(stats) or random.choice(index_moves)
+        else:
+            mcts = self.trees.get(cell_type)
+            if mcts is None or not mcts.same_board(game_state.layout):
+                mcts = self.trees[cell_type] = MCTS(self.game_scene, self.exploration_weight)
+            best_move = mcts.search(index_moves, search_time, OWNER_CODES[cell_type], self.rollout_budget,
+                                    game_state, stop_check)
+            stats = mcts.root_statistics(game_state)
+        if simulation is None:
+            return best_move
+        return self._verify_with_engine(simulation, stats, best_move, cell_type, deadline, stop_check)
+
+    def _verify_with_engine(self, simulation, stats, best_move, cell_type, deadline, stop_check=None):
+        """Rozgrywa ruch wybrany przez MCTS i kilka najczęściej odwiedzanych na kopii silnika przez
+           engine_lookahead sekund; inny ruch zastępuje wybór MCTS tylko z lepszym wynikiem strony cell_type.
+           Rozgrywka przerwana przez deadline (czas ściany) nie jest oceniana."""
+        others = [move for move in sorted(stats, key=lambda move: stats[move][0], reverse=True) if move != best_move]
+        candidates = ([best_move] if best_move is not None else []) + others[:self.engine_candidates]
+        if len(candidates) < 2:
+            return best_move
+        frames = int(round(self.engine_lookahead / simulation.frame_dt))
+        best_score = None
+        for move in candidates:
+            if stop_check is not None and stop_check():
+                break
+            trial = simulation.copy()
+            if trial.apply_move(move) is None:
+                continue
+            for _ in range(frames):
+                if time.time() >= deadline:
+                    return best_move
+                trial.step()
+            score = trial.score(cell_type)
+            if best_score is None or score > best_score:
+                best_score, best_move = score, move
         return best_move
 
-    def _get_possible_moves(self, controlled_cells):
-        """Generuje listę wszystkich możliwych ruchów dla zadanych komórek"""
-        possible_moves = []
-
-        for source_cell in controlled_cells:
-            if source_cell.points < 2:
+    def resolve_move(self, board, best_move):
+        """Zamienia ruch w indeksach na (komórka źródłowa, komórka docelowa, koszt)"""
+        if best_move is None:
+            return None
+        source_index, target_index, cost = best_move
+        return board.cells[source_index], board.cells[target_index], cost
+
+    def _parallel_statistics(self, game_state, index_moves, search_time):
+        """Zrównoleglenie korzenia: każdy proces buduje własne drzewo z innym ziarnem losowania,
+           a statystyki ruchów z korzenia są sumowane przed wyborem ruchu"""
+        executor = get_executor(self.workers)
+        snapshot = game_state.snapshot()
+        budget = None if self.rollout_budget is None else max(1, math.ceil(self.rollout_budget / self.workers))
+        futures = [
+            executor.submit(parallel_search_worker, snapshot, index_moves, search_time, budget,
+                            self.exploration_weight, random.getrandbits(32))
+            for _ in range(self.workers)
+        ]
+        merged = {}
+        for future in futures:
+            try:
+                stats = future.result(timeout=search_time + 5)
+            except Exception:
                 continue
+            for move, (visits, value) in stats.items():
+                total = merged.setdefault(move, [0, 0.0])
+                total[0] += visits
+                total[1] += value
+        return merged
 
-            for target_cell in self.game_scene.cells:
-                if target_cell == source_cell:
-                    continue
-
-                connection_exists = any(
-                    (conn.source_cell == source_cell and conn.target_cell == target_cell) or
-                    (conn.source_cell == target_cell and conn.target_cell == source_cell)
-                    for conn in self.game_scene.connections
-                )
-
-                if connection_exists:
-                    continue
-
-                dx = target_cell.x - source_cell.x
-                dy = target_cell.y - source_cell.y
-                distance = math.hypot(dx, dy)
-                cost = int(distance / 20)
-
-                if source_cell.points < cost:
-                    continue
-
-                possible_moves.append((source_cell, target_cell, cost))
-
-        return possible_moves
+    def shutdown(self):
+        """Zamyka pulę procesów AI (tworzona leniwie przy pierwszym równoległym wyszukiwaniu)"""
+        shutdown_executor()
 
 
 class MCTS:
     """Implementacja algorytmu Monte Carlo Tree Search (MCTS)"""
 
-    def __init__(self, game_scene, exploration_weight=1.41):
+    def __init__(self, game_scene, exploration_weight=1.41, table_size=200000):
         self.game_scene = game_scene
         self.exploration_weight = exploration_weight
-        self.Q = defaultdict(int)
-        self.N = defaultdict(int)
-        self.children = {}
+        # Statystyki wspólne dla identycznych pozycji osiągniętych różnymi kolejnościami ruchów
+        self.table = TranspositionTable(table_size)
+        self.root = None
 
-    def search(self, possible_moves, time_limit):
-        """Wyszukiwanie najlepszego ruchu z użyciem MCTS z limitem czasowym"""
-        start_time = time.time()
+    def same_board(self, layout):
+        """Czy drzewo dotyczy tej samej planszy (te same komórki w tej samej kolejności)"""
+        return self.root is None or (self.root.layout.xs == layout.xs and self.root.layout.ys == layout.ys)
 
+    def search(self, possible_moves, time_limit, side=None, rollout_budget=100, game_state=None, stop_check=None):
+        """Wyszukiwanie najlepszego ruchu z użyciem MCTS z limitem czasowym.
+           Ruchy to krotki (indeks źródła, indeks celu, koszt); side to kod strony, dla której szukamy."""
         if not possible_moves:
             return None
 
-        game_state = GameState(self.game_scene)
+        if game_state is None:
+            game_state = GameState.from_scene(self.game_scene, side if side is not None else PLAYER)
+        self.reroot(game_state, possible_moves)
+        self.run(game_state, possible_moves, time_limit, rollout_budget, stop_check)
 
+        best_move = choose_move(self.root_statistics(game_state))
+
+        if best_move is None and possible_moves:
+            return random.choice(possible_moves)
+
+        return best_move
+
+    def reroot(self, game_state, possible_moves):
+        """Ustawia game_state jako nowy korzeń, przenosząc wiedzę z poprzedniego wyszukiwania.
+           Punkty komórek zmieniają się w czasie rzeczywistym, więc dokładne trafienie w tablicy jest rzadkie –
+           szukamy wśród poprzedniego korzenia i jego potomków (2 poziomy) węzła o tej samej strukturze
+           (właściciele komórek i mosty) i przeszczepiamy jego statystyki ruchów."""
+        previous, self.root = self.root, game_state
+        entry = self.table.get(game_state)
+        if entry is not None:
+            self._refresh_children(game_state, entry, possible_moves)
+            return
+        if previous is None:
+            return
+        structure = game_state.structure_key()
+        best, best_visits = None, 0
+        frontier = [previous]
+        for depth in range(3):
+            next_frontier = []
+            for state in frontier:
+                entry = self.table.get(state)
+                if entry is None:
+                    continue
+                if state.structure_key() == structure and entry.visits > best_visits:
+                    best, best_visits = state, entry.visits
+                if entry.children:
+                    next_frontier.extend(child for child, move in entry.children)
+            frontier = next_frontier
+        if best is not None:
+            self._graft(best, game_state, possible_moves, REROOT_GRAFT_DEPTH)
+
+    def _refresh_children(self, state, entry, possible_moves):
+        """Dzieci węzła z tablicy według bieżących ruchów – wpis mógł powstać przy innym zbiorze ruchów
+           (np. zanim przejęta komórka dała nowe mosty); dzieci dla tych samych ruchów zachowują statystyki"""
+        if entry.children is None:
+            return
+        known = {move: child for child, move in entry.children}
+        entry.children = [
+            (known[move] if move in known else state.apply_move(move), move)
+            for move in possible_moves if move in known or state.is_valid_move(move)
+        ]
+
+    def _graft(self, old_state, new_state, possible_moves, depth):
+        """Kopiuje statystyki poddrzewa old_state do odpowiadających (tymi samymi ruchami) węzłów new_state"""
+        old = self.table.get(old_state)
+        if old is None or not old.visits:
+            return
+        new = self.table.get_or_create(new_state)
+        if new.visits:
+            return
+        new.visits, new.value = old.visits, old.value
+        if depth == 0 or not old.children:
+            return
+        old_children = {move: child for child, move in old.children}
+        new.children = [
+            (new_state.apply_move(move), move)
+            for move in possible_moves if new_state.is_valid_move(move)
+        ]
+        for child_state, move in new.children:
+            if move in old_children:
+                self._graft(old_children[move], child_state, possible_moves, depth - 1)
+
+    def run(self, game_state, possible_moves, time_limit, rollout_budget=None, stop_check=None):
+        """Wykonuje symulacje z korzenia game_state do wyczerpania czasu lub budżetu; zwraca ich liczbę.
+           stop_check – opcjonalna funkcja; zwrócenie True przerywa wyszukiwanie (anulowanie)"""
+        start_time = time.time()
         num_rollouts = 0
         while time.time() - start_time < time_limit:
-            path, leaf_state, move = self._select_and_expand(game_state, possible_moves)
+            path = self._select_and_expand(game_state, possible_moves)
 
-            reward = self._simulate(leaf_state)
+            reward = self._simulate(path[-1])
 
             self._backpropagate(path, reward)
 
             num_rollouts += 1
 
-            if num_rollouts >= 100:
+            if rollout_budget is not None and num_rollouts >= rollout_budget:
                 break
 
-        best_move = None
-        best_value = float('-inf')
-
-        for move in possible_moves:
-            move_hash = self._move_hash(game_state, move)
-            if move_hash in self.N:
-                value = self.Q[move_hash] / self.N[move_hash]
-                if value > best_value:
-                    best_value = value
-                    best_move = move
-
-        if best_move is None and possible_moves:
-            return random.choice(possible_moves)
-
-        return best_move
+            if stop_check is not None and stop_check():
+                break
+        return num_rollouts
+
+    def root_statistics(self, game_state):
+        """Statystyki ruchów z korzenia: {ruch: (liczba odwiedzin, suma nagród)}"""
+        stats = {}
+        root = self.table.get(game_state)
+        for child_state, move in (root.children if root and root.children else []):
+            child = self.table.get(child_state)
+            if child and child.visits:
+                stats[move] = (child.visits, child.value)
+        return stats
 
     def _select_and_expand(self, state, possible_moves):
         """Wybiera ścieżkę poprzez drzewo i dodaje nowy liść"""
@@ -122,50 +269,42 @@ class MCTS:
 
         while True:
             path.append(current_state)
+            entry = self.table.get_or_create(current_state)
 
-            if current_state not in self.children:
-                self.children[current_state] = []
-                for move in possible_moves:
-                    source_cell, target_cell, cost = move
-                    if current_state.is_valid_move(source_cell, target_cell, cost):
-                        new_state = current_state.apply_move(source_cell, target_cell, cost)
-                        self.children[current_state].append((new_state, move))
+            if entry.children is None:
+                entry.children = [
+                    (current_state.apply_move(move), move)
+                    for move in possible_moves if current_state.is_valid_move(move)
+                ]
 
-                if not self.children[current_state]:
-                    return path, current_state, None
+                if not entry.children:
+                    return path
 
-                child_state, move = random.choice(self.children[current_state])
+                child_state, move = random.choice(entry.children)
                 path.append(child_state)
-                return path, child_state, move
+                return path
 
-            unexplored = []
-            for child_state, move in self.children[current_state]:
-                move_hash = self._move_hash(current_state, move)
-                if move_hash not in self.N:
-                    unexplored.append((child_state, move))
+            if not entry.children:
+                return path
 
+            child_entries = [(child_state, self.table.get(child_state)) for child_state, move in entry.children]
+            unexplored = [child_state for child_state, child in child_entries if child is None or not child.visits]
             if unexplored:
-                child_state, move = random.choice(unexplored)
-                path.append(child_state)
-                return path, child_state, move
+                path.append(random.choice(unexplored))
+                return path
 
+            log_N_vertex = math.log(max(entry.visits, 1))
             best_score = float('-inf')
             best_child = None
-            best_move = None
-
-            log_N_vertex = math.log(self.N[current_state])
 
-            for child_state, move in self.children[current_state]:
-                move_hash = self._move_hash(current_state, move)
-
-                exploit = self.Q[move_hash] / self.N[move_hash]
-                explore = self.exploration_weight * math.sqrt(log_N_vertex / self.N[move_hash])
+            for child_state, child in child_entries:
+                exploit = child.value / child.visits
+                explore = self.exploration_weight * math.sqrt(log_N_vertex / child.visits)
                 score = exploit + explore
 
                 if score > best_score:
                     best_score = score
                     best_child = child_state
-                    best_move = move
 
             current_state = best_child
 
@@ -181,239 +320,379 @@ class MCTS:
             if not possible_moves:
                 break
 
-            source_cell, target_cell, cost = random.choice(possible_moves)
-
-            state = state.apply_move(source_cell, target_cell, cost)
+            state = state.apply_move(random.choice(possible_moves))
 
-        player_cells = sum(1 for cell in state.cells if cell.cell_type == "player")
-        enemy_cells = sum(1 for cell in state.cells if cell.cell_type == "enemy")
-
-        if player_cells == 0:
-            return 0
-        elif enemy_cells == 0:
-            return 1
-        else:
-            total_cells = player_cells + enemy_cells
-            return player_cells / total_cells
+        return state.score()
 
     def _backpropagate(self, path, reward):
         """Aktualizuje statystyki dla wszystkich stanów w ścieżce"""
         for state in reversed(path):
-            self.N[state] += 1
-            self.Q[state] += reward
+            entry = self.table.get_or_create(state)
+            entry.visits += 1
+            entry.value += reward
+
+
+def choose_move(stats):
+    """Ruch o najwyższej średniej nagrodzie spośród odwiedzonych"""
+    best_move = None
+    best_value = float('-inf')
+    for move, (visits, value) in stats.items():
+        if visits and value / visits > best_value:
+            best_value = value / visits
+            best_move = move
+    return best_move
+
+
+def parallel_search_worker(snapshot, possible_moves, time_limit, rollout_budget, exploration_weight, seed):
+    """Funkcja wykonywana w procesie puli: niezależne drzewo MCTS z własnym ziarnem"""
+    random.seed(seed)
+    game_state = GameState.from_snapshot(snapshot)
+    mcts = MCTS(None, exploration_weight)
+    mcts.run(game_state, possible_moves, time_limit, rollout_budget)
+    return mcts.root_statistics(game_state)
+
+
+_executor = None
+_executor_workers = 0
+
+
+def get_executor(workers):
+    """Wspólna, leniwie tworzona pula procesów dla wszystkich instancji GameAI.
+       Procesy startowane przez spawn – pula powstaje w wątku AIWorker, a fork wielowątkowego procesu Qt
+       jest w Linuksie niebezpieczny."""
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        shutdown_executor()
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _executor_workers = workers
+    return _executor
+
+
+def shutdown_executor():
+    global _executor, _executor_workers
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        _executor_workers = 0
+
+
+atexit.register(shutdown_executor)
+
+
+class TableEntry:
+    """Statystyki pozycji w tablicy transpozycji: liczba odwiedzin, suma nagród i lista dzieci"""
+    __slots__ = ('visits', 'value', 'children')
+
+    def __init__(self):
+        self.visits = 0
+        self.value = 0.0
+        self.children = None
+
+
+class TranspositionTable:
+    """Ograniczona tablica transpozycji (pozycja -> TableEntry) z usuwaniem najdawniej używanych (LRU)"""
+    def __init__(self, capacity=200000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, state):
+        entry = self.entries.get(state)
+        if entry is not None:
+            self.entries.move_to_end(state)
+        return entry
+
+    def get_or_create(self, state):
+        entry = self.get(state)
+        if entry is None:
+            entry = TableEntry()
+            self.entries[state] = entry
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return entry
+
+
+NEUTRAL, PLAYER, ENEMY = 0, 1, 2
+OWNER_CODES = {"neutral": NEUTRAL, "player": PLAYER, "enemy": ENEMY}
+OWNER_NAMES = ("neutral", "player", "enemy")
+ZOBRIST_SEED = 0x5EED
+REROOT_GRAFT_DEPTH = 2
+LAYOUT_CACHE_SIZE = 4
+MIN_TARGET_COST = 50            # najmniejszy promień (koszt mostu) listy celów komórki
+LINK_KEY_SALT = 0x9E3779B97F4A7C15
+MASK64 = (1 << 64) - 1
+
+_layouts = OrderedDict()        # (xs, ys) -> BoardLayout
+_layouts_lock = threading.Lock()
+
+
+class BoardLayout:
+    """Niezmienna część planszy współdzielona przez wszystkie stany symulacji: pozycje komórek,
+       cele mostów posortowane po koszcie i klucze Zobrista. Pamięć O(komórki) – bez macierzy n x n:
+       listy celów liczone są wektorowo w numpy tylko dla komórek, z których szukamy ruchów, i tylko
+       w promieniu potrzebnym dla budżetu. Liczona raz na układ komórek (for_positions) i nie trzyma
+       obiektów sceny, więc ten sam układ służy wątkowi GUI, wątkowi AI i procesom puli."""
+    def __init__(self, xs, ys):
+        self.size = len(xs)
+        n = self.size
+        self.xs = list(xs)
+        self.ys = list(ys)
+        self._x = np.asarray(self.xs, dtype=float)
+        self._y = np.asarray(self.ys, dtype=float)
+        # komórka -> (największy koszt, cele posortowane po koszcie, ich koszty)
+        self._targets = {}
+        # Klucze Zobrista: właściciel i punkty każdej komórki; klucze mostów wyliczane z numeru pary (link_key)
+        self._rng = random.Random(ZOBRIST_SEED)
+        self._keys_lock = threading.Lock()
+        self.owner_keys = [[self._rng.getrandbits(64) for _ in OWNER_NAMES] for _ in range(n)]
+        self.points_keys = [[] for _ in range(n)]
+        self.side_keys = [self._rng.getrandbits(64) for _ in OWNER_NAMES]
+
+    @classmethod
+    def for_positions(cls, xs, ys):
+        """Układ dla pozycji komórek z pamięci podręcznej (ostatnie LAYOUT_CACHE_SIZE plansz); liczony
+           tylko po zmianie komórek (nowy poziom, nowa komórka)"""
+        key = (tuple(xs), tuple(ys))
+        with _layouts_lock:
+            layout = _layouts.get(key)
+            if layout is not None:
+                _layouts.move_to_end(key)
+                return layout
+        layout = cls(*key)
+        with _layouts_lock:
+            _layouts[key] = layout
+            while len(_layouts) > LAYOUT_CACHE_SIZE:
+                _layouts.popitem(last=False)
+        return layout
+
+    @classmethod
+    def for_scene(cls, game_scene):
+        return cls.for_positions([cell.x for cell in game_scene.cells], [cell.y for cell in game_scene.cells])
+
+    def reachable(self, source, budget):
+        """Cele (indeksy komórek) i koszty mostów z source w zasięgu budget punktów, rosnąco po koszcie"""
+        entry = self._targets.get(source)
+        if entry is None or entry[0] < budget:
+            # Promień z zapasem (co najmniej podwojony), żeby rosnące punkty komórki nie wymuszały
+            # przeliczania przy każdym zapytaniu
+            limit = max(budget, MIN_TARGET_COST, 2 * entry[0] if entry else 0)
+            cost = (np.hypot(self._x - self._x[source], self._y - self._y[source]) / 20).astype(np.int64)
+            cost[source] = limit + 1
+            inside = np.flatnonzero(cost <= limit)
+            order = inside[np.argsort(cost[inside], kind='stable')]
+            entry = self._targets[source] = (limit, order.tolist(), cost[order].tolist())
+        end = bisect_right(entry[2], budget)
+        return entry[1][:end], entry[2][:end]
+
+    def pair(self, i, j):
+        """Numer nieuporządkowanej pary komórek – most w dowolnym kierunku blokuje kolejny"""
+        return i * self.size + j if i < j else j * self.size + i
+
+    @staticmethod
+    def link_key(pair):
+        """Klucz Zobrista mostu: mieszanie numeru pary (splitmix64) zamiast tablicy kluczy n x n"""
+        value = (pair + LINK_KEY_SALT) & MASK64
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+        return value ^ (value >> 31)
+
+    def points_key(self, cell, points):
+        """Klucz Zobrista dla liczby punktów komórki; tablica rośnie leniwie (punkty nie mają sztywnego limitu).
+           Układ jest współdzielony przez wątek GUI i wątek AI, więc dopisywanie kluczy jest pod blokadą."""
+        keys = self.points_keys[cell]
+        if points >= len(keys):
+            with self._keys_lock:
+                if points >= len(keys):
+                    keys.extend(self._rng.getrandbits(64) for _ in range(points + 1 - len(keys)))
+        return keys[points]
+
+    def cell_key(self, cell, owner, points):
+        return self.owner_keys[cell][owner] ^ self.points_key(cell, max(points, 0))
+
+
+class BoardSnapshot(namedtuple('BoardSnapshot', 'cells xs ys owner points links simulation')):
+    """Zamrożony stan sceny dla AI: obiekty komórek (do zamiany wyniku z powrotem na komórki sceny),
+       pozycje, kody właścicieli, punkty, mosty jako pary indeksów i opcjonalna kopia silnika"""
+    __slots__ = ()
+
+    @classmethod
+    def from_scene(cls, game_scene, with_simulation=False):
+        cells = tuple(game_scene.cells)
+        index = {cell: i for i, cell in enumerate(cells)}
+        links = []
+        for conn in game_scene.connections:
+            source = index.get(conn.source_cell)
+            target = index.get(conn.target_cell)
+            if source is not None and target is not None:
+                links.append((source, target))
+        simulation = Simulation.from_scene(cells, game_scene.connections) if with_simulation else None
+        return cls(cells, tuple(cell.x for cell in cells), tuple(cell.y for cell in cells),
+                   bytes(OWNER_CODES.get(cell.cell_type, NEUTRAL) for cell in cells),
+                   tuple(cell.points for cell in cells), tuple(links), simulation)
+
+
+def bridge_targets(game_scene, source_cell):
+    """Komórki, do których source_cell może zbudować most (bez par połączonych już mostem tego samego typu)"""
+    cells = game_scene.cells
+    index = {cell: i for i, cell in enumerate(cells)}
+    layout = BoardLayout.for_scene(game_scene)
+    source = index[source_cell]
+    linked = set()
+    for conn in game_scene.connections:
+        if conn.connection_type != source_cell.cell_type:
+            continue
+        if conn.source_cell is source_cell:
+            linked.add(index.get(conn.target_cell))
+        elif conn.target_cell is source_cell:
+            linked.add(index.get(conn.source_cell))
+    targets, costs = layout.reachable(source, source_cell.points)
+    return [cells[target] for target in targets if target not in linked]
 
-    def _move_hash(self, state, move):
-        """Tworzy unikalny hash dla danego ruchu w danym stanie"""
-        if not move:
-            return None
-        source_cell, target_cell, cost = move
-        return (hash(state), source_cell.x, source_cell.y, target_cell.x, target_cell.y, cost)
 
+class GameState:
+    """Stan gry dla symulatora MCTS: właściciele i punkty komórek w tablicach (array)
+       indeksowanych numerem komórki oraz zbiór numerów par komórek połączonych mostem (BoardLayout.pair)"""
+    __slots__ = ('layout', 'owner', 'points', 'links', 'side', 'key')
 
-class SimpleCell:
-    """Uproszczona reprezentacja komórki dla celów symulacji AI"""
-    def __init__(self, x, y, cell_type, points, radius=30, original_cell=None):
-        self.x = x
-        self.y = y
-        self.cell_type = cell_type
+    def __init__(self, layout, owner, points, links=frozenset(), side=PLAYER, key=None):
+        self.layout = layout
+        self.owner = owner
         self.points = points
-        self.strength = (points // 10) + 1
-        self.radius = radius
-        self.original_cell = original_cell
-        self.connections = []
-
-class SimpleConnection:
-    """Uproszczona reprezentacja połączenia dla celów symulacji AI"""
-    def __init__(self, source_cell, target_cell, connection_type, cost=0):
-        self.source_cell = source_cell
-        self.target_cell = target_cell
-        self.connection_type = connection_type
-        self.cost = cost
-        self.dots = []
-
-class GameState:
-    """Klasa reprezentująca stan gry dla symulatora MCTS"""
-
-    def __init__(self, game_scene=None):
-        if game_scene:
-            self.cells = []
-            self.cell_map = {}
-
-            for cell in game_scene.cells:
-                simple_cell = SimpleCell(
-                    cell.x, cell.y, cell.cell_type, cell.points,
-                    getattr(cell, 'radius', 30), cell
-                )
-                self.cells.append(simple_cell)
-                self.cell_map[cell] = simple_cell
-
-            self.connections = []
-            for conn in game_scene.connections:
-                source = self.cell_map.get(conn.source_cell)
-                target = self.cell_map.get(conn.target_cell)
-                if source and target:
-                    simple_conn = SimpleConnection(
-                        source, target, conn.connection_type,
-                        getattr(conn, 'cost', 0)
-                    )
-                    self.connections.append(simple_conn)
-                    source.connections.append(simple_conn)
-                    target.connections.append(simple_conn)
-        else:
-            self.cells = []
-            self.connections = []
-            self.cell_map = {}
+        self.links = links
+        self.side = side
+        self.key = self._full_key() if key is None else key
+
+    def structure_key(self):
+        """Struktura pozycji bez punktów: właściciele komórek i istniejące mosty"""
+        return self.owner.tobytes(), self.links
+
+    def snapshot(self):
+        """Dane stanu bez obiektów sceny – do przekazania do innego procesu"""
+        return (self.layout.xs, self.layout.ys, self.owner.tobytes(), self.points.tolist(), self.links, self.side)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        xs, ys, owner_bytes, points, links, side = snapshot
+        owner = array('b')
+        owner.frombytes(owner_bytes)
+        # Układ z pamięci podręcznej procesu – budowany raz na planszę, nie przy każdym ruchu
+        return cls(BoardLayout.for_positions(xs, ys), owner, array('i', points), links, side)
+
+    def _full_key(self):
+        """Pełne wyliczenie klucza Zobrista – tylko przy budowie stanu ze sceny"""
+        layout = self.layout
+        key = layout.side_keys[self.side]
+        for i in range(layout.size):
+            key ^= layout.cell_key(i, self.owner[i], self.points[i])
+        for pair in self.links:
+            key ^= layout.link_key(pair)
+        return key
+
+    @classmethod
+    def from_board(cls, board, side=PLAYER):
+        """Buduje stan z zamrożonej planszy (BoardSnapshot); side to kod strony wykonującej ruchy w symulacji"""
+        layout = BoardLayout.for_positions(board.xs, board.ys)
+        owner = array('b', board.owner)
+        links = frozenset(layout.pair(source, target) for source, target in board.links)
+        return cls(layout, owner, array('i', board.points), links, side)
+
+    @classmethod
+    def from_scene(cls, game_scene, side=PLAYER):
+        return cls.from_board(BoardSnapshot.from_scene(game_scene), side)
 
     def __hash__(self):
-        """Unikalny hash stanu gry bazujący na stanie komórek"""
-        h = 0
-        for cell in self.cells:
-            cell_hash = hash((cell.x, cell.y, cell.cell_type, cell.points))
-            h = h ^ cell_hash
-        return h
+        """Hash stanu – klucz Zobrista aktualizowany przyrostowo w apply_move"""
+        return self.key
 
     def __eq__(self, other):
-        """Porównanie stanów gry"""
+        """Porównanie stanów gry (pełne porównanie chroni przed kolizjami kluczy)"""
         if not isinstance(other, GameState):
             return False
+        return (self.key == other.key and self.links == other.links and
+                self.owner == other.owner and self.points == other.points)
 
-        if len(self.cells) != len(other.cells):
-            return False
-
-        for cell1, cell2 in zip(sorted(self.cells, key=lambda c: (c.x, c.y)),
-                               sorted(other.cells, key=lambda c: (c.x, c.y))):
-            if (cell1.x != cell2.x or cell1.y != cell2.y or
-                cell1.cell_type != cell2.cell_type or cell1.points != cell2.points):
-                return False
+    def copy(self):
+        return GameState(self.layout, self.owner[:], self.points[:], self.links, self.side, self.key)
 
-        return True
-
-    def _copy_cells(self):
-        """Tworzy płytką kopię listy komórek"""
-        copied_cells = []
-        cell_map = {}
-
-        for cell in self.cells:
-            new_cell = SimpleCell(cell.x, cell.y, cell.cell_type, cell.points, cell.radius)
-            copied_cells.append(new_cell)
-            cell_map[cell] = new_cell
-
-        return copied_cells, cell_map
-
-    def is_valid_move(self, source_cell, target_cell, cost):
+    def is_valid_move(self, move):
         """Sprawdza czy ruch jest możliwy w tym stanie"""
-        source = None
-        target = None
-
-        if hasattr(source_cell, 'original_cell') and source_cell.original_cell:
-            source = self.cell_map.get(source_cell.original_cell)
-        else:
-            for cell in self.cells:
-                if cell.x == source_cell.x and cell.y == source_cell.y:
-                    source = cell
-                    break
-
-        if hasattr(target_cell, 'original_cell') and target_cell.original_cell:
-            target = self.cell_map.get(target_cell.original_cell)
-        else:
-            for cell in self.cells:
-                if cell.x == target_cell.x and cell.y == target_cell.y:
-                    target = cell
-                    break
-
-        if not source or not target:
-            return False
-
-        if source.points < cost:
+        source, target, cost = move
+        if self.owner[source] != self.side or self.points[source] < cost:
             return False
+        return self.layout.pair(source, target) not in self.links
 
-        for conn in self.connections:
-            if ((conn.source_cell == source and conn.target_cell == target) or
-                (conn.source_cell == target and conn.target_cell == source)):
-                return False
-
-        return True
-
-    def apply_move(self, source_cell, target_cell, cost):
+    def apply_move(self, move):
         """Tworzy nowy stan po wykonaniu ruchu"""
-        new_state = GameState()
-        new_cells, new_cell_map = self._copy_cells()
-        new_state.cells = new_cells
-
-        source = new_cell_map.get(self._find_cell(source_cell.x, source_cell.y))
-        target = new_cell_map.get(self._find_cell(target_cell.x, target_cell.y))
-
-        if not source or not target:
-            return new_state
-
-        source.points -= cost
-        source.strength = (source.points // 10) + 1
-
-        connection = SimpleConnection(source, target, source.cell_type, cost)
-        new_state.connections.append(connection)
-
-        points_to_transfer = min(5, source.points)
-
-        if source.cell_type == target.cell_type:
-            target.points += points_to_transfer
+        source, target, cost = move
+        layout = self.layout
+        new_state = self.copy()
+        points = new_state.points
+        owner = new_state.owner
+        pair = layout.pair(source, target)
+        key = new_state.key ^ layout.cell_key(source, owner[source], points[source]) ^ layout.link_key(pair)
+        if target != source:
+            key ^= layout.cell_key(target, owner[target], points[target])
+
+        points[source] -= cost
+        new_state.links = new_state.links | {pair}
+
+        points_to_transfer = min(5, points[source])
+
+        if owner[source] == owner[target]:
+            points[target] += points_to_transfer
         else:
-            target.points -= points_to_transfer
-            if target.points <= 0:
-                target.cell_type = source.cell_type
-                target.points = abs(target.points) + 1
-
-        target.strength = (target.points // 10) + 1
-
+            points[target] -= points_to_transfer
+            if points[target] <= 0:
+                owner[target] = owner[source]
+                points[target] = abs(points[target]) + 1
+
+        key ^= layout.cell_key(source, owner[source], points[source])
+        if target != source:
+            key ^= layout.cell_key(target, owner[target], points[target])
+        new_state.key = key
         return new_state
 
-    def _find_cell(self, x, y):
-        """Znajduje komórkę o podanych współrzędnych"""
-        for cell in self.cells:
-            if cell.x == x and cell.y == y:
-                return cell
-        return None
+    def _counts(self):
+        own = self.owner.count(self.side)
+        opponent = self.owner.count(ENEMY if self.side == PLAYER else PLAYER)
+        return own, opponent
 
     def check_game_outcome(self):
-        """Sprawdza czy gra się zakończyła i zwraca wynik"""
-        player_cells = sum(1 for cell in self.cells if cell.cell_type == "player")
-        enemy_cells = sum(1 for cell in self.cells if cell.cell_type == "enemy")
+        """Sprawdza czy gra się zakończyła i zwraca wynik z punktu widzenia strony side"""
+        own, opponent = self._counts()
 
-        if player_cells == 0:
+        if own == 0:
             return 0
-        elif enemy_cells == 0:
+        elif opponent == 0:
             return 1
         else:
             return None
 
+    def score(self):
+        """Udział komórek strony side wśród komórek obu walczących stron"""
+        own, opponent = self._counts()
+        if own == 0:
+            return 0
+        elif opponent == 0:
+            return 1
+        return own / (own + opponent)
+
     def get_possible_moves(self):
-        """Generuje listę wszystkich możliwych ruchów w tym stanie"""
+        """Generuje listę wszystkich możliwych ruchów strony side w tym stanie"""
         possible_moves = []
-        player_cells = [cell for cell in self.cells if cell.cell_type == "player"]
+        owner, points, links = self.owner, self.points, self.links
+        layout = self.layout
+        n = layout.size
+        side = self.side
 
-        for source_cell in player_cells:
-            if source_cell.points < 2:
+        for source in range(n):
+            if owner[source] != side or points[source] < 2:
                 continue
+            targets, costs = layout.reachable(source, points[source])
+            for target, cost in zip(targets, costs):
+                if (source * n + target if source < target else target * n + source) not in links:
+                    possible_moves.append((source, target, cost))
 
-            for target_cell in self.cells:
-                if target_cell == source_cell:
-                    continue
-
-                connection_exists = False
-                for conn in self.connections:
-                    if ((conn.source_cell == source_cell and conn.target_cell == target_cell) or
-                        (conn.source_cell == target_cell and conn.target_cell == source_cell)):
-                        connection_exists = True
-                        break
-
-                if connection_exists:
-                    continue
-
-                dx = target_cell.x - source_cell.x
-                dy = target_cell.y - source_cell.y
-                distance = math.hypot(dx, dy)
-                cost = int(distance / 20)
-
-                if source_cell.points >= cost:
-                    possible_moves.append((source_cell, target_cell, cost))
-
-        return possible_moves
\ No newline at end of file
+        return possible_moves
@@ -0,0 +1,473 @@
+import math
+import time
+
+import numpy as np
+
+import game_rules
+
+# Silnik reguł gry bez Qt: kropki w drodze, konflikty mostów, zamrożenie i przejmowanie komórek.
+# GameScene trzyma w nim swoje komórki i mosty (CellUnit / CellConnection) i tylko rysuje wynik,
+# a AI i skrypty mogą krokować kopię planszy (Cell / Bridge) tysiące razy na sekundę bez wyświetlania.
+
+
+def strength_for(points):
+    """Poziom komórki (liczba możliwych mostów) dla danej liczby punktów"""
+    return (points // game_rules.POINTS_PER_STRENGTH) + 1
+
+
+def bridge_cost(source, target):
+    """Koszt mostu między komórkami – zależy tylko od odległości"""
+    return int(math.hypot(target.x - source.x, target.y - source.y) / game_rules.BRIDGE_COST_DIVISOR)
+
+
+def add_point(cell):
+    """Przyrost punktu komórki (bez zamrożonych i ponad limit); zwraca True, jeśli punkty się zmieniły"""
+    if cell.frozen or cell.points >= game_rules.MAX_CELL_POINTS:
+        return False
+    cell.points += 1
+    cell.strength = strength_for(cell.points)
+    return True
+
+
+class Cell:
+    """Komórka bez grafiki – te same atrybuty co CellUnit"""
+    def __init__(self, x, y, cell_type, points=10):
+        self.x = x
+        self.y = y
+        self.cell_type = cell_type
+        self.points = points
+        self.strength = strength_for(points)
+        self.connections = []
+        self.frozen = False
+        self.freeze_end_time = 0
+
+
+class Bridge:
+    """Most bez grafiki (bazowa klasa CellConnection).
+       Kropki mostu należącego do symulacji są w jej wspólnej tablicy (DotStore) – `dots` zwraca wtedy
+       kopię listy postępów, a przypisanie `dots = [...]` je zastępuje. Most spoza symulacji
+       (np. w powtórce) trzyma kropki w zwykłej liście."""
+    def __init__(self, source_cell, target_cell, connection_type="neutral"):
+        self.source_cell = source_cell
+        self.target_cell = target_cell
+        self.connection_type = connection_type
+        self.cost = 0
+        self.conflict = False
+        self.conflict_progress = 0
+        self.store = None
+        self.slot = None
+        self._dots = []
+
+    @property
+    def dots(self):
+        if self.store is None:
+            return self._dots
+        return self.store.of(self.slot)
+
+    @dots.setter
+    def dots(self, dots):
+        if self.store is None:
+            self._dots = list(dots)
+        else:
+            self.store.replace(self.slot, dots)
+
+
+class DotStore:
+    """Kropki wszystkich mostów w jednej ciągłej tablicy numpy: postęp na moście (0..1) i numer mostu (slot).
+       Ruch, wykrycie dotarcia i zliczenie kropek per most to kilka operacji wektorowych na klatkę."""
+    def __init__(self, capacity=256):
+        self.progress = np.empty(capacity)
+        self.slots = np.empty(capacity, dtype=np.int64)
+        self.count = 0
+        self.bridges = []    # slot -> most (None – wolny)
+        self.free = []
+
+    def attach(self, bridge):
+        if self.free:
+            slot = self.free.pop()
+            self.bridges[slot] = bridge
+        else:
+            slot = len(self.bridges)
+            self.bridges.append(bridge)
+        dots = bridge._dots
+        bridge.store, bridge.slot, bridge._dots = self, slot, []
+        if dots:
+            self.extend(np.full(len(dots), slot), dots)
+
+    def detach(self, bridge):
+        """Usuwa most razem z jego kropkami"""
+        if bridge.store is not self:
+            return
+        self._drop(self.slots[:self.count] == bridge.slot)
+        self.bridges[bridge.slot] = None
+        self.free.append(bridge.slot)
+        bridge.store, bridge.slot = None, None
+
+    def extend(self, slots, progress):
+        added = len(slots)
+        if not added:
+            return
+        needed = self.count + added
+        if needed > len(self.progress):
+            capacity = max(needed, 2 * len(self.progress))
+            self.progress = np.resize(self.progress, capacity)
+            self.slots = np.resize(self.slots, capacity)
+        self.progress[self.count:needed] = progress
+        self.slots[self.count:needed] = slots
+        self.count = needed
+
+    def _drop(self, mask):
+        keep = ~mask
+        kept = int(np.count_nonzero(keep))
+        if kept == self.count:
+            return
+        self.progress[:kept] = self.progress[:self.count][keep]
+        self.slots[:kept] = self.slots[:self.count][keep]
+        self.count = kept
+
+    def of(self, slot):
+        return self.progress[:self.count][self.slots[:self.count] == slot].tolist()
+
+    def replace(self, slot, dots):
+        self._drop(self.slots[:self.count] == slot)
+        self.extend(np.full(len(dots), slot), dots)
+
+    def grouped(self):
+        """{slot: lista postępów} dla wszystkich mostów jednym sortowaniem"""
+        order = np.argsort(self.slots[:self.count], kind='stable')
+        slots = self.slots[order]
+        progress = self.progress[order]
+        starts = np.flatnonzero(np.diff(slots)) + 1
+        return {int(chunk_slots[0]): chunk.tolist()
+                for chunk_slots, chunk in zip(np.split(slots, starts), np.split(progress, starts)) if len(chunk)}
+
+    def advance(self, step, active_slots):
+        """Przesuwa kropki aktywnych mostów o step; usuwa te, które dotarły do celu,
+           i zwraca tablicę liczby dotarłych kropek per slot (None, gdy żadna nie dotarła)"""
+        n = self.count
+        if not n or not active_slots:
+            return None
+        active = np.zeros(len(self.bridges), dtype=bool)
+        active[active_slots] = True
+        moving = active[self.slots[:n]]
+        progress = self.progress[:n]
+        progress[moving] += step
+        arrived = moving & (progress >= 1.0)
+        if not arrived.any():
+            return None
+        counts = np.bincount(self.slots[:n][arrived], minlength=len(self.bridges))
+        self._drop(arrived)
+        return counts
+
+    def positions(self):
+        """Współrzędne wszystkich kropek: (sloty, x, y) liczone wektorowo z końców mostów"""
+        n = self.count
+        ends = np.array([(b.source_cell.x, b.source_cell.y, b.target_cell.x, b.target_cell.y) if b is not None
+                         else (0.0, 0.0, 0.0, 0.0) for b in self.bridges], dtype=float).reshape(-1, 4)
+        slots = self.slots[:n]
+        progress = self.progress[:n]
+        ends = ends[slots]
+        x = ends[:, 0] + progress * (ends[:, 2] - ends[:, 0])
+        y = ends[:, 1] + progress * (ends[:, 3] - ends[:, 1])
+        return slots, x, y
+
+
+def dots_by_bridge(connections):
+    """{most: lista postępów} – mosty z tej samej symulacji grupowane jednym sortowaniem"""
+    grouped = {}
+    result = {}
+    for conn in connections:
+        if conn.store is None:
+            result[conn] = list(conn.dots)
+            continue
+        groups = grouped.get(id(conn.store))
+        if groups is None:
+            groups = grouped[id(conn.store)] = conn.store.grouped()
+        result[conn] = groups.get(conn.slot, [])
+    return result
+
+
+class Simulation:
+    """Stan planszy i reguły gry. tick() to jedna klatka (FRAME_INTERVAL_MS), add_points() to takt punktów
+       (POINTS_INTERVAL_MS); step()/run() łączą oba przy krokowaniu bez zegarów Qt.
+       Metody zmieniające stan zwracają listę zdarzeń, które scena zamienia na logi i historię ruchów:
+       ("bridge_removed", most, powód) – także dla mostów wychodzących z przejętej komórki (powód "captured") –
+       i ("captured", komórka, punkty przed przejęciem, nowy typ, liczba usuniętych mostów)."""
+
+    def __init__(self, cells=None, connections=None, connection_class=Bridge, clock=None, start_time=0.0):
+        self.cells = cells if cells is not None else []
+        self.connections = connections if connections is not None else []
+        self.connection_class = connection_class
+        # clock – zegar rzeczywisty (scena, time.time); bez niego czas płynie tylko przez step()
+        self.clock = clock
+        self.time = start_time
+        self.frame_dt = game_rules.FRAME_INTERVAL_MS / 1000
+        self.points_dt = game_rules.POINTS_INTERVAL_MS / 1000
+        self.points_elapsed = 0.0
+        self.events = []
+
+    @property
+    def connections(self):
+        return self._connections
+
+    @connections.setter
+    def connections(self, connections):
+        """Nowa lista mostów (nowy poziom, wczytanie gry) – kropki przenoszone do nowej tablicy"""
+        self._connections = connections
+        self.dot_store = DotStore()
+        for conn in connections:
+            self.dot_store.attach(conn)
+
+    @classmethod
+    def from_scene(cls, cells, connections, start_time=None):
+        """Niezależna kopia planszy (Cell / Bridge) – np. dla AI działającego w innym wątku"""
+        copies = {}
+        for cell in cells:
+            copy = Cell(cell.x, cell.y, cell.cell_type, cell.points)
+            copy.strength = cell.strength
+            copy.frozen = cell.frozen
+            copy.freeze_end_time = cell.freeze_end_time
+            copies[cell] = copy
+        bridges = []
+        dots = dots_by_bridge(connections)
+        for conn in connections:
+            source = copies.get(conn.source_cell)
+            target = copies.get(conn.target_cell)
+            if source is None or target is None:
+                continue
+            bridge = Bridge(source, target, conn.connection_type)
+            bridge.cost = conn.cost
+            bridge.dots = dots[conn]
+            bridge.conflict = conn.conflict
+            bridge.conflict_progress = conn.conflict_progress
+            source.connections.append(bridge)
+            target.connections.append(bridge)
+            bridges.append(bridge)
+        return cls(list(copies.values()), bridges, start_time=time.time() if start_time is None else start_time)
+
+    def copy(self):
+        simulation = Simulation.from_scene(self.cells, self.connections, self.now())
+        simulation.points_elapsed = self.points_elapsed
+        return simulation
+
+    def now(self):
+        return self.clock() if self.clock is not None else self.time
+
+    def _take_events(self):
+        events, self.events = self.events, []
+        return events
+
+    # --- Mosty ---
+
+    def create_connection(self, source, target, conn_type, cost=0):
+        """Dodaje most; zwraca go lub None, gdy trafia na przeciwny most innego typu (konflikt)"""
+        if source.cell_type != conn_type:
+            conn_type = source.cell_type
+        for conn in self.connections:
+            if conn.source_cell == target and conn.target_cell == source and conn.connection_type != conn_type:
+                conn.conflict = True
+                return None
+        connection = self.connection_class(source, target, conn_type)
+        connection.cost = cost
+        connection.conflict = False
+        self.dot_store.attach(connection)
+        source.connections.append(connection)
+        target.connections.append(connection)
+        self.connections.append(connection)
+        return connection
+
+    def remove_connection(self, conn):
+        if conn in conn.source_cell.connections:
+            conn.source_cell.connections.remove(conn)
+        if conn in conn.target_cell.connections:
+            conn.target_cell.connections.remove(conn)
+        if conn in self.connections:
+            self.connections.remove(conn)
+        self.dot_store.detach(conn)
+
+    def apply_move(self, move):
+        """Ruch AI (indeks źródła, indeks celu, koszt): opłata za most i jego budowa, jak ruch gracza"""
+        source_index, target_index, cost = move
+        source = self.cells[source_index]
+        target = self.cells[target_index]
+        if source.points < cost:
+            return None
+        source.points -= cost
+        source.strength = strength_for(source.points)
+        return self.create_connection(source, target, source.cell_type, cost)
+
+    def cut_connection(self, conn, fraction):
+        """Przecięcie mostu przez gracza w miejscu fraction (0..1 od źródła): round(fraction * koszt) wraca
+           do źródła, reszta trafia do celu – do własnej komórki jako punkty, do obcej jako atak"""
+        self.remove_connection(conn)
+        source, target = conn.source_cell, conn.target_cell
+        cost = getattr(conn, "cost", 0)
+        source_points = round(fraction * cost)
+        target_points = cost - source_points
+        if conn.connection_type != "neutral":
+            if target.cell_type != conn.connection_type:
+                source.points += source_points
+                target.points -= target_points
+                if target.points <= 0:
+                    target.cell_type = conn.connection_type
+                    target.points = abs(target.points)
+            else:
+                source.points = min(source.points + source_points, game_rules.MAX_CELL_POINTS)
+                target.points = min(target.points + target_points, game_rules.MAX_CELL_POINTS)
+        source.strength = strength_for(source.points)
+        target.strength = strength_for(target.points)
+
+    def freeze(self, cell, duration=game_rules.FREEZE_DURATION_SECONDS):
+        cell.frozen = True
+        cell.freeze_end_time = self.now() + duration
+
+    def take_over(self, cell, cell_type):
+        cell.cell_type = cell_type
+
+    def add_bonus(self, cell, points=game_rules.BONUS_POINTS):
+        cell.points = min(cell.points + points, game_rules.MAX_CELL_POINTS)
+        cell.strength = strength_for(cell.points)
+
+    # --- Takty ---
+
+    def add_points(self):
+        """Takt punktów: +1 dla komórek wszystkich frakcji (nie neutralnych), każdy aktywny most wysyła kropkę"""
+        for cell in self.cells:
+            if cell.cell_type != "neutral":
+                add_point(cell)
+        sending = []
+        for conn in self.connections:
+            if conn.connection_type != "neutral":
+                if conn.source_cell.frozen or conn.target_cell.frozen:
+                    continue
+                if conn.source_cell.points >= 1:
+                    conn.source_cell.points -= 1
+                    conn.source_cell.strength = strength_for(conn.source_cell.points)
+                    sending.append(conn.slot)
+        self.dot_store.extend(sending, np.zeros(len(sending)))
+        return self._take_events()
+
+    def tick(self):
+        """Jedna klatka: spójność mostów, ruch kropek i dostarczanie punktów, konflikty, koniec zamrożenia"""
+        now = self.now()
+        for cell in self.cells:
+            if cell.frozen and now >= cell.freeze_end_time:
+                cell.frozen = False
+                cell.freeze_end_time = 0
+
+        for conn in list(self.connections):
+            if conn.source_cell.cell_type != conn.connection_type:
+                self.remove_connection(conn)
+                self.events.append(("bridge_removed", conn, "inconsistent"))
+
+        # Kropki: ruch wektorowy w DotStore, potem dostarczenie punktów paczkami per most
+        # (w kolejności mostów – przejęcie przez jeden most zmienia skutek kolejnych)
+        active = [conn.slot for conn in self.connections
+                  if conn.connection_type != "neutral" and not conn.conflict
+                  and not conn.source_cell.frozen and not conn.target_cell.frozen]
+        counts = self.dot_store.advance(game_rules.DOT_SPEED * self.frame_dt, active)
+        if counts is not None:
+            for conn in list(self.connections):
+                # mosty usunięte przez wcześniejsze przejęcie w tej klatce nie mają już slotu
+                if conn.store is not None and counts[conn.slot]:
+                    self._deliver(conn, int(counts[conn.slot]))
+
+        conflict_step = game_rules.CONFLICT_SPEED * self.frame_dt
+        for conn in self.connections:
+            if conn.conflict:
+                conn.conflict_progress += conflict_step
+                if conn.conflict_progress >= 1.0:
+                    conn.source_cell.points -= 1
+                    conn.target_cell.points -= 1
+                    conn.source_cell.strength = strength_for(conn.source_cell.points)
+                    conn.target_cell.strength = strength_for(conn.target_cell.points)
+
+        for cell in self.cells:
+            if cell.points <= 0:
+                for conn in list(self.connections):
+                    if conn.conflict and (conn.source_cell == cell or conn.target_cell == cell):
+                        cell.points += conn.cost // 2
+                        self.remove_connection(conn)
+                        self.events.append(("bridge_removed", conn, "conflict"))
+
+        if self.clock is None:
+            self.time += self.frame_dt
+        return self._take_events()
+
+    def _deliver(self, conn, arrived):
+        """Dostarczenie `arrived` kropek do celu mostu naraz (wynik jak przy dostarczaniu po jednej)"""
+        target = conn.target_cell
+        transfer = arrived * game_rules.DOT_TRANSFER
+        if conn.connection_type != target.cell_type:
+            # punkty potrzebne do przejęcia (komórka z <= 0 punktów pada od pierwszej kropki)
+            needed = max(target.points, game_rules.DOT_TRANSFER)
+            if transfer < needed:
+                target.points -= transfer
+            else:
+                points_before = target.points - needed
+                target.cell_type = conn.connection_type
+                target.points = 1
+                transfer -= needed
+                # Przejęta komórka traci swoje mosty wychodzące
+                removed = [rem_conn for rem_conn in self.connections if rem_conn.source_cell == target]
+                for rem_conn in removed:
+                    self.remove_connection(rem_conn)
+                    self.events.append(("bridge_removed", rem_conn, "captured"))
+                self.events.append(("captured", target, points_before, conn.connection_type, len(removed)))
+        if conn.connection_type == target.cell_type and transfer and target.points < game_rules.MAX_CELL_POINTS:
+            target.points = min(target.points + transfer, game_rules.MAX_CELL_POINTS)
+        target.strength = strength_for(target.points)
+
+    def step(self):
+        """Klatka symulacji z taktem punktów co POINTS_INTERVAL_MS (krokowanie bez zegarów Qt)"""
+        events = self.tick()
+        self.points_elapsed += self.frame_dt
+        if self.points_elapsed >= self.points_dt:
+            self.points_elapsed -= self.points_dt
+            events.extend(self.add_points())
+        return events
+
+    def run(self, seconds):
+        for _ in range(int(round(seconds / self.frame_dt))):
+            self.step()
+
+    def bridges_with_dots(self):
+        """Mosty, na których są kropki (tylko ich obszar zmienia się między klatkami)"""
+        store = self.dot_store
+        return [store.bridges[slot] for slot in np.unique(store.slots[:store.count]).tolist()]
+
+    def dot_positions(self):
+        """{typ mostu: (x, y)} – współrzędne kropek do narysowania (bez mostów w konflikcie)"""
+        slots, x, y = self.dot_store.positions()
+        kinds = np.array([0 if bridge is None or bridge.conflict else 1 if bridge.connection_type == "player" else 2
+                          for bridge in self.dot_store.bridges], dtype=np.int8)
+        kind = kinds[slots]
+        return {"player": (x[kind == 1], y[kind == 1]), "enemy": (x[kind == 2], y[kind == 2])}
+
+    # --- Ocena ---
+
+    def counts(self, cell_type):
+        """(komórki, punkty) strony cell_type i jej przeciwnika"""
+        opponent = "enemy" if cell_type == "player" else "player"
+        own = [cell.points for cell in self.cells if cell.cell_type == cell_type]
+        other = [cell.points for cell in self.cells if cell.cell_type == opponent]
+        return len(own), sum(own), len(other), sum(other)
+
+    def factions(self):
+        """Frakcje, które mają jeszcze komórki (gra wieloosobowa – zwycięzcą jest ostatnia)"""
+        return sorted({cell.cell_type for cell in self.cells if cell.cell_type != "neutral"})
+
+    def winner(self):
+        own_cells, _, other_cells, _ = self.counts("player")
+        if own_cells == 0:
+            return "enemy"
+        if other_cells == 0:
+            return "player"
+        return None
+
+    def score(self, cell_type):
+        """Ocena pozycji dla strony cell_type: udział w komórkach, a przy remisie udział w punktach"""
+        own_cells, own_points, other_cells, other_points = self.counts(cell_type)
+        if own_cells == 0:
+            return 0.0, 0.0
+        return own_cells / (own_cells + other_cells), own_points / max(own_points + other_points, 1)
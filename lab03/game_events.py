@@ -0,0 +1,155 @@
+import re
+
+# Zdarzenia historii gry (GameScene.move_history) – słowniki z polami liczbowymi i indeksami komórek
+# (kolejność jak w initial_state), więc zapis do JSON/XML/MongoDB/formatu binarnego i odtwarzanie
+# nie formatują ani nie parsują tekstu. Stare powtórki z opisami tekstowymi zamienia normalize().
+
+BRIDGE_CREATED = "bridge_created"      # source, target, cost
+BRIDGE_REMOVED = "bridge_removed"      # source, target
+STATUS = "status"                      # cells: [[typ, punkty], ...] dla każdej komórki
+PRE_FINAL_STATUS = "pre_final_status"  # status przed ogłoszeniem wyniku
+FINAL_STATUS = "final_status"          # status po ogłoszeniu wyniku
+RESULT = "result"                      # text
+NOTE = "note"                          # text – pozostałe wpisy
+
+STATUS_TYPES = (STATUS, PRE_FINAL_STATUS, FINAL_STATUS)
+
+
+def bridge_created(timestamp, source, target, cost):
+    return {"timestamp": timestamp, "type": BRIDGE_CREATED, "source": source, "target": target, "cost": cost}
+
+
+def bridge_removed(timestamp, source, target):
+    return {"timestamp": timestamp, "type": BRIDGE_REMOVED, "source": source, "target": target}
+
+
+def status(timestamp, cells, event_type=STATUS):
+    """Stan wszystkich komórek (obiekty z cell_type i points)"""
+    return {"timestamp": timestamp, "type": event_type, "cells": [[cell.cell_type, cell.points] for cell in cells]}
+
+
+def result(timestamp, text):
+    return {"timestamp": timestamp, "type": RESULT, "text": text}
+
+
+def note(timestamp, text):
+    return {"timestamp": timestamp, "type": NOTE, "text": text}
+
+
+# --- Zgodność ze starymi powtórkami (opisy tekstowe) ---
+
+_CREATE_RE = re.compile(r"Utworzono most między \(([\d.]+),\s*([\d.]+)\)\s*a\s*\(([\d.]+),\s*([\d.]+)\)\s*o koszcie (\d+)")
+_REMOVE_RE = re.compile(r"Usunięto most między \(([\d.]+),\s*([\d.]+)\)\s*a\s*\(([\d.]+),\s*([\d.]+)\)")
+_STATUS_RE = re.compile(r"\((\w+)\s+@\s+([\d.]+),([\d.]+):\s+(\d+)\s+pts\)")
+_STATUS_PREFIXES = (("Status punktowy:", STATUS),
+                    ("Status przed ostatnim ruchem:", PRE_FINAL_STATUS),
+                    ("Status po ogłoszeniu wyniku:", FINAL_STATUS))
+
+
+class CellIndex:
+    """Indeks komórki po współrzędnych ze starego opisu (tolerancja 10 px, jak dawniej w PlaybackScene)"""
+
+    def __init__(self, cells):
+        self.positions = [(float(cell["x"]), float(cell["y"])) for cell in cells]
+        self.exact = {(round(x), round(y)): i for i, (x, y) in enumerate(self.positions)}
+
+    def find(self, x, y):
+        index = self.exact.get((round(float(x)), round(float(y))))
+        if index is not None:
+            return index
+        for i, (cx, cy) in enumerate(self.positions):
+            if abs(cx - float(x)) < 10 and abs(cy - float(y)) < 10:
+                return i
+        return None
+
+
+def from_description(timestamp, description, index):
+    """Zdarzenie ze starego opisu tekstowego; komórki spoza planszy w statusie mają wartość None"""
+    description = description.strip()
+    if description.startswith("Utworzono most"):
+        m = _CREATE_RE.search(description)
+        if m:
+            source, target = index.find(m.group(1), m.group(2)), index.find(m.group(3), m.group(4))
+            if source is not None and target is not None:
+                return bridge_created(timestamp, source, target, int(m.group(5)))
+    elif description.startswith("Usunięto most"):
+        m = _REMOVE_RE.search(description)
+        if m:
+            source, target = index.find(m.group(1), m.group(2)), index.find(m.group(3), m.group(4))
+            if source is not None and target is not None:
+                return bridge_removed(timestamp, source, target)
+    elif description.startswith("Wynik:"):
+        return result(timestamp, description.replace("Wynik:", "").strip())
+    else:
+        for prefix, event_type in _STATUS_PREFIXES:
+            if description.startswith(prefix):
+                cells = [None] * len(index.positions)
+                for cell_type, x, y, points in _STATUS_RE.findall(description):
+                    i = index.find(x, y)
+                    if i is not None:
+                        cells[i] = [cell_type, int(points)]
+                return {"timestamp": timestamp, "type": event_type, "cells": cells}
+    return note(timestamp, description)
+
+
+def _find_point(index, text):
+    """Indeks komórki z tekstu 'x,y'"""
+    parts = str(text or "").split(",")
+    if len(parts) != 2:
+        return None
+    try:
+        return index.find(parts[0], parts[1])
+    except ValueError:
+        return None
+
+
+def _from_move_type(move, index):
+    """Stary zapis ze słownikiem move_type (Source/Target jako tekst 'x,y')"""
+    timestamp = float(move.get("timestamp", 0))
+    move_type = move.get("move_type")
+    if move_type in ("CreateBridge", "RemoveBridge"):
+        source, target = _find_point(index, move.get("Source")), _find_point(index, move.get("Target"))
+        if source is not None and target is not None:
+            if move_type == "CreateBridge":
+                return bridge_created(timestamp, source, target, int(move.get("Cost", 0)))
+            return bridge_removed(timestamp, source, target)
+    elif move_type in ("Status", "PreFinalStatus"):
+        cells = [None] * len(index.positions)
+        for cell in move.get("Cells", []):
+            i = index.find(cell.get("x", 0), cell.get("y", 0))
+            if i is not None:
+                cells[i] = [cell.get("type", "neutral"), int(cell.get("points", 0))]
+        return {"timestamp": timestamp, "type": STATUS if move_type == "Status" else PRE_FINAL_STATUS, "cells": cells}
+    elif move_type == "Result":
+        return result(timestamp, move.get("Result", ""))
+    return note(timestamp, move.get("Description", ""))
+
+
+def upgrade(move, index, current):
+    """Zdarzenie typowane z dowolnego zapisu (description / move_type / już typowane);
+       brakujące komórki w statusie są uzupełniane ostatnim znanym stanem current"""
+    if "type" in move:
+        event = move
+    elif "description" in move:
+        event = from_description(float(move.get("timestamp", 0)), move["description"], index)
+    else:
+        event = _from_move_type(move, index)
+    if event["type"] in STATUS_TYPES:
+        status_cells = event["cells"]
+        if None in status_cells or len(status_cells) != len(current):
+            event["cells"] = [status_cells[i] if i < len(status_cells) and status_cells[i] is not None else current[i]
+                              for i in range(len(current))]
+    return event
+
+
+def normalize(moves, cells):
+    """Zwraca listę zdarzeń typowanych (stare wpisy są przekształcane przez upgrade)"""
+    index = CellIndex(cells)
+    current = [[cell.get("type", "neutral"), cell.get("points", 0)] for cell in cells]
+    events = []
+    for move in moves:
+        event = upgrade(move, index, current)
+        if event["type"] in STATUS_TYPES:
+            current = event["cells"]
+        events.append(event)
+    return events
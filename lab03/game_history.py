@@ -1,13 +1,101 @@
 import os
-import re
+import threading
 import xml.etree.ElementTree as ET
 import json
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
 
-client = MongoClient("mongodb://localhost:27017")
-db = client["wno2lab"]
-replays_collection = db["replays"]
+import config
+import game_events
+import replay_format
+
+# Klient MongoDB jest tworzony przy pierwszym użyciu, a nie przy imporcie – start gry nie czeka na bazę
+_client = None
+_client_lock = threading.Lock()
+_indexes_ready = False
+
+# Lista powtórek potrzebuje tylko metadanych – bez stanów komórek i pełnej tablicy ruchów
+# (pierwszy ruch zostaje dla starszych dokumentów bez pola "timestamp")
+REPLAY_LIST_PROJECTION = {"initial_state": 0, "final_state": 0, "moves": {"$slice": 1}}
+
+def get_replays_collection():
+    """Kolekcja powtórek w MongoDB (połączenie leniwe, wspólne dla wątków)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(config.MONGODB_URI, serverSelectionTimeoutMS=config.MONGODB_TIMEOUT_MS)
+    return _client[config.MONGODB_DATABASE][config.MONGODB_COLLECTION]
+
+def _indexed_collection():
+    """Kolekcja z indeksem pod listę powtórek (tworzonym raz na uruchomienie)"""
+    global _indexes_ready
+    collection = get_replays_collection()
+    if not _indexes_ready:
+        collection.create_index([("level", ASCENDING), ("is_quicksave", ASCENDING), ("timestamp", DESCENDING)])
+        _indexes_ready = True
+    return collection
+
+def summarize_history(history):
+    """
+    Metadane powtórki do katalogu i listy w menu: czas rozpoczęcia, długość, wynik
+    ("win" / "loss" / "other" – jak w PlaybackScene.show_game_result), liczba komórek graczy i zdarzeń.
+    """
+    moves = history.get("moves", [])
+    final_types = [cell.get("type") for cell in history.get("final_state", {}).get("cells", [])]
+    if not final_types:
+        for move in reversed(moves):
+            if move.get("type") in (game_events.STATUS, game_events.FINAL_STATUS):
+                final_types = [cell_type for cell_type, _ in move["cells"]]
+                break
+    player_cells = final_types.count("player")
+    enemy_cells = final_types.count("enemy")
+    if enemy_cells == 0 and player_cells > 0:
+        result = "win"
+    elif player_cells == 0 and enemy_cells > 0:
+        result = "loss"
+    else:
+        result = "other"
+    start = moves[0].get("timestamp") if moves else None
+    return {
+        "timestamp": start,
+        "duration": moves[-1].get("timestamp", start) - start if moves else 0,
+        "result": result,
+        "player_cells": player_cells,
+        "enemy_cells": enemy_cells,
+        "move_count": len(moves),
+    }
+
+def history_snapshot(game_scene, is_quicksave=False):
+    """
+    Historia gry jako zwykły słownik (poziom, stan początkowy, zdarzenia, stan końcowy).
+    Wspólna postać dla zapisu XML/JSON/binarnego/MongoDB – tworzona raz w wątku GUI,
+    zapisywana w tle (persistence.py).
+    """
+    return {
+        "level": game_scene.current_level,
+        "is_quicksave": is_quicksave,
+        "initial_state": {
+            "cells": [
+                {
+                    "x": cell.x,
+                    "y": cell.y,
+                    "type": str(getattr(cell, 'initial_type', cell.cell_type)),
+                    "points": cell.points
+                } for cell in game_scene.cells
+            ]
+        },
+        "moves": list(getattr(game_scene, "move_history", [])),
+        "final_state": {
+            "cells": [
+                {
+                    "x": cell.x,
+                    "y": cell.y,
+                    "type": cell.cell_type,
+                    "points": cell.points
+                } for cell in game_scene.cells
+            ]
+        }
+    }
 
 def save_game_history(game_scene, filename):
     """
@@ -15,96 +103,104 @@ def save_game_history(game_scene, filename):
     W zapisie znajduje się początkowy stan (lista komórek i połączeń),
     lista ruchów oraz stan końcowy.
     """
+    write_history_xml(history_snapshot(game_scene), filename)
+
+def write_history_xml(history, filename):
+    """Zapis historii (history_snapshot) do pliku XML"""
     root = ET.Element("GameHistory")
 
     initial_state = ET.SubElement(root, "InitialState")
     cells_el = ET.SubElement(initial_state, "Cells")
-    for cell in game_scene.cells:
+    for cell in history["initial_state"]["cells"]:
         cell_el = ET.SubElement(cells_el, "Cell")
-        cell_el.set("x", str(cell.x))
-        cell_el.set("y", str(cell.y))
-        cell_el.set("type", str(getattr(cell, 'initial_type', cell.cell_type)))
-        cell_el.set("points", str(cell.points))
+        cell_el.set("x", str(cell["x"]))
+        cell_el.set("y", str(cell["y"]))
+        cell_el.set("type", cell["type"])
+        cell_el.set("points", str(cell["points"]))
 
     moves_el = ET.SubElement(root, "Moves")
-    if hasattr(game_scene, "move_history"):
-        for move in game_scene.move_history:
-            move_el = ET.SubElement(moves_el, "Move")
-            move_el.set("timestamp", str(move.get("timestamp", 0)))
-            description = move.get("description", "")
-            if description.startswith("Utworzono most"):
-                create_el = ET.SubElement(move_el, "CreateBridge")
-                m = re.search(r"Utworzono most między \(([\d.]+), ([\d.]+)\) a \(([\d.]+), ([\d.]+)\) o koszcie (\d+)", description)
-                if m:
-                    ET.SubElement(create_el, "Source").text = f"{m.group(1)},{m.group(2)}"
-                    ET.SubElement(create_el, "Target").text = f"{m.group(3)},{m.group(4)}"
-                    ET.SubElement(create_el, "Cost").text = m.group(5)
-                else:
-                    ET.SubElement(create_el, "Info").text = description
-            elif description.startswith("Usunięto most"):
-                remove_el = ET.SubElement(move_el, "RemoveBridge")
-                m = re.search(r"Usunięto most między \(([\d.]+), ([\d.]+)\) a \(([\d.]+), ([\d.]+)\)", description)
-                if m:
-                    ET.SubElement(remove_el, "Source").text = f"{m.group(1)},{m.group(2)}"
-                    ET.SubElement(remove_el, "Target").text = f"{m.group(3)},{m.group(4)}"
-                else:
-                    ET.SubElement(remove_el, "Info").text = description
-            elif description.startswith("Status punktowy:"):
-                status_el = ET.SubElement(move_el, "Status")
-                parts = description.replace("Status punktowy:", "").split(";")
-                for part in parts:
-                    part = part.strip()
-                    if part:
-                        m = re.search(r"\((\w+)\s+@\s+([\d.]+),([\d.]+):\s+(\d+)\s+pts\)", part)
-                        if m:
-                            cell_status = ET.SubElement(status_el, "Cell")
-                            cell_status.set("type", m.group(1))
-                            cell_status.set("x", m.group(2))
-                            cell_status.set("y", m.group(3))
-                            cell_status.set("points", m.group(4))
-                        else:
-                            ET.SubElement(status_el, "Info").text = part
-            elif description.startswith("Status przed ostatnim ruchem:"):
-                pre_final_el = ET.SubElement(move_el, "PreFinalStatus")
-                parts = description.replace("Status przed ostatnim ruchem:", "").split(";")
-                for part in parts:
-                    part = part.strip()
-                    if part:
-                        m = re.search(r"\((\w+)\s+@\s+([\d.]+),([\d.]+):\s+(\d+)\s+pts\)", part)
-                        if m:
-                            cell_status = ET.SubElement(pre_final_el, "Cell")
-                            cell_status.set("type", m.group(1))
-                            cell_status.set("x", m.group(2))
-                            cell_status.set("y", m.group(3))
-                            cell_status.set("points", m.group(4))
-                        else:
-                            ET.SubElement(pre_final_el, "Info").text = part
-            elif description.startswith("Wynik:"):
-                result_el = ET.SubElement(move_el, "Result")
-                result_el.text = description.replace("Wynik:", "").strip()
-            else:
-                ET.SubElement(move_el, "Description").text = description
+    for move in history["moves"]:
+        move_el = ET.SubElement(moves_el, "Move")
+        move_el.set("timestamp", str(move.get("timestamp", 0)))
+        move_type = move["type"]
+        if move_type == game_events.BRIDGE_CREATED:
+            create_el = ET.SubElement(move_el, "CreateBridge")
+            create_el.set("source", str(move["source"]))
+            create_el.set("target", str(move["target"]))
+            create_el.set("cost", str(move["cost"]))
+        elif move_type == game_events.BRIDGE_REMOVED:
+            remove_el = ET.SubElement(move_el, "RemoveBridge")
+            remove_el.set("source", str(move["source"]))
+            remove_el.set("target", str(move["target"]))
+        elif move_type in game_events.STATUS_TYPES:
+            status_el = ET.SubElement(move_el, _STATUS_TAGS[move_type])
+            for cell_type, points in move["cells"]:
+                cell_status = ET.SubElement(status_el, "Cell")
+                cell_status.set("type", cell_type)
+                cell_status.set("points", str(points))
+        elif move_type == game_events.RESULT:
+            ET.SubElement(move_el, "Result").text = move["text"]
+        else:
+            ET.SubElement(move_el, "Description").text = move.get("text", "")
 
     final_state = ET.SubElement(root, "FinalState")
     final_cells_el = ET.SubElement(final_state, "Cells")
-    for cell in game_scene.cells:
+    for cell in history["final_state"]["cells"]:
         cell_el = ET.SubElement(final_cells_el, "Cell")
-        cell_el.set("x", str(cell.x))
-        cell_el.set("y", str(cell.y))
-        cell_el.set("type", cell.cell_type)
-        cell_el.set("points", str(cell.points))
+        cell_el.set("x", str(cell["x"]))
+        cell_el.set("y", str(cell["y"]))
+        cell_el.set("type", cell["type"])
+        cell_el.set("points", str(cell["points"]))
 
     tree = ET.ElementTree(root)
     ET.indent(tree, space="    ")
     tree.write(filename, encoding="utf-8", xml_declaration=True)
 
+_STATUS_TAGS = {game_events.STATUS: "Status", game_events.PRE_FINAL_STATUS: "PreFinalStatus",
+                game_events.FINAL_STATUS: "FinalStatus"}
+_STATUS_EVENTS = {tag: event_type for event_type, tag in _STATUS_TAGS.items()}
+
+def event_from_xml(timestamp, child, index):
+    """Zdarzenie z elementu ruchu; starsze pliki mają współrzędne komórek zamiast indeksów"""
+    if child.tag in ("CreateBridge", "RemoveBridge"):
+        if child.get("source") is not None:
+            source, target = int(child.get("source")), int(child.get("target"))
+        else:
+            source_el, target_el = child.find("Source"), child.find("Target")
+            if source_el is None or target_el is None:
+                return game_events.note(timestamp, (child.findtext("Info") or "").strip())
+            source = index.find(*source_el.text.split(","))
+            target = index.find(*target_el.text.split(","))
+            if source is None or target is None:
+                return game_events.note(timestamp, "")
+        if child.tag == "CreateBridge":
+            cost = child.get("cost") if child.get("cost") is not None else child.findtext("Cost", "0")
+            return game_events.bridge_created(timestamp, source, target, int(cost))
+        return game_events.bridge_removed(timestamp, source, target)
+    if child.tag in _STATUS_EVENTS:
+        cells = []
+        for cell_el in child.findall("Cell"):
+            entry = [cell_el.get("type", "neutral"), int(cell_el.get("points", 0))]
+            if cell_el.get("x") is None:
+                cells.append(entry)
+                continue
+            if not cells:
+                cells = [None] * len(index.positions)
+            position = index.find(cell_el.get("x"), cell_el.get("y"))
+            if position is not None:
+                cells[position] = entry
+        return {"timestamp": timestamp, "type": _STATUS_EVENTS[child.tag], "cells": cells}
+    if child.tag == "Result":
+        return game_events.result(timestamp, (child.text or "").strip())
+    return game_events.from_description(timestamp, child.text or "", index)
+
 def load_game_history(filename):
     """
     Odczytuje historię rozgrywki zapisaną w formacie XML
     i zwraca słownik z kluczami:
       - "initial_state": zawiera listy komórek (każda jako słownik)
                          i połączeń (jako słownik z indeksami i danymi)
-      - "moves": lista ruchów, każdy jako słownik (timestamp, description)
+      - "moves": lista zdarzeń (słowniki z game_events)
     """
     if not os.path.exists(filename):
         return {"initial_state": {"cells": [], "connections": []}, "moves": []}
@@ -142,52 +238,14 @@ def load_game_history(filename):
 
     moves_el = root.find("Moves")
     if moves_el is not None:
+        index = game_events.CellIndex(history["initial_state"].get("cells", []))
         for move_el in moves_el.findall("Move"):
             timestamp = float(move_el.get("timestamp", 0))
-            if len(move_el):
-                description_parts = []
-                for child in move_el:
-                    if child.tag == "CreateBridge":
-                        source = child.find("Source").text if child.find("Source") is not None else ""
-                        target = child.find("Target").text if child.find("Target") is not None else ""
-                        cost = child.find("Cost").text if child.find("Cost") is not None else ""
-                        description_parts.append(f"Utworzono most między ({source}) a ({target}) o koszcie {cost}")
-                    elif child.tag == "RemoveBridge":
-                        source = child.find("Source").text if child.find("Source") is not None else ""
-                        target = child.find("Target").text if child.find("Target") is not None else ""
-                        description_parts.append(f"Usunięto most między ({source}) a ({target})")
-                    elif child.tag == "Status":
-                        cell_parts = []
-                        for cell in child.findall("Cell"):
-                            typ = cell.get("type", "neutral")
-                            x = cell.get("x", "0")
-                            y = cell.get("y", "0")
-                            points = cell.get("points", "0")
-                            cell_parts.append(f"({typ} @ {x},{y}: {points} pts)")
-                        description_parts.append("Status punktowy: " + "; ".join(cell_parts))
-                    elif child.tag == "PreFinalStatus":
-                        cell_parts = []
-                        for cell in child.findall("Cell"):
-                            typ = cell.get("type", "neutral")
-                            x = cell.get("x", "0")
-                            y = cell.get("y", "0")
-                            points = cell.get("points", "0")
-                            cell_parts.append(f"({typ} @ {x},{y}: {points} pts)")
-                        description_parts.append("Status przed ostatnim ruchem: " + "; ".join(cell_parts))
-                    elif child.tag == "Result":
-                        result_text = child.text.strip() if child.text else ""
-                        description_parts.append("Wynik: " + result_text)
-                    else:
-                        if child.text:
-                            description_parts.append(child.text.strip())
-                full_description = "\n".join(description_parts)
-            else:
-                full_description = (move_el.text or "").strip()
-            move = {
-                "timestamp": timestamp,
-                "description": full_description.strip()
-            }
-            history["moves"].append(move)
+            for child in move_el:
+                history["moves"].append(event_from_xml(timestamp, child, index))
+            if not len(move_el) and (move_el.text or "").strip():
+                history["moves"].append(game_events.from_description(timestamp, move_el.text, index))
+        history["moves"] = game_events.normalize(history["moves"], history["initial_state"].get("cells", []))
 
     final_state_el = root.find("FinalState")
     if final_state_el is not None:
@@ -209,28 +267,10 @@ def load_game_history(filename):
     return history
 
 def save_game_history_json(game_scene, filename):
-    data = {}
-    data["initial_state"] = {
-        "cells": [
-            {
-                "x": cell.x,
-                "y": cell.y,
-                "type": str(getattr(cell, 'initial_type', cell.cell_type)),
-                "points": cell.points
-            } for cell in game_scene.cells
-        ]
-    }
-    data["moves"] = game_scene.move_history
-    data["final_state"] = {
-        "cells": [
-            {
-                "x": cell.x,
-                "y": cell.y,
-                "type": cell.cell_type,
-                "points": cell.points
-            } for cell in game_scene.cells
-        ]
-    }
+    write_history_json(history_snapshot(game_scene), filename)
+
+def write_history_json(history, filename):
+    data = {key: history[key] for key in ("initial_state", "moves", "final_state")}
     with open(filename, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=4, ensure_ascii=False)
 
@@ -239,45 +279,54 @@ def load_game_history_json(filename):
         return {"initial_state": {"cells": []}, "moves": []}
     with open(filename, "r", encoding="utf-8") as f:
         data = json.load(f)
+    data["moves"] = game_events.normalize(data.get("moves", []), data.get("initial_state", {}).get("cells", []))
     return data
 
 
+def save_game_history_binary(game_scene, filename):
+    """Zapisuje historię gry w binarnym formacie powtórek (replay_format.py)"""
+    return write_history_binary(history_snapshot(game_scene), filename)
+
+def write_history_binary(history, filename):
+    return replay_format.save_replay(history, filename, history["level"],
+                                     config.REPLAY_COMPRESSION, config.REPLAY_KEYFRAME_INTERVAL)
+
+def load_game_history_binary(filename):
+    return replay_format.load_replay(filename)
+
+
 def save_game_history_mongodb(game_scene, is_quicksave=False):
     """
     Zapisuje historię gry do bazy MongoDB.
     Dodaje dodatkowe pole "is_quicksave" określające czy dokument to quicksave.
     """
-    history = {}
-    history["level"] = game_scene.current_level
-    history["is_quicksave"] = is_quicksave
-    history["initial_state"] = {
-        "cells": [
-            {
-                "x": cell.x,
-                "y": cell.y,
-                "type": str(getattr(cell, 'initial_type', cell.cell_type)),
-                "points": cell.points
-            } for cell in game_scene.cells
-        ]
-    }
-    history["moves"] = game_scene.move_history
-    history["final_state"] = {
-        "cells": [
-            {
-                "x": cell.x,
-                "y": cell.y,
-                "type": cell.cell_type,
-                "points": cell.points
-            } for cell in game_scene.cells
-        ]
-    }
-    result = replays_collection.insert_one(history)
-    return result.inserted_id
+    return insert_histories([history_snapshot(game_scene, is_quicksave)])[0]
+
+def insert_histories(histories):
+    """Zapisuje wiele historii jednym insert_many; zwraca identyfikatory dokumentów w tej samej kolejności"""
+    # insert_many dopisuje _id do słowników – kopie, żeby nie zmieniać wspólnej historii;
+    # metadane z summarize_history pozwalają wyświetlić listę bez pobierania ruchów
+    documents = [dict(history, **summarize_history(history)) for history in histories]
+    result = _indexed_collection().insert_many(documents)
+    return result.inserted_ids
+
+def list_replay_documents(level, is_quicksave=None):
+    """Metadane powtórek z MongoDB dla poziomu (od najnowszej), bez stanów i ruchów"""
+    query = {"level": level}
+    if is_quicksave is not None:
+        query["is_quicksave"] = is_quicksave
+    documents = list(_indexed_collection().find(query, REPLAY_LIST_PROJECTION))
+    for doc in documents:
+        if doc.get("timestamp") is None:
+            doc["timestamp"] = doc.get("moves", [{}])[0].get("timestamp", 0) if doc.get("moves") else 0
+        doc.pop("moves", None)
+    documents.sort(key=lambda doc: doc["timestamp"], reverse=True)
+    return documents
 
 def load_game_history_mongodb(replay_id):
     """
     Odczytuje historię gry z bazy MongoDB na podstawie podanego identyfikatora.
     Zwraca dokument (słownik) lub None, jeśli rekord nie został znaleziony.
     """
-    document = replays_collection.find_one({"_id": replay_id})
+    document = get_replays_collection().find_one({"_id": replay_id})
     return document
\ No newline at end of file
@@ -2,10 +2,98 @@ import math
 import time
 
 from PyQt5.QtCore import QRectF, QPointF, Qt
-from PyQt5.QtGui import QPainterPath, QPen, QRadialGradient, QFont, QColor
+from PyQt5.QtGui import QPainter, QPainterPath, QPen, QPixmap, QRadialGradient, QFont, QColor
 from PyQt5.QtWidgets import QGraphicsItem
 
 import config
+import game_engine
+
+# Pre-renderowane sprite'y komórek: gradient, obrys i kropki siły zależą tylko od wyglądu komórki,
+# nie od jej pozycji ani punktów – liczba punktów i licznik zamrożenia są rysowane na wierzchu
+_sprite_cache = {}
+_font_cache = {}
+SPRITE_CACHE_LIMIT = 512
+
+
+def _font(size):
+    font = _font_cache.get(size)
+    if font is None:
+        font = _font_cache[size] = QFont(config.FONT_FAMILY, size)
+    return font
+
+
+def cell_sprite(cell_type, radius, strength, highlighted, frozen, used_dots, scale):
+    """QPixmap komórki dla danego wyglądu; scale – skala urządzenia (widok i HiDPI), by sprite nie był rozmyty"""
+    key = (cell_type, radius, strength, highlighted, frozen, used_dots, scale)
+    pixmap = _sprite_cache.get(key)
+    if pixmap is not None:
+        return pixmap
+    if len(_sprite_cache) >= SPRITE_CACHE_LIMIT:
+        _sprite_cache.clear()
+
+    effective_radius = radius * (1 + 0.2 * (strength - 1))
+    size = effective_radius * 2 + 20
+    pixmap = QPixmap(max(1, math.ceil(size * scale)), max(1, math.ceil(size * scale)))
+    pixmap.fill(Qt.transparent)
+    painter = QPainter(pixmap)
+    painter.setRenderHint(QPainter.Antialiasing)
+    # skalujemy ręcznie – rysowanie na pixmapie z ułamkowym devicePixelRatio < 1 jest przycinane
+    painter.scale(scale, scale)
+    cx = cy = size / 2
+
+    if cell_type == "player":
+        base_color = config.COLOR_PLAYER
+    elif cell_type == "enemy":
+        base_color = config.COLOR_ENEMY
+    else:
+        base_color = config.COLOR_NEUTRAL
+
+    gradient = QRadialGradient(cx, cy, effective_radius)
+    gradient.setColorAt(0, base_color.lighter(150))
+    gradient.setColorAt(0.8, base_color)
+    gradient.setColorAt(1, base_color.darker(150))
+
+    if highlighted:
+        painter.setPen(QPen(Qt.yellow, 4))
+    else:
+        painter.setPen(QPen(Qt.white, 2))
+
+    painter.setBrush(gradient)
+    painter.drawEllipse(QRectF(cx - effective_radius, cy - effective_radius,
+                               effective_radius * 2, effective_radius * 2))
+
+    total_dots = min(strength, 9)
+    rows = math.ceil(total_dots / 3)
+    dot_radius = effective_radius / 10
+    spacing = effective_radius / 3
+    count_dot = 0
+    for row in range(rows):
+        row_dots = 3 if row < rows - 1 else total_dots - row * 3
+        y_dotted = cy + effective_radius * (0.5 + row * 0.15)
+        if y_dotted + dot_radius > cy + effective_radius:
+            y_dotted = cy + effective_radius - dot_radius
+        for col in range(row_dots):
+            x_dotted = cx + (col - (row_dots - 1) / 2) * spacing
+            if count_dot >= total_dots - used_dots:
+                painter.setPen(QPen(Qt.white, 1))
+                painter.setBrush(Qt.NoBrush)
+            else:
+                painter.setPen(Qt.NoPen)
+                painter.setBrush(Qt.white)
+            painter.drawEllipse(QRectF(x_dotted - dot_radius, y_dotted - dot_radius,
+                                       dot_radius * 2, dot_radius * 2))
+            count_dot += 1
+
+    if frozen:
+        painter.setPen(QPen(config.COLOR_FROZEN_OUTLINE, 4))
+        painter.setBrush(Qt.NoBrush)
+        painter.drawEllipse(QRectF(cx - effective_radius, cy - effective_radius,
+                                   effective_radius * 2, effective_radius * 2))
+    painter.end()
+    pixmap.setDevicePixelRatio(scale)
+    _sprite_cache[key] = pixmap
+    return pixmap
+
 
 class CellUnit(QGraphicsItem):
     """Base class for all cell units in the game"""
@@ -23,6 +111,10 @@ class CellUnit(QGraphicsItem):
         self.highlighted = False
         self.frozen = False
         self.freeze_end_time = 0
+        # Qt trzyma gotowy obraz komórki i przerysowuje ją tylko po update()
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+        self._render_key = None
+        self._render_rect = None
 
     def setHighlighted(self, highlighted):
         """Ustawia stan podświetlenia komórki"""
@@ -30,6 +122,23 @@ class CellUnit(QGraphicsItem):
             self.highlighted = highlighted
             self.update()
 
+    def refresh(self):
+        """Przerysowuje komórkę tylko wtedy, gdy zmienił się jej wygląd (wywoływane w każdej klatce gry)"""
+        remaining = max(0, int(self.freeze_end_time - time.time())) if self.frozen else None
+        key = (self.cell_type, self.points, self.strength, self.highlighted, remaining,
+               self.get_outgoing_connections_count(), self.x, self.y)
+        if key == self._render_key:
+            return
+        self._render_key = key
+        rect = self.boundingRect()
+        if rect != self._render_rect:
+            # zmiana siły lub pozycji zmienia obszar komórki – stary obszar też trzeba odświeżyć
+            if self._render_rect is not None and self.scene() is not None:
+                self.scene().update(self._render_rect)
+            self.prepareGeometryChange()
+            self._render_rect = rect
+        self.update()
+
     def boundingRect(self):
         """Define the bounding rectangle for the cell"""
         effective_radius = self.radius * (1 + 0.2 * (self.strength - 1))
@@ -43,90 +152,34 @@ class CellUnit(QGraphicsItem):
         return path
 
     def paint(self, painter, option, widget):
-        """Draw the cell with proper color and effects"""
+        """Draw the cell: cached sprite plus points (and freeze countdown) on top"""
         effective_radius = self.radius * (1 + 0.2 * (self.strength - 1))
-        if self.cell_type == "player":
-            base_color = config.COLOR_PLAYER
-        elif self.cell_type == "enemy":
-            base_color = config.COLOR_ENEMY
-        elif self.cell_type == "neutral":
-            base_color = config.COLOR_NEUTRAL
-
-        gradient = QRadialGradient(self.x, self.y, effective_radius)
-        gradient.setColorAt(0, base_color.lighter(150))
-        gradient.setColorAt(0.8, base_color)
-        gradient.setColorAt(1, base_color.darker(150))
-
-        if self.highlighted:
-            painter.setPen(QPen(Qt.yellow, 4))
-        else:
-            painter.setPen(QPen(Qt.white, 2))
-
-        painter.setBrush(gradient)
-        painter.drawEllipse(QRectF(self.x - effective_radius, self.y - effective_radius,
-                                   effective_radius * 2, effective_radius * 2))
+        transform = painter.deviceTransform()
+        scale = round(max(abs(transform.m11()), abs(transform.m12()), 0.1), 2)
+        current_time = time.time()
+        frozen = self.frozen and current_time < self.freeze_end_time
+        sprite = cell_sprite(self.cell_type, self.radius, self.strength, self.highlighted, frozen,
+                             self.get_outgoing_connections_count(), scale)
+        painter.drawPixmap(QPointF(self.x - effective_radius - 10, self.y - effective_radius - 10), sprite)
 
         font_size = int(effective_radius / 1.5)
         if len(str(self.points)) > 2:
             font_size = int(effective_radius / 2)
-        font = QFont(config.FONT_FAMILY, font_size)
-        painter.setFont(font)
+        painter.setFont(_font(font_size))
         painter.setPen(Qt.white)
         text_rect = QRectF(self.x - effective_radius, self.y - effective_radius, effective_radius * 2, effective_radius * 2)
         painter.drawText(text_rect, Qt.AlignCenter, str(self.points))
 
-        used_dots = sum(1 for conn in self.connections if conn.source_cell is self)
-        total_dots = min(self.strength, 9)
-        rows = math.ceil(total_dots / 3)
-        effective_radius = self.radius * (1 + 0.2 * (self.strength - 1))
-        dot_radius = effective_radius / 10
-        spacing = effective_radius / 3
-        count_dot = 0
-        for row in range(rows):
-            row_dots = 3 if row < rows - 1 else total_dots - row * 3
-            y_dotted = self.y + effective_radius * (0.5 + row * 0.15)
-            if y_dotted + dot_radius > self.y + effective_radius:
-                y_dotted = self.y + effective_radius - dot_radius
-            for col in range(row_dots):
-                x_dotted = self.x + (col - (row_dots - 1) / 2) * spacing
-                if count_dot >= total_dots - used_dots:
-                    painter.setPen(QPen(Qt.white, 1))
-                    painter.setBrush(Qt.NoBrush)
-                    painter.drawEllipse(QRectF(x_dotted - dot_radius, y_dotted - dot_radius,
-                                               dot_radius * 2, dot_radius * 2))
-                else:
-                    painter.setPen(Qt.NoPen)
-                    painter.setBrush(Qt.white)
-                    painter.drawEllipse(QRectF(x_dotted - dot_radius, y_dotted - dot_radius,
-                                               dot_radius * 2, dot_radius * 2))
-                count_dot += 1
-
-        if self.frozen:
-            current_time = time.time()
-            if current_time < self.freeze_end_time:
-                painter.setPen(QPen(config.COLOR_FROZEN_OUTLINE, 4))
-                painter.setBrush(Qt.NoBrush)
-                painter.drawEllipse(QRectF(self.x - effective_radius, self.y - effective_radius,
-                                           effective_radius * 2, effective_radius * 2))
-                remaining = max(0, int(self.freeze_end_time - current_time))
-                counter_text = str(remaining)
-                font = QFont(config.FONT_FAMILY, int(effective_radius / 2))
-                painter.setFont(font)
-                painter.setPen(QPen(QColor(0, 150, 255), 2))
-                text_rect = QRectF(self.x + effective_radius - 20, self.y + effective_radius - 20, 40, 40)
-                painter.drawText(text_rect, Qt.AlignCenter, counter_text)
-            else:
-                self.frozen = False
-                self.freeze_end_time = 0
-                self.update()
+        if frozen:
+            remaining = max(0, int(self.freeze_end_time - current_time))
+            painter.setFont(_font(int(effective_radius / 2)))
+            painter.setPen(QPen(QColor(0, 150, 255), 2))
+            text_rect = QRectF(self.x + effective_radius - 20, self.y + effective_radius - 20, 40, 40)
+            painter.drawText(text_rect, Qt.AlignCenter, str(remaining))
 
     def add_point(self):
         """Dodaje punkt do komórki oraz aktualizuje siłę"""
-        if self.frozen:
-            return
-        if self.points < config.MAX_CELL_POINTS:                                       
-            self.points += 1
-            self.strength = (self.points // config.POINTS_PER_STRENGTH) + 1
+        if game_engine.add_point(self):
             self.update()
 
     def get_outgoing_connections_count(self):
@@ -137,11 +190,8 @@ class CellUnit(QGraphicsItem):
         """Sprawdza czy komórka może utworzyć nowe połączenie"""
         return self.get_outgoing_connections_count() < self.strength
 
-class CellConnection:
+class CellConnection(game_engine.Bridge):
     """Class to represent connections between cells"""
 
     def __init__(self, source_cell, target_cell, connection_type="neutral"):
-        self.source_cell = source_cell
-        self.target_cell = target_cell
-        self.connection_type = connection_type
-        self.dots = []
\ No newline at end of file
+        super().__init__(source_cell, target_cell, connection_type)
\ No newline at end of file
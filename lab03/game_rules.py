@@ -0,0 +1,25 @@
+# Stałe reguł gry bez zależności od Qt – wspólne dla sceny (przez config.py),
+# silnika symulacji (game_engine.py) i AI
+
+# Frakcje (typy komórek poza "neutral"); gra w oknie używa dwóch pierwszych, serwer meczów (relay_server.py) – więcej
+FACTIONS = ("player", "enemy", "faction3", "faction4", "faction5", "faction6")
+
+# Komórki
+POINTS_PER_STRENGTH = 10
+MAX_CELL_POINTS = 50
+
+# Takty gry
+FRAME_INTERVAL_MS = 16         # krok aktualizacji (kropki, konflikty)
+POINTS_INTERVAL_MS = 2000      # przyrost punktów i wysyłanie kropek
+
+# Mosty: koszt = odległość // BRIDGE_COST_DIVISOR, kropka przechodzi most w 1 / DOT_SPEED s
+BRIDGE_COST_DIVISOR = 20
+DOT_SPEED = 1.0
+CONFLICT_SPEED = 1.0
+DOT_TRANSFER = 1               # punkty dostarczane przez jedną kropkę
+
+# Czas trwania zamrożenia w sekundach
+FREEZE_DURATION_SECONDS = 10
+
+# Punkty dodawane przez powerup punktujący
+BONUS_POINTS = 10
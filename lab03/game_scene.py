@@ -1,21 +1,55 @@
-import json
+import base64
 import math
 import os
+import threading
 import time
 import datetime
 
-from PyQt5.QtCore import Qt, QTimer, QPointF, QRectF
+from PyQt5.QtCore import Qt, QTimer, QPointF, QRectF, QEventLoop, QMetaObject
 from PyQt5.QtGui import QCursor, QColor, QLinearGradient, QPen, QFont, QTransform
 from PyQt5.QtWidgets import (
     QGraphicsScene, QGraphicsDropShadowEffect, QGraphicsItem, QMenu,
     QMessageBox, QGraphicsTextItem, QDialog, QVBoxLayout, QHBoxLayout,
-    QLabel, QPushButton, QListWidget
+    QLabel, QPushButton, QListWidget, QProgressDialog
 )
 
 import config
-from game_ai import GameAI
+from ai_worker import AIWorker
+from game_ai import GameAI, bridge_targets
+from game_engine import Simulation
 from game_objects import CellUnit, CellConnection
+import game_events
 import game_history
+import level_store
+import lockstep
+import persistence
+import replay_catalog
+import replay_format
+import state_sync
+
+
+def wait_for_saves(parent=None):
+    """Czeka na zlecone zapisy (persistence.flush) w osobnym wątku, a okno w tym czasie obsługuje zdarzenia –
+       przy niedostępnym MongoDB zapis trwa do czasu wyboru serwera. Dłuższe oczekiwanie pokazuje okno postępu,
+       które blokuje okno nadrzędne."""
+    if not persistence.pending():
+        return
+    loop = QEventLoop()
+    done = threading.Event()
+
+    def wait():
+        persistence.flush()
+        done.set()
+        QMetaObject.invokeMethod(loop, "quit", Qt.QueuedConnection)
+
+    progress = QProgressDialog("Kończenie zapisu gry...", None, 0, 0, parent)
+    progress.setWindowModality(Qt.WindowModal if parent is not None else Qt.ApplicationModal)
+    progress.setMinimumDuration(300)
+    threading.Thread(target=wait, name="persistence-flush", daemon=True).start()
+    if not done.is_set():
+        loop.exec_()
+    progress.close()
+
 
 class GameScene(QGraphicsScene):
     """Main game scene class"""
@@ -23,6 +57,8 @@ class GameScene(QGraphicsScene):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setSceneRect(0, 0, config.WINDOW_WIDTH, config.WINDOW_HEIGHT)
+        # Reguły gry (kropki, konflikty, przejęcia) liczy silnik bez Qt; scena trzyma w nim swoje komórki i mosty
+        self.simulation = Simulation(connection_class=CellConnection, clock=time.time)
         self.cells = []
         self.connections = []
         self.current_level = 1
@@ -38,6 +74,13 @@ class GameScene(QGraphicsScene):
         self.game_over_text = None
 
         self.game_ai = GameAI(self)
+        # Mosty z kropkami w poprzedniej klatce – ich obszary są odświeżane (invalidate_dots)
+        self.dot_bridges = []
+        # AI liczy w osobnym wątku na zamrożonym stanie; cel ('enemy'/'hint') -> (id, stan, sygnatura sceny)
+        self.ai_requests = {}
+        self.ai_worker = AIWorker(self.game_ai)
+        self.ai_worker.move_ready.connect(self.on_ai_move)
+        self.ai_worker.start()
         self.hint_active = False
         self.hint_source = None
         self.hint_target = None
@@ -54,6 +97,11 @@ class GameScene(QGraphicsScene):
         self.round_time_remaining = self.turn_duration
         self.turn_timer = QTimer()
         self.turn_timer.setInterval(1000)                                     
+        # synchronizacja stanu w grze sieciowej: przyrosty względem stanu potwierdzonego przez partnera
+        self.sync_sender = state_sync.SyncSender(config.STATE_SYNC_COMPRESSION)
+        self.sync_receiver = state_sync.SyncReceiver()
+        # tryb lockstep (lockstep.py): przez UDP idą tylko komendy graczy, symulację krokują obie strony
+        self.lockstep = None
 
         self.logger = None
         self.powerup_active = None
@@ -71,8 +119,25 @@ class GameScene(QGraphicsScene):
         gradient.setColorAt(1, config.COLOR_BG_BOTTOM)
         painter.fillRect(rect, gradient)
 
-    def initialize_level(self, level_number):
-        """Set up cells and connections for a specific level"""
+    @property
+    def cells(self):
+        return self.simulation.cells
+
+    @cells.setter
+    def cells(self, cells):
+        self.simulation.cells = cells
+
+    @property
+    def connections(self):
+        return self.simulation.connections
+
+    @connections.setter
+    def connections(self, connections):
+        self.simulation.connections = connections
+
+    def initialize_level(self, level_number, level_data=None):
+        """Set up cells and connections for a specific level (level_data – gotowy level_store.Level,
+           np. plansza generowana; domyślnie poziom z levels.json)"""
         if self.enemy_timer:
             self.enemy_timer.stop()
         self.clear()
@@ -80,19 +145,15 @@ class GameScene(QGraphicsScene):
         self.connections = []
         self.current_level = level_number
 
-        level_data = self.load_level_data(level_number)
+        if level_data is None:
+            level_data = self.load_level_data(level_number)
 
         if self.logger:
             self.logger.log(f"GameScene: Inicjalizacja poziomu {level_number}.")
 
         if level_data:
-            for cell_data in level_data.get("cells", []):
-                cell = CellUnit(
-                    cell_data.get("x", 0),
-                    cell_data.get("y", 0),
-                    cell_data.get("type", "neutral"),
-                    cell_data.get("points", 2)
-                )
+            for cell_data in level_data.cells:
+                cell = CellUnit(cell_data.x, cell_data.y, cell_data.type, cell_data.points)
                 self.cells.append(cell)
                 self.addItem(cell)
             if self.cells:
@@ -109,15 +170,15 @@ class GameScene(QGraphicsScene):
                     cell.y += offset_y
                     cell.update()
 
-            for conn_data in level_data.get("connections", []):
-                source_idx = conn_data.get("source", 0)
-                target_idx = conn_data.get("target", 0)
-                conn_type = conn_data.get("type", "neutral")
+            for conn_data in level_data.connections:
+                source_idx = conn_data.source
+                target_idx = conn_data.target
+                conn_type = conn_data.type
 
                 if 0 <= source_idx < len(self.cells) and 0 <= target_idx < len(self.cells):
                     source = self.cells[source_idx]
                     target = self.cells[target_idx]
-                    connection = self.create_connection(source, target, conn_type, cost=conn_data.get("cost", 0))
+                    connection = self.create_connection(source, target, conn_type, cost=conn_data.cost)
         else:
             self._initialize_default_level(level_number)
             if self.cells:
@@ -138,15 +199,9 @@ class GameScene(QGraphicsScene):
             self.start_turn_timer()                                         
 
     def load_level_data(self, level_number):
-        """Load level data from file"""
+        """Load level data from file (level_store – levels.json parsowany raz)"""
         try:
-            levels_path = os.path.join(os.path.dirname(__file__), 'levels.json')
-            with open(levels_path, 'r') as f:
-                levels = json.load(f)
-
-            if 1 <= level_number <= len(levels):
-                return levels[level_number - 1]
-            return None
+            return level_store.get_level(level_number)
         except Exception as e:
             print(f"Błąd wczytywania poziomu {level_number}: {e}")
             return None
@@ -171,24 +226,14 @@ class GameScene(QGraphicsScene):
             if self.logger:
                 self.logger.log(f"DEBUG: Niepoprawny typ mostu. Komórka ({source.x:.0f}, {source.y:.0f}) typu {source.cell_type} próbuje utworzyć most typu {conn_type}. Przypisano typ {source.cell_type}.")
             conn_type = source.cell_type
-        connection = CellConnection(source, target, conn_type)
-        connection.cost = cost
-        for conn in self.connections:
-            if conn.source_cell == target and conn.target_cell == source and conn.connection_type != conn_type:
-                connection.conflict = True
-                conn.conflict = True
-                return
-        if not hasattr(connection, 'conflict'):
-            connection.conflict = False
-        source.connections.append(connection)
-        target.connections.append(connection)
-        self.connections.append(connection)
+        connection = self.simulation.create_connection(source, target, conn_type, cost)
+        if connection is None:
+            return
+        self.update(self.connection_rect(connection))
         if self.logger:
             self.logger.log(f"GameScene: Utworzono most między komórkami przy ({source.x:.0f}, {source.y:.0f}) i ({target.x:.0f}, {target.y:.0f}) o koszcie {connection.cost}.")
-        self.move_history.append({
-            "timestamp": time.time(),
-            "description": f"Utworzono most między ({source.x:.0f}, {source.y:.0f}) a ({target.x:.0f}, {target.y:.0f}) o koszcie {connection.cost}"
-        })
+        self.move_history.append(game_events.bridge_created(time.time(), self.cells.index(source),
+                                                            self.cells.index(target), connection.cost))
         if hasattr(self, "network_send_callback") and self.network_send_callback and not hasattr(source, '_skip_network'):
             source._skip_network = True                                                                      
             try:
@@ -202,40 +247,17 @@ class GameScene(QGraphicsScene):
 
     def process_network_message(self, message):
         """Analizuje odebrane dane i aktualizuje stan gry."""
-        if message.startswith("snapshot_full;") or message.startswith("snapshot_part;"):
-            try:
-                parts = message.strip().split(";", 3 if message.startswith("snapshot_part;") else 1)
-
-                if message.startswith("snapshot_full;"):
-                    json_data = parts[1]
-                    snapshot = json.loads(json_data)
-                    self.apply_game_state_snapshot(snapshot)
-                    return
-                else:                            
-                    part_number = int(parts[1])
-                    total_parts = int(parts[2])
-                    content = parts[3]
-
-                    if not hasattr(self, '_snapshot_parts'):
-                        self._snapshot_parts = {}
-
-                    self._snapshot_parts[part_number] = content
-
-                    if len(self._snapshot_parts) == total_parts:
-                        combined_json = "".join(self._snapshot_parts[i+1] for i in range(total_parts))
-                        self._snapshot_parts = {}
-
-                        snapshot = json.loads(combined_json)
-                        self.apply_game_state_snapshot(snapshot)
-
-                        if self.logger:
-                            self.logger.log(f"GameScene: Połączono {total_parts} części snapshotu gry")
-                    return
-            except Exception as e:
-                if self.logger:
-                    self.logger.log(f"GameScene: Błąd podczas przetwarzania snapshotu: {e}")
-
-        elif message.startswith("game_over;"):
+        if message.startswith("state_delta;"):
+            self.receive_state_delta(message.split(";", 1)[1])
+            return
+        if message.startswith("state_ack;") or message.startswith("state_nack;"):
+            kind, seq = message.strip().split(";", 1)
+            if kind == "state_ack":
+                self.sync_sender.ack(int(seq))
+            else:
+                self.sync_sender.reset()
+            return
+        if message.startswith("game_over;"):
             parts = message.strip().split(";")
             if len(parts) >= 2:
                 winner = parts[1]
@@ -252,10 +274,7 @@ class GameScene(QGraphicsScene):
 
                 self.update()
 
-                self.move_history.append({
-                    "timestamp": time.time(),
-                    "description": f"Gra zakończona: {final_result}"
-                })
+                self.move_history.append(game_events.note(time.time(), f"Gra zakończona: {final_result}"))
 
                 self.save_game_history()
 
@@ -411,16 +430,9 @@ class GameScene(QGraphicsScene):
                         (abs(sx - target_x) < 10 and abs(sy - target_y) < 10 and
                          abs(tx - source_x) < 10 and abs(ty - source_y) < 10)):
 
-                        if conn in conn.source_cell.connections:
-                            conn.source_cell.connections.remove(conn)
-                        if conn in conn.target_cell.connections:
-                            conn.target_cell.connections.remove(conn)
-                        self.connections.remove(conn)
+                        self.remove_connection(conn)
 
-                        self.move_history.append({
-                            "timestamp": time.time(),
-                            "description": f"Usunięto most między ({conn.source_cell.x:.0f}, {conn.source_cell.y:.0f}) a ({conn.target_cell.x:.0f}, {conn.target_cell.y:.0f})"
-                        })
+                        self.record_bridge_removed(conn)
 
                         if self.logger:
                             self.logger.log(f"GameScene: Usunięto most przez komunikat sieciowy między ({source_x},{source_y}) a ({target_x},{target_y})")
@@ -431,106 +443,76 @@ class GameScene(QGraphicsScene):
                     self.logger.log(f"GameScene: Błąd przetwarzania wiadomości remove_bridge: {e}")
 
     def update_game(self):
-        for conn in list(self.connections):
-            if conn.source_cell.cell_type != conn.connection_type:
-                if self.logger:
-                    self.logger.log(f"DEBUG: Usunięto niespójny most: Komórka ({conn.source_cell.x:.0f}, {conn.source_cell.y:.0f}) typu {conn.source_cell.cell_type} ma most typu {conn.connection_type}.")
-                self.move_history.append({
-                    "timestamp": time.time(),
-                    "description": f"Usunięto most między ({conn.source_cell.x:.0f}, {conn.source_cell.y:.0f}) a ({conn.target_cell.x:.0f}, {conn.target_cell.y:.0f})"
-                })
-                if conn in conn.source_cell.connections:
-                    conn.source_cell.connections.remove(conn)
-                if conn in conn.target_cell.connections:
-                    conn.target_cell.connections.remove(conn)
-                self.connections.remove(conn)
         """Main game update loop"""
+        if self.lockstep is not None and self.game_over_text:
+            # partner może jeszcze potrzebować naszych ostatnich ramek, żeby dojść do końca gry
+            self.lockstep.exchange()
+            return
+        if self.ai_requests:
+            self.cancel_stale_ai_requests()
+        if self.lockstep is not None:
+            events = self.lockstep.update()
+        else:
+            events = self.simulation.tick()
         for cell in self.cells:
-            cell.update()
-
-        for conn in self.connections:
-            if conn.connection_type in ["player", "enemy"] and not conn.conflict:
-                if conn.source_cell.frozen or conn.target_cell.frozen:
-                    continue
-                finished = []
-                for i in range(len(conn.dots)):
-                    conn.dots[i] += 0.016
-                    if conn.dots[i] >= 1.0:
-                        if conn.connection_type == conn.target_cell.cell_type:
-                            if conn.target_cell.points < config.MAX_CELL_POINTS:                              
-                                conn.target_cell.points += 1
-                        else:
-                            conn.target_cell.points -= 1
-                            if conn.target_cell.points <= 0:
-                                captured = conn.target_cell
-                                if self.logger:
-                                    self.logger.log(f"DEBUG: Przechwytywanie komórki ({captured.x:.0f}, {captured.y:.0f}). Punkty przed przejęciem: {captured.points, conn.connection_type}.")
-                                captured.cell_type = conn.connection_type
-                                captured.points = 1
-                                if self.logger:
-                                    self.logger.log(f"DEBUG: Komórka przejęta. Nowy typ: {captured.cell_type}, punkty zresetowane do {captured.points}. Próba usunięcia mostów wychodzących...")
-                                removed_count = 0
-                                for rem_conn in list(self.connections):
-                                    if rem_conn.source_cell == captured:
-                                        if rem_conn in captured.connections:
-                                            captured.connections.remove(rem_conn)
-                                        if rem_conn in rem_conn.target_cell.connections:
-                                            rem_conn.target_cell.connections.remove(rem_conn)
-                                        self.connections.remove(rem_conn)
-                                        removed_count += 1
-                                if self.logger:
-                                    self.logger.log(f"DEBUG: Usunięto {removed_count} mostów wychodzących z przejętej komórki ({captured.x:.0f}, {captured.y:.0f}).")
-                        conn.target_cell.strength = (conn.target_cell.points // config.POINTS_PER_STRENGTH) + 1
-                        conn.target_cell.update()
-                        finished.append(i)
-
-                for index in sorted(finished, reverse=True):
-                    del conn.dots[index]
-
-        for conn in self.connections:
-            if hasattr(conn, 'conflict') and conn.conflict:
-                if not hasattr(conn, 'conflict_progress'):
-                    conn.conflict_progress = 0
-                conn.conflict_progress += 0.016
-                if conn.conflict_progress >= 1.0:
-                    conn.source_cell.points -= 1
-                    conn.target_cell.points -= 1
-                    conn.source_cell.strength = (conn.source_cell.points // config.POINTS_PER_STRENGTH) + 1
-                    conn.target_cell.strength = (conn.target_cell.points // config.POINTS_PER_STRENGTH) + 1
-                    conn.source_cell.update()
-                    conn.target_cell.update()
-
-        for cell in self.cells:
-            if cell.points <= 0:
-                for conn in list(self.connections):
-                    if hasattr(conn, 'conflict') and conn.conflict and (conn.source_cell == cell or conn.target_cell == cell):
-                        refund = conn.cost // 2
-                        cell.points += refund
-                        self.move_history.append({
-                            "timestamp": time.time(),
-                            "description": f"Usunięto most między ({conn.source_cell.x:.0f}, {conn.source_cell.y:.0f}) a ({conn.target_cell.x:.0f}, {conn.target_cell.y:.0f})"
-                        })
-                        if conn in conn.source_cell.connections:
-                            conn.source_cell.connections.remove(conn)
-                        if conn in conn.target_cell.connections:
-                            conn.target_cell.connections.remove(conn)
-                        self.connections.remove(conn)
-                        cell.update()
+            cell.refresh()
+        self.handle_simulation_events(events)
+        self.invalidate_dots()
 
         now = time.time()
         if now - self.last_state_record >= 1.0:
-            points_status = "; ".join(
-                f"({cell.cell_type} @ {int(cell.x)},{int(cell.y)}: {cell.points} pts)"
-                for cell in self.cells
-            )
-            self.move_history.append({
-                "timestamp": now,
-                "description": f"Status punktowy: {points_status}"
-            })
+            self.move_history.append(game_events.status(now, self.cells))
             self.last_state_record = now
 
         self.check_game_state()
 
+    def handle_simulation_events(self, events):
+        """Logi i historia ruchów dla zdarzeń zgłoszonych przez silnik"""
+        for event in events:
+            if event[0] == "bridge_removed":
+                conn, reason = event[1], event[2]
+                self.update(self.connection_rect(conn))
+                if reason == "inconsistent" and self.logger:
+                    self.logger.log(f"DEBUG: Usunięto niespójny most: Komórka ({conn.source_cell.x:.0f}, {conn.source_cell.y:.0f}) typu {conn.source_cell.cell_type} ma most typu {conn.connection_type}.")
+                # mosty przejętej komórki nie trafiają do historii osobno – opisuje je zdarzenie przejęcia
+                if reason != "captured":
+                    self.record_bridge_removed(conn)
+            elif event[0] == "bridge_created":
+                conn = event[1]
+                self.update(self.connection_rect(conn))
+                self.move_history.append(game_events.bridge_created(time.time(), self.cells.index(conn.source_cell),
+                                                                    self.cells.index(conn.target_cell), conn.cost))
+            elif event[0] == "desync" and self.logger:
+                self.logger.log(f"GameScene: Lockstep – różne skróty stanu w ticku {event[1]}, symulacje się rozjechały.")
+            elif event[0] == "captured" and self.logger:
+                captured, points_before, conn_type, removed_count = event[1:]
+                self.logger.log(f"DEBUG: Przechwytywanie komórki ({captured.x:.0f}, {captured.y:.0f}). Punkty przed przejęciem: {points_before, conn_type}.")
+                self.logger.log(f"DEBUG: Komórka przejęta. Nowy typ: {captured.cell_type}, punkty zresetowane do {captured.points}. Próba usunięcia mostów wychodzących...")
+                self.logger.log(f"DEBUG: Usunięto {removed_count} mostów wychodzących z przejętej komórki ({captured.x:.0f}, {captured.y:.0f}).")
+
+    def record_bridge_removed(self, conn):
+        """Dopisuje usunięcie mostu do historii gry"""
+        self.move_history.append(game_events.bridge_removed(time.time(), self.cells.index(conn.source_cell),
+                                                            self.cells.index(conn.target_cell)))
+
+    def remove_connection(self, conn):
+        """Usuwa most z symulacji i odświeża jego obszar (scena rysuje tylko zmienione fragmenty)"""
+        self.simulation.remove_connection(conn)
+        self.update(self.connection_rect(conn))
+
+    def connection_rect(self, conn):
+        """Obszar sceny zajmowany przez most razem z kropkami i podświetleniem"""
+        margin = 6
+        return QRectF(QPointF(conn.source_cell.x, conn.source_cell.y),
+                      QPointF(conn.target_cell.x, conn.target_cell.y)).normalized().adjusted(-margin, -margin, margin, margin)
+
+    def invalidate_dots(self):
+        """Odświeża tylko obszary mostów z kropkami (oraz tych, z których kropki właśnie zeszły)"""
+        bridges = self.simulation.bridges_with_dots()
+        for conn in set(bridges).union(self.dot_bridges):
+            self.update(self.connection_rect(conn))
+        self.dot_bridges = bridges
+
     def calculate_reachable_cells(self):
         """Oblicza i oznacza komórki, do których można stworzyć most"""
         if not self.drag_start_cell:
@@ -544,30 +526,10 @@ class GameScene(QGraphicsScene):
                 self.logger.log(f"GameScene: Komórka osiągnęła maksymalną liczbę mostów ({self.drag_start_cell.strength}).")
             return
 
-        self.reachable_cells = []
-        available_points = self.drag_start_cell.points
-
-        for cell in self.cells:
-            if cell == self.drag_start_cell:
-                continue
-
-            exists = any(
-                (((conn.source_cell == self.drag_start_cell and conn.target_cell == cell) or
-                  (conn.source_cell == cell and conn.target_cell == self.drag_start_cell))
-                 and conn.connection_type == self.drag_start_cell.cell_type)
-                for conn in self.connections
-            )
-            if exists:
-                continue
-
-            dx = cell.x - self.drag_start_cell.x
-            dy = cell.y - self.drag_start_cell.y
-            distance = math.hypot(dx, dy)
-            cost = int(distance / 20)
-
-            if cost <= available_points:
-                self.reachable_cells.append(cell)
-                cell.setHighlighted(True)
+        # Koszty mostów i cele posortowane po koszcie są liczone raz na poziom (BoardLayout)
+        self.reachable_cells = bridge_targets(self, self.drag_start_cell)
+        for cell in self.reachable_cells:
+            cell.setHighlighted(True)
 
         self.update()
 
@@ -601,6 +563,8 @@ class GameScene(QGraphicsScene):
 
         if self.powerup_active is not None:
             clicked_item = self.itemAt(event.scenePos(), QTransform())
+            own_side = self.lockstep.side if self.lockstep is not None else "player"
+            opponent = self.lockstep.remote_side if self.lockstep is not None else "enemy"
             if self.powerup_active == config.POWERUP_NEW_CELL:
                 if self.copy_source is None:
                     if isinstance(clicked_item, CellUnit):
@@ -645,9 +609,10 @@ class GameScene(QGraphicsScene):
                             self.powerup_label.setPlainText("Błędna odległość. Wybierz miejsce między {} a {} pikseli.".format(min_dist, max_dist))
                         event.accept()
                         return
-                    new_cell = CellUnit(pos.x(), pos.y(), "player", self.copy_source.points)
-                    self.cells.append(new_cell)
-                    self.addItem(new_cell)
+                    if self.lockstep is not None:
+                        self.lockstep.submit(("copy", self.cells.index(self.copy_source), int(pos.x()), int(pos.y())))
+                    else:
+                        self.cells.append(self.make_cell(pos.x(), pos.y(), own_side, self.copy_source.points))
                     if self.logger:
                         self.logger.log("GameScene: Nowa komórka skopiowana z komórki o {} punktach.".format(self.copy_source.points))
                     self.copy_source = None
@@ -661,9 +626,11 @@ class GameScene(QGraphicsScene):
             elif isinstance(clicked_item, QGraphicsItem):
                 if self.powerup_active == config.POWERUP_FREEZE:
                     if isinstance(clicked_item, CellUnit):
-                        if clicked_item.cell_type == "enemy":
-                            clicked_item.frozen = True
-                            clicked_item.freeze_end_time = time.time() + config.FREEZE_DURATION_SECONDS
+                        if clicked_item.cell_type == opponent:
+                            if self.lockstep is not None:
+                                self.lockstep.submit(("freeze", self.cells.index(clicked_item)))
+                            else:
+                                self.simulation.freeze(clicked_item)
                             if self.logger:
                                 self.logger.log("GameScene: Komórka przeciwnika zamrożona.")
                             if hasattr(self, 'powerup_label') and self.powerup_label is not None:
@@ -686,8 +653,11 @@ class GameScene(QGraphicsScene):
                     return
                 elif self.powerup_active == config.POWERUP_TAKEOVER:
                     if isinstance(clicked_item, CellUnit):
-                        if clicked_item.cell_type == "enemy":
-                            clicked_item.cell_type = "player"
+                        if clicked_item.cell_type == opponent:
+                            if self.lockstep is not None:
+                                self.lockstep.submit(("takeover", self.cells.index(clicked_item)))
+                            else:
+                                self.simulation.take_over(clicked_item, own_side)
                             clicked_item.update()
                             if self.logger:
                                 self.logger.log("GameScene: Komórka przeciwnika przejęta.")
@@ -712,8 +682,10 @@ class GameScene(QGraphicsScene):
                 elif self.powerup_active == config.POWERUP_ADD_POINTS:
                     if isinstance(clicked_item, CellUnit):
                         if clicked_item.cell_type in ["player", "enemy"]:
-                            clicked_item.points = min(clicked_item.points + 10, config.MAX_CELL_POINTS)
-                            clicked_item.strength = (clicked_item.points // config.POINTS_PER_STRENGTH) + 1
+                            if self.lockstep is not None:
+                                self.lockstep.submit(("bonus", self.cells.index(clicked_item)))
+                            else:
+                                self.simulation.add_bonus(clicked_item)
                             clicked_item.update()
                             if self.logger:
                                 self.logger.log("GameScene: Dodano 10 punktów do komórki.")
@@ -841,45 +813,16 @@ class GameScene(QGraphicsScene):
                     if t < 0: t = 0
                     if t > 1: t = 1
 
-                    self.move_history.append({
-                        "timestamp": time.time(),
-                        "description": f"Usunięto most między ({conn.source_cell.x:.0f}, {conn.source_cell.y:.0f}) a ({conn.target_cell.x:.0f}, {conn.target_cell.y:.0f})"
-                    })
-
-                    if conn in self.connections:
-                        self.connections.remove(conn)
-                    if conn in conn.source_cell.connections:
-                        conn.source_cell.connections.remove(conn)
-                    if conn in conn.target_cell.connections:
-                        conn.target_cell.connections.remove(conn)
-
-                    cost = getattr(conn, "cost", 0)
-                    source_points = round(t * cost)
-                    target_points = cost - source_points
-
-                    if conn.connection_type == "player":
-                        if conn.target_cell.cell_type != "player":
-                            conn.source_cell.points += source_points
-                            conn.target_cell.points -= target_points
-                            if conn.target_cell.points <= 0:
-                                conn.target_cell.cell_type = "player"
-                                conn.target_cell.points = abs(conn.target_cell.points)
-                        else:
-                            conn.source_cell.points = min(conn.source_cell.points + source_points, config.MAX_CELL_POINTS)
-                            conn.target_cell.points = min(conn.target_cell.points + target_points, config.MAX_CELL_POINTS)
-                    elif conn.connection_type == "enemy":
-                        if conn.target_cell.cell_type != "enemy":
-                            conn.source_cell.points += source_points
-                            conn.target_cell.points -= target_points
-                            if conn.target_cell.points <= 0:
-                                conn.target_cell.cell_type = "enemy"
-                                conn.target_cell.points = abs(conn.target_cell.points)
-                        else:
-                            conn.source_cell.points = min(conn.source_cell.points + source_points, config.MAX_CELL_POINTS)
-                            conn.target_cell.points = min(conn.target_cell.points + target_points, config.MAX_CELL_POINTS)
+                    if self.lockstep is not None:
+                        self.lockstep.submit(("cut", self.cells.index(conn.source_cell),
+                                              self.cells.index(conn.target_cell), round(t * 1000)))
+                        self.hover_connection = None
+                        return super().mouseMoveEvent(event)
+
+                    self.record_bridge_removed(conn)
+                    self.simulation.cut_connection(conn, t)
+                    self.update(self.connection_rect(conn))
 
-                    conn.source_cell.strength = (conn.source_cell.points // config.POINTS_PER_STRENGTH) + 1
-                    conn.target_cell.strength = (conn.target_cell.points // config.POINTS_PER_STRENGTH) + 1
                     conn.source_cell.update()
                     conn.target_cell.update()
 
@@ -937,47 +880,40 @@ class GameScene(QGraphicsScene):
                 self.update()
                 return
 
-        if actual_button == Qt.LeftButton:
-            if isinstance(release_item, CellUnit) and release_item != self.drag_start_cell:
-                dx = release_item.x - self.drag_start_cell.x
-                dy = release_item.y - self.drag_start_cell.y
-                distance = math.hypot(dx, dy)
-                cost = int(distance / 20)
-                if self.drag_start_cell.points >= cost:
-                    exists = any(((conn.source_cell == self.drag_start_cell and conn.target_cell == release_item) or
-                                  (conn.source_cell == release_item and conn.target_cell == self.drag_start_cell))
-                                  and conn.connection_type == "player" for conn in self.connections)
-                    if not exists:
-                        self.drag_start_cell.points -= cost
-                        self.drag_start_cell.strength = (self.drag_start_cell.points // config.POINTS_PER_STRENGTH) + 1
-                        self.drag_start_cell.update()
-                        new_conn = self.create_connection(self.drag_start_cell, release_item, "player", cost)
-
-                        if self.turn_based_mode and new_conn is not None:
-                            self.switch_turn()                                                       
-        elif actual_button == Qt.RightButton and not self.single_player:
-            if isinstance(release_item, CellUnit) and release_item != self.drag_start_cell:
-                dx = release_item.x - self.drag_start_cell.x
-                dy = release_item.y - self.drag_start_cell.y
-                distance = math.hypot(dx, dy)
-                cost = int(distance / 20)
-                if self.drag_start_cell.points >= cost:
-                    exists = any(((conn.source_cell == self.drag_start_cell and conn.target_cell == release_item) or
-                                  (conn.source_cell == release_item and conn.target_cell == self.drag_start_cell))
-                                  and conn.connection_type == "enemy" for conn in self.connections)
-                    if not exists:
-                        self.drag_start_cell.points -= cost
-                        self.drag_start_cell.strength = (self.drag_start_cell.points // config.POINTS_PER_STRENGTH) + 1
-                        self.drag_start_cell.update()
-                        new_conn = self.create_connection(self.drag_start_cell, release_item, "enemy", cost)
-
-                        if self.turn_based_mode and new_conn is not None:
-                            self.switch_turn()
+        if isinstance(release_item, CellUnit) and release_item != self.drag_start_cell:
+            if actual_button == Qt.LeftButton:
+                self.build_bridge(self.drag_start_cell, release_item, "player")
+            elif actual_button == Qt.RightButton and not self.single_player:
+                self.build_bridge(self.drag_start_cell, release_item, "enemy")
 
         self.drag_start_cell = None
         self.drag_current_pos = None
         self.update()
 
+    def build_bridge(self, source, target, conn_type):
+        """Most przeciągnięty przez gracza: opłata i budowa (w trybie lockstep – komenda), potem zmiana tury.
+           Zwraca True, jeśli ruch został wykonany lub zlecony."""
+        distance = math.hypot(target.x - source.x, target.y - source.y)
+        cost = int(distance / 20)
+        if source.points < cost:
+            return False
+        exists = any(((conn.source_cell == source and conn.target_cell == target) or
+                      (conn.source_cell == target and conn.target_cell == source))
+                     and conn.connection_type == conn_type for conn in self.connections)
+        if exists:
+            return False
+        if self.lockstep is not None:
+            self.lockstep.submit(("bridge", self.cells.index(source), self.cells.index(target)))
+            return True
+        source.points -= cost
+        source.strength = (source.points // config.POINTS_PER_STRENGTH) + 1
+        source.update()
+        new_conn = self.create_connection(source, target, conn_type, cost)
+
+        if self.turn_based_mode and new_conn is not None:
+            self.switch_turn()
+        return new_conn is not None
+
     def check_game_state(self):
         """Check if player has won or lost the level"""
         player_cells = sum(1 for cell in self.cells if cell.cell_type == "player")
@@ -989,33 +925,20 @@ class GameScene(QGraphicsScene):
             self.game_over(True)
 
     def game_over(self, victory):
-        self.timer.stop()
+        if self.lockstep is None:
+            self.timer.stop()
         self.points_timer.stop()
+        self.cancel_ai()
         final_result = "Wygrana!" if victory else "Przegrana!"
         self.game_over_text = final_result
         if self.logger:
             self.logger.log(f"GameScene: Gra zakończona - {self.game_over_text}.")
-        points_status = "; ".join(
-            f"({cell.cell_type} @ {int(cell.x)},{int(cell.y)}: {cell.points} pts)" for cell in self.cells
-        )
-        self.move_history.append({
-            "timestamp": time.time(),
-            "description": f"Status przed ostatnim ruchem: {points_status}"
-        })
-        self.move_history.append({
-            "timestamp": time.time(),
-            "description": f"Wynik: {final_result}"
-        })
-        final_status = "; ".join(
-            f"({cell.cell_type} @ {int(cell.x)},{int(cell.y)}: {cell.points} pts)"
-            for cell in self.cells
-        )
-        self.move_history.append({
-            "timestamp": time.time(),
-            "description": f"Status po ogłoszeniu wyniku: {final_status}"
-        })
-
-        if hasattr(self, 'is_multiplayer') and self.is_multiplayer and hasattr(self, "network_send_callback"):
+        self.move_history.append(game_events.status(time.time(), self.cells, game_events.PRE_FINAL_STATUS))
+        self.move_history.append(game_events.result(time.time(), final_result))
+        self.move_history.append(game_events.status(time.time(), self.cells, game_events.FINAL_STATUS))
+
+        # w trybie lockstep obie strony same dochodzą do tego samego końca gry
+        if hasattr(self, 'is_multiplayer') and self.is_multiplayer and hasattr(self, "network_send_callback") and self.lockstep is None:
             winner = "player" if victory and self.multiplayer_role == "player" else "enemy"
             self.network_send_callback(f"game_over;{winner}")
 
@@ -1040,41 +963,17 @@ class GameScene(QGraphicsScene):
 
     def add_points(self):
         """Dodaje 1 punkt do każdej komórki (oprócz neutralnych) co sekundę oraz przesyła kropki przez mosty gracza"""
+        self.simulation.add_points()
         for cell in self.cells:
-            if cell.cell_type != "neutral":
-                cell.add_point()
+            cell.refresh()
 
-                if self.drag_start_cell == cell:
-                    for reach_cell in self.reachable_cells:
-                        reach_cell.setHighlighted(False)
-                    self.reachable_cells = []
+        if self.drag_start_cell is not None and self.drag_start_cell.cell_type != "neutral":
+            for reach_cell in self.reachable_cells:
+                reach_cell.setHighlighted(False)
+            self.reachable_cells = []
 
-                    self.calculate_reachable_cells()
-
-        for conn in self.connections:
-            if conn.connection_type in ["player", "enemy"]:
-                if conn.source_cell.frozen or conn.target_cell.frozen:
-                    continue
-                if conn.source_cell.points >= 1:
-                    conn.source_cell.points -= 1
-                    conn.source_cell.strength = (conn.source_cell.points // config.POINTS_PER_STRENGTH) + 1
-                    conn.source_cell.update()
-                    conn.dots.append(0)
-
-                    if self.drag_start_cell == conn.source_cell:
-                        for reach_cell in self.reachable_cells:
-                            reach_cell.setHighlighted(False)
-                        self.reachable_cells = []
-
-                        self.calculate_reachable_cells()
-        points_status = "; ".join(
-            f"({cell.cell_type} @ {int(cell.x)},{int(cell.y)}: {cell.points} pts)"
-            for cell in self.cells
-        )
-        self.move_history.append({
-            "timestamp": time.time(),
-            "description": f"Status punktowy: {points_status}"
-        })
+            self.calculate_reachable_cells()
+        self.move_history.append(game_events.status(time.time(), self.cells))
 
     def drawForeground(self, painter, rect):
         if self.turn_based_mode:
@@ -1089,7 +988,8 @@ class GameScene(QGraphicsScene):
             font = QFont(config.FONT_FAMILY, config.GAME_TURN_FONT_SIZE, QFont.Bold)
             painter.setFont(font)
             painter.setPen(QPen(Qt.white))
-            turn_rect = QRectF(rect.left(), rect.top(), rect.width(), 50)
+            scene_rect = self.sceneRect()
+            turn_rect = QRectF(scene_rect.left(), scene_rect.top(), scene_rect.width(), 50)
             painter.drawText(turn_rect, Qt.AlignCenter, info_text)
 
         if self.drag_start_cell and self.drag_current_pos:
@@ -1113,6 +1013,9 @@ class GameScene(QGraphicsScene):
                 painter.setPen(QPen(color, 2))
                 painter.drawLine(QPointF(self.drag_start_cell.x, self.drag_start_cell.y), target_point)
         for conn in self.connections:
+            # przy częściowym odświeżaniu pomijamy mosty spoza odświeżanego obszaru
+            if not rect.intersects(self.connection_rect(conn)):
+                continue
             source = QPointF(conn.source_cell.x, conn.source_cell.y)
             target = QPointF(conn.target_cell.x, conn.target_cell.y)
 
@@ -1135,18 +1038,13 @@ class GameScene(QGraphicsScene):
                 else:
                     painter.setPen(QPen(config.COLOR_CONN_ENEMY, 3))
                 painter.drawLine(source, target)
-            if not (hasattr(conn, 'conflict') and conn.conflict):
-                if conn.connection_type == "player":
-                    dot_color = config.COLOR_DOT_PLAYER
-                else:
-                    dot_color = config.COLOR_DOT_ENEMY
-                for progress in conn.dots:
-                    x = conn.source_cell.x + progress * (conn.target_cell.x - conn.source_cell.x)
-                    y = conn.source_cell.y + progress * (conn.target_cell.y - conn.source_cell.y)
-                    dot_radius = 4
-                    painter.setPen(Qt.NoPen)
-                    painter.setBrush(dot_color)
-                    painter.drawEllipse(QRectF(x - dot_radius, y - dot_radius, dot_radius * 2, dot_radius * 2))
+        # Pozycje wszystkich kropek liczone wektorowo w silniku, rysowane grupami po kolorze
+        dot_radius = 4
+        painter.setPen(Qt.NoPen)
+        for conn_type, (xs, ys) in self.simulation.dot_positions().items():
+            painter.setBrush(config.COLOR_DOT_PLAYER if conn_type == "player" else config.COLOR_DOT_ENEMY)
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                painter.drawEllipse(QRectF(x - dot_radius, y - dot_radius, dot_radius * 2, dot_radius * 2))
         if self.game_over_text is not None:
             font = QFont(config.FONT_FAMILY, config.GAME_OVER_FONT_SIZE, QFont.Bold)
             painter.setFont(font)
@@ -1262,9 +1160,11 @@ class GameScene(QGraphicsScene):
                 self.update()
 
     def show_hint(self):
-        """Pokazuje podpowiedź strategiczną od AI"""
-        best_move = self.game_ai.analyze_best_move()
+        """Pokazuje podpowiedź strategiczną od AI (wynik przychodzi sygnałem z wątku AI)"""
+        if not self.request_ai("hint", "player"):
+            self.show_hint_result(None)
 
+    def show_hint_result(self, best_move):
         if (best_move):
             self.hint_source, self.hint_target, self.hint_cost = best_move
             self.hint_active = True
@@ -1308,6 +1208,10 @@ class GameScene(QGraphicsScene):
         if self.points_timer:
             self.points_timer.stop()
 
+        if self.lockstep is not None:
+            self.lockstep.close()
+            self.lockstep = None
+
         if hasattr(self, 'turn_timer') and self.turn_timer:
             self.turn_timer.stop()
             try:
@@ -1550,10 +1454,17 @@ class GameScene(QGraphicsScene):
         if self.turn_based_mode and self.current_turn != "enemy":
             return
 
-        best_move = self.game_ai.analyze_best_move(cell_type="enemy")
+        if "enemy" not in self.ai_requests:
+            self.request_ai("enemy", "enemy")
+
+    def apply_enemy_move(self, best_move):
+        """Wykonuje ruch przeciwnika policzony przez wątek AI (o ile nadal jest dozwolony)"""
+        if not self.single_player or (self.turn_based_mode and self.current_turn != "enemy"):
+            return
+
         if best_move:
             source, target, cost = best_move
-            if source.points >= cost:
+            if source in self.cells and target in self.cells and source.cell_type == "enemy" and source.points >= cost:
                 source.points -= cost
                 source.strength = (source.points // config.POINTS_PER_STRENGTH) + 1
                 new_conn = self.create_connection(source, target, "enemy", cost)
@@ -1565,19 +1476,81 @@ class GameScene(QGraphicsScene):
 
         self.update()
 
+    def ai_signature(self):
+        """Sygnatura istotnego stanu sceny: właściciele komórek i liczba mostów"""
+        return tuple(cell.cell_type for cell in self.cells), len(self.connections)
+
+    def request_ai(self, purpose, cell_type):
+        """Zleca wątkowi AI wyszukanie ruchu; zwraca False, gdy strona nie ma komórek (brak ruchów zgłasza
+           wątek AI wynikiem None)"""
+        board = self.game_ai.prepare_search(cell_type)
+        if board is None:
+            return False
+        request_id = self.ai_worker.request(purpose, cell_type, board)
+        self.ai_requests[purpose] = (request_id, board, self.ai_signature())
+        return True
+
+    def cancel_ai(self, purpose=None):
+        if purpose is None:
+            self.ai_requests.clear()
+        else:
+            self.ai_requests.pop(purpose, None)
+        self.ai_worker.cancel(purpose)
+
+    def cancel_stale_ai_requests(self):
+        """Anuluje wyszukiwania, których stan wyjściowy przestał odpowiadać scenie (przejęcie, nowy/usunięty most)"""
+        signature = self.ai_signature()
+        for purpose, (request_id, board, request_signature) in list(self.ai_requests.items()):
+            if request_signature != signature:
+                if self.logger:
+                    self.logger.log(f"GameScene: Anulowano obliczenia AI ({purpose}) – zmiana stanu gry.")
+                self.cancel_ai(purpose)
+                if purpose == "hint":
+                    self.show_hint()
+
+    def on_ai_move(self, request_id, purpose, move):
+        pending = self.ai_requests.get(purpose)
+        if pending is None or pending[0] != request_id or not self.ai_worker.finish(request_id, purpose):
+            return
+        del self.ai_requests[purpose]
+        if pending[2] != self.ai_signature():
+            # stan zmienił się w trakcie liczenia – podpowiedź liczymy od nowa, ruch wroga przy następnym takcie
+            if purpose == "hint":
+                self.show_hint()
+            return
+        best_move = self.game_ai.resolve_move(pending[1], move)
+        if purpose == "enemy":
+            self.apply_enemy_move(best_move)
+        else:
+            self.show_hint_result(best_move)
+
+    def stop_ai(self):
+        """Zatrzymuje wątek AI (przy wyjściu ze sceny gry)"""
+        self.ai_requests.clear()
+        if self.ai_worker.isRunning():
+            self.ai_worker.stop()
+
     def quicksave(self):
         saves_dir = "saves"
         if not os.path.exists(saves_dir):
             os.makedirs(saves_dir)
         xml_filename = os.path.join(saves_dir, f"quicksave_level{self.current_level}.xml")
-        game_history.save_game_history(self, xml_filename)
         json_filename = os.path.join(saves_dir, f"quicksave_level{self.current_level}.json")
-        game_history.save_game_history_json(self, json_filename)
-        mongodb_id = game_history.save_game_history_mongodb(self, is_quicksave=True)
-        if self.logger:
-            self.logger.log(f"Quicksave wykonany: XML: {xml_filename}, JSON: {json_filename}, MongoDB id: {mongodb_id}")
+        history = game_history.history_snapshot(self, is_quicksave=True)
+        logger = self.logger
+        def on_done(results):
+            if not logger:
+                return
+            # PersistenceWorker zwraca wyjątek zamiast wyniku, gdy zapis się nie powiódł
+            logger.log(f"Quicksave wykonany: XML: {results['xml']}, JSON: {results['json']}")
+            if isinstance(results['mongodb'], Exception):
+                logger.log(f"Błąd zapisu quicksave do MongoDB: {results['mongodb']}")
+            else:
+                logger.log(f"Quicksave zapisany do MongoDB z id: {results['mongodb']}")
+        persistence.submit(history, [("xml", xml_filename), ("json", json_filename)], on_done=on_done)
 
     def quickload(self):
+        wait_for_saves(self.views()[0] if self.views() else None)
         level = self.current_level
         dialog = QDialog()
         dialog.setWindowTitle("Wczytaj quicksave")
@@ -1643,10 +1616,9 @@ class GameScene(QGraphicsScene):
             def update_list():
                 list_widget.clear()
                 items.clear()
-                documents = list(game_history.replays_collection.find({"level": level, "is_quicksave": True}))
-                documents = sorted(documents, key=lambda doc: doc.get("moves", [{}])[0].get("timestamp", 0), reverse=True)
+                documents = game_history.list_replay_documents(level, is_quicksave=True)
                 for doc in documents:
-                    ts = doc.get("moves", [{}])[0].get("timestamp", 0)
+                    ts = doc["timestamp"]
                     try:
                         time_str = datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
                     except Exception:
@@ -1671,7 +1643,8 @@ class GameScene(QGraphicsScene):
             ok_button.clicked.connect(on_ok)
             cancel_button.clicked.connect(dialog.reject)
             if dialog.exec_() == QDialog.Accepted:
-                state = selected_file[0]
+                # lista ma tylko metadane – pełny dokument dopiero dla wybranego zapisu
+                state = game_history.load_game_history_mongodb(selected_file[0]["_id"]) if selected_file[0] else None
                 if state and "_id" in state:
                     state["_id"] = str(state["_id"])
             else:
@@ -1688,134 +1661,108 @@ class GameScene(QGraphicsScene):
         self.points_timer.start(2000)
         return True
 
-    def create_game_state_snapshot(self):
-        """
-        Tworzy snapshot aktualnego stanu gry, który może być przesłany
-        w formacie podobnym do tego używanego w zapisie powtórek.
-        """
-        snapshot = {
-            "cells": [
-                {
-                    "index": i,
-                    "x": cell.x,
-                    "y": cell.y,
-                    "type": cell.cell_type,
-                    "points": cell.points,
-                    "frozen": cell.frozen
-                } for i, cell in enumerate(self.cells)
-            ],
-            "connections": [
-                {
-                    "source_index": self.cells.index(conn.source_cell),
-                    "target_index": self.cells.index(conn.target_cell),
-                    "type": conn.connection_type,
-                    "cost": getattr(conn, "cost", 0),
-                    "dots": conn.dots                                            
-                } for conn in self.connections
-            ],
-            "current_turn": self.current_turn,
-            "round_time_remaining": self.round_time_remaining
-        }
-        return snapshot
-
-    def send_game_state_snapshot(self):
+    def start_lockstep(self, local_port, remote_address):
+        """Gra sieciowa w trybie lockstep: obie strony zaczynają od tego samego stanu poziomu i krokują
+           symulację bez zegara, a ruchy i powerupy są komendami wykonywanymi u obu stron w tym samym ticku"""
+        self.points_timer.stop()
+        self.turn_based_mode = False
+        self.simulation.clock = None
+        self.simulation.time = 0.0
+        self.simulation.points_elapsed = 0.0
+        self.lockstep = lockstep.LockstepSession(self.simulation, self.multiplayer_role, local_port, remote_address,
+                                                 config.LOCKSTEP_INPUT_DELAY, config.LOCKSTEP_HASH_INTERVAL,
+                                                 make_cell=self.make_cell)
+        self.timer.start(config.FRAME_INTERVAL_MS)
+        if self.logger:
+            self.logger.log(f"GameScene: Lockstep UDP na porcie {local_port}, partner {remote_address[0]}:{remote_address[1]}, "
+                            f"opóźnienie komend {config.LOCKSTEP_INPUT_DELAY} ticków.")
+
+    def make_cell(self, x, y, cell_type, points):
+        """Komórka z powerupu stawiającego dodana do sceny (do listy komórek dodaje ją wywołujący)"""
+        cell = CellUnit(x, y, cell_type, points)
+        self.addItem(cell)
+        return cell
+
+    def sync_state(self):
+        """Stan do synchronizacji sieciowej (state_sync.py) – komórki i mosty według indeksów komórek"""
+        return state_sync.simulation_state(self.cells, self.connections, self.current_turn, self.round_time_remaining)
+
+    def send_game_state_snapshot(self, full=False):
         """
-        Wysyła pełny snapshot stanu gry do drugiego gracza
+        Wysyła drugiemu graczowi zmiany stanu gry od ostatniego stanu, który potwierdził
+        (full=True – pełny stan, np. na początku gry)
         """
         if not hasattr(self, "network_send_callback") or not self.network_send_callback:
             return
 
         try:
-            snapshot = self.create_game_state_snapshot()
-            snapshot_json = json.dumps(snapshot)
-
-            if len(snapshot_json) > 1000:
-                chunks = [snapshot_json[i:i+1000] for i in range(0, len(snapshot_json), 1000)]
-                for i, chunk in enumerate(chunks):
-                    self.network_send_callback(f"snapshot_part;{i+1};{len(chunks)};{chunk}")
-            else:
-                self.network_send_callback(f"snapshot_full;{snapshot_json}")
-
-            if self.logger:
-                self.logger.log(f"GameScene: Wysłano snapshot stanu gry o rozmiarze {len(snapshot_json)}")
+            data = self.sync_sender.make(self.sync_state(), full)
+            self.network_send_callback("state_delta;" + base64.b64encode(data).decode("ascii"))
         except Exception as e:
             if self.logger:
-                self.logger.log(f"GameScene: Błąd podczas wysyłania snapshotu: {e}")
+                self.logger.log(f"GameScene: Błąd podczas wysyłania synchronizacji stanu: {e}")
 
-    def apply_game_state_snapshot(self, snapshot):
-        """
-        Stosuje otrzymany snapshot stanu gry
-        """
+    def receive_state_delta(self, payload):
+        try:
+            seq, _, _, state = self.sync_receiver.receive(base64.b64decode(payload))
+        except (state_sync.SyncError, ValueError) as e:
+            if self.logger:
+                self.logger.log(f"GameScene: Odrzucono synchronizację stanu: {e}")
+            # partner wyśle pełny stan
+            self.network_send_callback("state_nack;0")
+            return
+        # porównanie z całym odtworzonym stanem nadawcy, a nie tylko jego przyrostem – poprawia też
+        # rozbieżności powstałe lokalnie (komórka przejęta tylko u nas, most, którego partner nie ma)
+        self.apply_state_delta(state_sync.diff(self.sync_state(), state))
+        self.network_send_callback(f"state_ack;{seq}")
+
+    def apply_state_delta(self, delta):
+        """Stosuje przyrost stanu (state_sync.diff) przez indeksy komórek i słownik mostów"""
         try:
-            for cell_data in snapshot.get("cells", []):
-                idx = cell_data.get("index", -1)
-                if 0 <= idx < len(self.cells):
-                    cell = self.cells[idx]
-                    cell.cell_type = cell_data.get("type", cell.cell_type)
-                    cell.points = cell_data.get("points", cell.points)
-                    cell.frozen = cell_data.get("frozen", False)
+            for index, cell_type, points, frozen in delta["cells"]:
+                if 0 <= index < len(self.cells):
+                    cell = self.cells[index]
+                    cell.cell_type = cell_type
+                    cell.points = points
+                    cell.frozen = frozen
                     cell.strength = (cell.points // config.POINTS_PER_STRENGTH) + 1
                     cell.update()
 
-            connection_pairs = []
-            for conn_data in snapshot.get("connections", []):
-                source_idx = conn_data.get("source_index", -1)
-                target_idx = conn_data.get("target_index", -1)
-                if 0 <= source_idx < len(self.cells) and 0 <= target_idx < len(self.cells):
-                    connection_pairs.append((source_idx, target_idx))
-
-            for conn in list(self.connections):
-                source_idx = self.cells.index(conn.source_cell)
-                target_idx = self.cells.index(conn.target_cell)
-
-                if (source_idx, target_idx) not in connection_pairs and (target_idx, source_idx) not in connection_pairs:
-                    if conn in conn.source_cell.connections:
-                        conn.source_cell.connections.remove(conn)
-                    if conn in conn.target_cell.connections:
-                        conn.target_cell.connections.remove(conn)
-                    self.connections.remove(conn)
-
-            for conn_data in snapshot.get("connections", []):
-                source_idx = conn_data.get("source_index", -1)
-                target_idx = conn_data.get("target_index", -1)
-                conn_type = conn_data.get("type", "neutral")
-                cost = conn_data.get("cost", 0)
-                dots = conn_data.get("dots", [])
-
-                if 0 <= source_idx < len(self.cells) and 0 <= target_idx < len(self.cells):
-                    source = self.cells[source_idx]
-                    target = self.cells[target_idx]
-
-                    existing_conn = None
-                    for conn in self.connections:
-                        if ((conn.source_cell == source and conn.target_cell == target) or
-                            (conn.source_cell == target and conn.target_cell == source)) and conn.connection_type == conn_type:
-                            existing_conn = conn
-                            break
-
-                    if existing_conn:
-                        existing_conn.dots = dots
-                    else:
-                        source._skip_network = True                                             
-                        try:
-                            connection = self.create_connection(source, target, conn_type)
-                            connection.cost = cost
-                            connection.dots = dots                              
-                        finally:
-                            delattr(source, '_skip_network')
-
-            if "current_turn" in snapshot:
-                self.current_turn = snapshot.get("current_turn")
-            if "round_time_remaining" in snapshot:
-                self.round_time_remaining = snapshot.get("round_time_remaining")
+            index_of = {cell: i for i, cell in enumerate(self.cells)}
+            by_pair = {(index_of[conn.source_cell], index_of[conn.target_cell]): conn for conn in self.connections}
+            for pair in delta["removed"]:
+                conn = by_pair.pop(pair, None)
+                if conn is not None:
+                    self.remove_connection(conn)
 
-            if self.logger:
-                self.logger.log("GameScene: Zastosowano snapshot stanu gry")
+            for source_idx, target_idx, conn_type, cost in delta["connections"]:
+                if not (0 <= source_idx < len(self.cells) and 0 <= target_idx < len(self.cells)):
+                    continue
+                existing_conn = by_pair.get((source_idx, target_idx))
+                if existing_conn is not None and existing_conn.connection_type == conn_type:
+                    existing_conn.cost = cost
+                    continue
+                if existing_conn is not None:
+                    self.remove_connection(existing_conn)
+                source = self.cells[source_idx]
+                source._skip_network = True
+                try:
+                    connection = self.create_connection(source, self.cells[target_idx], conn_type)
+                    if connection is not None:
+                        connection.cost = cost
+                        by_pair[(source_idx, target_idx)] = connection
+                finally:
+                    delattr(source, '_skip_network')
+
+            if delta["turn"] is not None:
+                self.current_turn = delta["turn"]
+            if delta["time"] is not None:
+                self.round_time_remaining = delta["time"]
 
             self.update()
         except Exception as e:
             if self.logger:
-                self.logger.log(f"GameScene: Błąd podczas stosowania snapshotu: {e}")
+                self.logger.log(f"GameScene: Błąd podczas stosowania synchronizacji stanu: {e}")
 
     def save_game_history(self):
         """Zapisuje historię gry do plików i MongoDB"""
@@ -1830,10 +1777,18 @@ class GameScene(QGraphicsScene):
 
         xml_filename = os.path.join(replays_dir, f"replay_level{self.current_level}_{timestamp}.xml")
         json_filename = os.path.join(replays_dir, f"replay_level{self.current_level}_{timestamp}.json")
-
-        game_history.save_game_history(self, xml_filename)
-        game_history.save_game_history_json(self, json_filename)
-        mongodb_id = game_history.save_game_history_mongodb(self)
-
-        if self.logger:
-            self.logger.log(f"Replay zapisany do MongoDB z id: {mongodb_id}")
\ No newline at end of file
+        binary_filename = os.path.join(replays_dir, f"replay_level{self.current_level}_{timestamp}{replay_format.EXTENSION}")
+
+        # zapis w tle (persistence.py) – koniec gry nie czeka na dysk ani na MongoDB
+        history = game_history.history_snapshot(self)
+        logger = self.logger
+        def on_done(results):
+            if logger:
+                if isinstance(results['mongodb'], Exception):
+                    logger.log(f"Błąd zapisu replayu do MongoDB: {results['mongodb']}")
+                else:
+                    logger.log(f"Replay zapisany do MongoDB z id: {results['mongodb']}")
+            saved = [path for fmt, path in results.items() if fmt != "mongodb" and not isinstance(path, Exception)]
+            replay_catalog.record(history, saved)
+        persistence.submit(history, [("xml", xml_filename), ("json", json_filename), ("binary", binary_filename)],
+                           on_done=on_done)
\ No newline at end of file
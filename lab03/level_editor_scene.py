@@ -1,6 +1,3 @@
-import json
-import os
-
 from PyQt5.QtCore import Qt, QPointF
 from PyQt5.QtGui import QColor, QPen, QFont, QLinearGradient, QCursor
 from PyQt5.QtWidgets import (
@@ -10,6 +7,7 @@ from PyQt5.QtWidgets import (
 
 import config
 from game_objects import CellUnit
+import level_store
 
 class LevelEditorScene(QGraphicsScene):
     def __init__(self, level_id=1, parent=None):
@@ -75,22 +73,13 @@ class LevelEditorScene(QGraphicsScene):
 
     def load_level(self):
         try:
-            levels_path = os.path.join(os.path.dirname(__file__), 'levels.json')
-            with open(levels_path, 'r') as f:
-                levels = json.load(f)
-
-            if 1 <= self.level_id <= len(levels):
-                level_data = levels[self.level_id - 1]
+            level_data = level_store.get_level(self.level_id)
 
-                self.level_name = level_data.get("name", f"Poziom {self.level_id}")
+            if level_data is not None:
+                self.level_name = level_data.name
 
-                for cell_data in level_data.get("cells", []):
-                    cell = CellUnit(
-                        cell_data.get("x", 0),
-                        cell_data.get("y", 0),
-                        cell_data.get("type", "neutral"),
-                        cell_data.get("points", 2)
-                    )
+                for cell_data in level_data.cells:
+                    cell = CellUnit(cell_data.x, cell_data.y, cell_data.type, cell_data.points)
                     self.cells.append(cell)
                     self.addItem(cell)
             else:
@@ -119,35 +108,25 @@ class LevelEditorScene(QGraphicsScene):
 
             self.level_name = name
 
-            level_data = {
-                "name": self.level_name,
-                "cells": [
-                    {
-                        "x": cell.x,
-                        "y": cell.y,
-                        "type": cell.cell_type,
-                        "points": cell.points
-                    } for cell in self.cells
-                ],
-                "connections": []
-            }
-
-            levels_path = os.path.join(os.path.dirname(__file__), 'levels.json')
+            level_data = level_store.Level(
+                self.level_name,
+                tuple(level_store.CellSpec(cell.x, cell.y, cell.cell_type, cell.points) for cell in self.cells),
+                ()
+            )
+
             try:
-                with open(levels_path, 'r') as f:
-                    levels = json.load(f)
-            except:
+                levels = list(level_store.load_levels())
+            except (OSError, ValueError):
                 levels = []
 
             if 1 <= self.level_id <= len(levels):
                 levels[self.level_id - 1] = level_data
             else:
                 while len(levels) < self.level_id - 1:
-                    levels.append({"name": f"Pusty poziom {len(levels) + 1}", "cells": [], "connections": []})
+                    levels.append(level_store.Level(f"Pusty poziom {len(levels) + 1}", (), ()))
                 levels.append(level_data)
 
-            with open(levels_path, 'w', encoding='utf-8') as f:
-                json.dump(levels, f, indent=2, ensure_ascii=False)
+            level_store.save_levels(level_store.LEVELS_PATH, levels)
 
             QMessageBox.information(None, "Sukces", f"Poziom {self.level_id} zapisany pomyślnie!")
             if self.logger:
@@ -205,7 +184,7 @@ class LevelEditorScene(QGraphicsScene):
             new_pos = event.scenePos() - self.drag_offset
             self.dragging_cell.x = new_pos.x()
             self.dragging_cell.y = new_pos.y()
-            self.dragging_cell.update()
+            self.dragging_cell.refresh()
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
@@ -231,16 +210,16 @@ class LevelEditorScene(QGraphicsScene):
                 if ok:
                     item.points = points
                     item.strength = (item.points // 10) + 1
-                    item.update()
+                    item.refresh()
             elif action == player_action:
                 item.cell_type = "player"
-                item.update()
+                item.refresh()
             elif action == enemy_action:
                 item.cell_type = "enemy"
-                item.update()
+                item.refresh()
             elif action == neutral_action:
                 item.cell_type = "neutral"
-                item.update()
+                item.refresh()
 
         super().mouseDoubleClickEvent(event)
 
@@ -0,0 +1,236 @@
+import json
+import math
+import os
+import random
+import struct
+import sys
+import threading
+import zlib
+from collections import namedtuple
+
+import game_rules
+
+# Poziomy gry jako niezmienne obiekty (Level z krotkami CellSpec i ConnectionSpec). Plik poziomów jest parsowany
+# raz i trzymany w pamięci – menu, gra, edytor i serwer meczów dostają ten sam obiekt, a ponowne wczytanie
+# następuje tylko po zmianie pliku na dysku (np. zapisie w edytorze).
+# Oprócz levels.json obsługiwany jest binarny format .lvl dla dużych plansz (tysiące komórek) i generator
+# plansz proceduralnych z ziarnem. Moduł nie zależy od Qt:
+#     python level_store.py levels.json                                (konwersja do levels.lvl)
+#     python level_store.py --generate 2000 --seed 7 --output plansza.lvl
+
+LEVELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "levels.json")
+
+MAGIC = b"CEWL"
+VERSION = 1
+EXTENSION = ".lvl"
+
+TYPES = ("neutral",) + game_rules.FACTIONS
+TYPE_CODES = {cell_type: code for code, cell_type in enumerate(TYPES)}
+
+_HEADER = struct.Struct("<4sBBI")      # magic, wersja, kompresja (0/1 – zlib), liczba poziomów
+_NAME = struct.Struct("<H")            # długość nazwy (UTF-8)
+_COUNT = struct.Struct("<I")
+_CELL = struct.Struct("<ddBH")         # x, y (dokładnie jak w JSON), typ, punkty
+_CONNECTION = struct.Struct("<IIBH")   # źródło, cel, typ, koszt
+
+CellSpec = namedtuple("CellSpec", "x y type points")
+ConnectionSpec = namedtuple("ConnectionSpec", "source target type cost")
+Level = namedtuple("Level", "name cells connections")
+
+
+class LevelFormatError(ValueError):
+    pass
+
+
+def level_from_dict(data, number=None):
+    """Poziom z obiektu levels.json (brakujące pola jak w dotychczasowym wczytywaniu)"""
+    cells = tuple(CellSpec(cell.get("x", 0), cell.get("y", 0), cell.get("type", "neutral"), cell.get("points", 2))
+                  for cell in data.get("cells", []))
+    connections = tuple(ConnectionSpec(conn.get("source", 0), conn.get("target", 0), conn.get("type", "neutral"),
+                                       conn.get("cost", 0))
+                        for conn in data.get("connections", []))
+    name = data.get("name", f"Poziom {number}" if number is not None else "Poziom")
+    return Level(name, cells, connections)
+
+
+def level_to_dict(level):
+    return {"name": level.name,
+            "cells": [{"x": cell.x, "y": cell.y, "type": cell.type, "points": cell.points} for cell in level.cells],
+            "connections": [{"source": conn.source, "target": conn.target, "type": conn.type, "cost": conn.cost}
+                            for conn in level.connections]}
+
+
+# --- format binarny ---
+
+def encode_levels(levels, compress=True):
+    parts = []
+    for level in levels:
+        name = level.name.encode("utf-8")
+        parts.append(_NAME.pack(len(name)))
+        parts.append(name)
+        parts.append(_COUNT.pack(len(level.cells)))
+        parts.extend(_CELL.pack(cell.x, cell.y, TYPE_CODES[cell.type], cell.points) for cell in level.cells)
+        parts.append(_COUNT.pack(len(level.connections)))
+        parts.extend(_CONNECTION.pack(conn.source, conn.target, TYPE_CODES[conn.type], conn.cost)
+                     for conn in level.connections)
+    body = b"".join(parts)
+    return _HEADER.pack(MAGIC, VERSION, int(compress), len(levels)) + (zlib.compress(body) if compress else body)
+
+
+def decode_levels(data):
+    try:
+        magic, version, compressed, count = _HEADER.unpack_from(data)
+    except struct.error:
+        raise LevelFormatError("Za krótki plik poziomów")
+    if magic != MAGIC:
+        raise LevelFormatError("To nie jest plik poziomów")
+    if version != VERSION:
+        raise LevelFormatError(f"Nieobsługiwana wersja pliku poziomów: {version}")
+    body = data[_HEADER.size:]
+    if compressed:
+        try:
+            body = zlib.decompress(body)
+        except zlib.error as e:
+            raise LevelFormatError(f"Uszkodzony plik poziomów: {e}")
+    levels = []
+    offset = 0
+    try:
+        for _ in range(count):
+            (name_length,) = _NAME.unpack_from(body, offset)
+            offset += _NAME.size
+            name = body[offset:offset + name_length].decode("utf-8")
+            offset += name_length
+            (cell_count,) = _COUNT.unpack_from(body, offset)
+            offset += _COUNT.size
+            cells = tuple(CellSpec(x, y, TYPES[code], points)
+                          for x, y, code, points in _CELL.iter_unpack(body[offset:offset + cell_count * _CELL.size]))
+            offset += cell_count * _CELL.size
+            (connection_count,) = _COUNT.unpack_from(body, offset)
+            offset += _COUNT.size
+            connections = tuple(ConnectionSpec(source, target, TYPES[code], cost) for source, target, code, cost in
+                                _CONNECTION.iter_unpack(body[offset:offset + connection_count * _CONNECTION.size]))
+            offset += connection_count * _CONNECTION.size
+            levels.append(Level(name, cells, connections))
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise LevelFormatError(f"Uszkodzony plik poziomów: {e}")
+    return tuple(levels)
+
+
+def save_levels(path, levels):
+    """Zapis poziomów w formacie zależnym od rozszerzenia (.lvl – binarny, inne – JSON jak levels.json)"""
+    if path.endswith(EXTENSION):
+        with open(path, "wb") as f:
+            f.write(encode_levels(levels))
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([level_to_dict(level) for level in levels], f, indent=2, ensure_ascii=False)
+    invalidate(path)
+
+
+def parse_levels(path):
+    if path.endswith(EXTENSION):
+        with open(path, "rb") as f:
+            return decode_levels(f.read())
+    with open(path, "r", encoding="utf-8") as f:
+        return tuple(level_from_dict(data, number) for number, data in enumerate(json.load(f), 1))
+
+
+# --- pamięć podręczna ---
+
+_cache = {}                 # ścieżka -> (mtime_ns, rozmiar, poziomy)
+_lock = threading.Lock()
+
+
+def load_levels(path=None):
+    """Wszystkie poziomy z pliku (domyślnie LEVELS_PATH) jako krotka obiektów Level; plik parsowany tylko
+       przy pierwszym wywołaniu i po jego zmianie na dysku. Błędy wczytania (OSError, ValueError) przechodzą
+       do wywołującego."""
+    path = os.path.abspath(path or LEVELS_PATH)
+    stat = os.stat(path)
+    with _lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+    levels = parse_levels(path)
+    with _lock:
+        _cache[path] = (stat.st_mtime_ns, stat.st_size, levels)
+    return levels
+
+
+def get_level(number, path=None):
+    """Poziom o numerze od 1 albo None, gdy takiego nie ma"""
+    levels = load_levels(path)
+    if 1 <= number <= len(levels):
+        return levels[number - 1]
+    return None
+
+
+def invalidate(path=None):
+    with _lock:
+        if path is None:
+            _cache.clear()
+        else:
+            _cache.pop(os.path.abspath(path), None)
+
+
+# --- generator ---
+
+def generate_level(cell_count, seed=0, factions=2, spacing=70, aspect=16 / 9, start_cells=None, name=None):
+    """Plansza proceduralna: cell_count komórek na siatce z losowym przesunięciem (odstęp ok. spacing px,
+       proporcje aspect). Każda frakcja zaczyna w swoim rejonie brzegu planszy od start_cells komórek
+       (domyślnie 1% planszy, co najmniej 2; jedna silna), reszta jest neutralna.
+       To samo ziarno daje zawsze tę samą planszę."""
+    if not 2 <= factions <= len(game_rules.FACTIONS):
+        raise ValueError(f"Liczba frakcji poza zakresem 2..{len(game_rules.FACTIONS)}")
+    if cell_count < 2 * factions:
+        raise ValueError(f"Za mało komórek dla {factions} frakcji: {cell_count}")
+    rng = random.Random(seed)
+    columns = max(1, math.ceil(math.sqrt(cell_count * aspect)))
+    rows = math.ceil(cell_count / columns)
+    slots = sorted(rng.sample(range(columns * rows), cell_count))
+    jitter = 0.3 * spacing
+    positions = [(round((slot % columns + 0.5) * spacing + rng.uniform(-jitter, jitter), 1),
+                  round((slot // columns + 0.5) * spacing + rng.uniform(-jitter, jitter), 1)) for slot in slots]
+
+    types = ["neutral"] * cell_count
+    points = [rng.randint(2, 20) for _ in range(cell_count)]
+    width, height = columns * spacing, rows * spacing
+    per_faction = start_cells if start_cells is not None else max(2, cell_count // 100)
+    if not 1 <= per_faction <= cell_count // factions:
+        raise ValueError(f"Nieprawidłowa liczba komórek startowych: {per_faction}")
+    for i, faction in enumerate(game_rules.FACTIONS[:factions]):
+        # punkt startowy frakcji na elipsie wpisanej w planszę, komórki startowe najbliżej niego
+        angle = math.pi + 2 * math.pi * i / factions
+        anchor = (width / 2 + 0.4 * width * math.cos(angle), height / 2 + 0.4 * height * math.sin(angle))
+        free = [index for index in range(cell_count) if types[index] == "neutral"]
+        free.sort(key=lambda index: math.dist(positions[index], anchor))
+        for rank, index in enumerate(free[:per_faction]):
+            types[index] = faction
+            points[index] = 30 if rank == 0 else 10
+
+    cells = tuple(CellSpec(x, y, cell_type, cell_points)
+                  for (x, y), cell_type, cell_points in zip(positions, types, points))
+    return Level(name or f"Generowana {cell_count} ({seed})", cells, ())
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Konwersja levels.json do formatu .lvl i generowanie plansz")
+    parser.add_argument("source", nargs="?", default=LEVELS_PATH, help="plik poziomów do konwersji")
+    parser.add_argument("--output", default=None, help="plik wynikowy (.lvl – binarny, .json – JSON)")
+    parser.add_argument("--generate", type=int, default=None, metavar="KOMÓRKI", help="zamiast konwersji: plansza generowana")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--factions", type=int, default=2)
+    args = parser.parse_args()
+    if args.generate is not None:
+        if args.output is None:
+            sys.exit("Dla --generate podaj plik wynikowy (--output)")
+        output, levels = args.output, (generate_level(args.generate, args.seed, args.factions),)
+    else:
+        output, levels = args.output or os.path.splitext(args.source)[0] + EXTENSION, load_levels(args.source)
+    save_levels(output, levels)
+    print(f"{output}: {len(levels)} poziom(ów), {sum(len(level.cells) for level in levels)} komórek, "
+          f"{os.path.getsize(output)} B")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import level_store
+
+# Test wydajności na dużych planszach z generatora (level_store.generate_level): dla każdej liczby komórek
+# mierzy wczytanie planszy (JSON i .lvl), zbudowanie sceny, pętlę gry (GameScene.update_game), rysowanie
+# całej planszy do obrazu i wyszukiwanie ruchu przez AI. Scena działa bez okna (Qt offscreen).
+#
+#   python level_stress.py --cells 200 1000 3000 --ticks 300 --frames 20
+
+
+def timed(function, repeat=1):
+    """Średni czas wywołania w ms i wynik ostatniego wywołania"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return 1000 * (time.perf_counter() - started) / repeat, result
+
+
+def connect_nearest(scene, per_cell):
+    """Każda komórka frakcji dostaje mosty do per_cell najbliższych komórek – kropki na całej planszy"""
+    created = 0
+    for source in [cell for cell in scene.cells if cell.cell_type != "neutral"]:
+        nearest = sorted((cell for cell in scene.cells if cell is not source),
+                         key=lambda cell: math.hypot(cell.x - source.x, cell.y - source.y))[:per_cell]
+        for target in nearest:
+            if scene.create_connection(source, target, source.cell_type) is not None:
+                created += 1
+    return created
+
+
+def measure(cells, args):
+    from PyQt5.QtCore import QRectF
+    from PyQt5.QtGui import QImage, QPainter
+
+    import config
+    import game_ai
+    from game_scene import GameScene
+
+    start_cells = max(1, int(cells * args.owned))
+
+    def generate():
+        return level_store.generate_level(cells, args.seed, args.factions, start_cells=start_cells)
+    result = {"cells": cells}
+    result["generate_ms"], level = timed(generate)
+
+    as_json = json.dumps([level_store.level_to_dict(level)])
+    as_binary = level_store.encode_levels([level])
+    result["json_kB"] = round(len(as_json) / 1024, 1)
+    result["lvl_kB"] = round(len(as_binary) / 1024, 1)
+    result["json_parse_ms"], _ = timed(lambda: [level_store.level_from_dict(data) for data in json.loads(as_json)], 5)
+    result["lvl_parse_ms"], _ = timed(lambda: level_store.decode_levels(as_binary), 5)
+
+    scene = GameScene()
+    result["scene_build_ms"], _ = timed(lambda: scene.initialize_level(0, level))
+    result["bridges"] = connect_nearest(scene, args.bridges)
+
+    # pętla gry jak przy timerze FRAME_INTERVAL_MS, z taktem punktów co POINTS_INTERVAL_MS
+    points_every = max(1, config.POINTS_INTERVAL_MS // config.FRAME_INTERVAL_MS)
+
+    def run_ticks():
+        most_dots = 0
+        for frame in range(args.ticks):
+            scene.update_game()
+            if frame % points_every == 0:
+                scene.add_points()
+            most_dots = max(most_dots, scene.simulation.dot_store.count)
+        return most_dots
+    elapsed, result["dots_max"] = timed(run_ticks)
+    result["tick_ms"] = elapsed / args.ticks
+
+    image = QImage(config.WINDOW_WIDTH, config.WINDOW_HEIGHT, QImage.Format_ARGB32_Premultiplied)
+    source = scene.itemsBoundingRect()
+
+    def render():
+        painter = QPainter(image)
+        scene.render(painter, QRectF(image.rect()), source)
+        painter.end()
+    result["render_ms"], _ = timed(render, args.frames)
+
+    if args.ai:
+        scene.game_ai.simulation_time = args.ai_time
+        # ai_prepare – zamrożenie sceny w wątku GUI, ai_state – układ planszy, stan i ruchy (wątek AI)
+        result["ai_prepare_ms"], board = timed(lambda: scene.game_ai.prepare_search("player"))
+        result["ai_state_ms"], moves = timed(lambda: game_ai.GameState.from_board(board).get_possible_moves())
+        result["ai_moves"] = len(moves)
+        result["ai_search_ms"], _ = timed(lambda: scene.game_ai.analyze_best_move("player"))
+    scene.stop_all_timers()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test wydajności gry na dużych planszach generowanych")
+    parser.add_argument("--cells", type=int, nargs="+", default=[200, 1000, 3000])
+    parser.add_argument("--factions", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--owned", type=float, default=0.1, help="udział komórek startowych każdej frakcji")
+    parser.add_argument("--bridges", type=int, default=2, help="mosty z każdej komórki frakcji do najbliższych")
+    parser.add_argument("--ticks", type=int, default=300)
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--no-ai", dest="ai", action="store_false")
+    parser.add_argument("--ai-time", type=float, default=0.5, help="limit czasu wyszukiwania AI (s)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication(sys.argv)
+
+    results = [measure(cells, args) for cells in args.cells]
+    keys = list(dict.fromkeys(key for result in results for key in result))
+    for key in keys:
+        values = [result.get(key) for result in results]
+        print(f"{key:16}" + "".join(f"{'-' if value is None else round(value, 2) if isinstance(value, float) else value:>12}"
+                                        for value in values))
+    app.quit()
+
+
+if __name__ == "__main__":
+    main()
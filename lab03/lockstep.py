@@ -0,0 +1,300 @@
+import socket
+import struct
+import time
+import zlib
+
+import game_engine
+from state_sync import TYPES, TYPE_CODES
+
+# Gra sieciowa w trybie lockstep: obie strony krokują tę samą deterministyczną symulację (Simulation bez
+# zegara, krok = FRAME_INTERVAL_MS), a przez UDP wymieniają tylko komendy graczy. Komenda wydana w ticku t
+# wykona się u obu stron w ticku t + input_delay; tick może się wykonać dopiero, gdy znane są komendy
+# partnera dla tego ticku (ramka, często pusta). Każdy pakiet powtarza wszystkie ramki niepotwierdzone
+# przez partnera (redundancja zamiast retransmisji), niesie potwierdzenie ramek partnera i ostatni skrót
+# stanu – różne skróty dla tego samego ticku oznaczają rozjechanie się symulacji (desync).
+#
+# Komendy: ("bridge", źródło, cel), ("cut", źródło, cel, miejsce cięcia w promilach),
+#          ("freeze", komórka), ("takeover", komórka), ("bonus", komórka), ("copy", źródło, x, y)
+
+VERSION = 1
+SIDES = ("player", "enemy")       # kolejność stosowania komend w ticku
+INPUT_DELAY = 6                   # ticki (~100 ms) między wydaniem a wykonaniem komendy
+HASH_INTERVAL = 30                # co ile ticków liczony jest skrót stanu
+MAX_FRAMES = 120                  # najwięcej ramek w pakiecie (najstarsze niepotwierdzone)
+MAX_CATCHUP = 8                   # najwięcej ticków nadrabianych w jednym update()
+MAX_COMMANDS = 255                # komend w jednej ramce (licznik u8)
+HASH_HISTORY = 16                 # ile własnych skrótów pamiętać do porównania
+MAX_PACKET = 65535
+
+COMMANDS = ("bridge", "cut", "freeze", "takeover", "bonus", "copy")
+COMMAND_CODES = {name: code for code, name in enumerate(COMMANDS)}
+
+_HEADER = struct.Struct("<BBIIIIH")   # wersja, strona, ack, tick skrótu, skrót, pierwsza ramka, liczba ramek
+_FRAME = struct.Struct("<B")          # liczba komend w ramce
+_COMMAND = struct.Struct("<BHHhh")    # rodzaj, komórka, cel, a, b
+_HASH_CELL = struct.Struct("<BiB")
+_HASH_CONNECTION = struct.Struct("<HHBiB")
+
+
+class LockstepError(Exception):
+    pass
+
+
+def encode_command(command):
+    kind = command[0]
+    values = list(command[1:]) + [0] * (5 - len(command))
+    if kind == "copy":
+        values = [values[0], 0, values[1], values[2]]
+    return _COMMAND.pack(COMMAND_CODES[kind], *values)
+
+
+def decode_command(code, cell, target, a, b):
+    kind = COMMANDS[code]
+    if kind == "bridge":
+        return (kind, cell, target)
+    if kind == "cut":
+        return (kind, cell, target, a)
+    if kind == "copy":
+        return (kind, cell, a, b)
+    return (kind, cell)
+
+
+def encode_packet(side, ack, hash_tick, state_hash, first_tick, frames):
+    body = [_HEADER.pack(VERSION, TYPE_CODES[side], ack, hash_tick, state_hash, first_tick, len(frames))]
+    for commands in frames:
+        body.append(_FRAME.pack(len(commands)))
+        body.extend(encode_command(command) for command in commands)
+    return b"".join(body)
+
+
+def decode_packet(data):
+    """(strona, ack, tick skrótu, skrót, pierwsza ramka, lista ramek); LockstepError przy błędnych danych"""
+    try:
+        version, side, ack, hash_tick, state_hash, first_tick, count = _HEADER.unpack_from(data)
+        if version != VERSION:
+            raise LockstepError(f"Nieobsługiwana wersja lockstep: {version}")
+        offset = _HEADER.size
+        frames = []
+        for _ in range(count):
+            (commands,) = _FRAME.unpack_from(data, offset)
+            offset += _FRAME.size
+            end = offset + commands * _COMMAND.size
+            if end > len(data):
+                raise LockstepError("Ucięta ramka komend")
+            frames.append([decode_command(*values) for values in _COMMAND.iter_unpack(data[offset:end])])
+            offset = end
+        return TYPES[side], ack, hash_tick, state_hash, first_tick, frames
+    except (struct.error, IndexError) as e:
+        raise LockstepError(f"Uszkodzony pakiet lockstep: {e}")
+
+
+def state_hash(simulation):
+    """CRC32 stanu istotnego dla rozgrywki: komórki, mosty (z konfliktami) i liczba kropek w drodze"""
+    index = {id(cell): i for i, cell in enumerate(simulation.cells)}
+    data = [_HASH_CELL.pack(TYPE_CODES.get(cell.cell_type, 0), cell.points, int(bool(cell.frozen)))
+            for cell in simulation.cells]
+    data.extend(_HASH_CONNECTION.pack(index[id(conn.source_cell)], index[id(conn.target_cell)],
+                                      TYPE_CODES.get(conn.connection_type, 0), conn.cost, int(bool(conn.conflict)))
+                for conn in simulation.connections)
+    data.append(struct.pack("<I", simulation.dot_store.count))
+    return zlib.crc32(b"".join(data))
+
+
+def apply_command(simulation, side, command, make_cell=None):
+    """Wykonuje komendę strony (frakcji) side na symulacji; komendy niedozwolone w bieżącym stanie są pomijane
+       (obie strony oceniają je tak samo). Zwraca zdarzenia jak metody Simulation oraz ("bridge_created", most)."""
+    cells = simulation.cells
+    kind = command[0]
+    if not all(0 <= index < len(cells) for index in command[1:3 if kind in ("bridge", "cut") else 2]):
+        return []
+    cell = cells[command[1]]
+    opponent = cell.cell_type not in (side, "neutral")
+    if kind == "bridge":
+        target = cells[command[2]]
+        if cell.cell_type != side or target is cell:
+            return []
+        outgoing = sum(1 for conn in cell.connections if conn.source_cell is cell)
+        exists = any(conn.connection_type == side and {conn.source_cell, conn.target_cell} == {cell, target}
+                     for conn in cell.connections)
+        cost = game_engine.bridge_cost(cell, target)
+        if exists or outgoing >= cell.strength or cell.points < cost:
+            return []
+        connection = simulation.apply_move((command[1], command[2], cost))
+        return [("bridge_created", connection)] if connection is not None else []
+    if kind == "cut":
+        target = cells[command[2]]
+        for conn in cell.connections:
+            if conn.source_cell is cell and conn.target_cell is target and conn.connection_type == side:
+                simulation.cut_connection(conn, command[3] / 1000)
+                return [("bridge_removed", conn, "cut")]
+        return []
+    if kind == "freeze" and opponent:
+        simulation.freeze(cell)
+    elif kind == "takeover" and opponent:
+        simulation.take_over(cell, side)
+    elif kind == "bonus" and cell.cell_type != "neutral":
+        simulation.add_bonus(cell)
+    elif kind == "copy":
+        make_cell = make_cell or game_engine.Cell
+        cells.append(make_cell(command[2], command[3], side, cell.points))
+    return []
+
+
+class LockstepSession:
+    """
+    Jedna strona meczu lockstep na gnieździe UDP.
+    update() wywoływane co klatkę: odbiera pakiety, wykonuje zaległe ticki (według zegara, o ile są ramki
+    partnera) i wysyła pakiet. submit(komenda) planuje komendę gracza. make_cell(x, y, typ, punkty) tworzy
+    komórkę dla komendy copy (domyślnie game_engine.Cell).
+    """
+
+    def __init__(self, simulation, side, local_port, remote_address, input_delay=INPUT_DELAY,
+                 hash_interval=HASH_INTERVAL, make_cell=None, clock=time.monotonic):
+        self.simulation = simulation
+        self.side = side
+        self.remote_side = "enemy" if side == "player" else "player"
+        self.remote_address = remote_address
+        self.input_delay = input_delay
+        self.hash_interval = hash_interval
+        self.make_cell = make_cell
+        self.clock = clock
+        family = socket.AF_INET6 if ":" in remote_address[0] else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.bind(("::" if family == socket.AF_INET6 else "0.0.0.0", local_port))
+        self.sock.setblocking(False)
+
+        self.tick = 0                  # liczba wykonanych ticków = następny tick do wykonania
+        self.started = None
+        # ramki < input_delay są z definicji puste u obu stron
+        self.local_frames = {}         # tick -> komendy
+        self.local_acked = input_delay  # partner ma już nasze ramki < local_acked
+        self.remote_frames = {}
+        self.remote_next = input_delay  # pierwsza ramka partnera, której jeszcze nie mamy
+        self.local_hashes = {0: state_hash(simulation)}
+        self.remote_hashes = {}
+        self.desync_tick = None
+        self.stalls = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.pending_events = []
+
+    def close(self):
+        self.sock.close()
+
+    def submit(self, command):
+        """Planuje komendę gracza; zwraca tick, w którym wykona się u obu stron
+           (None, gdy ta sama komenda już czeka – np. kolejne ruchy myszy nad przecinanym mostem)"""
+        command = tuple(command)
+        if any(command in frame for tick, frame in self.local_frames.items() if tick >= self.tick):
+            return None
+        tick = self.tick + self.input_delay
+        while len(self.local_frames.get(tick, ())) >= MAX_COMMANDS:
+            tick += 1
+        self.local_frames.setdefault(tick, []).append(command)
+        return tick
+
+    def can_advance(self):
+        return self.tick < self.remote_next
+
+    def advance(self):
+        """Wykonuje następny tick (wymaga can_advance()); zwraca zdarzenia symulacji"""
+        tick = self.tick
+        frames = {self.side: self.local_frames.get(tick, ()), self.remote_side: self.remote_frames.pop(tick, ())}
+        events = []
+        for side in SIDES:
+            for command in frames[side]:
+                events.extend(apply_command(self.simulation, side, command, self.make_cell))
+        events.extend(self.simulation.step())
+        self.tick += 1
+        for old in [t for t in self.local_frames if t < min(self.local_acked, self.tick)]:
+            del self.local_frames[old]
+        if self.tick % self.hash_interval == 0:
+            self.local_hashes[self.tick] = state_hash(self.simulation)
+            if len(self.local_hashes) > HASH_HISTORY:
+                del self.local_hashes[min(self.local_hashes)]
+            self._compare_hash(self.tick)
+        events.extend(self.pending_events)
+        self.pending_events = []
+        return events
+
+    def update(self, now=None):
+        """Krok pętli gry: odbiór, ticki należne według zegara (najwyżej MAX_CATCHUP), wysłanie pakietu"""
+        now = self.clock() if now is None else now
+        if self.started is None:
+            self.started = now
+        self.receive()
+        target = int((now - self.started) / self.simulation.frame_dt)
+        events = []
+        for _ in range(MAX_CATCHUP):
+            if self.tick >= target:
+                break
+            if not self.can_advance():
+                self.stalls += 1
+                break
+            events.extend(self.advance())
+        self.send()
+        events.extend(self.pending_events)
+        self.pending_events = []
+        return events
+
+    def exchange(self):
+        """Tylko odbiór i wysyłanie (np. po końcu gry, żeby partner dostał nasze ostatnie ramki)"""
+        self.receive()
+        self.send()
+
+    def send(self):
+        first = self.local_acked
+        last = min(self.tick + self.input_delay, first + MAX_FRAMES)
+        frames = [self.local_frames.get(tick, ()) for tick in range(first, last)]
+        hash_tick = max(self.local_hashes)
+        packet = encode_packet(self.side, self.remote_next, hash_tick, self.local_hashes[hash_tick], first, frames)
+        try:
+            self.sock.sendto(packet, self.remote_address)
+        except OSError:
+            return
+        self.bytes_sent += len(packet)
+        self.packets_sent += 1
+
+    def receive(self):
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(MAX_PACKET)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # np. ICMP "port unreachable" zgłaszany przez Windows, zanim partner otworzy gniazdo
+                return
+            try:
+                side, ack, hash_tick, remote_hash, first_tick, frames = decode_packet(data)
+            except LockstepError:
+                continue
+            if side != self.remote_side:
+                continue
+            self.bytes_received += len(data)
+            self.packets_received += 1
+            self.local_acked = max(self.local_acked, ack)
+            for offset, commands in enumerate(frames):
+                tick = first_tick + offset
+                if tick >= self.remote_next:
+                    self.remote_frames.setdefault(tick, commands)
+            while self.remote_next in self.remote_frames:
+                self.remote_next += 1
+            if hash_tick >= min(self.local_hashes):
+                self.remote_hashes[hash_tick] = remote_hash
+                self._compare_hash(hash_tick)
+
+    def _compare_hash(self, tick):
+        local, remote = self.local_hashes.get(tick), self.remote_hashes.get(tick)
+        if local is None or remote is None:
+            return
+        del self.remote_hashes[tick]
+        if local != remote and self.desync_tick is None:
+            self.desync_tick = tick
+            self.pending_events.append(("desync", tick))
+
+    def stats(self):
+        return {"tick": self.tick, "bytes_sent": self.bytes_sent, "bytes_received": self.bytes_received,
+                "packets_sent": self.packets_sent, "packets_received": self.packets_received,
+                "stalls": self.stalls, "desync_tick": self.desync_tick}
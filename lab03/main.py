@@ -7,7 +7,7 @@ import socket
 import threading
 import time
 
-from PyQt5.QtCore import Qt, QTimer, QEventLoop, pyqtSlot, QObject
+from PyQt5.QtCore import Qt, QTimer, QEventLoop, pyqtSlot, QObject, QMetaObject, Q_ARG
 from PyQt5.QtGui import QFont
 from PyQt5.QtWidgets import (
     QApplication, QGraphicsView, QMainWindow, QDockWidget,
@@ -17,12 +17,16 @@ from PyQt5.QtWidgets import (
 )
 
 import config
-from game_scene import GameScene
+from game_scene import GameScene, wait_for_saves
 from level_editor_scene import LevelEditorScene
 from logger import Logger
 from menu_scene import MenuScene
 from playback_scene import PlaybackScene
 import game_history
+from net_session import NetSession
+import persistence
+import replay_catalog
+import replay_format
 
 class DynamicGraphicsView(QGraphicsView):
     def resizeEvent(self, event):
@@ -39,9 +43,15 @@ class ConnectionHandler(QObject):
     def request_finish_connection(self):
         self.parent.finish_connection_setup()
 
-    @pyqtSlot(str)
-    def request_process_message(self, data):
-        self.parent.process_game_message(data)
+    @pyqtSlot(object, str)
+    def request_network_message(self, session, data):
+        self.parent.dispatch_network_message(session, data)
+
+    @pyqtSlot()
+    def request_connection_check(self):
+        game_scene = self.parent.game_scene
+        if game_scene and getattr(game_scene, 'is_multiplayer', False):
+            self.parent.check_connection_status()
 
 class GameWindow(QMainWindow):
     def __init__(self):
@@ -83,7 +93,9 @@ class GameWindow(QMainWindow):
 
         self.view = DynamicGraphicsView()
         self.view.setRenderHints(self.view.renderHints())
-        self.view.setViewportUpdateMode(self.view.FullViewportUpdate)
+        # Odświeżane są tylko zmienione obszary (komórki, mosty z kropkami); tło jest buforowane przez widok
+        self.view.setViewportUpdateMode(self.view.MinimalViewportUpdate)
+        self.view.setCacheMode(self.view.CacheBackground)
         self.setCentralWidget(self.view)
         self.resize(config.WINDOW_WIDTH, config.WINDOW_HEIGHT)
 
@@ -100,6 +112,19 @@ class GameWindow(QMainWindow):
         self.connection_timeout = 10000                                       
 
         self.handler = ConnectionHandler(self)
+        # jedno trwałe połączenie meczu w obie strony: wychodzące albo przyjęte przez nasłuch
+        self.session = None
+        self.inbound_sessions = []
+        self.session_lock = threading.Lock()     # sesje zmieniają wątek nasłuchu, wątki sesji i wątek główny
+
+    def closeEvent(self, event):
+        # Wątek AI musi zakończyć się przed zniszczeniem sceny
+        if self.game_scene and hasattr(self.game_scene, 'stop_ai'):
+            self.game_scene.stop_ai()
+        self.close_network_sessions()
+        # oczekujące zapisy historii muszą trafić na dysk/do bazy przed wyjściem
+        persistence.shutdown()
+        super().closeEvent(event)
 
     def toggle_log_dock(self, visible):
         if visible:
@@ -141,6 +166,12 @@ class GameWindow(QMainWindow):
                 except (TypeError, RuntimeError):
                     pass
 
+            if hasattr(self.game_scene, 'stop_ai'):
+                self.game_scene.stop_ai()
+
+            if getattr(self.game_scene, 'is_multiplayer', False):
+                self.close_network_sessions()
+
             if self.logger:
                 self.logger.log("GameWindow: Wszystkie timery zatrzymane, przejście do menu.")
 
@@ -153,6 +184,7 @@ class GameWindow(QMainWindow):
         self.game_scene = GameScene()
         self.game_scene.logger = self.logger
         self.game_scene.current_level = level_id
+        wait_for_saves(self)
         quicksave_xml = os.path.join("saves", f"quicksave_level{level_id}.xml")
         quicksave_json = os.path.join("saves", f"quicksave_level{level_id}.json")
         if os.path.exists(quicksave_xml) or os.path.exists(quicksave_json):
@@ -199,7 +231,9 @@ class GameWindow(QMainWindow):
                 if hasattr(self, 'connection_setup_completed'):
                     delattr(self, 'connection_setup_completed')                                     
 
-                self.start_network_listener(remote_port)
+                # port nasłuchu (TCP i UDP lockstep) – domyślnie ten sam numer co port partnera
+                self.listen_port = config.NETWORK_LISTEN_PORT or remote_port
+                self.start_network_listener(self.listen_port)
                 local_ip = get_local_ip(self.use_ipv6)
 
                 self.game_scene.is_multiplayer = True
@@ -214,6 +248,10 @@ class GameWindow(QMainWindow):
                 self.game_scene.single_player = False
 
                 self.game_scene.network_send_callback = lambda msg: self.send_network_message(remote_ip, remote_port, msg)
+                self.remote_address = (remote_ip, remote_port)
+                if config.LOCKSTEP:
+                    # do startu lockstep plansza u obu stron musi zostać w stanie początkowym poziomu
+                    self.game_scene.points_timer.stop()
 
                 self.game_scene.on_disconnect = lambda: self.handle_client_disconnect()
 
@@ -274,6 +312,11 @@ class GameWindow(QMainWindow):
 
     def finish_connection_setup(self):
         """Kończy konfigurację połączenia i rozpoczyna grę"""
+        if (config.LOCKSTEP and self.game_scene and getattr(self.game_scene, 'is_connection_initiator', False)
+                and not self.connection_established):
+            # strona lockstep musi być ustalona przed startem: czekamy na potwierdzenie partnera
+            # albo na jego żądanie połączenia (wtedy jesteśmy odbiorcą)
+            return
         if hasattr(self, 'connection_safety_timer') and self.connection_safety_timer.isActive():
             self.connection_safety_timer.stop()
 
@@ -294,6 +337,13 @@ class GameWindow(QMainWindow):
                 if not hasattr(self.game_scene, 'multiplayer_role'):
                     self.game_scene.multiplayer_role = "player" if getattr(self.game_scene, 'is_connection_initiator', True) else "enemy"
 
+                if config.LOCKSTEP:
+                    try:
+                        self.game_scene.start_lockstep(self.listen_port, self.remote_address)
+                    except OSError as e:
+                        if self.logger:
+                            self.logger.log(f"Nie udało się uruchomić trybu lockstep: {e}")
+
                 role_text = "ZIELONY" if self.game_scene.multiplayer_role == "player" else "CZERWONY"
                 if hasattr(self.game_scene, 'role_info') and self.game_scene.role_info:
                     self.game_scene.removeItem(self.game_scene.role_info)
@@ -310,25 +360,26 @@ class GameWindow(QMainWindow):
                 if self.logger:
                     self.logger.log(f"Przypisana rola: {role_text}, Inicjator: {getattr(self.game_scene, 'is_connection_initiator', False)}")
 
-                try:
-                    self.game_scene.start_turn_timer()
-                    if self.logger:
-                        self.logger.log("Timer tury został uruchomiony")
-                except Exception as e:
-                    if self.logger:
-                        self.logger.log(f"Błąd podczas uruchamiania timera tury: {e}")
+                if self.game_scene.lockstep is None:
+                    try:
+                        self.game_scene.start_turn_timer()
+                        if self.logger:
+                            self.logger.log("Timer tury został uruchomiony")
+                    except Exception as e:
+                        if self.logger:
+                            self.logger.log(f"Błąd podczas uruchamiania timera tury: {e}")
 
-                try:
-                    self.game_scene.timer.start(16)
-                    self.game_scene.points_timer.start(2000)
-                    if self.logger:
-                        self.logger.log("Timery gry zostały uruchomione")
-                except Exception as e:
-                    if self.logger:
-                        self.logger.log(f"Błąd podczas uruchamiania timerów gry: {e}")
+                    try:
+                        self.game_scene.timer.start(16)
+                        self.game_scene.points_timer.start(2000)
+                        if self.logger:
+                            self.logger.log("Timery gry zostały uruchomione")
+                    except Exception as e:
+                        if self.logger:
+                            self.logger.log(f"Błąd podczas uruchamiania timerów gry: {e}")
 
-                if hasattr(self.game_scene, "network_send_callback") and self.game_scene.network_send_callback:
-                    self.game_scene.send_game_state_snapshot()
+                if self.game_scene.lockstep is None and hasattr(self.game_scene, "network_send_callback") and self.game_scene.network_send_callback:
+                    self.game_scene.send_game_state_snapshot(full=True)
                     if self.logger:
                         self.logger.log("Wysłano pełną synchronizację stanu gry")
 
@@ -386,26 +437,51 @@ class GameWindow(QMainWindow):
         layout = QVBoxLayout(dialog)
         label = QLabel("Wybierz plik replay:")
         layout.addWidget(label)
+        filters_layout = QHBoxLayout()
         level_combo = QComboBox()
-        level_combo.addItems(["Poziom 1", "Poziom 2", "Poziom 3"])
-        layout.addWidget(level_combo)
+        level_combo.addItems(["Wszystkie poziomy", "Poziom 1", "Poziom 2", "Poziom 3"])
+        filters_layout.addWidget(level_combo)
+        result_combo = QComboBox()
+        result_combo.addItem("Każdy wynik", None)
+        for result, result_label in replay_catalog.RESULT_LABELS.items():
+            result_combo.addItem(result_label, result)
+        filters_layout.addWidget(result_combo)
+        order_combo = QComboBox()
+        for order, order_label in (("newest", "Najnowsze"), ("oldest", "Najstarsze"), ("longest", "Najdłuższe"),
+                                   ("shortest", "Najkrótsze"), ("largest", "Największe")):
+            order_combo.addItem(order_label, order)
+        filters_layout.addWidget(order_combo)
+        layout.addLayout(filters_layout)
         list_widget = QListWidget()
         layout.addWidget(list_widget)
-        ext = ".xml" if replay_source == "XML" else ".json" if replay_source == "JSON" else ""
+        fmt = replay_catalog.FORMATS.get({"XML": ".xml", "JSON": ".json", "BIN": replay_format.EXTENSION}.get(replay_source, ""))
         replays_dir = "replays"
         if not os.path.exists(replays_dir):
             os.makedirs(replays_dir)
+        # lista z katalogu metadanych (SQLite) – pliki są wczytywane tylko, gdy są nowe lub zmienione
+        catalog = replay_catalog.ReplayCatalog()
+        catalog.sync(replays_dir)
 
         def update_list():
             list_widget.clear()
-            selected_level = int(level_combo.currentText().split()[1])
-            level_prefix = f"replay_level{selected_level}_"
-            files = [f for f in os.listdir(replays_dir) if f.startswith(level_prefix) and f.endswith(ext)]
-            sorted_files = sorted(files, key=lambda f: os.path.getmtime(os.path.join(replays_dir, f)), reverse=True)
-            for f in sorted_files:
-                list_widget.addItem(f)
+            level = level_combo.currentIndex() or None
+            for entry in catalog.query(fmt, level, result_combo.currentData(), order_combo.currentData()):
+                try:
+                    time_str = datetime.datetime.fromtimestamp(entry["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+                except Exception:
+                    time_str = "Brak daty"
+                duration = int(entry["duration"] or 0)
+                text = (f"{time_str} | Poziom {entry['level']} | {duration // 60:02d}:{duration % 60:02d} | "
+                        f"{replay_catalog.RESULT_LABELS.get(entry['result'], '?')} "
+                        f"({entry['player_cells']}:{entry['enemy_cells']}) | {entry['size'] / 1024:.1f} KB")
+                list_item = QListWidgetItem(text)
+                list_item.setData(Qt.UserRole, entry["path"])
+                list_item.setToolTip(os.path.basename(entry["path"]))
+                list_widget.addItem(list_item)
         update_list()
         level_combo.currentIndexChanged.connect(update_list)
+        result_combo.currentIndexChanged.connect(update_list)
+        order_combo.currentIndexChanged.connect(update_list)
 
         buttons_layout = QHBoxLayout()
         ok_button = QPushButton("OK")
@@ -418,11 +494,13 @@ class GameWindow(QMainWindow):
         def on_ok():
             item = list_widget.currentItem()
             if item:
-                selected_file[0] = os.path.join(replays_dir, item.text())
+                selected_file[0] = item.data(Qt.UserRole)
                 dialog.accept()
         ok_button.clicked.connect(on_ok)
         cancel_button.clicked.connect(dialog.reject)
-        if dialog.exec_() == QDialog.Accepted:
+        accepted = dialog.exec_() == QDialog.Accepted
+        catalog.close()
+        if accepted:
             return selected_file[0]
         return None
 
@@ -443,18 +521,16 @@ class GameWindow(QMainWindow):
             doc_mapping.clear()
             row = 0
             selected_level = int(level_combo.currentText().split()[1])
-            documents = list(game_history.replays_collection.find({"level": selected_level}))
-            quicksaves = sorted([doc for doc in documents if doc.get("is_quicksave")],
-                                key=lambda doc: doc.get("moves", [{}])[0].get("timestamp", 0), reverse=True)
-            regular = sorted([doc for doc in documents if not doc.get("is_quicksave")],
-                             key=lambda doc: doc.get("moves", [{}])[0].get("timestamp", 0), reverse=True)
+            documents = game_history.list_replay_documents(selected_level)
+            quicksaves = [doc for doc in documents if doc.get("is_quicksave")]
+            regular = [doc for doc in documents if not doc.get("is_quicksave")]
             if quicksaves:
                 header = QListWidgetItem("=== Quick Saves ===")
                 header.setFlags(header.flags() & ~Qt.ItemIsSelectable)
                 list_widget.addItem(header)
                 row += 1
                 for doc in quicksaves:
-                    ts = doc.get("moves", [{}])[0].get("timestamp", 0)
+                    ts = doc["timestamp"]
                     try:
                         time_str = datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
                     except Exception:
@@ -471,7 +547,7 @@ class GameWindow(QMainWindow):
                 list_widget.addItem(header)
                 row += 1
                 for doc in regular:
-                    ts = doc.get("moves", [{}])[0].get("timestamp", 0)
+                    ts = doc["timestamp"]
                     try:
                         time_str = datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
                     except Exception:
@@ -503,9 +579,14 @@ class GameWindow(QMainWindow):
         return None
 
     def start_replay(self):
+        wait_for_saves(self)
         replay_source = getattr(self.menu_scene, "replay_source", "XML")
         if (replay_source == "NoSQL"):
             selected_doc = self.select_replay_document()
+            if not selected_doc:
+                return
+            # lista ma tylko metadane – pełny dokument dopiero dla wybranej powtórki
+            selected_doc = game_history.load_game_history_mongodb(selected_doc["_id"])
             if not selected_doc:
                 return
             if "_id" in selected_doc:
@@ -555,145 +636,26 @@ class GameWindow(QMainWindow):
                 ip_version = "IPv6" if hasattr(self, 'use_ipv6') and self.use_ipv6 else "IPv4"
                 self.logger.log(f"Nasłuchiwanie {ip_version} uruchomione na porcie {port}")
 
-            buffer_size = 4096                                              
-
             while True:
                 try:
                     conn, addr = server_sock.accept()
-                    try:
-                        data = b""
-                        while True:
-                            chunk = conn.recv(buffer_size)
-                            if not chunk:
-                                break
-                            data += chunk
-                            if len(chunk) < buffer_size:
-                                break
-
-                        if data:
-                            decoded_data = data.decode("utf-8")
-
-                            if "heartbeat" in decoded_data:
-                                self.last_heartbeat_received = time.time()
-
-                                if ";time:" in decoded_data:
-                                    try:
-                                        time_part = decoded_data.split(";time:")[1].split(";")[0]
-                                        time_value = int(time_part)
-
-                                        if hasattr(self, 'game_scene') and self.game_scene:
-                                            if hasattr(self.game_scene, 'current_turn') and hasattr(self.game_scene, 'multiplayer_role'):
-                                                if self.game_scene.current_turn != self.game_scene.multiplayer_role:
-                                                    self.game_scene.round_time_remaining = time_value
-                                                    if self.logger:
-                                                        self.logger.log(f"Synchronizacja czasu: {time_value}s pozostało")
-                                    except Exception as e:
-                                        if self.logger:
-                                            self.logger.log(f"Błąd parsowania czasu z heartbeat: {e}")
-
-                                try:
-                                    conn.sendall("heartbeat_ack".encode("utf-8"))
-                                except:
-                                    pass
-
-                            if "connection_request" in decoded_data:
-                                if self.logger:
-                                    self.logger.log(f"Otrzymano żądanie połączenia z {addr}")
-                                try:
-                                    conn.sendall("connection_confirm;ok".encode("utf-8"))
-
-                                    if hasattr(self, 'game_scene') and self.game_scene:
-                                        self.game_scene.is_connection_initiator = False
-                                        self.game_scene.multiplayer_role = "enemy"
-                                        if self.logger:
-                                            self.logger.log("Ustawiono rolę odbiorcy jako ENEMY")
-
-                                    if hasattr(self, 'connection_check_timer') and self.connection_check_timer.isActive():
-                                        self.connection_check_timer.stop()
-
-                                    self.handler.request_finish_connection()
-
-                                except Exception as e:
-                                    if self.logger:
-                                        self.logger.log(f"Błąd wysyłania potwierdzenia połączenia: {e}")
-
-                            if "request_full_sync" in decoded_data:
-                                if self.logger:
-                                    self.logger.log(f"Otrzymano żądanie pełnej synchronizacji od {addr}")
-
-                                if hasattr(self, 'game_scene') and self.game_scene and hasattr(self.game_scene, 'network_send_callback'):
-                                    if hasattr(self.game_scene, 'round_time_remaining'):
-                                        self.game_scene.network_send_callback(f"sync_time;{self.game_scene.round_time_remaining}")
-
-                                    if hasattr(self.game_scene, 'cells') and self.game_scene.cells:
-                                        for i, cell in enumerate(self.game_scene.cells):
-                                            self.game_scene.network_send_callback(f"sync_cell;{i};{cell.cell_type};{cell.points}")
-
-                                    self.game_scene.network_send_callback("sync_complete")
-
-                                    if self.logger:
-                                        self.logger.log("Wysłano pełny stan gry do partnera")
-
-                            if decoded_data.startswith("sync_time") and ";" in decoded_data:
-                                try:
-                                    time_value = int(decoded_data.split(";")[1])
-                                    if hasattr(self, 'game_scene') and self.game_scene:
-                                        self.game_scene.round_time_remaining = time_value
-                                        if self.logger:
-                                            self.logger.log(f"Zsynchronizowano czas: {time_value}s")
-                                except Exception as e:
-                                    if self.logger:
-                                        self.logger.log(f"Błąd synchronizacji czasu: {e}")
-
-                            if decoded_data.startswith("sync_cell") and len(decoded_data.split(";")) >= 4:
-                                try:
-                                    parts = decoded_data.split(";")
-                                    cell_index = int(parts[1])
-                                    cell_type = parts[2]
-                                    cell_points = int(parts[3])
-
-                                    if hasattr(self, 'game_scene') and self.game_scene and hasattr(self.game_scene, 'cells'):
-                                        if 0 <= cell_index < len(self.game_scene.cells):
-                                            cell = self.game_scene.cells[cell_index]
-                                            cell.cell_type = cell_type
-                                            cell.points = cell_points
-                                            cell.strength = (cell.points // config.POINTS_PER_STRENGTH) + 1
-                                            cell.update()
-                                            if self.logger:
-                                                self.logger.log(f"Zsynchronizowano komórkę {cell_index}: {cell_type}, {cell_points} punktów")
-                                except Exception as e:
-                                    if self.logger:
-                                        self.logger.log(f"Błąd synchronizacji komórki: {e}")
-
-                            priority_msg = False
-                            if "switch_turn" in decoded_data:
-                                priority_msg = True
-                                try:
-                                    conn.sendall("received".encode("utf-8"))
-                                except:
-                                    pass
-
-                            if self.logger and not decoded_data.startswith("update_turn_time") and not decoded_data.startswith("heartbeat") and not decoded_data.startswith("snapshot_"):
-                                if len(decoded_data) > 100:
-                                    self.logger.log(f"Odebrano wiadomość z {addr}: {decoded_data[:100]}...")
-                                else:
-                                    self.logger.log(f"Odebrano wiadomość z {addr}: {decoded_data}")
-
-                            if self.game_scene:
-                                self.handler.request_process_message(decoded_data)
-                    except Exception as e:
-                        if self.logger:
-                            self.logger.log(f"Błąd podczas przetwarzania otrzymanej wiadomości: {e}")
-                    finally:
-                        conn.close()
+                    # jedno trwałe połączenie na partnera – kolejne wiadomości przychodzą ramkami w wątku sesji
+                    session = NetSession(conn, addr, on_message=self.handle_network_message,
+                                         on_close=self.handle_session_closed)
+                    with self.session_lock:
+                        self.inbound_sessions = [other for other in self.inbound_sessions if other.is_alive()]
+                        self.inbound_sessions.append(session)
+                        # odpowiadamy tym samym połączeniem – bez drugiego połączenia do nasłuchu partnera
+                        if self.session is None or not self.session.is_alive():
+                            self.session = session
+                    if self.logger:
+                        self.logger.log(f"Nawiązano połączenie z {addr}")
                 except socket.timeout:
                     pass
                 except Exception as e:
                     if self.logger:
                         self.logger.log(f"Wyjątek w pętli nasłuchiwania: {e}")
-                    if hasattr(self, 'game_scene') and self.game_scene and hasattr(self.game_scene, 'is_multiplayer'):
-                        if self.game_scene.is_multiplayer:
-                            self.check_connection_status()
+                    QMetaObject.invokeMethod(self.handler, "request_connection_check", Qt.QueuedConnection)
         except Exception as e:
             if self.logger:
                 self.logger.log(f"Błąd nasłuchiwania TCP/IP: {e}")
@@ -702,142 +664,187 @@ class GameWindow(QMainWindow):
             if self.logger:
                 self.logger.log("Serwer nasłuchujący zamknięty")
 
-    def send_network_message(self, ip, port, message):
+    def handle_network_message(self, session, decoded_data):
+        """Wiadomość odebrana w sesji (wątek czytający sesji): tu tylko znacznik czasu heartbeat,
+           resztę obsługuje wątek główny (dispatch_network_message)"""
+        if "heartbeat" in decoded_data:
+            self.last_heartbeat_received = time.time()
+        if decoded_data in ("heartbeat_ack", "received"):
+            return
+        QMetaObject.invokeMethod(self.handler, "request_network_message", Qt.QueuedConnection,
+                                 Q_ARG(object, session), Q_ARG(str, decoded_data))
+
+    def dispatch_network_message(self, session, decoded_data):
+        """Obsługa wiadomości z sesji w wątku głównym (scena, timery); odpowiedzi wracają tą samą sesją"""
         try:
-            use_ipv6 = ":" in ip and not ip.startswith("127.")
-
-            if use_ipv6:
-                sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-            else:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # odpowiedzi na nasze wiadomości
+            if decoded_data.startswith("connection_confirm"):
+                if self.logger:
+                    self.logger.log(f"Otrzymano potwierdzenie połączenia: {decoded_data}")
+                self.connection_established = True
+                if config.LOCKSTEP:
+                    QMetaObject.invokeMethod(self.handler, "request_finish_connection", Qt.QueuedConnection)
+                return
+            if "heartbeat" in decoded_data:
+                if ";time:" in decoded_data:
+                    try:
+                        time_part = decoded_data.split(";time:")[1].split(";")[0]
+                        time_value = int(time_part)
 
-            if "set_role" in message and hasattr(self, 'game_scene') and self.game_scene:
-                if getattr(self.game_scene, 'is_connection_initiator', False):
-                    if "enemy" not in message:
-                        message = "set_role;enemy"
-                        if self.logger:
-                            self.logger.log("Poprawiono wysyłaną rolę na: enemy")
-                else:
-                    if "player" not in message:
-                        message = "set_role;player"
+                        if hasattr(self, 'game_scene') and self.game_scene:
+                            if hasattr(self.game_scene, 'current_turn') and hasattr(self.game_scene, 'multiplayer_role'):
+                                if self.game_scene.current_turn != self.game_scene.multiplayer_role:
+                                    self.game_scene.round_time_remaining = time_value
+                                    if self.logger:
+                                        self.logger.log(f"Synchronizacja czasu: {time_value}s pozostało")
+                    except Exception as e:
                         if self.logger:
-                            self.logger.log("Poprawiono wysyłaną rolę na: player")
+                            self.logger.log(f"Błąd parsowania czasu z heartbeat: {e}")
 
-            priority_msg = False
-            if "switch_turn" in message or "heartbeat" in message:
-                priority_msg = True
+                try:
+                    session.send("heartbeat_ack")
+                except:
+                    pass
 
-            is_snapshot = message.startswith("snapshot_")
-            timeout_value = 5 if is_snapshot else (2 if priority_msg else 3)
+            if "connection_request" in decoded_data:
+                if self.logger:
+                    self.logger.log(f"Otrzymano żądanie połączenia z {session.address}")
+                try:
+                    session.send("connection_confirm;ok")
 
-            sock.settimeout(timeout_value)                                  
+                    if hasattr(self, 'game_scene') and self.game_scene:
+                        self.game_scene.is_connection_initiator = False
+                        self.game_scene.multiplayer_role = "enemy"
+                        if self.logger:
+                            self.logger.log("Ustawiono rolę odbiorcy jako ENEMY")
 
-            retries = 3 if is_snapshot else (2 if priority_msg else 1)
-            retry_count = 0
+                    if hasattr(self, 'connection_check_timer') and self.connection_check_timer.isActive():
+                        self.connection_check_timer.stop()
 
-            if use_ipv6 and "%" in ip:
-                ip_parts = ip.split("%")
-                ip = ip_parts[0]
+                    QMetaObject.invokeMethod(self.handler, "request_finish_connection", Qt.QueuedConnection)
 
-            success = False
-            while retry_count <= retries and not success:
-                try:
-                    if use_ipv6:
-                        sock.connect((ip, port))
-                    else:
-                        sock.connect((ip, port))
-
-                    sock.sendall(message.encode("utf-8"))
-
-                    if "heartbeat" in message:
-                        sock.settimeout(1.0)
-                        try:
-                            response = sock.recv(1024).decode("utf-8")
-                            if "heartbeat_ack" in response:
-                                self.last_heartbeat_received = time.time()
-                        except socket.timeout:
-                            if retry_count == retries:
-                                if hasattr(self, 'game_scene') and self.game_scene and hasattr(self.game_scene, 'is_multiplayer'):
-                                    if self.game_scene.is_multiplayer:
-                                        self.check_connection_status()
-
-                    elif priority_msg:
-                        sock.settimeout(1.0)
-                        try:
-                            response = sock.recv(1024).decode("utf-8")
-                            if response == "received":
-                                if self.logger and not message.startswith("heartbeat"):
-                                    self.logger.log(f"Otrzymano potwierdzenie odebrania {message}")
-                        except socket.timeout:
-                            pass
-
-                    if self.logger and not message.startswith("update_turn_time") and not message.startswith("heartbeat") and not message.startswith("snapshot_"):
-                        self.logger.log(f"Wysłano wiadomość do {ip}:{port}: {message[:50]}..." if len(message) > 50 else f"Wysłano wiadomość do {ip}:{port}: {message}")
-                    success = True
                 except Exception as e:
-                    retry_count += 1
-                    if retry_count <= retries:
-                        if self.logger and not message.startswith("heartbeat") and not message.startswith("snapshot_"):
-                            self.logger.log(f"Ponawiam wysłanie wiadomości ({retry_count}/{retries+1})")
-                        time.sleep(0.2 * retry_count)                                    
-                    else:
-                        if self.logger and not message.startswith("heartbeat") and not message.startswith("snapshot_"):
-                            self.logger.log(f"Nie udało się wysłać wiadomości po {retries+1} próbach: {e}")
-                        if hasattr(self, 'game_scene') and self.game_scene and hasattr(self.game_scene, 'is_multiplayer'):
-                            if self.game_scene.is_multiplayer:
-                                self.check_connection_status()
-        except Exception as e:
-            if self.logger and not message.startswith("heartbeat"):
-                self.logger.log(f"Błąd wysyłania wiadomości do {ip}:{port}: {e}")
-            if hasattr(self, 'game_scene') and self.game_scene and hasattr(self.game_scene, 'is_multiplayer'):
-                if self.game_scene.is_multiplayer:
-                    self.check_connection_status()
-        finally:
-            if 'sock' in locals():
-                sock.close()
+                    if self.logger:
+                        self.logger.log(f"Błąd wysyłania potwierdzenia połączenia: {e}")
 
-    def send_network_message_with_confirmation(self, ip, port, message, max_retries=3):
-        use_ipv6 = ":" in ip and not ip.startswith("127.")
+            if "request_full_sync" in decoded_data:
+                if self.logger:
+                    self.logger.log(f"Otrzymano żądanie pełnej synchronizacji od {session.address}")
 
-        """Wysyła wiadomość sieciową i czeka na potwierdzenie lub zakończenie prób"""
-        for retry in range(max_retries):
-            try:
-                if use_ipv6:
-                    sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-                else:
-                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                if hasattr(self, 'game_scene') and self.game_scene and hasattr(self.game_scene, 'network_send_callback'):
+                    if hasattr(self.game_scene, 'round_time_remaining'):
+                        self.game_scene.network_send_callback(f"sync_time;{self.game_scene.round_time_remaining}")
 
-                sock.settimeout(2.0)                                       
+                    if hasattr(self.game_scene, 'cells') and self.game_scene.cells:
+                        for i, cell in enumerate(self.game_scene.cells):
+                            self.game_scene.network_send_callback(f"sync_cell;{i};{cell.cell_type};{cell.points}")
 
-                if use_ipv6 and "%" in ip:
-                    connect_ip = ip.split("%")[0]
-                else:
-                    connect_ip = ip
+                    self.game_scene.network_send_callback("sync_complete")
 
-                sock.connect((connect_ip, port))
-                sock.sendall(message.encode("utf-8"))
+                    if self.logger:
+                        self.logger.log("Wysłano pełny stan gry do partnera")
 
+            if decoded_data.startswith("sync_time") and ";" in decoded_data:
                 try:
-                    response = sock.recv(1024).decode("utf-8")
-                    if response and "connection_confirm" in response:
+                    time_value = int(decoded_data.split(";")[1])
+                    if hasattr(self, 'game_scene') and self.game_scene:
+                        self.game_scene.round_time_remaining = time_value
                         if self.logger:
-                            self.logger.log(f"Otrzymano potwierdzenie połączenia: {response}")
-                        return True
-                except socket.timeout:
-                    pass
+                            self.logger.log(f"Zsynchronizowano czas: {time_value}s")
+                except Exception as e:
+                    if self.logger:
+                        self.logger.log(f"Błąd synchronizacji czasu: {e}")
 
-                if self.logger:
-                    self.logger.log(f"Próba {retry+1}/{max_retries} - brak potwierdzenia")
+            if decoded_data.startswith("sync_cell") and len(decoded_data.split(";")) >= 4:
+                try:
+                    parts = decoded_data.split(";")
+                    cell_index = int(parts[1])
+                    cell_type = parts[2]
+                    cell_points = int(parts[3])
+
+                    if hasattr(self, 'game_scene') and self.game_scene and hasattr(self.game_scene, 'cells'):
+                        if 0 <= cell_index < len(self.game_scene.cells):
+                            cell = self.game_scene.cells[cell_index]
+                            cell.cell_type = cell_type
+                            cell.points = cell_points
+                            cell.strength = (cell.points // config.POINTS_PER_STRENGTH) + 1
+                            cell.update()
+                            if self.logger:
+                                self.logger.log(f"Zsynchronizowano komórkę {cell_index}: {cell_type}, {cell_points} punktów")
+                except Exception as e:
+                    if self.logger:
+                        self.logger.log(f"Błąd synchronizacji komórki: {e}")
 
-                time.sleep(0.5)
-            except Exception as e:
-                if self.logger:
-                    self.logger.log(f"Błąd podczas próby połączenia ({retry+1}/{max_retries}): {e}")
-                time.sleep(0.5)
-            finally:
-                sock.close()
+            if "switch_turn" in decoded_data:
+                session.send("received")
 
-        return False
+            if self.logger and not decoded_data.startswith("update_turn_time") and not decoded_data.startswith("heartbeat") and not decoded_data.startswith("state_"):
+                if len(decoded_data) > 100:
+                    self.logger.log(f"Odebrano wiadomość z {session.address}: {decoded_data[:100]}...")
+                else:
+                    self.logger.log(f"Odebrano wiadomość z {session.address}: {decoded_data}")
+
+            self.process_game_message(decoded_data)
+        except Exception as e:
+            if self.logger:
+                self.logger.log(f"Błąd podczas przetwarzania otrzymanej wiadomości: {e}")
+
+    def handle_session_closed(self, session, error):
+        with self.session_lock:
+            if session is self.session:
+                self.session = None
+        if error is not None and self.logger:
+            self.logger.log(f"Połączenie z {session.address} zakończone: {error}")
+        if error is not None:
+            QMetaObject.invokeMethod(self.handler, "request_connection_check", Qt.QueuedConnection)
+
+    def close_network_sessions(self):
+        with self.session_lock:
+            sessions = [self.session] + self.inbound_sessions
+            self.session = None
+            self.inbound_sessions = []
+        # close() zgłasza koniec sesji (handle_session_closed bierze blokadę), więc poza blokadą
+        for session in sessions:
+            if session is not None:
+                session.close()
+
+    def send_network_message(self, ip, port, message):
+        """Wysyła wiadomość trwałym połączeniem z partnerem: przyjętym od niego przez nasłuch albo własnym
+           (tworzonym przy pierwszej wiadomości lub po zerwaniu). Wiadomość trafia do kolejki sesji –
+           wywołanie nie czeka na sieć."""
+        try:
+            if "set_role" in message and hasattr(self, 'game_scene') and self.game_scene:
+                if getattr(self.game_scene, 'is_connection_initiator', False):
+                    if "enemy" not in message:
+                        message = "set_role;enemy"
+                        if self.logger:
+                            self.logger.log("Poprawiono wysyłaną rolę na: enemy")
+                else:
+                    if "player" not in message:
+                        message = "set_role;player"
+                        if self.logger:
+                            self.logger.log("Poprawiono wysyłaną rolę na: player")
+
+            stale = None
+            with self.session_lock:
+                session = self.session
+                if (session is None or not session.is_alive() or
+                        (session not in self.inbound_sessions and session.address != (ip, port))):
+                    stale = session
+                    session = self.session = NetSession.connect(ip, port, on_message=self.handle_network_message,
+                                                                on_close=self.handle_session_closed)
+            session.send(message)
+            if stale is not None:
+                stale.close()
+
+            if self.logger and not message.startswith("update_turn_time") and not message.startswith("heartbeat") and not message.startswith("state_"):
+                self.logger.log(f"Wysłano wiadomość do {ip}:{port}: {message[:50]}..." if len(message) > 50 else f"Wysłano wiadomość do {ip}:{port}: {message}")
+        except Exception as e:
+            if self.logger and not message.startswith("heartbeat"):
+                self.logger.log(f"Błąd wysyłania wiadomości do {ip}:{port}: {e}")
+            if hasattr(self, 'game_scene') and self.game_scene and hasattr(self.game_scene, 'is_multiplayer'):
+                if self.game_scene.is_multiplayer:
+                    self.check_connection_status()
 
     def process_game_message(self, data):
         if self.game_scene:
@@ -903,12 +910,13 @@ class GameWindow(QMainWindow):
 
         if hasattr(self, 'game_scene') and self.game_scene:
             try:
-                if not hasattr(self, '_last_full_sync_time'):
-                    self._last_full_sync_time = 0
+                if not hasattr(self, '_last_state_sync_time'):
+                    self._last_state_sync_time = 0
 
                 current_time = time.time()
-                if current_time - self._last_full_sync_time > 5:                                
-                    self._last_full_sync_time = current_time
+                # w trybie lockstep stan nie jest przesyłany – strony porównują tylko skróty (lockstep.py)
+                if self.game_scene.lockstep is None and current_time - self._last_state_sync_time > config.STATE_SYNC_INTERVAL:
+                    self._last_state_sync_time = current_time
                     self.game_scene.send_game_state_snapshot()
                 else:
                     time_remaining = self.game_scene.round_time_remaining if hasattr(self.game_scene, 'round_time_remaining') else 0
@@ -1,6 +1,3 @@
-import json
-import os
-
 from PyQt5.QtCore import Qt, QRectF, pyqtSignal, QRegExp
 from PyQt5.QtGui import (
     QColor, QBrush, QPen, QFont, QLinearGradient,
@@ -14,6 +11,7 @@ from PyQt5.QtWidgets import (
 
 import resources_rc
 import config
+import level_store
 
 class SwitchButton(QGraphicsItem):
     def __init__(self, width=60, height=30, parent=None):
@@ -113,12 +111,10 @@ class MenuScene(QGraphicsScene):
 
     def load_levels(self):
         try:
-            levels_path = os.path.join(os.path.dirname(__file__), 'levels.json')
-            with open(levels_path, 'r') as f:
-                self.levels_data = json.load(f)
+            self.levels_data = level_store.load_levels()
         except Exception as e:
             print(f"Błąd wczytywania poziomów: {e}")
-            self.levels_data = [{"name": "Poziom 1"}]
+            self.levels_data = (level_store.Level("Poziom 1", (), ()),)
 
     def setup_menu(self):
         title = QGraphicsTextItem("Cell Expansion Wars")
@@ -156,7 +152,7 @@ class MenuScene(QGraphicsScene):
 
         for i, level in enumerate(self.levels_data):
             button_x = (self.width() - button_width) / 2
-            level_name = level.get('name', f'Poziom {i+1}')
+            level_name = level.name
             button_text = f"Poziom {i+1}: {level_name}"
 
             button = self.create_button(button_text, button_x, y_pos, button_width)
@@ -231,7 +227,7 @@ class MenuScene(QGraphicsScene):
         replay_source_title.setPos((self.width() - replay_source_title_width) / 2, self.height() - config.MENU_REPLAY_TITLE_Y_OFFSET)
         self.addItem(replay_source_title)
         self.replay_source = "XML"
-        replay_options = [("XML", "XML"), ("JSON", "JSON"), ("NoSQL", "NoSQL")]
+        replay_options = [("XML", "XML"), ("JSON", "JSON"), ("BIN", "BIN"), ("NoSQL", "NoSQL")]
         radio_y = self.height() - 80
         spacing = 100
         group_width = len(replay_options) * spacing
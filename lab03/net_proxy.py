@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import heapq
+import random
+import time
+
+# Lokalny pośrednik sieciowy do testów gry sieciowej: przyjmuje połączenia TCP i datagramy UDP na jednym
+# porcie i przekazuje je pod adres docelowy z zadanym opóźnieniem, rozrzutem (jitter) i utratą.
+# UDP: każdy datagram ma własne opóźnienie (więc duży jitter zmienia kolejność), może zginąć albo zostać
+# zdublowany. TCP nie gubi ani nie przestawia danych – utrata oznacza tu retransmisję: porcja danych
+# dociera po dodatkowym RETRANSMIT_MS, a kolejne czekają za nią (jak w prawdziwym strumieniu).
+#
+#   python net_proxy.py --listen 6001 --target 127.0.0.1:5001 --latency 80 --jitter 20 --loss 0.05
+
+RETRANSMIT_MS = 200        # opóźnienie porcji TCP "zgubionej" po drodze (minimalny RTO)
+CHUNK = 65536
+
+
+class LinkProfile:
+    """Parametry łącza w jedną stronę: opóźnienie i jitter w ms, utrata i duplikacja (0..1)"""
+
+    def __init__(self, latency=0.0, jitter=0.0, loss=0.0, duplicate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.duplicate = duplicate
+        self.rng = random.Random(seed)
+
+    def delay(self):
+        """Opóźnienie jednej porcji w sekundach (jitter z rozkładu normalnego, bez wartości ujemnych)"""
+        return max(0.0, self.latency + self.rng.gauss(0.0, self.jitter)) / 1000
+
+    def lost(self):
+        return self.rng.random() < self.loss
+
+    def duplicated(self):
+        return self.rng.random() < self.duplicate
+
+    def describe(self):
+        return f"{self.latency:.0f}±{self.jitter:.0f} ms, utrata {100 * self.loss:.1f}%"
+
+
+class ProxyStats:
+    def __init__(self):
+        self.tcp_connections = 0       # połączenia TCP zestawione do celu
+        self.tcp_bytes = 0
+        self.tcp_retransmits = 0
+        self.udp_packets = 0
+        self.udp_bytes = 0
+        self.udp_dropped = 0
+        self.udp_duplicated = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class _DelayedPipe:
+    """Jeden kierunek połączenia TCP: dane odczytane z reader trafiają do writer po opóźnieniu,
+       w kolejności odczytu"""
+
+    def __init__(self, reader, writer, profile, stats):
+        self.reader = reader
+        self.writer = writer
+        self.profile = profile
+        self.stats = stats
+        self.queue = asyncio.Queue()
+        self.last_delivery = 0.0
+
+    async def read(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                data = await self.reader.read(CHUNK)
+                if not data:
+                    break
+                delay = self.profile.delay()
+                if self.profile.lost():
+                    delay += RETRANSMIT_MS / 1000
+                    self.stats.tcp_retransmits += 1
+                # porcja nie może wyprzedzić wcześniejszych – strumień zachowuje kolejność
+                self.last_delivery = max(self.last_delivery, loop.time() + delay)
+                await self.queue.put((self.last_delivery, data))
+        except (ConnectionError, OSError):
+            pass
+        await self.queue.put((None, None))
+
+    async def write(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                deliver_at, data = await self.queue.get()
+                if data is None:
+                    break
+                await asyncio.sleep(max(0.0, deliver_at - loop.time()))
+                self.writer.write(data)
+                self.stats.tcp_bytes += len(data)
+                await self.writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.writer.close()
+
+
+class _UdpForwarder(asyncio.DatagramProtocol):
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.transport = None
+        self.pending = []          # kopiec (czas dostarczenia, numer, dane)
+        self.counter = 0
+        self.wakeup = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        profile, stats = self.proxy.profile, self.proxy.stats
+        stats.udp_packets += 1
+        if profile.lost():
+            stats.udp_dropped += 1
+            return
+        copies = 2 if profile.duplicated() else 1
+        stats.udp_duplicated += copies - 1
+        loop = asyncio.get_running_loop()
+        for _ in range(copies):
+            self.counter += 1
+            heapq.heappush(self.pending, (loop.time() + profile.delay(), self.counter, data))
+        self._schedule()
+
+    def _schedule(self):
+        if self.wakeup is not None:
+            self.wakeup.cancel()
+        if self.pending:
+            loop = asyncio.get_running_loop()
+            self.wakeup = loop.call_at(self.pending[0][0], self._deliver)
+
+    def _deliver(self):
+        self.wakeup = None
+        now = asyncio.get_running_loop().time()
+        while self.pending and self.pending[0][0] <= now:
+            _, _, data = heapq.heappop(self.pending)
+            self.transport.sendto(data, self.proxy.target)
+            self.proxy.stats.udp_bytes += len(data)
+        self._schedule()
+
+
+class NetProxy:
+    """Pośrednik TCP + UDP na porcie listen_port do target (host, port) z parametrami łącza profile
+       (ten sam profil w obie strony połączenia TCP; UDP tylko w stronę target)"""
+
+    def __init__(self, listen_port, target, profile, host="127.0.0.1"):
+        self.host = host
+        self.listen_port = listen_port
+        self.target = target
+        self.profile = profile
+        self.stats = ProxyStats()
+        self.tcp_server = None
+        self.udp_transport = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.tcp_server = await asyncio.start_server(self._handle_tcp, self.host, self.listen_port)
+        self.udp_transport, _ = await loop.create_datagram_endpoint(lambda: _UdpForwarder(self),
+                                                                    local_addr=(self.host, self.listen_port))
+
+    def close(self):
+        if self.tcp_server is not None:
+            self.tcp_server.close()
+        if self.udp_transport is not None:
+            self.udp_transport.close()
+
+    async def _handle_tcp(self, reader, writer):
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(*self.target)
+        except OSError:
+            writer.close()
+            return
+        self.stats.tcp_connections += 1
+        pipes = (_DelayedPipe(reader, upstream_writer, self.profile, self.stats),
+                 _DelayedPipe(upstream_reader, writer, self.profile, self.stats))
+        await asyncio.gather(*(task for pipe in pipes for task in (pipe.read(), pipe.write())))
+
+
+async def _serve(args):
+    host, port = args.target.rsplit(":", 1)
+    profile = LinkProfile(args.latency, args.jitter, args.loss, args.duplicate, args.seed)
+    proxy = NetProxy(args.listen, (host, int(port)), profile, args.host)
+    await proxy.start()
+    print(f"Pośrednik {args.host}:{args.listen} -> {args.target} ({profile.describe()})", flush=True)
+    started = time.monotonic()
+    while True:
+        await asyncio.sleep(10)
+        elapsed = time.monotonic() - started
+        stats = proxy.stats
+        print(f"TCP {stats.tcp_bytes / elapsed:.0f} B/s ({stats.tcp_retransmits} retransmisji), "
+              f"UDP {stats.udp_bytes / elapsed:.0f} B/s ({stats.udp_dropped}/{stats.udp_packets} zgubionych)", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pośrednik TCP/UDP z opóźnieniem, jitterem i utratą pakietów")
+    parser.add_argument("--listen", type=int, required=True)
+    parser.add_argument("--target", required=True, help="host:port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--latency", type=float, default=50.0, help="ms w jedną stronę")
+    parser.add_argument("--jitter", type=float, default=10.0, help="odchylenie standardowe opóźnienia (ms)")
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--duplicate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
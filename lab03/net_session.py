@@ -0,0 +1,139 @@
+import queue
+import socket
+import struct
+import threading
+
+# Trwałe połączenie TCP gry sieciowej: jedno połączenie na mecz zamiast osobnego połączenia na każdą
+# wiadomość. Wiadomości są ramkami [długość u32 big-endian][treść UTF-8], więc granice wiadomości
+# nie zależą od tego, jak TCP podzieli dane. Odczyt odbywa się w osobnym wątku (callback on_message
+# w tym wątku), wysyłanie przez kolejkę obsługiwaną przez wątek piszący – send() nie blokuje GUI.
+
+HEADER = struct.Struct(">I")
+MAX_FRAME = 16 * 1024 * 1024
+CONNECT_TIMEOUT = 3.0
+
+
+def encode_frame(message):
+    data = message.encode("utf-8") if isinstance(message, str) else message
+    return HEADER.pack(len(data)) + data
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Połączenie zamknięte")
+        data += chunk
+    return bytes(data)
+
+
+def read_frame(sock):
+    """Jedna ramka z gniazda (bajty); ConnectionError przy zamknięciu lub błędnej długości"""
+    (length,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    if length > MAX_FRAME:
+        raise ConnectionError(f"Za duża ramka: {length} B")
+    return _recv_exact(sock, length)
+
+
+class NetSession:
+    """
+    Dwukierunkowa sesja na jednym gnieździe.
+    on_message(session, text) – odebrana wiadomość, on_close(session, error) – koniec sesji (raz).
+    Sesja utworzona przez connect() łączy się w wątku piszącym; wiadomości wysłane wcześniej czekają w kolejce.
+    """
+
+    def __init__(self, sock=None, address=None, on_message=None, on_close=None):
+        self.sock = sock
+        self.address = address
+        self.on_message = on_message
+        self.on_close = on_close
+        self.outgoing = queue.Queue()
+        self.closed = threading.Event()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._close_lock = threading.Lock()
+        self._close_reported = False
+        if sock is not None:
+            self._configure(sock)
+            threading.Thread(target=self._read_loop, name="net-session-read", daemon=True).start()
+        threading.Thread(target=self._write_loop, name="net-session-write", daemon=True).start()
+
+    @classmethod
+    def connect(cls, ip, port, on_message=None, on_close=None):
+        return cls(address=(ip, port), on_message=on_message, on_close=on_close)
+
+    @staticmethod
+    def _configure(sock):
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def is_alive(self):
+        return not self.closed.is_set()
+
+    def send(self, message):
+        if not self.closed.is_set():
+            self.outgoing.put(encode_frame(message))
+
+    def close(self, error=None):
+        with self._close_lock:
+            if self.closed.is_set():
+                return
+            self.closed.set()
+        self.outgoing.put(None)
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+        self._report_close(error)
+
+    def _report_close(self, error):
+        with self._close_lock:
+            if self._close_reported:
+                return
+            self._close_reported = True
+        if self.on_close:
+            self.on_close(self, error)
+
+    def _write_loop(self):
+        try:
+            if self.sock is None:
+                self.sock = socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+                self._configure(self.sock)
+                if self.closed.is_set():
+                    self.sock.close()
+                    return
+                threading.Thread(target=self._read_loop, name="net-session-read", daemon=True).start()
+            while True:
+                frame = self.outgoing.get()
+                if frame is None:
+                    break
+                # kilka oczekujących wiadomości idzie jednym zapisem
+                frames = [frame]
+                while True:
+                    try:
+                        frame = self.outgoing.get_nowait()
+                    except queue.Empty:
+                        break
+                    if frame is None:
+                        break
+                    frames.append(frame)
+                data = b"".join(frames)
+                self.sock.sendall(data)
+                self.bytes_sent += len(data)
+                if frame is None:
+                    break
+        except OSError as e:
+            self.close(e)
+
+    def _read_loop(self):
+        try:
+            while not self.closed.is_set():
+                data = read_frame(self.sock)
+                self.bytes_received += HEADER.size + len(data)
+                if self.on_message:
+                    self.on_message(self, data.decode("utf-8"))
+        except (OSError, ConnectionError) as e:
+            self.close(None if self.closed.is_set() else e)
@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+import zlib
+
+import net_proxy
+
+# Test gry sieciowej w złych warunkach: dwie instancje gry bez okien (Qt offscreen) łączą się ze sobą przez
+# lokalne pośredniki net_proxy.py z opóźnieniem, jitterem i utratą pakietów, a boty budują mosty w swoich turach
+# (w trybie lockstep – bez tur). Mierzone są:
+#   - czas do spójności: od ruchu do chwili, gdy nowy most widać u obu graczy,
+#   - przepływ danych przez pośredniki (B/s w obie strony, TCP i UDP),
+#   - odsetek rozjechanych próbek: porównanie właścicieli komórek i mostów u obu graczy w chwilach,
+#     gdy od ostatniego ruchu minęło co najmniej --grace sekund,
+#   - rozłączenia i rozbieżności wykryte przez lockstep.
+#
+#   python netbench.py --mode both --latency 80 --jitter 20 --loss 0.03 --duration 30
+
+SAMPLE_MS = 50                 # co ile instancja zgłasza skrót stanu planszy
+PREFIX = "BENCH "
+
+
+def free_port():
+    # ten sam numer musi być wolny dla TCP i UDP (nasłuch gry, lockstep i pośrednik)
+    while True:
+        with socket.socket() as tcp, socket.socket(type=socket.SOCK_DGRAM) as udp:
+            tcp.bind(("127.0.0.1", 0))
+            port = tcp.getsockname()[1]
+            try:
+                udp.bind(("127.0.0.1", port))
+            except OSError:
+                continue
+            return port
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+# --- instancja gry (proces potomny) ---
+
+def board_state(scene):
+    """Właściciele komórek i mosty (pary indeksów z typem) – to, co obaj gracze powinni widzieć tak samo;
+       punkty rosną u każdego lokalnie między synchronizacjami, więc nie są porównywane"""
+    index_of = {cell: i for i, cell in enumerate(scene.cells)}
+    owners = [cell.cell_type for cell in scene.cells]
+    bridges = sorted((index_of[conn.source_cell], index_of[conn.target_cell], conn.connection_type)
+                     for conn in scene.connections)
+    return owners, bridges
+
+
+def run_instance(args):
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication, QMessageBox
+
+    import config
+    config.NETWORK_LISTEN_PORT = args.listen
+    config.LOCKSTEP = args.lockstep
+
+    # bez okien dialogowych – blokowałyby pętlę zdarzeń instancji bez użytkownika
+    QMessageBox.exec_ = lambda self: QMessageBox.Ok
+    QMessageBox.critical = staticmethod(lambda *a, **k: QMessageBox.Ok)
+    QMessageBox.question = staticmethod(lambda *a, **k: QMessageBox.No)
+
+    from main import GameWindow
+
+    app = QApplication(sys.argv)
+    window = GameWindow()
+    rng = random.Random(args.seed)
+    started = time.time()
+    known_bridges = set()
+    counters = {"moves": 0}
+
+    def emit(kind, **fields):
+        fields["event"] = kind
+        fields["t"] = time.time()
+        # stderr – na stdout piszą logi gry, także z wątków sieciowych
+        print(PREFIX + json.dumps(fields), file=sys.stderr, flush=True)
+
+    original_disconnect = window.handle_client_disconnect
+
+    def on_disconnect():
+        emit("disconnect")
+        original_disconnect()
+    window.handle_client_disconnect = on_disconnect
+
+    def scene():
+        """Scena gry, gdy obie strony są już połączone (odbiorca przyjął sesję, inicjator dostał potwierdzenie)"""
+        game_scene = window.game_scene
+        if game_scene is None or not getattr(game_scene, "is_multiplayer", False):
+            return None
+        session = window.session
+        if not getattr(window, "connection_setup_completed", False) or session is None or not session.is_alive():
+            return None
+        if session not in window.inbound_sessions and not window.connection_established:
+            return None
+        return game_scene
+
+    def sample():
+        game_scene = scene()
+        if game_scene is None:
+            return
+        owners, bridges = board_state(game_scene)
+        for source, target, conn_type in bridges:
+            if (source, target) not in known_bridges:
+                known_bridges.add((source, target))
+                emit("bridge", pair=[source, target])
+        known_bridges.intersection_update((source, target) for source, target, _ in bridges)
+        digest = zlib.crc32(json.dumps([owners, bridges]).encode("ascii"))
+        emit("state", digest=digest, bridges=len(bridges))
+
+    def bot_move():
+        game_scene = scene()
+        if game_scene is None or game_scene.game_over_text:
+            return
+        role = game_scene.multiplayer_role
+        if game_scene.lockstep is None and game_scene.current_turn != role:
+            return
+        own = [cell for cell in game_scene.cells if cell.cell_type == role]
+        if not own:
+            return
+        source = rng.choice(own)
+        targets = [cell for cell in game_scene.cells if cell is not source]
+        rng.shuffle(targets)
+        for target in targets:
+            pair = [game_scene.cells.index(source), game_scene.cells.index(target)]
+            moved_at = time.time()
+            if game_scene.build_bridge(source, target, role):
+                counters["moves"] += 1
+                emit("move", pair=pair, moved_at=moved_at)
+                return
+
+    def finish():
+        game_scene = scene()
+        stats = game_scene.lockstep.stats() if game_scene is not None and game_scene.lockstep is not None else None
+        emit("done", moves=counters["moves"], lockstep=stats)
+        if game_scene is not None:
+            game_scene.stop_all_timers()
+        app.quit()
+
+    window.menu_scene.update_game_mode("gra sieciowa")
+    window.menu_scene.ip_lineedit.setText("127.0.0.1")
+    window.menu_scene.port_lineedit.setText(str(args.peer_port))
+    window.start_game(args.level)
+
+    sample_timer = QTimer()
+    sample_timer.timeout.connect(sample)
+    sample_timer.start(SAMPLE_MS)
+    bot_timer = QTimer()
+    bot_timer.timeout.connect(bot_move)
+    bot_timer.start(int(1000 * args.move_interval))
+    QTimer.singleShot(int(1000 * args.duration), finish)
+    emit("started", listen=args.listen, lockstep=args.lockstep, startup=time.time() - started)
+    app.exec_()
+
+
+# --- proces nadrzędny: pośredniki, instancje i analiza ---
+
+async def read_events(process, name, events):
+    while True:
+        line = await process.stderr.readline()
+        if not line:
+            break
+        line = line.decode("utf-8", "replace").strip()
+        if line.startswith(PREFIX):
+            try:
+                event = json.loads(line[len(PREFIX):])
+            except ValueError:
+                continue
+            event["side"] = name
+            events.append(event)
+
+
+async def run_mode(args, lockstep):
+    port_a, port_b, proxy_a, proxy_b = (free_port() for _ in range(4))
+    # A wysyła do B przez proxy_a (i odbiera odpowiedzi tą samą drogą), B do A przez proxy_b
+    proxies = [net_proxy.NetProxy(proxy_a, ("127.0.0.1", port_b), net_proxy.LinkProfile(
+                   args.latency, args.jitter, args.loss, args.duplicate, args.seed)),
+               net_proxy.NetProxy(proxy_b, ("127.0.0.1", port_a), net_proxy.LinkProfile(
+                   args.latency, args.jitter, args.loss, args.duplicate, args.seed + 1))]
+    for proxy in proxies:
+        await proxy.start()
+
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    script = os.path.abspath(__file__)
+    events = []
+    processes, readers, workdirs = [], [], []
+    try:
+        for name, listen, peer, delay in (("A", port_a, proxy_a, 0.0), ("B", port_b, proxy_b, args.stagger)):
+            await asyncio.sleep(delay)
+            # osobny katalog roboczy – powtórki, zapisy i logi instancji nie trafiają do repozytorium
+            workdir = tempfile.TemporaryDirectory(prefix=f"netbench_{name}_")
+            workdirs.append(workdir)
+            command = [sys.executable, script, "--instance", "--listen", str(listen), "--peer-port", str(peer),
+                       "--level", str(args.level), "--duration", str(args.duration), "--move-interval", str(args.move_interval),
+                       "--seed", str(args.seed + len(processes))]
+            if lockstep:
+                command.append("--lockstep")
+            process = await asyncio.create_subprocess_exec(*command, cwd=workdir.name, env=env,
+                                                           stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+            processes.append(process)
+            readers.append(asyncio.ensure_future(read_events(process, name, events)))
+        started = time.time()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(process.wait() for process in processes)), args.duration + 30)
+        except asyncio.TimeoutError:
+            for process in processes:
+                process.kill()
+        await asyncio.gather(*readers)
+        elapsed = time.time() - started
+    finally:
+        for proxy in proxies:
+            proxy.close()
+        for workdir in workdirs:
+            workdir.cleanup()
+
+    return summarize(events, proxies, elapsed, args)
+
+
+def summarize(events, proxies, elapsed, args):
+    moves = [event for event in events if event["event"] == "move"]
+    appeared = {"A": {}, "B": {}}
+    samples = {"A": [], "B": []}
+    for event in events:
+        if event["event"] == "bridge":
+            appeared[event["side"]].setdefault(tuple(event["pair"]), []).append(event["t"])
+        elif event["event"] == "state":
+            samples[event["side"]].append((event["t"], event["digest"]))
+
+    # czas do spójności: pierwsze pojawienie się mostu po ruchu u każdej ze stron
+    consistency, unresolved = [], 0
+    for move in moves:
+        pair = tuple(move["pair"])
+        seen = []
+        for side in ("A", "B"):
+            times = [t for t in appeared[side].get(pair, []) if t >= move["moved_at"] - SAMPLE_MS / 1000]
+            if times:
+                seen.append(min(times))
+        if len(seen) == 2:
+            consistency.append(max(seen) - move["moved_at"])
+        else:
+            unresolved += 1
+
+    # rozjazdy: próbki A z najbliższą w czasie próbką B, poza oknem --grace po ruchach
+    move_times = sorted(move["moved_at"] for move in moves)
+    compared = mismatched = 0
+    b_samples = samples["B"]
+    j = 0
+    for t, digest in samples["A"]:
+        while j + 1 < len(b_samples) and abs(b_samples[j + 1][0] - t) <= abs(b_samples[j][0] - t):
+            j += 1
+        if not b_samples or abs(b_samples[j][0] - t) > SAMPLE_MS / 1000:
+            continue
+        if any(t - args.grace <= moved_at <= t for moved_at in move_times):
+            continue
+        compared += 1
+        mismatched += digest != b_samples[j][1]
+
+    done = {event["side"]: event for event in events if event["event"] == "done"}
+    lockstep_desyncs = sum(1 for event in done.values()
+                           if event.get("lockstep") and event["lockstep"]["desync_tick"] is not None)
+    traffic = sum(proxy.stats.tcp_bytes + proxy.stats.udp_bytes for proxy in proxies)
+    return {
+        "seconds": round(elapsed, 1),
+        "moves": len(moves),
+        "consistency_ms_p50": round(1000 * percentile(consistency, 0.5)) if consistency else None,
+        "consistency_ms_p95": round(1000 * percentile(consistency, 0.95)) if consistency else None,
+        "moves_never_consistent": unresolved,
+        "bytes_per_second": round(traffic / elapsed),
+        "tcp_connections": sum(proxy.stats.tcp_connections for proxy in proxies),
+        "tcp_retransmits": sum(proxy.stats.tcp_retransmits for proxy in proxies),
+        "udp_dropped": sum(proxy.stats.udp_dropped for proxy in proxies),
+        "desync_rate": round(mismatched / compared, 4) if compared else None,
+        "samples_compared": compared,
+        "disconnects": sum(1 for event in events if event["event"] == "disconnect"),
+        "lockstep_desyncs": lockstep_desyncs,
+        "instances_finished": len(done),
+    }
+
+
+async def main_async(args):
+    modes = {"sync": [False], "lockstep": [True], "both": [False, True]}[args.mode]
+    profile = net_proxy.LinkProfile(args.latency, args.jitter, args.loss)
+    print(f"Łącze: {profile.describe()}, duplikacja {100 * args.duplicate:.1f}%, poziom {args.level}, {args.duration:.0f} s")
+    results = {}
+    for lockstep in modes:
+        name = "lockstep" if lockstep else "sync"
+        results[name] = await run_mode(args, lockstep)
+    keys = list(next(iter(results.values())))
+    print(f"{'':26}" + "".join(f"{name:>12}" for name in results))
+    for key in keys:
+        print(f"{key:26}" + "".join(f"{str(result[key]):>12}" for result in results.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pomiar gry sieciowej przez pośrednik z opóźnieniem i utratą pakietów")
+    parser.add_argument("--mode", choices=("sync", "lockstep", "both"), default="both",
+                        help="sync – TCP z przyrostami stanu, lockstep – UDP z samymi komendami")
+    parser.add_argument("--latency", type=float, default=60.0, help="ms w jedną stronę")
+    parser.add_argument("--jitter", type=float, default=15.0)
+    parser.add_argument("--loss", type=float, default=0.02)
+    parser.add_argument("--duplicate", type=float, default=0.0)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--level", type=int, default=1)
+    parser.add_argument("--move-interval", type=float, default=0.7, help="co ile sekund bot próbuje ruchu")
+    parser.add_argument("--grace", type=float, default=1.0, help="s po ruchu wyłączone z porównania stanów")
+    parser.add_argument("--stagger", type=float, default=1.0, help="s między startem instancji A i B")
+    parser.add_argument("--seed", type=int, default=1)
+    # tryb wewnętrzny – jedna instancja gry
+    parser.add_argument("--instance", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--listen", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--peer-port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--lockstep", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.instance:
+        run_instance(args)
+    else:
+        asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
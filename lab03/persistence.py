@@ -0,0 +1,134 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import game_history
+
+# Zapis historii gry w tle: GameScene tworzy raz słownik historii (game_history.history_snapshot)
+# i wrzuca go do kolejki; wątek zapisu rozdziela go równolegle na włączone zapisy (pliki XML/JSON/binarny
+# i MongoDB), a dokumenty MongoDB ze wszystkich oczekujących zleceń zapisuje jednym insert_many.
+
+WRITERS = {
+    "xml": game_history.write_history_xml,
+    "json": game_history.write_history_json,
+    "binary": game_history.write_history_binary,
+}
+
+
+class PersistenceWorker(threading.Thread):
+    """Wątek zapisu z kolejką zleceń; wyniki trafiają do callbacku zlecenia (w wątku zapisu)"""
+
+    def __init__(self, workers=None):
+        super().__init__(name="persistence", daemon=True)
+        self.requests = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=workers or config.PERSISTENCE_WORKERS,
+                                           thread_name_prefix="persistence")
+
+    def submit(self, history, files, mongodb=True, on_done=None):
+        """
+        Zleca zapis historii: files to lista par (format z WRITERS, nazwa pliku), mongodb – czy zapisać w bazie.
+        on_done(results) dostaje słownik format -> nazwa pliku / id dokumentu albo wyjątek zapisu.
+        """
+        self.requests.put((history, list(files), mongodb, on_done))
+
+    def flush(self):
+        """Czeka na zakończenie wszystkich zleconych zapisów"""
+        self.requests.join()
+
+    def busy(self):
+        """Czy są zlecone zapisy, które jeszcze się nie zakończyły"""
+        with self.requests.all_tasks_done:
+            return self.requests.unfinished_tasks > 0
+
+    def stop(self):
+        self.requests.put(None)
+        self.join()
+        self.executor.shutdown()
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            while True:
+                try:
+                    batch.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.process([item for item in batch if item is not None])
+            finally:
+                for _ in batch:
+                    self.requests.task_done()
+            if None in batch:
+                break
+
+    def process(self, batch):
+        if not batch:
+            return
+        file_jobs = [[(fmt, filename, self.executor.submit(WRITERS[fmt], history, filename))
+                      for fmt, filename in files]
+                     for history, files, _, _ in batch]
+        mongo_items = [i for i, (_, _, mongodb, _) in enumerate(batch) if mongodb]
+        mongo_job = None
+        if mongo_items:
+            mongo_job = self.executor.submit(game_history.insert_histories, [batch[i][0] for i in mongo_items])
+
+        mongo_results = {}
+        if mongo_job is not None:
+            try:
+                mongo_results = dict(zip(mongo_items, mongo_job.result()))
+            except Exception as e:
+                mongo_results = {i: e for i in mongo_items}
+        for i, (_, _, mongodb, on_done) in enumerate(batch):
+            results = {}
+            for fmt, filename, job in file_jobs[i]:
+                try:
+                    job.result()
+                    results[fmt] = filename
+                except Exception as e:
+                    results[fmt] = e
+            if mongodb:
+                results["mongodb"] = mongo_results.get(i)
+            if on_done:
+                try:
+                    on_done(results)
+                except Exception:
+                    pass
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    """Wspólny wątek zapisu, uruchamiany przy pierwszym zleceniu"""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = PersistenceWorker()
+            _worker.start()
+        return _worker
+
+
+def submit(history, files, mongodb=True, on_done=None):
+    get_worker().submit(history, files, mongodb, on_done)
+
+
+def flush():
+    """Czeka na oczekujące zapisy (np. przed wczytaniem quicksave lub listą powtórek)"""
+    if _worker is not None and _worker.is_alive():
+        _worker.flush()
+
+
+def pending():
+    """Czy wątek zapisu ma jeszcze niezakończone zlecenia"""
+    return _worker is not None and _worker.is_alive() and _worker.busy()
+
+
+def shutdown():
+    """Kończy zapisy przed zamknięciem programu"""
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None and worker.is_alive():
+        worker.stop()
@@ -1,14 +1,14 @@
-import os
-import re
-import xml.etree.ElementTree as ET
+import bisect
+from collections import deque
 
 from PyQt5.QtCore import Qt, QTimer, QPointF, QRectF
 from PyQt5.QtGui import QFont, QPen, QBrush, QColor, QLinearGradient
-from PyQt5.QtWidgets import QGraphicsScene, QGraphicsTextItem, QGraphicsProxyWidget, QPushButton, QSlider, QLabel, QMessageBox, QProgressBar
+from PyQt5.QtWidgets import QGraphicsScene, QGraphicsTextItem, QGraphicsProxyWidget, QPushButton, QSlider, QLabel, QMessageBox
 
 import config
 from game_objects import CellUnit, CellConnection
-from game_history import load_game_history, load_game_history_json
+import game_events
+from replay_stream import ReplayStream
 
 DEBUG_MODE = False
 
@@ -16,41 +16,18 @@ class PlaybackScene(QGraphicsScene):
     def __init__(self, history_file, parent=None):
         super().__init__(parent)
         self.setSceneRect(0, 0, config.WINDOW_WIDTH, config.WINDOW_HEIGHT)
-        if history_file.lower().endswith('.json'):
-            self.history = load_game_history_json(history_file)
-        else:
-            self.history = load_game_history(history_file)
-        self.move_history = self.history.get("moves", [])
-        for move in self.move_history:
-            if "description" not in move:
-                if move.get("move_type") == "CreateBridge":
-                    move["description"] = f"Utworzono most między ({move['Source']}) a ({move['Target']}) o koszcie {move['Cost']}"
-                elif move.get("move_type") == "RemoveBridge":
-                    move["description"] = f"Usunięto most między ({move['Source']}) a ({move['Target']})"
-                elif move.get("move_type") == "Status":
-                    cells = move.get("Cells", [])
-                    move["description"] = "Status punktowy: " + "; ".join(
-                        f"({c.get('type')} @ {c.get('x')},{c.get('y')}: {c.get('points')} pts)" for c in cells
-                    )
-                elif move.get("move_type") == "PreFinalStatus":
-                    cells = move.get("Cells", [])
-                    move["description"] = "Status przed ostatnim ruchem: " + "; ".join(
-                        f"({c.get('type')} @ {c.get('x')},{c.get('y')}: {c.get('points')} pts)" for c in cells
-                    )
-                elif move.get("move_type") == "Result":
-                    move["description"] = "Wynik: " + move.get("Result", "")
-                elif move.get("move_type") == "Description":
-                    move["description"] = move.get("Description", "")
-                else:
-                    move["description"] = ""
+        # zdarzenia są czytane partiami w trakcie odtwarzania; w pamięci jest tylko okno nadchodzących
+        # zdarzeń (window) i ostatnio zastosowanych (recent – do cofania bez ponownego czytania pliku)
+        self.stream = ReplayStream(history_file)
+        self.history = self.stream.header
+        self.window = deque()
+        self.recent = deque(maxlen=config.REPLAY_STREAM_WINDOW)
         self.current_move_index = 0
 
-        if self.move_history:
-            self.replay_start_time = self.move_history[0].get("timestamp", 0)
-            self.replay_end_time = self.move_history[-1].get("timestamp", 0)
-            self.replay_duration = self.replay_end_time - self.replay_start_time
-        else:
-            self.replay_duration = 0
+        self.replay_start_time = self.stream.start_time
+        self.replay_end_time = self.stream.end_time
+        self.replay_duration = self.replay_end_time - self.replay_start_time
+        self.current_time = self.replay_start_time
 
         cells_data = self.history.get("initial_state", {}).get("cells", [])
         self.cells = []
@@ -98,12 +75,14 @@ class PlaybackScene(QGraphicsScene):
         self.addItem(back_proxy)
         back_button.clicked.connect(self.return_to_menu)
 
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setRange(0, 100)
-        self.progress_bar.setValue(0)
-        self.progress_bar.setFixedWidth(300)
+        # oś czasu (ms od początku powtórki) – przeciągnięcie suwaka przewija powtórkę
+        self.timeline = QSlider(Qt.Horizontal)
+        self.timeline.setRange(0, int(self.replay_duration * 1000))
+        self.timeline.setValue(0)
+        self.timeline.setFixedWidth(300)
+        self.timeline.sliderMoved.connect(lambda value: self.seek_time(self.replay_start_time + value / 1000))
         progress_proxy = QGraphicsProxyWidget()
-        progress_proxy.setWidget(self.progress_bar)
+        progress_proxy.setWidget(self.timeline)
         progress_proxy.setPos((config.WINDOW_WIDTH - 300)/2, config.WINDOW_HEIGHT - 50)
         self.addItem(progress_proxy)
         self.clock_label = QLabel("00:00 / 00:00")
@@ -113,6 +92,24 @@ class PlaybackScene(QGraphicsScene):
         clock_proxy.setPos((config.WINDOW_WIDTH - 70)/2, config.WINDOW_HEIGHT - 70)
         self.addItem(clock_proxy)
 
+        self.pause_button = QPushButton("||")
+        self.pause_button.setFixedSize(40, 30)
+        pause_proxy = QGraphicsProxyWidget()
+        pause_proxy.setWidget(self.pause_button)
+        pause_proxy.setPos((config.WINDOW_WIDTH - 300) / 2 - 50, config.WINDOW_HEIGHT - 52)
+        self.addItem(pause_proxy)
+        self.pause_button.clicked.connect(self.toggle_pause)
+        self.reverse = False
+        self.reverse_button = QPushButton("◀")
+        self.reverse_button.setFixedSize(40, 30)
+        reverse_proxy = QGraphicsProxyWidget()
+        reverse_proxy.setWidget(self.reverse_button)
+        reverse_proxy.setPos((config.WINDOW_WIDTH - 300) / 2 - 95, config.WINDOW_HEIGHT - 52)
+        self.addItem(reverse_proxy)
+        self.reverse_button.clicked.connect(self.toggle_reverse)
+
+        self.init_keyframes()
+
         self.playback_timer = QTimer()
         self.playback_timer.timeout.connect(self.play_next_move)
         self.animation_timer = QTimer()
@@ -162,133 +159,236 @@ class PlaybackScene(QGraphicsScene):
         self.update()
 
     def start_playback(self):
-        self.current_move_index = 0
+        if self.current_move_index:
+            self.seek(0)
         self.playback_timer.start(int(1000 / self.speed_slider.value()))
         self.animation_timer.start(16)
 
+    def toggle_pause(self):
+        if self.playback_timer.isActive():
+            self.playback_timer.stop()
+            self.pause_button.setText("▶")
+        else:
+            if not self.reverse and self.peek_event() is None:
+                self.seek(0)
+            self.playback_timer.start(int(1000 / self.speed_slider.value()))
+            self.animation_timer.start(16)
+            self.pause_button.setText("||")
+
+    def toggle_reverse(self):
+        self.reverse = not self.reverse
+        self.reverse_button.setText("▶" if self.reverse else "◀")
+
+    def init_keyframes(self):
+        """Indeks klatek kluczowych: pełny stan komórek i mostów co REPLAY_SEEK_KEYFRAME_INTERVAL s powtórki.
+           Klatki powstają w miarę czytania zdarzeń, więc przewinięcie w odtworzone już miejsce stosuje
+           jedną klatkę i kilka zdarzeń zamiast całej historii."""
+        index_of = {cell: i for i, cell in enumerate(self.cells)}
+        self.state_cells = [[cell.cell_type, cell.points] for cell in self.cells]
+        self.state_bridges = {(index_of[conn.source_cell], index_of[conn.target_cell]): (conn.connection_type, conn.cost)
+                              for conn in self.connections}
+        # (liczba zastosowanych zdarzeń, czas ostatniego z nich, stan komórek, mosty (źródło, cel) -> (typ, koszt))
+        self.keyframes = [(0, self.replay_start_time, self.state_cells, dict(self.state_bridges))]
+        self.keyframe_indices = [0]
+        self.keyframe_times = [self.replay_start_time]
+
+    def record_keyframe(self):
+        last_index, last_time = self.keyframe_indices[-1], self.keyframe_times[-1]
+        if self.current_move_index > last_index and \
+                self.current_time - last_time >= config.REPLAY_SEEK_KEYFRAME_INTERVAL:
+            self.keyframes.append((self.current_move_index, self.current_time,
+                                   self.state_cells, dict(self.state_bridges)))
+            self.keyframe_indices.append(self.current_move_index)
+            self.keyframe_times.append(self.current_time)
+
+    def peek_event(self):
+        """Następne zdarzenie bez zastosowania (None na końcu powtórki)"""
+        if not self.window:
+            self.window.extend(self.stream.read(config.REPLAY_STREAM_WINDOW))
+        return self.window[0] if self.window else None
+
+    def next_event(self):
+        """Pobiera następne zdarzenie i stosuje je do stanu danych (state_cells/state_bridges)"""
+        if self.peek_event() is None:
+            return None
+        move = self.window.popleft()
+        self.state_cells = self.advance_state(self.state_cells, self.state_bridges, move)
+        self.current_move_index += 1
+        self.current_time = move.get("timestamp", self.current_time)
+        self.recent.append(move)
+        self.record_keyframe()
+        return move
+
+    def restore_keyframe(self, k):
+        """Stan z klatki kluczowej k; odczyt strumienia wznawiany od jej zdarzenia"""
+        index, timestamp, cells, bridges = self.keyframes[k]
+        self.stream.seek(index)
+        self.window.clear()
+        self.recent.clear()
+        self.current_move_index = index
+        self.current_time = timestamp
+        self.state_cells = cells
+        self.state_bridges = dict(bridges)
+
+    @staticmethod
+    def advance_state(cells, bridges, move):
+        """apply_move_event na samych danych: zmienia bridges, zwraca (nową) listę stanów komórek"""
+        move_type = move["type"]
+        if move_type == game_events.BRIDGE_CREATED:
+            key = (move["source"], move["target"])
+            if key not in bridges:
+                bridges[key] = (cells[move["source"]][0], move["cost"])
+        elif move_type == game_events.BRIDGE_REMOVED:
+            bridges.pop((move["source"], move["target"]), None)
+        elif move_type in (game_events.STATUS, game_events.FINAL_STATUS):
+            changed = {i for i, entry in enumerate(move["cells"]) if list(entry) != cells[i]}
+            if changed:
+                cells = [list(entry) for entry in move["cells"]]
+                for (source, target), (conn_type, _) in list(bridges.items()):
+                    if source in changed and conn_type != cells[source][0]:
+                        del bridges[(source, target)]
+        return cells
+
+    def seek(self, index):
+        """Ustawia stan po `index` zdarzeniach: najbliższa wcześniejsza klatka kluczowa + pozostałe zdarzenia"""
+        index = max(0, index)
+        k = bisect.bisect_right(self.keyframe_indices, index) - 1
+        start_index, start_time, cells, bridges = self.keyframes[k]
+        if start_index <= self.current_move_index <= index:
+            pass                                    # do przodu od bieżącego stanu
+        elif index < self.current_move_index and self.current_move_index - start_index <= len(self.recent):
+            # cofanie w obrębie ostatnio zastosowanych zdarzeń – bez ponownego czytania pliku
+            moves = list(self.recent)[len(self.recent) - (self.current_move_index - start_index):]
+            self.state_cells, self.state_bridges = cells, dict(bridges)
+            for move in moves[:index - start_index]:
+                self.state_cells = self.advance_state(self.state_cells, self.state_bridges, move)
+            undone = moves[index - start_index:]
+            self.window.extendleft(reversed(undone))
+            for _ in undone:
+                self.recent.pop()
+            self.current_move_index = index
+            self.current_time = moves[index - start_index - 1].get("timestamp", start_time) if index > start_index else start_time
+        else:
+            self.restore_keyframe(k)
+        while self.current_move_index < index and self.next_event() is not None:
+            pass
+        self.apply_state(self.state_cells, self.state_bridges)
+        self.update_progress()
+
+    def seek_time(self, timestamp):
+        """Ustawia stan po wszystkich zdarzeniach z czasem <= timestamp"""
+        if timestamp < self.current_time and self.recent and self.recent[0].get("timestamp", 0) <= timestamp:
+            later = sum(1 for move in self.recent if move.get("timestamp", 0) > timestamp)
+            self.seek(self.current_move_index - later)
+            return
+        k = max(0, bisect.bisect_right(self.keyframe_times, timestamp) - 1)
+        if not (self.keyframe_indices[k] <= self.current_move_index and self.current_time <= timestamp):
+            self.restore_keyframe(k)
+        while self.peek_event() is not None and self.window[0].get("timestamp", 0) <= timestamp:
+            self.next_event()
+        self.apply_state(self.state_cells, self.state_bridges)
+        self.update_progress()
+
+    def apply_state(self, cells, bridges):
+        """Przenosi stan z indeksu na obiekty sceny; istniejące mosty zachowują swoje kropki"""
+        for cell, (cell_type, points) in zip(self.cells, cells):
+            if cell.cell_type != cell_type or cell.points != points:
+                cell.cell_type = cell_type
+                cell.points = points
+                cell.strength = (points // 10) + 1
+                cell.refresh()
+        index_of = {cell: i for i, cell in enumerate(self.cells)}
+        kept = []
+        for conn in self.connections:
+            key = (index_of[conn.source_cell], index_of[conn.target_cell])
+            if key in bridges and bridges[key][0] == conn.connection_type:
+                kept.append(conn)
+        existing = {(index_of[conn.source_cell], index_of[conn.target_cell]) for conn in kept}
+        for (source, target), (conn_type, cost) in bridges.items():
+            if (source, target) not in existing:
+                new_conn = CellConnection(self.cells[source], self.cells[target], conn_type)
+                new_conn.cost = cost
+                new_conn.dots.append(0)
+                kept.append(new_conn)
+        self.connections = kept
+        self.update()
+
+    def update_progress(self):
+        """Suwak osi czasu i zegar według czasu ostatniego zastosowanego zdarzenia"""
+        elapsed = self.current_time - self.replay_start_time if self.current_move_index > 0 else 0
+        if not self.timeline.isSliderDown():
+            self.timeline.setValue(int(elapsed * 1000))
+        if self.replay_duration > 0:
+            minutes = int(elapsed // 60)
+            seconds = int(elapsed % 60)
+            total_minutes = int(self.replay_duration // 60)
+            total_seconds = int(self.replay_duration % 60)
+            self.clock_label.setText(f"{minutes:02d}:{seconds:02d} / {total_minutes:02d}:{total_seconds:02d}")
+        else:
+            self.clock_label.setText("00:00 / 00:00")
+
     def apply_move_event(self, move):
-        description = move.get("description", "").strip()
-        if description.startswith("Utworzono most"):
-            pattern = r"Utworzono most między \(([\d.]+),\s*([\d.]+)\)\s*a\s*\(([\d.]+),\s*([\d.]+)\)\s*o koszcie (\d+)"
-            m = re.search(pattern, description, flags=re.DOTALL)
-            if m and DEBUG_MODE:
-                print("DEBUG: Wzorzec dopasowany! Dane mostu:", m.groups())
-            elif not m and DEBUG_MODE:
-                print("DEBUG: Wzorzec nie został dopasowany.")
-            if m:
-                x1, y1, x2, y2, cost = list(map(float, m.groups()[:4])) + [int(m.group(5))]
-                found = False
-                for conn in self.connections:
-                    sx, sy = conn.source_cell.x, conn.source_cell.y
-                    tx, ty = conn.target_cell.x, conn.target_cell.y
-                    if abs(sx - x1) < 10 and abs(sy - y1) < 10 and abs(tx - x2) < 10 and abs(ty - y2) < 10:
-                        conn.flash = True
-                        QTimer.singleShot(500, lambda: setattr(conn, 'flash', False))
-                        found = True
-                        break
-                if not found:
+        move_type = move["type"]
+        if move_type == game_events.BRIDGE_CREATED:
+            src, tgt = self.cells[move["source"]], self.cells[move["target"]]
+            for conn in self.connections:
+                if conn.source_cell is src and conn.target_cell is tgt:
+                    conn.flash = True
+                    QTimer.singleShot(500, lambda: setattr(conn, 'flash', False))
+                    return
+            if DEBUG_MODE:
+                print("DEBUG: Nie znaleziono istniejącego mostu. Tworzę nowy most.")
+            new_conn = CellConnection(src, tgt, src.cell_type)
+            new_conn.cost = move["cost"]
+            new_conn.flash = True
+            new_conn.dots.append(0)
+            self.connections.append(new_conn)
+        elif move_type == game_events.BRIDGE_REMOVED:
+            src, tgt = self.cells[move["source"]], self.cells[move["target"]]
+            for conn in self.connections:
+                if conn.source_cell is src and conn.target_cell is tgt:
                     if DEBUG_MODE:
-                        print("DEBUG: Nie znaleziono istniejącego mostu. Tworzę nowy most.")
-                    src = None
-                    tgt = None
-                    for cell in self.cells:
-                        if abs(cell.x - x1) < 10 and abs(cell.y - y1) < 10:
-                            src = cell
-                        if abs(cell.x - x2) < 10 and abs(cell.y - y2) < 10:
-                            tgt = cell
-                    if src and tgt:
-                        new_conn = CellConnection(src, tgt, src.cell_type)
-                        new_conn.cost = cost
-                        new_conn.flash = True
-                        new_conn.dots.append(0)
-                        self.connections.append(new_conn)
-            return
-        elif description.startswith("Usunięto most"):
-            pattern = r"Usunięto most między \(([\d.]+),\s*([\d.]+)\)\s*a\s*\(([\d.]+),\s*([\d.]+)\)"
-            m = re.search(pattern, description, flags=re.DOTALL)
-            if m:
-                if DEBUG_MODE:
-                    print("DEBUG: Most do usunięcia znaleziony:", m.groups())
-                x1, y1, x2, y2 = map(float, m.groups())
-                for conn in self.connections:
-                    sx, sy = conn.source_cell.x, conn.source_cell.y
-                    tx, ty = conn.target_cell.x, conn.target_cell.y
-                    if abs(sx - x1) < 10 and abs(sy - y1) < 10 and abs(tx - x2) < 10 and abs(ty - y2) < 10:
+                        print("DEBUG: Usuwam most:", conn)
+                    self.connections.remove(conn)
+                    break
+        elif move_type in (game_events.STATUS, game_events.FINAL_STATUS):
+            for cell, (new_type, pts) in zip(self.cells, move["cells"]):
+                if cell.cell_type == new_type and cell.points == pts:
+                    continue
+                cell.cell_type = new_type
+                cell.points = pts
+                cell.strength = (pts // 10) + 1
+                cell.refresh()
+                for conn in self.connections[:]:
+                    if conn.source_cell == cell and conn.connection_type != cell.cell_type:
                         if DEBUG_MODE:
-                            print("DEBUG: Usuwam most:", conn)
+                            print("DEBUG: Usuwam niezgodny most wychodzący z komórki", cell.x, cell.y)
                         self.connections.remove(conn)
-                        break
-            else:
-                if DEBUG_MODE:
-                    print("DEBUG: Wzorzec usunięcia mostu nie dopasowany.")
-            return
-        elif description.startswith("Status punktowy:"):
-            matches = re.findall(r"\((\w+)\s+@\s+([\d.]+),([\d.]+):\s+(\d+)\s+pts\)", description)
-            for new_type, x, y, pts in matches:
-                x, y, pts = float(x), float(y), int(pts)
-                for cell in self.cells:
-                    if abs(cell.x - x) < 10 and abs(cell.y - y) < 10:
-                        cell.cell_type = new_type
-                        cell.points = pts
-                        cell.strength = (pts // 10) + 1
-                        cell.update()
-                        for conn in self.connections[:]:
-                            if conn.source_cell == cell and conn.connection_type != cell.cell_type:
-                                if DEBUG_MODE:
-                                    print("DEBUG: Usuwam niezgodny most wychodzący z komórki", cell.x, cell.y)
-                                self.connections.remove(conn)
-            return
-        elif description.startswith("Status po ogłoszeniu wyniku:"):
-            matches = re.findall(r"\((\w+)\s+@\s+([\d.]+),([\d.]+):\s+(\d+)\s+pts\)", description)
-            if DEBUG_MODE:
-                print("DEBUG: Aktualizacja finalnego statusu. Znalazłem komórki:", matches)
-            for new_type, x, y, pts in matches:
-                x, y, pts = float(x), float(y), int(pts)
-                for cell in self.cells:
-                    if abs(cell.x - x) < 10 and abs(cell.y - y) < 10:
-                        cell.cell_type = new_type
-                        cell.points = pts
-                        cell.strength = (pts // 10) + 1
-                        cell.update()
-                        for conn in self.connections[:]:
-                            if conn.source_cell == cell and conn.connection_type != cell.cell_type:
-                                if DEBUG_MODE:
-                                    print("DEBUG: Usuwam niezgodny most wychodzący z komórki", cell.x, cell.y)
-                                self.connections.remove(conn)
-            return
 
     def play_next_move(self):
-        if self.current_move_index < len(self.move_history):
-            move = self.move_history[self.current_move_index]
+        if self.reverse:
+            if self.current_move_index > 0:
+                self.seek(self.current_move_index - 1)
+                self.playback_timer.start(int(1000 / self.speed_slider.value()))
+            else:
+                self.playback_timer.stop()
+                self.pause_button.setText("▶")
+            return
+        move = self.next_event()
+        if move is not None:
             self.apply_move_event(move)
-            self.current_move_index += 1
             self.playback_timer.start(int(1000 / self.speed_slider.value()))
-            progress = int((self.current_move_index / len(self.move_history)) * 100)
-            self.progress_bar.setValue(progress)
-            if self.replay_duration > 0:
-                current_time = self.replay_start_time + (self.current_move_index / len(self.move_history)) * self.replay_duration
-                minutes = int((current_time - self.replay_start_time) // 60)
-                seconds = int((current_time - self.replay_start_time) % 60)
-                total_minutes = int(self.replay_duration // 60)
-                total_seconds = int(self.replay_duration % 60)
-                self.clock_label.setText(f"{minutes:02d}:{seconds:02d} / {total_minutes:02d}:{total_seconds:02d}")
-            else:
-                self.clock_label.setText("00:00 / 00:00")
+            self.update_progress()
         else:
             self.playback_timer.stop()
             self.animation_timer.stop()
+            self.pause_button.setText("▶")
             self.show_game_result()
 
     def show_game_result(self):
-        final_status = ""
-        for move in reversed(self.move_history):
-            desc = move.get("description", "")
-            if desc.startswith("Status punktowy:") or desc.startswith("Status po ogłoszeniu wyniku:"):
-                final_status = desc
-                break
-        matches = re.findall(r"\((\w+) @ [\d.]+,[\d.]+: \d+ pts\)", final_status)
-        player_count = matches.count("player")
-        enemy_count = matches.count("enemy")
+        final_cells = [cell_type for cell_type, _ in self.state_cells]
+        player_count = final_cells.count("player")
+        enemy_count = final_cells.count("enemy")
         if enemy_count == 0 and player_count > 0:
             result = "Gracz wygrał"
         elif player_count == 0 and enemy_count > 0:
@@ -300,6 +400,8 @@ class PlaybackScene(QGraphicsScene):
     def return_to_menu(self):
         self.playback_timer.stop()
         self.animation_timer.stop()
-        self.move_history.clear()
+        self.stream.close()
+        self.window.clear()
+        self.recent.clear()
         if self.views() and self.views()[0].parent():
             self.views()[0].parent().show_menu()
\ No newline at end of file
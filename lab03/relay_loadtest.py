@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import relay_server
+import state_sync
+from net_session import encode_frame
+
+# Test obciążenia serwera meczów: boty zakładają mecze, zajmują miejsca wszystkich frakcji i co chwilę
+# budują lub przecinają mosty, widzowie tylko odbierają stan. Na koniec wypisuje przepustowość serwera
+# (ticki/s, czas ticku, wysłane dane) i to, co widzą klienci (przyrosty/s, opóźnienie komenda -> stan).
+#
+#   python relay_loadtest.py --matches 100 --factions 3 --spectators 2 --duration 30
+#   python relay_loadtest.py --host 10.0.0.5 --port 5600 ...   (serwer uruchomiony osobno)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Bot:
+    def __init__(self, rng, spectator=False, command_interval=0.5):
+        self.rng = rng
+        self.spectator = spectator
+        self.command_interval = command_interval
+        self.receiver = state_sync.SyncReceiver()
+        self.replies = asyncio.Queue()
+        self.state = None
+        self.layout = []
+        self.faction = None
+        self.finished = False
+        self.pending = {}          # (źródło, cel) -> czas wysłania komendy
+        self.latencies = []
+        self.states_received = 0
+        self.bytes_received = 0
+        self.commands_sent = 0
+        self.reader = self.writer = None
+        self.read_task = None
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.read_task = asyncio.ensure_future(self.read_loop())
+
+    def send(self, message):
+        if not self.writer.is_closing():
+            self.writer.write(encode_frame(message))
+
+    async def request(self, message, prefix):
+        self.send(message)
+        while True:
+            reply = await self.replies.get()
+            if reply.startswith(prefix) or reply.startswith("error;"):
+                return reply
+
+    async def read_loop(self):
+        try:
+            while True:
+                message = await relay_server.read_frame(self.reader)
+                self.bytes_received += relay_server.HEADER.size + len(message)
+                self.handle(message)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+
+    def handle(self, message):
+        kind, _, payload = message.partition(";")
+        if kind == "state_delta":
+            try:
+                seq, _, _, self.state = self.receiver.receive(base64.b64decode(payload))
+            except state_sync.SyncError:
+                self.send("state_nack;0")
+                return
+            self.send(f"state_ack;{seq}")
+            self.states_received += 1
+            now = time.monotonic()
+            connections = self.state["connections"]
+            for pair, sent in list(self.pending.items()):
+                if connections.get(pair, (None,))[0] == self.faction:
+                    self.latencies.append(now - sent)
+                    del self.pending[pair]
+                elif now - sent > 3.0:
+                    del self.pending[pair]
+        elif kind == "layout":
+            self.layout = json.loads(payload)
+        elif kind == "game_over":
+            self.finished = True
+        else:
+            self.replies.put_nowait(message)
+
+    async def play(self, until):
+        while time.monotonic() < until and not self.finished:
+            await asyncio.sleep(self.command_interval * self.rng.uniform(0.5, 1.5))
+            if self.state is None or self.faction is None:
+                continue
+            cells = self.state["cells"]
+            own = [i for i, (cell_type, points, _) in enumerate(cells) if cell_type == self.faction and points > 3]
+            if not own:
+                continue
+            bridges = [pair for pair, (conn_type, _) in self.state["connections"].items() if conn_type == self.faction]
+            if bridges and self.rng.random() < 0.15:
+                source, target = self.rng.choice(bridges)
+                self.send(f"cmd;cut;{source};{target};{self.rng.randint(0, 1000)}")
+            else:
+                source = self.rng.choice(own)
+                target = self.rng.randrange(len(cells))
+                if target == source or (source, target) in self.state["connections"]:
+                    continue
+                self.pending[(source, target)] = time.monotonic()
+                self.send(f"cmd;bridge;{source};{target}")
+            self.commands_sent += 1
+
+    def close(self):
+        if self.read_task is not None:
+            self.read_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def server_stats(host, port):
+    bot = Bot(random.Random())
+    await bot.connect(host, port)
+    reply = await bot.request("stats", "stats;")
+    bot.close()
+    return json.loads(reply.split(";", 1)[1])
+
+
+async def run_match(host, port, args, rng, until):
+    creator = Bot(rng)
+    await creator.connect(host, port)
+    match_id = int((await creator.request(f"create;{args.factions};{args.level}", "created;")).split(";")[1])
+    players = [creator] + [Bot(rng) for _ in range(args.factions - 1)]
+    spectators = [Bot(rng, spectator=True) for _ in range(args.spectators)]
+    for bot in players[1:] + spectators:
+        await bot.connect(host, port)
+    for bot in players:
+        reply = await bot.request(f"join;{match_id}", "joined;")
+        bot.faction = reply.split(";")[2]
+    for bot in spectators:
+        await bot.request(f"spectate;{match_id}", "spectating;")
+    await asyncio.gather(*(bot.play(until) for bot in players), asyncio.sleep(max(0.0, until - time.monotonic())))
+    for bot in players + spectators:
+        bot.close()
+    return players, spectators
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def main_async(args):
+    host, port, process = args.host, args.port, None
+    if host is None:
+        # serwer w osobnym procesie, żeby boty nie zabierały mu czasu interpretera
+        host, port = "127.0.0.1", args.port or free_port()
+        process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "relay_server.py"),
+                                    "--host", host, "--port", str(port)], stdout=subprocess.DEVNULL)
+    try:
+        await wait_for_server(host, port)
+        before = await server_stats(host, port)
+        rng = random.Random(args.seed)
+        started = time.monotonic()
+        until = started + args.duration
+        results = await asyncio.gather(*(run_match(host, port, args, random.Random(rng.random()), until)
+                                         for _ in range(args.matches)))
+        elapsed = time.monotonic() - started
+        after = await server_stats(host, port)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    players = [bot for match_players, _ in results for bot in match_players]
+    spectators = [bot for _, match_spectators in results for bot in match_spectators]
+    latencies = [latency for bot in players for latency in bot.latencies]
+    ticks = after["ticks"] - before["ticks"]
+
+    def per_client(bots, attribute):
+        return sum(getattr(bot, attribute) for bot in bots) / max(len(bots), 1) / elapsed
+
+    summary = {
+        "matches": args.matches, "factions": args.factions, "players": len(players), "spectators": len(spectators),
+        "seconds": round(elapsed, 1),
+        "server_ticks_per_second": round(ticks / elapsed, 1),
+        "server_late_ticks": after["late_ticks"] - before["late_ticks"],
+        "server_tick_ms_max": round(after["tick_ms_max"], 2),
+        "server_frames_in_per_second": round((after["frames_in"] - before["frames_in"]) / elapsed),
+        "server_frames_out_per_second": round((after["frames_out"] - before["frames_out"]) / elapsed),
+        "server_kB_out_per_second": round((after["bytes_out"] - before["bytes_out"]) / 1024 / elapsed, 1),
+        "commands_per_second": round(sum(bot.commands_sent for bot in players) / elapsed, 1),
+        "states_per_second_per_client": round(per_client(players + spectators, "states_received"), 1),
+        "spectator_bytes_per_second": round(per_client(spectators, "bytes_received")) if spectators else None,
+        "command_to_state_ms_p50": round(1000 * percentile(latencies, 0.5), 1) if latencies else None,
+        "command_to_state_ms_p95": round(1000 * percentile(latencies, 0.95), 1) if latencies else None,
+        "finished_matches": sum(1 for match_players, _ in results if match_players[0].finished),
+    }
+    for key, value in summary.items():
+        print(f"{key:32} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test obciążenia serwera meczów botami")
+    parser.add_argument("--host", default=None, help="adres działającego serwera (domyślnie uruchamiany lokalnie)")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--matches", type=int, default=20)
+    parser.add_argument("--factions", type=int, default=3)
+    parser.add_argument("--spectators", type=int, default=2)
+    parser.add_argument("--level", type=int, default=0, help="poziom z levels.json (tylko 2 frakcje); 0 – plansza pierścieniowa; "
+                             "ujemny – plansza generowana z tyloma komórkami")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+import argparse
+import asyncio
+import base64
+import datetime
+import json
+import math
+import random
+import time
+
+import game_rules
+import level_store
+import lockstep
+import state_sync
+from game_engine import Simulation, Cell
+from net_session import HEADER, MAX_FRAME, encode_frame
+
+# Serwer meczów (lobby + relay) bez Qt: wiele równoległych meczów na jednej maszynie, każdy z własną
+# autorytatywną symulacją krokowaną co FRAME_INTERVAL_MS w jednej pętli asyncio. Klienci (gracze
+# i widzowie) łączą się po TCP ramkami jak w net_session.py i wysyłają tylko komendy (słownik z lockstep.py);
+# stan meczu wraca co SYNC_TICKS ticków jako przyrosty state_sync względem stanu potwierdzonego przez
+# klienta – klienci z tym samym stanem bazowym dostają tę samą, raz zakodowaną paczkę.
+#
+# Klient -> serwer:  list | create;<frakcje>[;<poziom>] | join;<mecz>[;<frakcja>] | spectate;<mecz> | leave
+#                    cmd;<komenda>;<argumenty...> | state_ack;<seq> | state_nack;<seq> | heartbeat | stats
+# Serwer -> klient:  matches;<json> | created;<mecz> | joined;<mecz>;<frakcja> | spectating;<mecz>
+#                    layout;<json [[x, y], ...]> | state_delta;<base64> | game_over;<frakcja> | error;<opis>
+#                    heartbeat_ack | stats;<json>
+# Poziom w create: numer z levels.json (tylko 2 frakcje), 0 – plansza pierścieniowa, ujemny – plansza
+# generowana (level_store.generate_level) z tyloma komórkami.
+
+DEFAULT_PORT = 5600
+TICK_SECONDS = game_rules.FRAME_INTERVAL_MS / 1000
+SYNC_TICKS = 6                 # stan do klientów co ~100 ms
+STATE_HISTORY = 32             # ile ostatnich stanów meczu może być bazą przyrostu
+MAX_WRITE_BUFFER = 256 * 1024  # klient z większą kolejką do wysłania pomija rozsyłanie (dostanie później większy przyrost)
+FINISHED_LINGER = 10.0         # ile sekund zakończony mecz czeka na klientów
+IDLE_TIMEOUT = 60.0            # po ilu sekundach bez klientów mecz jest usuwany
+STATS_INTERVAL = 10.0
+
+
+def log(message):
+    timestamp = datetime.datetime.now().strftime("%H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+
+async def read_frame(reader):
+    (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_FRAME:
+        raise ConnectionError(f"Za duża ramka: {length} B")
+    return (await reader.readexactly(length)).decode("utf-8")
+
+
+def level_board(level):
+    """Komórki poziomu (level_store.Level)"""
+    return [Cell(cell.x, cell.y, cell.type, cell.points) for cell in level.cells]
+
+
+def ring_board(factions, seed=0, width=1280, height=720):
+    """Plansza dla dowolnej liczby frakcji: po dwie komórki każdej frakcji na okręgu,
+       w środku pierścień komórek neutralnych (punkty losowane z ziarna)"""
+    rng = random.Random(seed)
+    cx, cy = width / 2, height / 2
+    radius = min(width, height) / 2 - 40
+    cells = []
+    for i, faction in enumerate(game_rules.FACTIONS[:factions]):
+        angle = 2 * math.pi * i / factions
+        for offset, r, points in ((0.0, radius, 30), (math.pi / (3 * factions), radius * 0.8, 10)):
+            cells.append(Cell(round(cx + r * math.cos(angle + offset)), round(cy + r * math.sin(angle + offset)),
+                              faction, points))
+    neutrals = 2 * factions
+    for i in range(neutrals):
+        angle = 2 * math.pi * (i + 0.5) / neutrals
+        r = radius * (0.3 if i % 2 else 0.5)
+        cells.append(Cell(round(cx + r * math.cos(angle)), round(cy + r * math.sin(angle)), "neutral", rng.randint(3, 12)))
+    return cells
+
+
+def parse_command(parts):
+    """cmd;<komenda>;<liczby...> -> krotka komendy lockstep (ValueError przy błędnej komendzie)"""
+    if not parts or parts[0] not in lockstep.COMMAND_CODES:
+        raise ValueError(f"Nieznana komenda: {parts[:1]}")
+    expected = {"bridge": 2, "cut": 3, "copy": 3}.get(parts[0], 1)
+    if len(parts) - 1 != expected:
+        raise ValueError(f"Komenda {parts[0]} wymaga {expected} argumentów")
+    return (parts[0],) + tuple(int(value) for value in parts[1:])
+
+
+class Client:
+    """Połączenie klienta: gracz frakcji (faction) albo widz (faction None)"""
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info("peername")
+        self.match = None
+        self.faction = None
+        self.acked_seq = 0
+
+    def send(self, message):
+        self.send_frame(encode_frame(message))
+
+    def send_frame(self, frame):
+        if self.writer.is_closing():
+            return
+        self.writer.write(frame)
+        self.server.frames_out += 1
+        self.server.bytes_out += len(frame)
+
+    def congested(self):
+        return self.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER
+
+
+class Match:
+    """Mecz z autorytatywną symulacją; komendy graczy są stosowane na początku najbliższego ticku"""
+
+    def __init__(self, match_id, cells, factions, name):
+        self.match_id = match_id
+        self.name = name
+        self.simulation = Simulation(cells)
+        self.factions = game_rules.FACTIONS[:factions]
+        self.seats = dict.fromkeys(self.factions)
+        self.members = set()
+        self.commands = []
+        self.states = {0: state_sync.empty_state()}
+        self.seq = 0
+        self.ticks = 0
+        self.layout_cells = len(cells)
+        self.winner = None
+        self.finished_at = None
+        self.idle_since = time.monotonic()
+
+    def describe(self):
+        return {"id": self.match_id, "name": self.name, "factions": list(self.factions),
+                "free": [faction for faction, client in self.seats.items() if client is None],
+                "spectators": sum(1 for client in self.members if client.faction is None),
+                "ticks": self.ticks, "finished": self.finished_at is not None, "winner": self.winner}
+
+    def layout(self):
+        return "layout;" + json.dumps([[cell.x, cell.y] for cell in self.simulation.cells])
+
+    def add(self, client, faction=None):
+        self.members.add(client)
+        client.match, client.faction, client.acked_seq = self, faction, 0
+        if faction is not None:
+            self.seats[faction] = client
+        client.send(self.layout())
+
+    def remove(self, client):
+        self.members.discard(client)
+        if client.faction is not None and self.seats.get(client.faction) is client:
+            self.seats[client.faction] = None
+        client.match, client.faction = None, None
+        if not self.members:
+            self.idle_since = time.monotonic()
+
+    def step(self):
+        if self.finished_at is not None:
+            return
+        for faction, command in self.commands:
+            lockstep.apply_command(self.simulation, faction, command)
+        self.commands = []
+        self.simulation.step()
+        self.ticks += 1
+        alive = self.simulation.factions()
+        if len(alive) <= 1:
+            self.winner = alive[0] if alive else None
+            self.finished_at = time.monotonic()
+            self.broadcast()
+            for client in self.members:
+                client.send(f"game_over;{self.winner}")
+
+    def broadcast(self):
+        """Stan meczu do wszystkich klientów; przyrost liczony raz na każdy stan bazowy"""
+        self.seq += 1
+        state = state_sync.simulation_state(self.simulation.cells, self.simulation.connections)
+        self.states[self.seq] = state
+        if len(self.states) > STATE_HISTORY:
+            del self.states[min(seq for seq in self.states if seq)]
+        layout = None
+        if len(self.simulation.cells) != self.layout_cells:
+            self.layout_cells = len(self.simulation.cells)
+            layout = encode_frame(self.layout())
+        frames = {}
+        for client in self.members:
+            if client.congested():
+                continue
+            if layout is not None:
+                client.send_frame(layout)
+            base = client.acked_seq if client.acked_seq in self.states else 0
+            frame = frames.get(base)
+            if frame is None:
+                data = state_sync.encode(self.seq, base, state_sync.diff(self.states[base], state))
+                frame = frames[base] = encode_frame("state_delta;" + base64.b64encode(data).decode("ascii"))
+            client.send_frame(frame)
+
+
+class RelayServer:
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT, levels_path=None):
+        self.host = host
+        self.port = port
+        try:
+            self.levels = level_store.load_levels(levels_path)
+        except (OSError, ValueError) as e:
+            log(f"Nie wczytano poziomów ({e}) – dostępne tylko plansze generowane")
+            self.levels = []
+        self.matches = {}
+        self.clients = set()
+        self.next_match_id = 1
+        self.ticks = 0
+        self.late_ticks = 0
+        self.tick_time_total = 0.0
+        self.tick_time_max = 0.0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.started = time.monotonic()
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        log(f"Serwer meczów nasłuchuje na {self.host}:{self.port}")
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await asyncio.gather(self.server.serve_forever(), self.run(), self.report())
+
+    # --- Klienci ---
+
+    async def handle_client(self, reader, writer):
+        client = Client(self, reader, writer)
+        self.clients.add(client)
+        try:
+            while True:
+                message = await read_frame(reader)
+                self.frames_in += 1
+                self.bytes_in += HEADER.size + len(message)
+                try:
+                    self.handle_message(client, message)
+                except (ValueError, IndexError) as e:
+                    client.send(f"error;Błędna wiadomość: {e}")
+        except (asyncio.IncompleteReadError, ConnectionError, UnicodeDecodeError, OSError):
+            pass
+        finally:
+            if client.match is not None:
+                client.match.remove(client)
+            self.clients.discard(client)
+            writer.close()
+
+    def handle_message(self, client, message):
+        parts = message.split(";")
+        kind = parts[0]
+        match = client.match
+        if kind == "cmd":
+            if match is None or client.faction is None or match.finished_at is not None:
+                return
+            try:
+                match.commands.append((client.faction, parse_command(parts[1:])))
+            except ValueError as e:
+                client.send(f"error;{e}")
+        elif kind == "state_ack":
+            seq = int(parts[1])
+            if match is not None and seq in match.states and seq > client.acked_seq:
+                client.acked_seq = seq
+        elif kind == "state_nack":
+            client.acked_seq = 0
+        elif kind == "heartbeat":
+            client.send("heartbeat_ack")
+        elif kind == "list":
+            client.send("matches;" + json.dumps([m.describe() for m in self.matches.values()]))
+        elif kind == "create":
+            try:
+                client.send(f"created;{self.create_match(*(int(value) for value in parts[1:3]))}")
+            except (ValueError, TypeError) as e:
+                client.send(f"error;{e}")
+        elif kind in ("join", "spectate"):
+            self.join(client, kind, parts[1:])
+        elif kind == "leave":
+            if match is not None:
+                match.remove(client)
+        elif kind == "stats":
+            client.send("stats;" + json.dumps(self.stats()))
+        else:
+            client.send(f"error;Nieznana wiadomość: {kind}")
+
+    def create_match(self, factions=2, level=0):
+        if not 2 <= factions <= len(game_rules.FACTIONS):
+            raise ValueError(f"Liczba frakcji poza zakresem 2..{len(game_rules.FACTIONS)}")
+        match_id = self.next_match_id
+        self.next_match_id += 1
+        if level < 0:
+            board = level_store.generate_level(-level, seed=match_id, factions=factions)
+            cells, name = level_board(board), board.name
+        elif level and factions == 2 and 1 <= level <= len(self.levels):
+            cells, name = level_board(self.levels[level - 1]), self.levels[level - 1].name
+        else:
+            cells, name = ring_board(factions, seed=match_id), f"Pierścień {factions}"
+        self.matches[match_id] = Match(match_id, cells, factions, name)
+        return match_id
+
+    def join(self, client, kind, args):
+        try:
+            match = self.matches[int(args[0])]
+        except (IndexError, ValueError, KeyError):
+            client.send("error;Nie ma takiego meczu")
+            return
+        if client.match is not None:
+            client.match.remove(client)
+        if kind == "spectate":
+            match.add(client)
+            client.send(f"spectating;{match.match_id}")
+            return
+        free = [faction for faction, seat in match.seats.items() if seat is None]
+        faction = args[1] if len(args) > 1 and args[1] else (free[0] if free else None)
+        if faction not in free:
+            client.send("error;Brak wolnego miejsca w meczu")
+            return
+        match.add(client, faction)
+        client.send(f"joined;{match.match_id};{faction}")
+
+    # --- Pętla meczów ---
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            started = time.perf_counter()
+            self.ticks += 1
+            broadcast = self.ticks % SYNC_TICKS == 0
+            now = time.monotonic()
+            for match_id, match in list(self.matches.items()):
+                match.step()
+                if broadcast and match.finished_at is None:
+                    match.broadcast()
+                if (match.finished_at is not None and now - match.finished_at > FINISHED_LINGER) or \
+                        (not match.members and now - match.idle_since > IDLE_TIMEOUT):
+                    for client in list(match.members):
+                        match.remove(client)
+                    del self.matches[match_id]
+            elapsed = time.perf_counter() - started
+            self.tick_time_total += elapsed
+            self.tick_time_max = max(self.tick_time_max, elapsed)
+            next_tick += TICK_SECONDS
+            delay = next_tick - loop.time()
+            if delay < 0:
+                self.late_ticks += 1
+                if delay < -SYNC_TICKS * TICK_SECONDS:
+                    # serwer nie nadąża – zamiast nadrabiać serią ticków zwalnia czas gry
+                    next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        uptime = time.monotonic() - self.started
+        return {"uptime": uptime, "matches": len(self.matches), "clients": len(self.clients),
+                "ticks": self.ticks, "ticks_per_second": self.ticks / uptime if uptime else 0.0,
+                "late_ticks": self.late_ticks, "tick_ms_avg": 1000 * self.tick_time_total / max(self.ticks, 1),
+                "tick_ms_max": 1000 * self.tick_time_max, "frames_in": self.frames_in, "frames_out": self.frames_out,
+                "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            stats = self.stats()
+            log(f"Mecze: {stats['matches']}, klienci: {stats['clients']}, tick śr. {stats['tick_ms_avg']:.2f} ms "
+                f"(maks. {stats['tick_ms_max']:.2f} ms, spóźnione {stats['late_ticks']}), "
+                f"wysłano {stats['bytes_out'] / 1024:.0f} kB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serwer meczów sieciowych (lobby + relay)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(RelayServer(args.host, args.port).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import re
+import sqlite3
+from contextlib import closing
+
+import config
+import game_history
+import replay_format
+
+# Katalog plików powtórek (SQLite): metadane każdej powtórki z katalogu replays, żeby lista w menu
+# nie wczytywała plików. Wpisy są dodawane przy zapisie (GameScene.save_game_history); sync()
+# uzupełnia pliki dodane lub zmienione poza grą i usuwa wpisy plików, których już nie ma.
+
+FORMATS = {".xml": "xml", ".json": "json", replay_format.EXTENSION: "bin"}
+LOADERS = {
+    "xml": game_history.load_game_history,
+    "json": game_history.load_game_history_json,
+    "bin": game_history.load_game_history_binary,
+}
+RESULT_LABELS = {"win": "Wygrana", "loss": "Przegrana", "other": "Nierozstrzygnięta"}
+ORDERS = {
+    "newest": "timestamp DESC",
+    "oldest": "timestamp ASC",
+    "longest": "duration DESC",
+    "shortest": "duration ASC",
+    "largest": "size DESC",
+}
+
+_LEVEL_RE = re.compile(r"replay_level(\d+)_")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS replays (
+    path TEXT PRIMARY KEY,
+    format TEXT NOT NULL,
+    level INTEGER,
+    timestamp REAL,
+    duration REAL,
+    result TEXT,
+    player_cells INTEGER,
+    enemy_cells INTEGER,
+    move_count INTEGER,
+    size INTEGER,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS replays_format_level_time ON replays (format, level, timestamp);
+CREATE INDEX IF NOT EXISTS replays_format_time ON replays (format, timestamp);
+"""
+
+
+class ReplayCatalog:
+    def __init__(self, path=None):
+        self.path = path or config.REPLAY_CATALOG_PATH
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.conn = sqlite3.connect(self.path, timeout=10)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def add(self, path, history=None):
+        """Dodaje lub odświeża wpis pliku; bez historii plik jest wczytywany (nieczytelny – wpis bez poziomu)"""
+        path = os.path.normpath(path)
+        fmt = FORMATS.get(os.path.splitext(path)[1].lower())
+        if fmt is None:
+            return
+        stat = os.stat(path)
+        summary = {}
+        level = None
+        try:
+            if history is None:
+                history = LOADERS[fmt](path)
+            summary = game_history.summarize_history(history)
+            level = history.get("level")
+            if level is None:
+                match = _LEVEL_RE.search(os.path.basename(path))
+                level = int(match.group(1)) if match else 0
+        except Exception:
+            summary = {}
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO replays (path, format, level, timestamp, duration, result, player_cells,"
+                " enemy_cells, move_count, size, mtime) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, fmt, level, summary.get("timestamp"), summary.get("duration"), summary.get("result"),
+                 summary.get("player_cells"), summary.get("enemy_cells"), summary.get("move_count"),
+                 stat.st_size, stat.st_mtime))
+
+    def sync(self, directory):
+        """Porównuje katalog z wpisami (rozmiar i czas modyfikacji) – wczytywane są tylko nowe i zmienione pliki"""
+        directory = os.path.normpath(directory)
+        if not os.path.isdir(directory):
+            return
+        known = {row["path"]: (row["size"], row["mtime"]) for row in
+                 self.conn.execute("SELECT path, size, mtime FROM replays")
+                 if os.path.dirname(row["path"]) == directory}
+        present = set()
+        for entry in os.scandir(directory):
+            if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in FORMATS:
+                continue
+            path = os.path.normpath(entry.path)
+            present.add(path)
+            stat = entry.stat()
+            if known.get(path) != (stat.st_size, stat.st_mtime):
+                self.add(path)
+        removed = [(path,) for path in known if path not in present]
+        if removed:
+            with self.conn:
+                self.conn.executemany("DELETE FROM replays WHERE path = ?", removed)
+
+    def query(self, fmt=None, level=None, result=None, order="newest", limit=None):
+        """Wpisy spełniające filtry (słowniki), posortowane według ORDERS[order]"""
+        conditions, params = ["level IS NOT NULL"], []
+        for column, value in (("format", fmt), ("level", level), ("result", result)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        sql = f"SELECT * FROM replays WHERE {' AND '.join(conditions)} ORDER BY {ORDERS[order]}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+
+def record(history, paths):
+    """Wpisuje zapisane właśnie pliki powtórki (wywoływane z wątku zapisu – własne połączenie)"""
+    with closing(ReplayCatalog()) as catalog:
+        for path in paths:
+            catalog.add(path, history)
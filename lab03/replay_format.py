@@ -0,0 +1,363 @@
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import game_events
+
+# Binarny format powtórek (.bin). Zamiast opisów tekstowych zapisywane są:
+#  - klatki kluczowe: typ i punkty każdej komórki (co KEYFRAME_INTERVAL s),
+#  - różnice: tylko komórki, których typ lub punkty zmieniły się od poprzedniego statusu,
+#  - zdarzenia mostów z indeksami komórek i kosztem (zdarzenia z game_events).
+# Plik: nagłówek (MAGIC, wersja, kompresja) + bloki skompresowane zlib lub zstd (jeśli zainstalowany):
+# pierwszy z komórkami, kolejne z rekordami – nowy blok zaczyna się przy każdej klatce kluczowej.
+# Moduł nie zależy od Qt – konwerter działa z wiersza poleceń:
+#     python replay_format.py replays/replay_level2_20250406_212606.json
+
+MAGIC = b"CEWR"
+VERSION = 2
+EXTENSION = ".bin"
+KEYFRAME_INTERVAL = 10.0
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+COMPRESSION_NAMES = {"none": COMPRESSION_NONE, "zlib": COMPRESSION_ZLIB, "zstd": COMPRESSION_ZSTD}
+
+CELL_TYPES = ("neutral", "player", "enemy")
+TYPE_CODES = {cell_type: code for code, cell_type in enumerate(CELL_TYPES)}
+
+# Rodzaje rekordów
+REC_STATUS = 1          # pełny status (klatka kluczowa)
+REC_STATUS_DELTA = 2    # zmienione komórki od poprzedniego statusu
+REC_CREATE_BRIDGE = 3
+REC_REMOVE_BRIDGE = 4
+REC_PRE_FINAL = 5
+REC_FINAL_STATUS = 6
+REC_RESULT = 7
+REC_TEXT = 8
+
+_HEADER = struct.Struct("<4sBB")       # magic, wersja, kompresja
+_BLOCK = struct.Struct("<I")           # długość skompresowanego bloku
+_START = struct.Struct("<ddHH")        # czas startu i końca, poziom, liczba komórek
+_START_V1 = struct.Struct("<dHH")      # wersja 1: czas startu, poziom, liczba komórek
+_CELL = struct.Struct("<ffBHBH")       # x, y, typ i punkty początkowe, typ i punkty końcowe
+_RECORD = struct.Struct("<BI")         # rodzaj, przesunięcie od startu (ms)
+_BRIDGE = struct.Struct("<HHH")        # źródło, cel, koszt
+_PAIR = struct.Struct("<HH")           # źródło, cel
+_COUNT = struct.Struct("<H")
+_DELTA_ITEM = struct.Struct("<HBH")    # indeks komórki, typ, punkty
+
+_STATUS_RECORDS = {game_events.STATUS: REC_STATUS, game_events.PRE_FINAL_STATUS: REC_PRE_FINAL,
+                   game_events.FINAL_STATUS: REC_FINAL_STATUS}
+_TEXT_RECORDS = {game_events.RESULT: REC_RESULT, game_events.NOTE: REC_TEXT}
+_EVENT_TYPES = {record: event_type for event_type, record in list(_STATUS_RECORDS.items()) + list(_TEXT_RECORDS.items())}
+
+
+class ReplayFormatError(Exception):
+    pass
+
+
+def _encode_status(status):
+    n = len(status)
+    return struct.pack(f"<{n}B{n}H", *(TYPE_CODES.get(t, 0) for t, _ in status),
+                       *(min(max(p, 0), 0xFFFF) for _, p in status))
+
+
+def _decode_status(payload, offset, n):
+    values = struct.unpack_from(f"<{n}B{n}H", payload, offset)
+    status = [[CELL_TYPES[values[i]], values[n + i]] for i in range(n)]
+    return status, offset + n * 3
+
+
+def _compress(data, compression):
+    if compression == COMPRESSION_ZSTD:
+        return zstandard.ZstdCompressor(level=19).compress(data)
+    if compression == COMPRESSION_ZLIB:
+        return zlib.compress(data, 9)
+    return data
+
+
+def _decompress(data, compression):
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ReplayFormatError("Powtórka skompresowana zstd – zainstaluj pakiet zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    if compression == COMPRESSION_NONE:
+        return data
+    raise ReplayFormatError(f"Nieznana kompresja: {compression}")
+
+
+def _encode_cells(cells, final_cells):
+    parts = []
+    for i, cell in enumerate(cells):
+        final = final_cells[i] if i < len(final_cells) else cell
+        parts.append(_CELL.pack(cell["x"], cell["y"], TYPE_CODES.get(cell.get("type"), 0), cell.get("points", 0),
+                                TYPE_CODES.get(final.get("type"), 0), final.get("points", 0)))
+    return b"".join(parts)
+
+
+def _decode_cells(payload, offset, n):
+    cells, final_cells = [], []
+    for _ in range(n):
+        x, y, start_type, start_points, final_type, final_points = _CELL.unpack_from(payload, offset)
+        offset += _CELL.size
+        cells.append({"x": x, "y": y, "type": CELL_TYPES[start_type], "points": start_points})
+        final_cells.append({"x": x, "y": y, "type": CELL_TYPES[final_type], "points": final_points})
+    return cells, final_cells, offset
+
+
+def encode_replay(history, level=0, compression="zstd", keyframe_interval=KEYFRAME_INTERVAL):
+    """Koduje historię (słownik jak z load_game_history_json) do formatu binarnego.
+       Rekordy są dzielone na bloki kompresowane osobno; każdy blok poza pierwszym zaczyna się
+       od pełnego statusu, więc odczyt można wznowić od dowolnego bloku (replay_stream.py)."""
+    cells = history.get("initial_state", {}).get("cells", [])
+    final_cells = history.get("final_state", {}).get("cells", []) or cells
+    events = game_events.normalize(history.get("moves", []), cells)
+    start = events[0]["timestamp"] if events else 0.0
+    end = events[-1]["timestamp"] if events else 0.0
+    n = len(cells)
+
+    compression = COMPRESSION_NAMES.get(compression, compression)
+    if compression == COMPRESSION_ZSTD and zstandard is None:
+        compression = COMPRESSION_ZLIB
+
+    blocks = [_START.pack(start, end, level, n) + _encode_cells(cells, final_cells)]
+    parts = []
+    current = [[cell.get("type", "neutral"), cell.get("points", 0)] for cell in cells]
+    last_keyframe = None
+    for event in events:
+        event_type, timestamp = event["type"], event["timestamp"]
+        offset = max(0, int(round((timestamp - start) * 1000)))
+        if event_type in _STATUS_RECORDS:
+            status = event["cells"]
+            if event_type == game_events.STATUS and last_keyframe is not None and timestamp - last_keyframe < keyframe_interval:
+                changed = [(i, entry) for i, entry in enumerate(status) if entry != current[i]]
+                parts.append(_RECORD.pack(REC_STATUS_DELTA, offset))
+                parts.append(_COUNT.pack(len(changed)))
+                parts.extend(_DELTA_ITEM.pack(i, TYPE_CODES.get(t, 0), min(max(p, 0), 0xFFFF)) for i, (t, p) in changed)
+            else:
+                if event_type == game_events.STATUS:
+                    last_keyframe = timestamp
+                    if parts:
+                        blocks.append(b"".join(parts))
+                        parts = []
+                parts.append(_RECORD.pack(_STATUS_RECORDS[event_type], offset))
+                parts.append(_encode_status(status))
+            current = status
+        elif event_type == game_events.BRIDGE_CREATED:
+            parts.append(_RECORD.pack(REC_CREATE_BRIDGE, offset))
+            parts.append(_BRIDGE.pack(event["source"], event["target"], event["cost"]))
+        elif event_type == game_events.BRIDGE_REMOVED:
+            parts.append(_RECORD.pack(REC_REMOVE_BRIDGE, offset))
+            parts.append(_PAIR.pack(event["source"], event["target"]))
+        else:
+            text = event.get("text", "").encode("utf-8")
+            parts.append(_RECORD.pack(_TEXT_RECORDS.get(event_type, REC_TEXT), offset))
+            parts.append(_COUNT.pack(len(text)))
+            parts.append(text)
+    if parts:
+        blocks.append(b"".join(parts))
+
+    output = [_HEADER.pack(MAGIC, VERSION, compression)]
+    for block in blocks:
+        compressed = _compress(block, compression)
+        output.append(_BLOCK.pack(len(compressed)))
+        output.append(compressed)
+    return b"".join(output)
+
+
+def decode_events(payload, offset, n, start, current):
+    """Dekoduje rekordy bloku od pozycji offset; current – stan komórek przed blokiem.
+       Różnice są rozwijane do pełnego statusu, więc zdarzenia statusu zawsze mają wszystkie komórki."""
+    events = []
+    size = len(payload)
+    while offset < size:
+        kind, ms = _RECORD.unpack_from(payload, offset)
+        offset += _RECORD.size
+        timestamp = start + ms / 1000.0
+        if kind in (REC_STATUS, REC_PRE_FINAL, REC_FINAL_STATUS):
+            current, offset = _decode_status(payload, offset, n)
+            events.append({"timestamp": timestamp, "type": _EVENT_TYPES[kind], "cells": current})
+        elif kind == REC_STATUS_DELTA:
+            (count,) = _COUNT.unpack_from(payload, offset)
+            offset += _COUNT.size
+            current = list(current)
+            for _ in range(count):
+                i, cell_type, points = _DELTA_ITEM.unpack_from(payload, offset)
+                offset += _DELTA_ITEM.size
+                current[i] = [CELL_TYPES[cell_type], points]
+            events.append({"timestamp": timestamp, "type": game_events.STATUS, "cells": current})
+        elif kind == REC_CREATE_BRIDGE:
+            events.append(game_events.bridge_created(timestamp, *_BRIDGE.unpack_from(payload, offset)))
+            offset += _BRIDGE.size
+        elif kind == REC_REMOVE_BRIDGE:
+            events.append(game_events.bridge_removed(timestamp, *_PAIR.unpack_from(payload, offset)))
+            offset += _PAIR.size
+        elif kind in (REC_RESULT, REC_TEXT):
+            (length,) = _COUNT.unpack_from(payload, offset)
+            offset += _COUNT.size
+            events.append({"timestamp": timestamp, "type": _EVENT_TYPES[kind],
+                           "text": payload[offset:offset + length].decode("utf-8")})
+            offset += length
+        else:
+            raise ReplayFormatError(f"Nieznany rekord {kind} na pozycji {offset}")
+    return events, current
+
+
+def read_header(data):
+    """Sprawdza nagłówek pliku; zwraca (wersja, kompresja)"""
+    if len(data) < _HEADER.size:
+        raise ReplayFormatError("Plik powtórki jest za krótki")
+    magic, version, compression = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ReplayFormatError("To nie jest binarny plik powtórki")
+    if version not in (1, VERSION):
+        raise ReplayFormatError(f"Nieobsługiwana wersja powtórki: {version}")
+    return version, compression
+
+
+def decode_replay(data):
+    """Dekoduje cały plik binarny do słownika w tym samym kształcie, co load_game_history_json"""
+    version, compression = read_header(data)
+    if version == 1:
+        # wersja 1: jeden blok bez czasu końca
+        payload = _decompress(data[_HEADER.size:], compression)
+        start, level, n = _START_V1.unpack_from(payload, 0)
+        cells, final_cells, offset = _decode_cells(payload, _START_V1.size, n)
+        events, _ = decode_events(payload, offset, n, start, [[cell["type"], cell["points"]] for cell in cells])
+    else:
+        blocks = []
+        offset = _HEADER.size
+        while offset < len(data):
+            (length,) = _BLOCK.unpack_from(data, offset)
+            offset += _BLOCK.size
+            blocks.append(_decompress(data[offset:offset + length], compression))
+            offset += length
+        start, _, level, n = _START.unpack_from(blocks[0], 0)
+        cells, final_cells, _ = _decode_cells(blocks[0], _START.size, n)
+        current = [[cell["type"], cell["points"]] for cell in cells]
+        events = []
+        for block in blocks[1:]:
+            block_events, current = decode_events(block, 0, n, start, current)
+            events.extend(block_events)
+    return {"level": level, "initial_state": {"cells": cells}, "moves": events,
+            "final_state": {"cells": final_cells}}
+
+
+class BinaryReplayReader:
+    """Odczyt blokami: w pamięci jest tylko jeden zdekompresowany blok. Pozycją wznowienia
+       jest przesunięcie bloku w pliku (każdy blok poza pierwszym zaczyna się pełnym statusem)."""
+
+    # każdy początek bloku warto zapamiętać (ReplayStream)
+    checkpoint_spacing = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self.version, self.compression = read_header(f.read(_HEADER.size))
+            if self.version == 1:
+                raise ReplayFormatError("Odczyt strumieniowy wymaga powtórki w wersji 2")
+            (length,) = _BLOCK.unpack(f.read(_BLOCK.size))
+            head = _decompress(f.read(length), self.compression)
+            self.first_block = f.tell()
+        self.start_time, self.end_time, self.level, self.cell_count = _START.unpack_from(head, 0)
+        cells, final_cells, _ = _decode_cells(head, _START.size, self.cell_count)
+        self.header = {"level": self.level, "initial_state": {"cells": cells}, "final_state": {"cells": final_cells}}
+
+    def events(self, position=None):
+        """Generator (pozycja wznowienia lub None, zdarzenie) od początku pliku lub od bloku `position`"""
+        position = self.first_block if position is None else position
+        current = [[cell["type"], cell["points"]] for cell in self.header["initial_state"]["cells"]]
+        with open(self.filename, "rb") as f:
+            f.seek(position)
+            while True:
+                block_start = f.tell()
+                size = f.read(_BLOCK.size)
+                if len(size) < _BLOCK.size:
+                    return
+                (length,) = _BLOCK.unpack(size)
+                block = _decompress(f.read(length), self.compression)
+                events, current = decode_events(block, 0, self.cell_count, self.start_time, current)
+                for i, event in enumerate(events):
+                    yield (block_start if i == 0 else None), event
+
+
+def save_replay(history, filename, level=0, compression="zstd", keyframe_interval=KEYFRAME_INTERVAL):
+    data = encode_replay(history, level, compression, keyframe_interval)
+    with open(filename, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def load_replay(filename):
+    if not os.path.exists(filename):
+        return {"initial_state": {"cells": []}, "moves": []}
+    with open(filename, "rb") as f:
+        return decode_replay(f.read())
+
+
+def convert(filename, compression="zstd", overwrite=False):
+    """Konwertuje powtórkę JSON/XML do formatu binarnego obok oryginału; zwraca ścieżkę nowego pliku.
+       Istniejący plik .bin (np. zapisany przez grę albo z drugiego formatu tej samej powtórki) jest
+       nadpisywany tylko przy overwrite=True – inaczej FileExistsError."""
+    target = os.path.splitext(filename)[0] + EXTENSION
+    if not overwrite and os.path.exists(target):
+        raise FileExistsError(f"Plik {target} już istnieje (--force nadpisuje)")
+    if filename.lower().endswith(".json"):
+        import json
+        with open(filename, "r", encoding="utf-8") as f:
+            history = json.load(f)
+    else:
+        from game_history import load_game_history
+        history = load_game_history(filename)
+    m = re.search(r"level(\d+)", os.path.basename(filename))
+    level = history.get("level") or (int(m.group(1)) if m else 0)
+    save_replay(history, target, level, compression)
+    return target
+
+
+def main(argv):
+    compression = "zstd"
+    overwrite = False
+    files = []
+    for arg in argv:
+        if arg == "--force":
+            overwrite = True
+        elif arg.startswith("--"):
+            compression = arg[2:]
+        else:
+            files.append(arg)
+    if not files or compression not in COMPRESSION_NAMES:
+        print("Użycie: python replay_format.py [--zstd|--zlib|--none] [--force] plik.json|plik.xml ...")
+        return 1
+    status = 0
+    for filename in files:
+        try:
+            target = convert(filename, compression, overwrite)
+        except FileExistsError as e:
+            print(f"{filename}: pominięto – {e}")
+            status = 1
+            continue
+        source_size, target_size = os.path.getsize(filename), os.path.getsize(target)
+        with open(target, "rb") as f:
+            data = f.read()
+        started = time.perf_counter()
+        events = decode_replay(data)["moves"]
+        decode_ms = (time.perf_counter() - started) * 1000
+        print(f"{filename} -> {target}: {source_size} B -> {target_size} B "
+              f"({source_size / max(target_size, 1):.1f}x), {len(events)} zdarzeń, odczyt {decode_ms:.2f} ms")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
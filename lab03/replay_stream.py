@@ -0,0 +1,213 @@
+import bisect
+import codecs
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+
+import game_events
+import game_history
+import replay_format
+
+# Strumieniowy odczyt powtórek dla PlaybackScene: nagłówek (komórki, poziom, czas końca) jest dostępny
+# od razu, a zdarzenia są czytane partiami w miarę odtwarzania, więc pamięć nie rośnie z długością gry.
+# Czytniki zwracają pary (pozycja wznowienia lub None, zdarzenie); ReplayStream zapamiętuje co jakiś
+# czas pozycje i przy przewijaniu wznawia odczyt od najbliższej z nich.
+
+CHECKPOINT_SPACING = 256   # co ile zdarzeń zapamiętać pozycję wznowienia (JSON)
+READ_SIZE = 64 * 1024
+TAIL_SIZE = 64 * 1024
+
+_SEPARATORS_RE = re.compile(r"[\s,]*")
+_TIMESTAMP_JSON_RE = re.compile(r'"timestamp"\s*:\s*([-+0-9.eE]+)')
+_TIMESTAMP_XML_RE = re.compile(r'timestamp="([-+0-9.eE]+)"')
+
+
+def _tail_timestamp(filename, pattern):
+    """Czas ostatniego zdarzenia odczytany z końcówki pliku (bez parsowania całości)"""
+    with open(filename, "rb") as f:
+        f.seek(max(0, os.path.getsize(filename) - TAIL_SIZE))
+        matches = pattern.findall(f.read().decode("utf-8", errors="ignore"))
+    return float(matches[-1]) if matches else None
+
+
+def _initial_status(cells):
+    return [[cell.get("type", "neutral"), cell.get("points", 0)] for cell in cells]
+
+
+class _ListReader:
+    """Całe zdarzenia w pamięci – dla plików, których nie da się czytać przyrostowo"""
+
+    checkpoint_spacing = CHECKPOINT_SPACING
+
+    def __init__(self, history):
+        self.moves = game_events.normalize(history.get("moves", []), history.get("initial_state", {}).get("cells", []))
+        self.header = {key: value for key, value in history.items() if key != "moves"}
+        self.start_time = self.moves[0]["timestamp"] if self.moves else 0
+        self.end_time = self.moves[-1]["timestamp"] if self.moves else 0
+
+    def events(self, position=None):
+        for i in range(position or 0, len(self.moves)):
+            yield i, self.moves[i]
+
+
+class _JsonReader:
+    """Przyrostowy odczyt tablicy "moves" z pliku JSON (json.JSONDecoder.raw_decode po kolejnych elementach).
+       Pozycją wznowienia jest przesunięcie elementu w pliku (w bajtach)."""
+
+    checkpoint_spacing = CHECKPOINT_SPACING
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.decoder = json.JSONDecoder()
+        head = b""
+        with open(filename, "rb") as f:
+            while True:
+                chunk = f.read(READ_SIZE)
+                head += chunk
+                match = re.search(rb'"moves"\s*:\s*\[', head)
+                if match or not chunk:
+                    break
+        if not match:
+            raise ValueError("Brak tablicy moves")
+        # nagłówek to wszystko przed "moves" (initial_state, poziom) domknięte nawiasem
+        self.header = json.loads(head[:match.start()].decode("utf-8").rstrip().rstrip(",") + "}")
+        self.header.setdefault("initial_state", {"cells": []})
+        self.cells = self.header["initial_state"].get("cells", [])
+        self.first_item = match.end()
+        first = next(self.events(), None)
+        self.start_time = first[1]["timestamp"] if first else 0
+        self.end_time = _tail_timestamp(filename, _TIMESTAMP_JSON_RE) or self.start_time
+
+    def events(self, position=None):
+        position = self.first_item if position is None else position
+        index = game_events.CellIndex(self.cells)
+        current = _initial_status(self.cells)
+        text_decoder = codecs.getincrementaldecoder("utf-8")()
+        buffer, offset, eof = "", 0, False
+        with open(self.filename, "rb") as f:
+            f.seek(position)
+            while True:
+                skipped = _SEPARATORS_RE.match(buffer, offset).end()
+                position += skipped - offset     # przecinki i białe znaki są jednobajtowe
+                offset = skipped
+                if buffer.startswith("]", offset):
+                    return
+                try:
+                    move, end = self.decoder.raw_decode(buffer, offset)
+                except ValueError:
+                    if eof:
+                        return
+                    chunk = f.read(READ_SIZE)
+                    eof = not chunk
+                    buffer = buffer[offset:] + text_decoder.decode(chunk, final=eof)
+                    offset = 0
+                    continue
+                event = game_events.upgrade(move, index, current)
+                if event["type"] in game_events.STATUS_TYPES:
+                    current = event["cells"]
+                yield position, event
+                position += len(buffer[offset:end].encode("utf-8"))
+                offset = end
+
+
+class _XmlReader:
+    """Odczyt XML przez ET.iterparse; przetworzone elementy <Move> są usuwane z drzewa.
+       iterparse nie pozwala wznowić odczytu w środku pliku – przewijanie wstecz czyta od początku."""
+
+    checkpoint_spacing = CHECKPOINT_SPACING
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.header = {"initial_state": {"cells": []}}
+        for _, element in ET.iterparse(filename, events=("end",)):
+            if element.tag == "InitialState":
+                self.header["initial_state"]["cells"] = [
+                    {"x": float(cell.get("x", 0)), "y": float(cell.get("y", 0)),
+                     "type": cell.get("type", "neutral"), "points": int(cell.get("points", 0))}
+                    for cell in element.iter("Cell")]
+                break
+        self.cells = self.header["initial_state"]["cells"]
+        first = next(self.events(), None)
+        self.start_time = first[1]["timestamp"] if first else 0
+        self.end_time = _tail_timestamp(filename, _TIMESTAMP_XML_RE) or self.start_time
+
+    def events(self, position=None):
+        index = game_events.CellIndex(self.cells)
+        current = _initial_status(self.cells)
+        moves_el = None
+        for kind, element in ET.iterparse(self.filename, events=("start", "end")):
+            if kind == "start":
+                if element.tag == "Moves":
+                    moves_el = element
+                continue
+            if element.tag != "Move" or moves_el is None:
+                continue
+            timestamp = float(element.get("timestamp", 0))
+            moves = [game_history.event_from_xml(timestamp, child, index) for child in element]
+            if not len(element) and (element.text or "").strip():
+                moves.append(game_events.from_description(timestamp, element.text, index))
+            moves_el.clear()
+            for move in moves:
+                event = game_events.upgrade(move, index, current)
+                if event["type"] in game_events.STATUS_TYPES:
+                    current = event["cells"]
+                yield None, event
+
+
+class ReplayStream:
+    """Zdarzenia powtórki czytane partiami; read() zwraca kolejne, seek(n) ustawia odczyt na n-te zdarzenie"""
+
+    def __init__(self, filename):
+        lower = filename.lower()
+        if lower.endswith(replay_format.EXTENSION):
+            try:
+                self.reader = replay_format.BinaryReplayReader(filename)
+            except replay_format.ReplayFormatError:
+                self.reader = _ListReader(replay_format.load_replay(filename))
+        elif lower.endswith(".json"):
+            try:
+                self.reader = _JsonReader(filename)
+            except ValueError:
+                self.reader = _ListReader(game_history.load_game_history_json(filename))
+        else:
+            self.reader = _XmlReader(filename)
+        self.header = self.reader.header
+        self.start_time = self.reader.start_time
+        self.end_time = self.reader.end_time
+        # numery zdarzeń i odpowiadające im pozycje wznowienia (rosnąco)
+        self.checkpoint_indices = []
+        self.checkpoint_positions = []
+        self.seek(0)
+
+    def seek(self, index):
+        """Ustawia odczyt na zdarzenie o numerze index (od najbliższej wcześniejszej pozycji wznowienia)"""
+        k = bisect.bisect_right(self.checkpoint_indices, index) - 1
+        if k >= 0:
+            self.position, start = self.checkpoint_indices[k], self.checkpoint_positions[k]
+        else:
+            self.position, start = 0, None
+        self.iterator = self.reader.events(start)
+        if self.position < index:
+            self.read(index - self.position)
+
+    def read(self, count):
+        """Do `count` kolejnych zdarzeń (mniej na końcu powtórki)"""
+        events = []
+        spacing = self.reader.checkpoint_spacing
+        for _ in range(count):
+            item = next(self.iterator, None)
+            if item is None:
+                break
+            position, event = item
+            if position is not None:
+                last = self.checkpoint_indices[-1] if self.checkpoint_indices else -spacing
+                if self.position - last >= spacing:
+                    self.checkpoint_indices.append(self.position)
+                    self.checkpoint_positions.append(position)
+            self.position += 1
+            events.append(event)
+        return events
+
+    def close(self):
+        self.iterator = iter(())
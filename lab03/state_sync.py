@@ -0,0 +1,171 @@
+import struct
+import zlib
+
+import game_rules
+
+# Synchronizacja stanu gry sieciowej przyrostami: nadawca pamięta stan ostatnio potwierdzony przez
+# partnera (state_ack) i wysyła tylko komórki i mosty zmienione od tego stanu, w zwartym zapisie
+# binarnym (opcjonalnie zlib). Każda paczka ma numer (seq) i numer stanu bazowego (base); base 0
+# oznacza pełny stan. Odbiorca odtwarza stan nadawcy dla każdego seq, więc może zastosować przyrost
+# tylko wtedy, gdy zna jego bazę – w przeciwnym razie odsyła state_nack i dostaje pełny stan.
+#
+# Stan: {"cells": [(typ, punkty, zamrożona), ...], "connections": {(źródło, cel): (typ, koszt)},
+#        "turn": typ lub None, "time": sekundy tury lub None}
+
+VERSION = 1
+FLAG_COMPRESSED = 1
+TYPES = ("neutral",) + game_rules.FACTIONS
+TYPE_CODES = {name: code for code, name in enumerate(TYPES)}
+NO_TURN = 0xFF
+NO_TIME = -1
+RECEIVED_STATES = 8   # ile odtworzonych stanów nadawcy pamięta odbiorca
+
+_HEADER = struct.Struct("<BBII")        # wersja, flagi, seq, base
+_GLOBAL = struct.Struct("<Bi")          # tura, czas tury
+_COUNT = struct.Struct("<H")
+_CELL = struct.Struct("<HBBi")          # indeks, typ, zamrożona, punkty
+_PAIR = struct.Struct("<HH")            # źródło, cel
+_CONNECTION = struct.Struct("<HHBi")    # źródło, cel, typ, koszt
+
+
+class SyncError(Exception):
+    pass
+
+
+def empty_state():
+    return {"cells": [], "connections": {}, "turn": None, "time": None}
+
+
+def simulation_state(cells, connections, turn=None, time_left=None):
+    """Stan do synchronizacji z list komórek i mostów (mosty według indeksów komórek)"""
+    index_of = {cell: i for i, cell in enumerate(cells)}
+    return {
+        "cells": [(cell.cell_type, cell.points, bool(cell.frozen)) for cell in cells],
+        "connections": {(index_of[conn.source_cell], index_of[conn.target_cell]):
+                        (conn.connection_type, getattr(conn, "cost", 0)) for conn in connections},
+        "turn": turn,
+        "time": time_left,
+    }
+
+
+def diff(base, state):
+    """Przyrost z base do state: zmienione komórki, usunięte i nowe/zmienione mosty, tura i czas"""
+    base_cells = base["cells"]
+    cells = [(i,) + cell for i, cell in enumerate(state["cells"])
+             if i >= len(base_cells) or base_cells[i] != cell]
+    base_conns, conns = base["connections"], state["connections"]
+    removed = [pair for pair in base_conns if pair not in conns]
+    changed = [pair + value for pair, value in conns.items() if base_conns.get(pair) != value]
+    return {"cells": cells, "removed": removed, "connections": changed,
+            "turn": state["turn"], "time": state["time"]}
+
+
+def patch(base, delta):
+    """Stan po zastosowaniu przyrostu do base (base nie jest zmieniany)"""
+    cells = list(base["cells"])
+    for index, cell_type, points, frozen in delta["cells"]:
+        if index >= len(cells):
+            cells.extend([("neutral", 0, False)] * (index + 1 - len(cells)))
+        cells[index] = (cell_type, points, frozen)
+    conns = dict(base["connections"])
+    for pair in delta["removed"]:
+        conns.pop(pair, None)
+    for source, target, conn_type, cost in delta["connections"]:
+        conns[(source, target)] = (conn_type, cost)
+    return {"cells": cells, "connections": conns, "turn": delta["turn"], "time": delta["time"]}
+
+
+def encode(seq, base_seq, delta, compress=True):
+    body = [_GLOBAL.pack(TYPE_CODES.get(delta["turn"], NO_TURN),
+                         NO_TIME if delta["time"] is None else int(delta["time"]))]
+    body.append(_COUNT.pack(len(delta["cells"])))
+    body.extend(_CELL.pack(index, TYPE_CODES.get(cell_type, 0), int(bool(frozen)), points)
+                for index, cell_type, points, frozen in delta["cells"])
+    body.append(_COUNT.pack(len(delta["removed"])))
+    body.extend(_PAIR.pack(source, target) for source, target in delta["removed"])
+    body.append(_COUNT.pack(len(delta["connections"])))
+    body.extend(_CONNECTION.pack(source, target, TYPE_CODES.get(conn_type, 0), cost)
+                for source, target, conn_type, cost in delta["connections"])
+    payload = b"".join(body)
+    flags = 0
+    if compress:
+        packed = zlib.compress(payload)
+        if len(packed) < len(payload):
+            payload, flags = packed, FLAG_COMPRESSED
+    return _HEADER.pack(VERSION, flags, seq, base_seq) + payload
+
+
+def decode(data):
+    """(seq, base, przyrost) z danych encode(); SyncError przy błędnych danych"""
+    try:
+        version, flags, seq, base_seq = _HEADER.unpack_from(data)
+        if version != VERSION:
+            raise SyncError(f"Nieobsługiwana wersja synchronizacji: {version}")
+        payload = data[_HEADER.size:]
+        if flags & FLAG_COMPRESSED:
+            payload = zlib.decompress(payload)
+        turn, time_left = _GLOBAL.unpack_from(payload)
+        offset = _GLOBAL.size
+        delta = {"turn": TYPES[turn] if turn < len(TYPES) else None,
+                 "time": None if time_left == NO_TIME else time_left}
+        for key, record, convert in (
+                ("cells", _CELL, lambda i, t, f, p: (i, TYPES[t], p, bool(f))),
+                ("removed", _PAIR, lambda s, t: (s, t)),
+                ("connections", _CONNECTION, lambda s, t, c, k: (s, t, TYPES[c], k))):
+            (count,) = _COUNT.unpack_from(payload, offset)
+            offset += _COUNT.size
+            delta[key] = [convert(*values) for values in record.iter_unpack(payload[offset:offset + count * record.size])]
+            offset += count * record.size
+        return seq, base_seq, delta
+    except (struct.error, zlib.error, IndexError) as e:
+        raise SyncError(f"Uszkodzona paczka synchronizacji: {e}")
+
+
+class SyncSender:
+    """Strona wysyłająca: numeruje paczki i liczy przyrosty względem stanu potwierdzonego przez partnera"""
+
+    def __init__(self, compress=True):
+        self.compress = compress
+        self.seq = 0
+        self.acked_seq = 0
+        self.acked_state = empty_state()
+        self.pending = {}     # seq -> stan wysłany, jeszcze niepotwierdzony
+
+    def make(self, state, full=False):
+        """Paczka z przyrostem state względem ostatniego potwierdzonego stanu (full – względem pustego)"""
+        self.seq += 1
+        base_seq, base = (0, empty_state()) if full else (self.acked_seq, self.acked_state)
+        self.pending[self.seq] = state
+        return encode(self.seq, base_seq, diff(base, state), self.compress)
+
+    def ack(self, seq):
+        state = self.pending.get(seq)
+        if state is None or seq <= self.acked_seq:
+            return
+        self.acked_seq, self.acked_state = seq, state
+        self.pending = {s: st for s, st in self.pending.items() if s > seq}
+
+    def reset(self):
+        """Partner nie zna bazy – następna paczka będzie pełnym stanem"""
+        self.acked_seq, self.acked_state = 0, empty_state()
+        self.pending.clear()
+
+
+class SyncReceiver:
+    """Strona odbierająca: odtwarza stany nadawcy według seq"""
+
+    def __init__(self):
+        self.states = {0: empty_state()}
+
+    def receive(self, data):
+        """(seq, base, przyrost, odtworzony stan nadawcy); SyncError, gdy baza paczki jest nieznana"""
+        seq, base_seq, delta = decode(data)
+        base = self.states.get(base_seq)
+        if base is None:
+            raise SyncError(f"Nieznany stan bazowy {base_seq} dla paczki {seq}")
+        state = patch(base, delta)
+        self.states[seq] = state
+        if len(self.states) > RECEIVED_STATES:
+            for old in sorted(s for s in self.states if s)[:len(self.states) - RECEIVED_STATES]:
+                del self.states[old]
+        return seq, base_seq, delta, state
@@ -0,0 +1,115 @@
+import unittest
+
+import game_rules
+from game_engine import Cell, Simulation
+
+# Reguły silnika (game_engine.Simulation) porównane z zachowaniem pętli gry sprzed wydzielenia silnika:
+# kropka przechodzi most w 63 klatkach (0.016 na klatkę), konflikt zaczyna odbierać punkty po 63 klatkach,
+# a komórka, która w konflikcie spadnie do zera, odzyskuje połowę kosztu mostu.
+#
+#   python -m unittest test_game_engine
+
+DOT_FRAMES = 63
+
+
+def board(*cells):
+    return Simulation(list(cells), [])
+
+
+class CaptureTest(unittest.TestCase):
+    def test_dot_captures_neutral_cell(self):
+        source = Cell(0, 0, "player", 10)
+        target = Cell(100, 0, "neutral", 1)
+        simulation = board(source, target)
+        simulation.create_connection(source, target, "player", 5)
+
+        simulation.add_points()
+        self.assertEqual(source.points, 10)     # +1 z taktu, -1 za wysłaną kropkę
+        for _ in range(DOT_FRAMES - 1):
+            simulation.tick()
+        self.assertEqual((target.cell_type, target.points), ("neutral", 1))
+
+        events = simulation.tick()
+        self.assertEqual((target.cell_type, target.points), ("player", 1))
+        self.assertEqual(events, [("captured", target, 0, "player", 0)])
+        self.assertEqual(simulation.dot_store.count, 0)
+
+    def test_captured_cell_loses_outgoing_bridges(self):
+        source = Cell(0, 0, "player", 10)
+        target = Cell(100, 0, "enemy", 1)
+        other = Cell(200, 0, "neutral", 5)
+        simulation = board(source, target, other)
+        attack = simulation.create_connection(source, target, "player", 5)
+        outgoing = simulation.create_connection(target, other, "enemy", 5)
+
+        simulation.add_points()
+        self.assertEqual(target.points, 1)      # +1 z taktu, -1 za kropkę na własnym moście
+        events = []
+        for _ in range(DOT_FRAMES):
+            events.extend(simulation.tick())
+
+        self.assertEqual(target.cell_type, "player")
+        self.assertEqual(events, [("bridge_removed", outgoing, "captured"), ("captured", target, 0, "player", 1)])
+        self.assertNotIn(outgoing, simulation.connections)
+        self.assertNotIn(outgoing, other.connections)
+        self.assertIn(attack, simulation.connections)
+
+    def test_dot_reinforces_own_cell_up_to_limit(self):
+        source = Cell(0, 0, "player", 10)
+        target = Cell(100, 0, "player", game_rules.MAX_CELL_POINTS - 1)
+        simulation = board(source, target)
+        simulation.create_connection(source, target, "player", 5)
+
+        simulation.add_points()
+        self.assertEqual(target.points, game_rules.MAX_CELL_POINTS)
+        simulation.add_points()
+        for _ in range(DOT_FRAMES):
+            simulation.tick()
+        self.assertEqual(target.points, game_rules.MAX_CELL_POINTS)
+
+
+class ConflictTest(unittest.TestCase):
+    def setUp(self):
+        self.player = Cell(0, 0, "player", 3)
+        self.enemy = Cell(100, 0, "enemy", 10)
+        self.simulation = board(self.player, self.enemy)
+        self.bridge = self.simulation.create_connection(self.player, self.enemy, "player", 8)
+
+    def test_opposing_bridge_starts_conflict(self):
+        self.assertIsNone(self.simulation.create_connection(self.enemy, self.player, "enemy", 8))
+        self.assertTrue(self.bridge.conflict)
+        self.assertEqual(self.simulation.connections, [self.bridge])
+
+        for _ in range(DOT_FRAMES - 1):
+            self.simulation.tick()
+        self.assertEqual((self.player.points, self.enemy.points), (3, 10))
+        self.simulation.tick()
+        self.assertEqual((self.player.points, self.enemy.points), (2, 9))
+
+    def test_bridge_of_same_type_is_not_a_conflict(self):
+        self.enemy.cell_type = "player"
+        self.assertIsNotNone(self.simulation.create_connection(self.enemy, self.player, "player", 8))
+        self.assertFalse(self.bridge.conflict)
+
+    def test_cell_drained_by_conflict_gets_half_cost_back(self):
+        self.simulation.create_connection(self.enemy, self.player, "enemy", 8)
+        for _ in range(DOT_FRAMES + 1):
+            self.simulation.tick()
+        self.assertEqual(self.player.points, 1)
+
+        events = self.simulation.tick()
+        self.assertEqual(self.player.points, 8 // 2)
+        self.assertEqual(self.enemy.points, 7)
+        self.assertEqual(events, [("bridge_removed", self.bridge, "conflict")])
+        self.assertEqual(self.simulation.connections, [])
+        self.assertEqual(self.player.connections, [])
+
+    def test_frozen_cell_does_not_send_dots(self):
+        self.simulation.freeze(self.player)
+        self.simulation.add_points()
+        self.assertEqual(self.player.points, 3)
+        self.assertEqual(self.simulation.dot_store.count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()